@@ -0,0 +1,393 @@
+"""Offline end-to-end benchmark of the pipeline
+
+Runs every stage of the pipeline on synthetic datasets against local stand-ins for FAIRsharing.org, GraphDB and
+RDFUnit, and reports the throughput and latency of each stage and the peak memory use as JSON. No network access,
+Java or GraphDB installation is needed, so reports of different versions can be compared on the same machine.
+
+Usage: python -m ncats_translator_dqa.benchmark run -o report.json [--datasets 4] [--triples 100000] ...
+       python -m ncats_translator_dqa.benchmark compare baseline.json report.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+from datetime import datetime
+from ncats_translator_dqa import config, pipeline, rdf_stream, run_manifest, scheduler, sysinfo, synthetic_data
+from ncats_translator_dqa.preliminary_statistics import fair_scraper, prelim_stats_rdf
+from ncats_translator_dqa.preliminary_statistics.fairsharing_standin import FAIRsharingStandIn
+from ncats_translator_dqa.computational_metrics.computational_metrics import upload_results, ENGINES, \
+    ENGINE_RDFUNIT
+from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.computational_metrics.graphdb_standin import GraphDBStandIn
+from ncats_translator_dqa.computational_metrics.rdfunit_stub import make_rdfunit_stub
+from ncats_translator_dqa.results_store import ResultsStore
+from ncats_translator_dqa.translator_dqa import translator_dqa, validation_workers, validation_executor, validator
+
+# Version of the report format
+REPORT_VERSION = 1
+
+# Settings changed while the benchmark runs. They are restored afterwards
+__settings = ['path_output', 'path_http_cache', 'path_result_cache', 'path_results_db', 'path_rdfunit',
+              'path_rdfunit_jobs', 'schema_mirror', 'schema_offline', 'path_schema_mirror', 'path_test_suite_cache',
+              'rdfunit_worker', 'rdfunit_workers', 'url_graphdb', 'graphdb_repo', 'graphdb_upload', 'graphdb_gzip',
+              'shard_bytes', 'sample_fraction', 'normalize_input', 'input_pipe', 'computational_metrics_engine',
+              'dqv_report', 'void_profile', 'interlinking_metrics', 'verbose']
+
+
+def run_benchmark(dir_work=None, n_datasets=4, n_triples=100000, error_rate=0.01, n_pages=20, dir_pages=None,
+                  engines=None, n_workers=None, page_latency=0.05, graphdb_latency=0, rdfunit_latency=0.5, seed=0,
+                  keep=False):
+    """Runs the benchmark
+
+    The stages are run one after the other: generating the datasets, scraping the FAIRsharing.org pages, writing the
+    preliminary statistics in W3C DQV, validating the datasets with each engine, uploading the results to GraphDB,
+    recording the results in the results store, and finally the complete pipeline on all rows at once (-m).
+
+    :param dir_work: Folder for the datasets and all outputs. Defaults to a temporary folder [optional]
+    :param n_datasets: Number of synthetic datasets (Integer) [optional]
+    :param n_triples: Number of triples in each dataset (Integer) [optional]
+    :param error_rate: Share of the triples replaced by errors (Float) [optional]
+    :param n_pages: Number of FAIRsharing.org pages to scrape, if dir_pages has no recorded pages (Integer) [optional]
+    :param dir_pages: Folder of recorded FAIRsharing.org pages, see fairsharing_standin.record_pages() [optional]
+    :param engines: Validation engines to benchmark. Defaults to all engines (List) [optional]
+    :param n_workers: Number of datasets validated at the same time. Defaults to config.rdfunit_workers [optional]
+    :param page_latency: Response time of the FAIRsharing.org stand-in in seconds (Float) [optional]
+    :param graphdb_latency: Response time of the GraphDB stand-in in seconds (Float) [optional]
+    :param rdfunit_latency: Time in seconds each run of the rdfunit stub takes (Float) [optional]
+    :param seed: Seed for generating the datasets [optional]
+    :param keep: True to keep the work folder [optional]
+    :return: Report (Dictionary)
+    """
+    if engines is None:
+        engines = ENGINES
+    if n_workers is None:
+        n_workers = config.rdfunit_workers
+
+    dir_work_tmp = None
+    if dir_work is None:
+        dir_work = dir_work_tmp = tempfile.mkdtemp(prefix='translator_dqa_benchmark_')
+    os.makedirs(dir_work, exist_ok=True)
+
+    settings = {name: getattr(config, name) for name in __settings}
+    standin_pages = FAIRsharingStandIn(dir_pages, latency=page_latency)
+    standin_graphdb = GraphDBStandIn(latency=graphdb_latency)
+
+    report = {
+        'report_version': REPORT_VERSION,
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': __git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': sysinfo.cpu_count(),
+        'parameters': {'n_datasets': n_datasets, 'n_triples': n_triples, 'error_rate': error_rate,
+                       'n_pages': n_pages, 'recorded_pages': dir_pages is not None, 'engines': list(engines),
+                       'n_workers': n_workers, 'page_latency': page_latency, 'graphdb_latency': graphdb_latency,
+                       'rdfunit_latency': rdfunit_latency, 'seed': seed},
+        'stages': {}
+    }
+    stages = report['stages']
+
+    try:
+        # Everything is written to the work folder, and nothing is reused from previous runs
+        config.path_output = os.path.join(dir_work, 'output')
+        config.path_http_cache = ''
+        config.path_result_cache = ''
+        config.path_results_db = os.path.join(dir_work, 'results.sqlite')
+        config.path_rdfunit = make_rdfunit_stub(os.path.join(dir_work, 'RDFUnit'), rdfunit_latency)
+        config.path_rdfunit_jobs = os.path.join(dir_work, 'rdfunit_jobs')
+        # The rdfunit stub detects no schemas, so nothing is mirrored or downloaded
+        config.schema_mirror = False
+        config.schema_offline = False
+        config.path_schema_mirror = os.path.join(dir_work, 'schema_mirror')
+        config.path_test_suite_cache = ''
+        config.rdfunit_worker = False
+        config.rdfunit_workers = n_workers
+        config.url_graphdb = standin_graphdb.url
+        config.graphdb_repo = ''
+        config.graphdb_upload = 'stream'
+        config.graphdb_gzip = True
+        # Settings that change what is measured have fixed values, so reports of different setups can be compared
+        config.shard_bytes = 0
+        config.sample_fraction = 0
+        config.normalize_input = False
+        config.input_pipe = False
+        config.computational_metrics_engine = ENGINE_RDFUNIT
+        config.dqv_report = True
+        config.void_profile = False
+        config.interlinking_metrics = False
+        config.verbose = False
+        os.makedirs(config.path_output, exist_ok=True)
+        standin_pages.start()
+        standin_graphdb.start()
+
+        # Generate the datasets
+        files_dataset = [os.path.join(dir_work, 'data', 'synthetic%02d.ttl' % i) for i in range(n_datasets)]
+        started = time.perf_counter()
+        injected = [synthetic_data.generate_dataset(file_dataset, n_triples, error_rate, seed + i)
+                    for i, file_dataset in enumerate(files_dataset)]
+        n_triples_total = sum(stats['triples'] for stats in injected)
+        stages['generate'] = __stage(n_datasets, 'datasets', time.perf_counter() - started, triples=n_triples_total,
+                                     bytes=sum(os.path.getsize(file_dataset) for file_dataset in files_dataset))
+        stages['generate']['injected_errors'] = {kind: sum(stats.get(kind, 0) for stats in injected)
+                                                 for kind in synthetic_data.ERRORS}
+
+        # Scrape the FAIRsharing.org pages
+        records = standin_pages.records()
+        if len(records) == 0:
+            records = ['biodbcore-%06d' % i for i in range(n_pages)]
+        urls = [standin_pages.url + record for record in records]
+        # Pages are scraped by a pipeline stage with config.scrape_workers workers, as in translator_dqa -m
+        prelim_stats_list = [None] * len(urls)
+
+        def scrape(i):
+            try:
+                prelim_stats_list[i] = fair_scraper.fair_scraper(urls[i])
+            except Exception:
+                pass
+
+        started = time.perf_counter()
+        pipeline.Pipeline([pipeline.PipelineStage('scrape', scrape, config.scrape_workers)]).run(range(len(urls)))
+        seconds = time.perf_counter() - started
+        scraped = [(record, stats) for record, stats in zip(records, prelim_stats_list) if stats is not None]
+        stages['scrape'] = __stage(len(urls), 'pages', seconds, errors=len(urls) - len(scraped))
+
+        # Write the preliminary statistics in W3C DQV, one file per page
+        latencies = []
+        started = time.perf_counter()
+        for record, stats in scraped:
+            started_item = time.perf_counter()
+            with prelim_stats_rdf.DQVWriter(os.path.join(config.path_output, record + '_rdf.ttl')) as writer:
+                writer.add_dataset(''.join(c for c in record if c.isalnum()) + 'Dataset', stats)
+            latencies.append(time.perf_counter() - started_item)
+        stages['prelim_stats_rdf'] = __stage(len(scraped), 'pages', time.perf_counter() - started,
+                                             latencies=latencies)
+
+        # Validate the datasets with each engine, through the validate stage and worker pool of translator_dqa -m,
+        # largest first. The results of the last engine are uploaded
+        jobs = scheduler.largest_first(scheduler.make_jobs(files_dataset, scheduler.CostModel()))
+        n_validate = validation_workers(len(jobs))
+        for engine in engines:
+            errors = []
+            started = time.perf_counter()
+            __validate(files_dataset, engine, jobs, n_validate, errors)
+            stages['validate_' + engine] = __stage(n_datasets, 'datasets', time.perf_counter() - started,
+                                                   triples=n_triples_total, errors=len(errors))
+
+        if len(engines) > 0:
+            # Upload the results to GraphDB
+            files_output = [RDFUnitWrapper.output_files(file_dataset)[0] for file_dataset in files_dataset]
+            n_triples_results = sum(sum(1 for _ in rdf_stream.iter_triples(file_output))
+                                    for file_output in files_output if os.path.exists(file_output))
+            latencies = []
+            errors = 0
+            started = time.perf_counter()
+            for file_dataset, file_output in zip(files_dataset, files_output):
+                started_item = time.perf_counter()
+                try:
+                    upload_results(file_dataset, file_output)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started_item)
+            stages['upload'] = __stage(n_datasets, 'uploads', time.perf_counter() - started, latencies=latencies,
+                                       triples=n_triples_results, errors=errors)
+
+            # Record the results in the results store
+            store = ResultsStore()
+            try:
+                run_id = store.start_run('benchmark')
+                latencies = []
+                started = time.perf_counter()
+                for file_dataset, file_output in zip(files_dataset, files_output):
+                    started_item = time.perf_counter()
+                    store.add_results_file(run_id, file_dataset, file_output)
+                    latencies.append(time.perf_counter() - started_item)
+                stages['record'] = __stage(n_datasets, 'datasets', time.perf_counter() - started, latencies=latencies,
+                                           triples=n_triples_results)
+                store.finish_run(run_id)
+            finally:
+                store.close()
+
+            # Complete pipeline over all rows of a CSV file, one row per dataset
+            file_multi = os.path.join(dir_work, 'datasets.csv')
+            with open(file_multi, 'w') as f:
+                for i, file_dataset in enumerate(files_dataset):
+                    f.write(urls[i % len(urls)] + ',' + file_dataset + '\n')
+            started = time.perf_counter()
+            translator_dqa(file_multi=file_multi, engine=engines[-1])
+            stages['end_to_end'] = __stage(n_datasets, 'datasets', time.perf_counter() - started,
+                                           triples=n_triples_total)
+
+        report['peak_rss_bytes'] = sysinfo.peak_rss()
+        report['peak_rss_children_bytes'] = sysinfo.peak_rss(children=True)
+    finally:
+        standin_pages.stop()
+        standin_graphdb.stop()
+        for name, value in settings.items():
+            setattr(config, name, value)
+        if dir_work_tmp is not None and not keep:
+            shutil.rmtree(dir_work_tmp, ignore_errors=True)
+
+    return report
+
+
+def compare_reports(report_baseline, report):
+    """Compares the throughput of each stage between two reports
+
+    :param report_baseline: Report of the baseline version (Dictionary)
+    :param report: Report to compare with the baseline (Dictionary)
+    :return: List of tuples (stage, metric, baseline value, value, relative change)
+    """
+    changes = []
+    for stage, metrics in report['stages'].items():
+        metrics_baseline = report_baseline['stages'].get(stage)
+        if metrics_baseline is None:
+            continue
+        for metric, value in metrics.items():
+            value_baseline = metrics_baseline.get(metric)
+            if not metric.endswith('_per_second') or not value_baseline or value is None:
+                continue
+            changes.append((stage, metric, value_baseline, value, (value - value_baseline) / value_baseline))
+    return changes
+
+
+def __validate(files_dataset, engine, jobs, n_workers, errors):
+    """Validates the datasets through the validate stage of the pipeline of translator_dqa -m
+
+    :param files_dataset: Paths to the datasets (List)
+    :param engine: Validation engine (String)
+    :param jobs: scheduler.Job of each dataset, in the order they are validated (List)
+    :param n_workers: Number of datasets validated at the same time (Integer)
+    :param errors: List receiving the exception of each failed validation
+    :return: None
+    """
+    def validate(i):
+        try:
+            stage(i)
+        except Exception as e:
+            errors.append(e)
+
+    executor = validation_executor(n_workers)
+    try:
+        with scheduler.Progress(jobs, n_workers) as progress:
+            stage = validator(files_dataset, '', engine, executor, progress, {})
+            pipeline.Pipeline([pipeline.PipelineStage(run_manifest.STAGE_VALIDATE, validate, n_workers)]).run(
+                [job.index for job in jobs])
+    finally:
+        executor.shutdown()
+
+
+def __stage(n_items, unit, seconds, latencies=None, triples=None, errors=0, **totals):
+    """Summarizes a stage of the benchmark
+
+    :param n_items: Number of items processed (Integer)
+    :param unit: Name of the items, e.g., 'pages' (String)
+    :param seconds: Duration of the stage (Float)
+    :param latencies: Duration of each item in seconds, if the items were processed one at a time (List) [optional]
+    :param triples: Number of triples processed (Integer) [optional]
+    :param errors: Number of items that failed (Integer) [optional]
+    :param totals: Other totals, reported with their throughput
+    :return: Dictionary
+    """
+    stage = {unit: n_items, 'seconds': round(seconds, 6), unit + '_per_second': __rate(n_items, seconds),
+             'errors': errors}
+    if triples is not None:
+        totals['triples'] = triples
+    for name, total in totals.items():
+        stage[name] = total
+        stage[name + '_per_second'] = __rate(total, seconds)
+    if latencies is not None and len(latencies) > 0:
+        latencies = sorted(latencies)
+        stage['latency_seconds'] = {
+            'mean': round(sum(latencies) / len(latencies), 6),
+            'p50': round(latencies[(len(latencies) - 1) // 2], 6),
+            'p95': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 6),
+            'max': round(latencies[-1], 6)
+        }
+    stage['peak_rss_bytes'] = sysinfo.peak_rss()
+    return stage
+
+
+def __rate(n, seconds):
+    return round(n / seconds, 3) if seconds > 0 else None
+
+
+def __git_commit():
+    """Gets the git commit of the package, if it is in a git repository
+
+    :return: Commit hash (String), or None
+    """
+    try:
+        cp = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            encoding='UTF-8', cwd=os.path.split(os.path.abspath(__file__))[0])
+    except OSError:
+        return None
+    return cp.stdout.strip() if cp.returncode == 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of NCATS translator data quality '
+                                                 'analysis')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_run = subparsers.add_parser('run', help='Run the benchmark')
+    parser_run.add_argument('-o', dest='file_report', help='JSON file to write the report to. Default: stdout')
+    parser_run.add_argument('--datasets', type=int, default=4, help='Number of synthetic datasets')
+    parser_run.add_argument('--triples', type=int, default=100000, help='Number of triples in each dataset')
+    parser_run.add_argument('--error-rate', type=float, default=0.01, help='Share of the triples that are errors')
+    parser_run.add_argument('--pages', type=int, default=20, help='Number of FAIRsharing.org pages to scrape')
+    parser_run.add_argument('--recorded-pages', dest='dir_pages', help='Folder of recorded FAIRsharing.org pages')
+    parser_run.add_argument('--engine', dest='engines', action='append', choices=ENGINES,
+                            help='Validation engine to benchmark. Can be repeated. Default: all engines')
+    parser_run.add_argument('--workers', type=int, help='Number of datasets validated at the same time')
+    parser_run.add_argument('--page-latency', type=float, default=0.05,
+                            help='Response time of the FAIRsharing.org stand-in in seconds')
+    parser_run.add_argument('--graphdb-latency', type=float, default=0,
+                            help='Response time of the GraphDB stand-in in seconds')
+    parser_run.add_argument('--rdfunit-latency', type=float, default=0.5,
+                            help='Time each run of the rdfunit stub takes in seconds')
+    parser_run.add_argument('--seed', type=int, default=0, help='Seed for generating the datasets')
+    parser_run.add_argument('--work-dir', dest='dir_work', help='Folder for the datasets and outputs. Default: a '
+                                                                'temporary folder that is deleted afterwards')
+
+    parser_compare = subparsers.add_parser('compare', help='Compare the throughput of two reports')
+    parser_compare.add_argument('file_baseline', help='Report of the baseline version')
+    parser_compare.add_argument('file_report', help='Report to compare with the baseline')
+    parser_compare.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative throughput drop reported as a regression. Default: 0.1')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report = run_benchmark(args.dir_work, args.datasets, args.triples, args.error_rate, args.pages,
+                               args.dir_pages, args.engines, args.workers, args.page_latency, args.graphdb_latency,
+                               args.rdfunit_latency, args.seed)
+        if args.file_report is None:
+            print(json.dumps(report, indent=2))
+        else:
+            with open(args.file_report, 'w') as f:
+                json.dump(report, f, indent=2)
+    else:
+        with open(args.file_baseline) as f:
+            report_baseline = json.load(f)
+        with open(args.file_report) as f:
+            report = json.load(f)
+
+        regressions = 0
+        for stage, metric, value_baseline, value, change in compare_reports(report_baseline, report):
+            regression = change < -args.threshold
+            regressions += regression
+            print('%-18s %-24s %14.3f %14.3f %+7.1f%%%s' % (stage, metric, value_baseline, value, 100 * change,
+                                                            '  REGRESSION' if regression else ''))
+
+        # Non-zero exit code, e.g., for failing a CI job
+        if regressions > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,107 @@
 """Wrapper for interacting with GraphDB REST API
 """
+import os
+import time
+import zlib
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from ncats_translator_dqa import profiling
+
+# Shared HTTP session so that all GraphDB requests of a process reuse the same pool of keep-alive connections
+__session = None
+__session_lock = threading.Lock()
+
+# Content types of RDF files by extension
+__content_types = {
+    '.ttl': 'text/turtle',
+    '.nt': 'application/n-triples',
+    '.nq': 'application/n-quads',
+    '.trig': 'application/trig',
+    '.rdf': 'application/rdf+xml',
+    '.owl': 'application/rdf+xml',
+    '.jsonld': 'application/ld+json'
+}
+
+
+def get_session():
+    """Gets the HTTP session shared by all GraphDB requests
+
+    :return: requests.Session
+    """
+    global __session
+    with __session_lock:
+        if __session is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            __session = session
+        return __session
+
+
+def content_type(file_data):
+    """Gets the content type of an RDF file from its extension
+
+    :param file_data: Path to the file (String)
+    :return: Content type (String). Unknown extensions are treated as Turtle
+    """
+    return __content_types.get(os.path.splitext(file_data)[1].lower(), 'text/turtle')
+
+
+class GraphDBImportError(Exception):
+    """Raised when GraphDB reports that a data import failed or the import does not finish in time
+    """
+    pass
 
 
 class GraphDBWrapper:
     """Wrapper for interacting with GraphDB REST API
     """
     __api_delete_repo = 'rest/repositories/'
+    __api_get_repo = 'rest/repositories/'
     __api_create_repo = 'rest/repositories/'
     __api_upload_url = 'rest/data/import/url/'
+    __api_statements = 'repositories/{}/statements'
+    __api_size = 'repositories/{}/size'
+    __api_graphs = 'repositories/{}/rdf-graphs/service'
+    __api_query = 'repositories/{}'
+
+    # Import status values reported by GraphDB
+    __status_done = 'DONE'
+    __status_error = 'ERROR'
 
-    def __init__(self, url_graphdb="http://localhost:7200", verbose=False):
+    # Bytes read from the data file at a time when streaming an upload
+    __chunk_size = 1024 * 1024
+
+    def __init__(self, url_graphdb="http://localhost:7200", verbose=False, session=None):
         """Constructor
 
         :param url_graphdb: URL to GraphDB
         :param verbose: True if you want to print status messages
+        :param session: requests.Session to send requests with. Defaults to a session shared by the process [optional]
         """
         # Make sure the url to graphdb ends with a '/'
         if url_graphdb[-1] != '/':
             url_graphdb += '/'
         self.url_graphdb = url_graphdb
         self.verbose = verbose
+        self.session = session if session is not None else get_session()
+
+    def repo_exists(self, repo_id):
+        """Checks whether a repository with the given ID exists
+
+        :param repo_id: repository ID
+        :return: True if the repository exists
+        """
+        headers = {'Accept': 'application/json'}
+        url_repo = self.url_graphdb + GraphDBWrapper.__api_get_repo + repo_id
+        response = self.session.get(url_repo, headers=headers)
+        if response.status_code == requests.codes.not_found:
+            return False
+        response.raise_for_status()
+        return True
 
     def delete_repo(self, repo_id):
         """Deletes the repository with the given ID.
@@ -36,8 +116,9 @@ class GraphDBWrapper:
 
         headers = {'Accept': '*/*'}
         url_delete = self.url_graphdb + GraphDBWrapper.__api_delete_repo + repo_id
-        response = requests.delete(url_delete, headers=headers)
-        response.raise_for_status()
+        with profiling.span('graphdb.delete_repo', repo=repo_id):
+            response = self.session.delete(url_delete, headers=headers)
+            response.raise_for_status()
 
         if self.verbose:
             if response.status_code == requests.codes.ok:
@@ -76,8 +157,9 @@ class GraphDBWrapper:
         }
 
         url_create = self.url_graphdb + GraphDBWrapper.__api_create_repo
-        response = requests.put(url_create, headers=headers, data=json.dumps(repo_config))
-        response.raise_for_status()
+        with profiling.span('graphdb.create_repo', repo=repo_id):
+            response = self.session.put(url_create, headers=headers, data=json.dumps(repo_config))
+            response.raise_for_status()
 
         if self.verbose:
             if response.status_code == requests.codes.created:
@@ -87,13 +169,16 @@ class GraphDBWrapper:
 
         return response
 
-    def upload_data_url(self, repo_id, url_data):
+    def upload_data_url(self, repo_id, url_data, wait=False, timeout=None):
         """Initiates a data URL upload to the specified repository
 
-        This method initiates an upload. It does not wait for the upload to complete.
+        By default, this method initiates an upload and does not wait for the upload to complete. With wait=True, it
+        polls the import status until GraphDB reports that the import is done.
 
         :param repo_id: Repository to upload to
         :param url_data: URL of data to upload
+        :param wait: True to wait until the import is done [optional]
+        :param timeout: Maximum time to wait in seconds. None waits as long as GraphDB lists the import [optional]
         :return: requests.response
         """
         if self.verbose:
@@ -103,8 +188,8 @@ class GraphDBWrapper:
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         }
-        url_import = self.url_graphdb + GraphDBWrapper.__api_upload_url + repo_id + '?url=' + url_data
-        response = requests.post(url_import, headers=headers)
+        url_import = self.url_graphdb + GraphDBWrapper.__api_upload_url + repo_id
+        response = self.session.post(url_import, headers=headers, params={'url': url_data})
         response.raise_for_status()
 
         if self.verbose:
@@ -113,8 +198,238 @@ class GraphDBWrapper:
             else:
                 GraphDBWrapper.print_response(response)
 
+        if wait:
+            self.wait_for_import(repo_id, url_data, timeout)
+
+        return response
+
+    def import_status(self, repo_id, name):
+        """Gets the status of a URL import
+
+        :param repo_id: Repository ID
+        :param name: Name of the import, i.e., the URL of the imported data
+        :return: Import status as reported by GraphDB (Dictionary), or None if GraphDB does not know the import
+        """
+        headers = {'Accept': 'application/json'}
+        url_import = self.url_graphdb + GraphDBWrapper.__api_upload_url + repo_id
+        response = self.session.get(url_import, headers=headers)
+        response.raise_for_status()
+
+        for status in response.json():
+            if status.get('name') == name:
+                return status
+        return None
+
+    def wait_for_import(self, repo_id, name, timeout=None, poll_interval=0.5, max_poll_interval=10,
+                        max_unknown_polls=10):
+        """Waits until a URL import is done
+
+        The import status is polled with exponential backoff, starting at poll_interval and doubling up to
+        max_poll_interval seconds. Even without a timeout, waiting stops when GraphDB doesn't list the import in
+        max_unknown_polls status requests in a row.
+
+        :param repo_id: Repository ID
+        :param name: Name of the import, i.e., the URL of the imported data
+        :param timeout: Maximum time to wait in seconds. None waits as long as GraphDB lists the import [optional]
+        :param poll_interval: Initial time between status requests in seconds [optional]
+        :param max_poll_interval: Maximum time between status requests in seconds [optional]
+        :param max_unknown_polls: Number of status requests in a row that may not find the import, e.g., before
+         GraphDB has registered it [optional]
+        :return: Import status as reported by GraphDB (Dictionary)
+        """
+        with profiling.span('graphdb.wait_for_import', repo=repo_id, url=name):
+            return self.__wait_for_import(repo_id, name, timeout, poll_interval, max_poll_interval, max_unknown_polls)
+
+    def __wait_for_import(self, repo_id, name, timeout, poll_interval, max_poll_interval, max_unknown_polls):
+        # Implementation of wait_for_import()
+        time_start = time.monotonic()
+        n_unknown = 0
+        while True:
+            status = self.import_status(repo_id, name)
+            if status is None:
+                n_unknown += 1
+                if n_unknown >= max_unknown_polls:
+                    raise GraphDBImportError('GraphDB: import of ' + name + ' into ' + repo_id + ' is not listed by '
+                                             'GraphDB after ' + str(n_unknown) + ' status requests')
+            else:
+                n_unknown = 0
+                if status.get('status') == GraphDBWrapper.__status_done:
+                    break
+                if status.get('status') == GraphDBWrapper.__status_error:
+                    raise GraphDBImportError('GraphDB: import of ' + name + ' into ' + repo_id + ' failed: ' +
+                                             str(status.get('message')))
+
+            elapsed = time.monotonic() - time_start
+            if timeout is not None and elapsed + poll_interval > timeout:
+                raise GraphDBImportError('GraphDB: import of ' + name + ' into ' + repo_id + ' did not finish within ' +
+                                         str(timeout) + ' seconds')
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+
+        if self.verbose:
+            print('GraphDB: import into ' + repo_id + ' finished in ' +
+                  '{:.1f}'.format(time.monotonic() - time_start) + ' seconds')
+
+        return status
+
+    def upload_data_file(self, repo_id, file_data, compress=True, timeout=None, graph=None):
+        """Uploads a data file to the specified repository and waits until the data is loaded
+
+        The file is streamed in chunks to the repository's statements endpoint, so it is never held in memory as a
+        whole. With compress=True, the chunks are gzip-compressed on the wire.
+
+        :param repo_id: Repository to upload to
+        :param file_data: Path to the data file. The format is guessed from the extension (String)
+        :param compress: True to send the data gzip-compressed [optional]
+        :param timeout: Maximum time in seconds to wait for GraphDB to respond after the data is sent. None waits
+         indefinitely [optional]
+        :param graph: IRI of the named graph to add the data to. Defaults to the default graph [optional]
+        :return: Number of statements added to the named graph, or to the repository without a graph (Integer).
+         Without a graph, statements added by other uploads into the repository at the same time are counted too
+        """
+        if self.verbose:
+            print('GraphDB: uploading into ' + repo_id + ': ' + file_data)
+
+        params = {'context': '<' + graph + '>'} if graph is not None else None
+        with profiling.span('graphdb.upload', repo=repo_id, file=file_data, bytes=os.path.getsize(file_data)) as s:
+            # Count the statements of the target graph, so uploads into other graphs at the same time don't count
+            size_before = self.size(repo_id, graph)
+            url_statements = self.url_graphdb + GraphDBWrapper.__api_statements.format(repo_id)
+            elapsed = self.__send_file('POST', url_statements, params, file_data, compress, timeout)
+            n_added = self.size(repo_id, graph) - size_before
+            s.tag(triples=n_added)
+
+        if self.verbose:
+            GraphDBWrapper.__print_rate('uploaded', n_added, repo_id, elapsed)
+
+        return n_added
+
+    def replace_graph(self, repo_id, graph, file_data, compress=True, timeout=None):
+        """Replaces the content of a named graph with the content of a data file
+
+        Uses the graph store protocol, so GraphDB clears the graph and loads the new data in one transaction. Queries
+        see either the old or the new content of the graph. The file is streamed as in upload_data_file.
+
+        :param repo_id: Repository ID
+        :param graph: IRI of the named graph (String)
+        :param file_data: Path to the data file. The format is guessed from the extension (String)
+        :param compress: True to send the data gzip-compressed [optional]
+        :param timeout: Maximum time in seconds to wait for GraphDB to respond after the data is sent. None waits
+         indefinitely [optional]
+        :return: Number of statements in the graph (Integer)
+        """
+        if self.verbose:
+            print('GraphDB: replacing graph ' + graph + ' in ' + repo_id + ' with ' + file_data)
+
+        url_graphs = self.url_graphdb + GraphDBWrapper.__api_graphs.format(repo_id)
+        with profiling.span('graphdb.replace_graph', repo=repo_id, graph=graph, file=file_data,
+                            bytes=os.path.getsize(file_data)) as s:
+            elapsed = self.__send_file('PUT', url_graphs, {'graph': graph}, file_data, compress, timeout)
+            n_loaded = self.size(repo_id, graph)
+            s.tag(triples=n_loaded)
+
+        if self.verbose:
+            GraphDBWrapper.__print_rate('loaded', n_loaded, repo_id, elapsed)
+
+        return n_loaded
+
+    def clear_graph(self, repo_id, graph):
+        """Removes all statements of a named graph
+
+        This will be successful even if the graph doesn't exist.
+
+        :param repo_id: Repository ID
+        :param graph: IRI of the named graph (String)
+        :return: requests.response
+        """
+        if self.verbose:
+            print('GraphDB: clearing graph ' + graph + ' in ' + repo_id)
+
+        url_graphs = self.url_graphdb + GraphDBWrapper.__api_graphs.format(repo_id)
+        response = self.session.delete(url_graphs, params={'graph': graph})
+        if response.status_code != requests.codes.not_found:
+            response.raise_for_status()
+
         return response
 
+    def query(self, repo_id, query):
+        """Runs a SPARQL SELECT or ASK query on a repository
+
+        :param repo_id: Repository ID
+        :param query: SPARQL query (String)
+        :return: Query results in SPARQL 1.1 Query Results JSON Format (Dictionary)
+        """
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/sparql-results+json'
+        }
+        url_query = self.url_graphdb + GraphDBWrapper.__api_query.format(repo_id)
+        response = self.session.post(url_query, headers=headers, data={'query': query})
+        response.raise_for_status()
+        return response.json()
+
+    def size(self, repo_id, graph=None):
+        """Gets the number of statements in a repository
+
+        :param repo_id: Repository ID
+        :param graph: IRI of a named graph to count the statements of. Defaults to the whole repository [optional]
+        :return: Number of statements (Integer)
+        """
+        params = {'context': '<' + graph + '>'} if graph is not None else None
+        url_size = self.url_graphdb + GraphDBWrapper.__api_size.format(repo_id)
+        response = self.session.get(url_size, headers={'Accept': 'text/plain'}, params=params)
+        response.raise_for_status()
+        return int(response.text.strip())
+
+    def __send_file(self, method, url, params, file_data, compress, timeout):
+        """Streams a data file in the body of a request
+
+        :param method: HTTP method (String)
+        :param url: URL of the request (String)
+        :param params: Query parameters (Dictionary)
+        :param file_data: Path to the data file (String)
+        :param compress: True to send the data gzip-compressed
+        :param timeout: Maximum time in seconds to wait for a response after the data is sent
+        :return: Time in seconds until GraphDB responded (Float)
+        """
+        headers = {'Content-Type': content_type(file_data)}
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+
+        time_start = time.monotonic()
+        response = self.session.request(method, url, headers=headers, params=params,
+                                        data=GraphDBWrapper.__read_chunks(file_data, compress), timeout=(None, timeout))
+        response.raise_for_status()
+        return time.monotonic() - time_start
+
+    @staticmethod
+    def __print_rate(action, n_statements, repo_id, elapsed):
+        rate = n_statements / elapsed if elapsed > 0 else 0
+        print('GraphDB: ' + action + ' ' + str(n_statements) + ' statements into ' + repo_id + ' in ' +
+              '{:.1f}'.format(elapsed) + ' seconds (' + '{:.0f}'.format(rate) + ' triples/s)')
+
+    @staticmethod
+    def __read_chunks(file_data, compress):
+        """Reads a file in chunks, optionally gzip-compressing them
+
+        :param file_data: Path to the file (String)
+        :param compress: True to gzip-compress the chunks
+        :return: Generator of chunks (bytes)
+        """
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+        with open(file_data, 'rb') as f:
+            while True:
+                chunk = f.read(GraphDBWrapper.__chunk_size)
+                if not chunk:
+                    break
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
     @staticmethod
     def print_response(response):
         """Prints basic information from a requests.response object
@@ -122,7 +437,7 @@ class GraphDBWrapper:
         :param response: A requests.response object
         :return: None
         """
-        print('GraphDB response status ' + response.status_code + ': ' + response.content.decode())
+        print('GraphDB response status ' + str(response.status_code) + ': ' + response.content.decode())
 
     @staticmethod
     def sanitize_repo_id(suggested_id):
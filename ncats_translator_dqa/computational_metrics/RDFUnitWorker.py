@@ -0,0 +1,364 @@
+"""Long-lived RDFUnit worker process
+
+Starting bin/rdfunit launches Maven and a new JVM, resolves the classpath and loads the ontologies before any data is
+validated. The worker keeps one JVM running (resources/RDFUnitWorker.java) and sends validation jobs to it over its
+stdin, so this fixed cost is only paid once per process.
+"""
+import os
+import re
+import sys
+import time
+import atexit
+import shutil
+import itertools
+import threading
+import subprocess
+from ncats_translator_dqa import config, supervisor
+
+# Time in seconds between checks of the time limits of a job
+_poll_interval = 1.0
+
+# Java version from which the Security Manager, which the worker uses to trap System.exit(), has to be allowed
+_java_security_manager_allow = 18
+
+# Factor by which the heap a job needs must exceed the heap of the running JVM before it is restarted with the larger
+# heap, so small changes of the available memory don't restart it
+_heap_restart_factor = 1.25
+
+
+class RDFUnitWorkerError(Exception):
+    """Raised when the worker can't be started or dies while running a job
+    """
+    pass
+
+
+class RDFUnitWorkerTimeoutError(RDFUnitWorkerError):
+    """Raised when a job is stopped for exceeding its time limit. The worker is killed and started again for the next
+    job
+
+    Public members:
+    timed_out - supervisor.TIMEOUT_WALL or supervisor.TIMEOUT_CPU
+    """
+
+    def __init__(self, message, timed_out):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+class RDFUnitWorker:
+    """Long-lived JVM running RDFUnit jobs sent over stdin
+    """
+    __main_class_validate = 'org.aksw.rdfunit.validate.cli.ValidateCLI'
+    __module_validate = 'rdfunit-validate'
+    __filename_classpath = 'rdfunit.classpath'
+    __filename_source = 'RDFUnitWorker.java'
+
+    def __init__(self, path_rdfunit=None, main_class=None, classpath=None, java_options=None, verbose=None):
+        """Constructor
+
+        :param path_rdfunit: Absolute path to the RDFUnit base directory. Defaults to config.path_rdfunit [optional]
+        :param main_class: Java class whose main method runs each job. Defaults to RDFUnit's ValidateCLI [optional]
+        :param classpath: Java classpath for RDFUnit. Defaults to config.rdfunit_classpath, or if that is empty, the
+         classpath is resolved once with Maven and cached [optional]
+        :param java_options: List of additional JVM options (e.g., ['-Xmx8g']). Defaults to config.rdfunit_java_options
+         [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.path_rdfunit = path_rdfunit if path_rdfunit is not None else config.path_rdfunit
+        self.main_class = main_class if main_class is not None else RDFUnitWorker.__main_class_validate
+        self.classpath = classpath if classpath is not None else config.rdfunit_classpath
+        self.java_options = java_options if java_options is not None else config.rdfunit_java_options
+        self.verbose = verbose if verbose is not None else config.verbose
+        self.__process = None
+        self.__heap_bytes = None
+        self.__start_error = None
+        self.__lock = threading.Lock()
+        self.__job_ids = itertools.count(1)
+
+    def start(self, heap_bytes=None):
+        """Starts the worker JVM and waits until it is ready to accept jobs
+
+        :param heap_bytes: Maximum JVM heap in bytes, passed as -Xmx unless java_options set it. A running JVM with a
+         smaller heap is restarted (Integer) [optional]
+        :return: None
+        """
+        with self.__lock:
+            if self.__is_alive():
+                if heap_bytes is None or self.__heap_bytes is None or \
+                        heap_bytes <= self.__heap_bytes * _heap_restart_factor:
+                    return
+                if self.verbose:
+                    print('Restarting the RDFUnit worker with a larger heap')
+                self.__stop()
+
+            # Don't retry a worker that could not be started
+            if self.__start_error is not None:
+                raise self.__start_error
+
+            try:
+                self.__start(heap_bytes)
+            except RDFUnitWorkerError as e:
+                self.__start_error = e
+                raise
+
+    def __start(self, heap_bytes):
+        """Starts the worker JVM. Must be called with the lock held
+
+        :param heap_bytes: Maximum JVM heap in bytes, or None (Integer)
+        :return: None
+        """
+        dir_worker = os.path.join(config.path_rdfunit_jobs, 'worker')
+        if not os.path.exists(dir_worker):
+            os.makedirs(dir_worker, exist_ok=True)
+
+        classpath = self.classpath
+        if len(classpath) == 0:
+            classpath = self.__resolve_classpath(dir_worker)
+        self.__compile(dir_worker, classpath)
+
+        if self.verbose:
+            print('Starting RDFUnit worker')
+
+        # Heap options set in java_options take precedence
+        java_options = list(self.java_options)
+        if not any(option.startswith('-Djava.security.manager') for option in java_options):
+            java_version = RDFUnitWorker.__java_version()
+            if java_version is not None and java_version >= _java_security_manager_allow:
+                java_options.append('-Djava.security.manager=allow')
+        self.__heap_bytes = None
+        if heap_bytes is not None and not any(option.startswith('-Xmx') for option in java_options):
+            java_options.append('-Xmx' + str(heap_bytes // 1024 ** 2) + 'm')
+            self.__heap_bytes = heap_bytes
+
+        args = ['java'] + java_options + ['-cp', classpath + os.pathsep + dir_worker, 'RDFUnitWorker',
+                                          self.main_class]
+        try:
+            self.__process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                              encoding='UTF-8', cwd=self.path_rdfunit, bufsize=1)
+        except OSError as e:
+            raise RDFUnitWorkerError('Could not start the RDFUnit worker: ' + str(e))
+
+        if self.__process.stdout.readline().strip() != 'READY':
+            self.__process.kill()
+            self.__process.wait()
+            self.__process = None
+            raise RDFUnitWorkerError('The RDFUnit worker failed to start')
+
+    def run(self, args, file_log, heap_bytes=None, timeout=None, cpu_timeout=None):
+        """Runs one job on the worker
+
+        Starts the worker if it is not running yet. A job that runs longer than timeout, or uses more than cpu_timeout
+        seconds of CPU time of the JVM, is stopped by killing the worker, which is started again for the next job.
+
+        :param args: Command line arguments for the main class, as they would be passed to bin/rdfunit (List)
+        :param file_log: Path to the file receiving the job's output (String)
+        :param heap_bytes: Maximum JVM heap the job needs in bytes, see start() (Integer) [optional]
+        :param timeout: Maximum wall-clock time of the job in seconds. None waits indefinitely [optional]
+        :param cpu_timeout: Maximum CPU time of the job in seconds. None for no limit. Only supported on Linux
+         [optional]
+        :return: Exit code of the job (Integer)
+        """
+        for arg in args + [file_log]:
+            if '\t' in arg or '\n' in arg:
+                raise ValueError('RDFUnit worker arguments can not contain tabs or newlines: ' + arg)
+
+        self.start(heap_bytes)
+
+        with self.__lock:
+            if not self.__is_alive():
+                raise RDFUnitWorkerError('The RDFUnit worker is not running')
+
+            job_id = str(next(self.__job_ids))
+            try:
+                self.__process.stdin.write('\t'.join([job_id, file_log] + args) + '\n')
+                self.__process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+            response, timed_out = self.__read_response(timeout, cpu_timeout)
+            if timed_out is not None:
+                self.__kill()
+                raise RDFUnitWorkerTimeoutError('The RDFUnit worker was stopped after exceeding the ' +
+                                                ('wall-clock' if timed_out == supervisor.TIMEOUT_WALL else 'CPU') +
+                                                ' time limit of job ' + job_id, timed_out)
+
+            fields = response.strip().split('\t')
+            if len(fields) != 2 or fields[0] != job_id:
+                self.__kill()
+                raise RDFUnitWorkerError('The RDFUnit worker died while running job ' + job_id)
+
+            return int(fields[1])
+
+    def __read_response(self, timeout, cpu_timeout):
+        """Reads the response to a job, waiting at most until the job exceeds one of its time limits
+
+        :param timeout: Maximum wall-clock time in seconds, or None
+        :param cpu_timeout: Maximum CPU time in seconds, or None
+        :return: Tuple (response line, or '' if the worker died, supervisor.TIMEOUT_WALL or TIMEOUT_CPU if the job
+         exceeded a limit or None)
+        """
+        stdout = self.__process.stdout
+        response = []
+
+        def read():
+            try:
+                response.append(stdout.readline())
+            except (OSError, ValueError):
+                response.append('')
+
+        reader = threading.Thread(target=read, name='rdfunit-worker-reader', daemon=True)
+        reader.start()
+        if timeout is None and cpu_timeout is None:
+            reader.join()
+            return response[0], None
+
+        started = time.monotonic()
+        cpu_started = self.__cpu_seconds()
+        while True:
+            reader.join(_poll_interval if timeout is None else
+                        max(min(_poll_interval, started + timeout - time.monotonic()), 0))
+            if not reader.is_alive():
+                return response[0], None
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return '', supervisor.TIMEOUT_WALL
+            if cpu_timeout is not None and cpu_started is not None:
+                cpu_seconds = self.__cpu_seconds()
+                if cpu_seconds is not None and cpu_seconds - cpu_started >= cpu_timeout:
+                    return '', supervisor.TIMEOUT_CPU
+
+    def __cpu_seconds(self):
+        """Gets the CPU time used by the worker JVM so far
+
+        :return: CPU time in seconds (Float), or None if it is not available, e.g., on other systems than Linux
+        """
+        try:
+            with open('/proc/' + str(self.__process.pid) + '/stat') as f:
+                # Fields after the process name, which may contain spaces. utime and stime are fields 14 and 15
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+
+    def stop(self):
+        """Stops the worker
+
+        :return: None
+        """
+        with self.__lock:
+            self.__stop()
+
+    def __stop(self):
+        # Implementation of stop(). Must be called with the lock held
+        if self.__process is None:
+            return
+        try:
+            self.__process.stdin.close()
+            self.__process.wait(timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            self.__kill()
+        self.__process = None
+
+    def is_alive(self):
+        """Checks whether the worker process is running
+
+        :return: True if the worker is running
+        """
+        with self.__lock:
+            return self.__is_alive()
+
+    def __is_alive(self):
+        return self.__process is not None and self.__process.poll() is None
+
+    def __kill(self):
+        if self.__process is not None:
+            self.__process.kill()
+            self.__process.wait()
+            self.__process = None
+
+    @staticmethod
+    def __java_version():
+        """Gets the major version of the Java runtime, e.g., 8 for 1.8.0 and 17 for 17.0.2
+
+        :return: Major version (Integer), or None if it can't be determined
+        """
+        try:
+            cp = subprocess.run(['java', '-version'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, encoding='UTF-8', errors='replace')
+        except OSError:
+            return None
+        match = re.search(r'version "(\d+)(?:\.(\d+))?', cp.stdout)
+        if match is None:
+            return None
+        major = int(match.group(1))
+        if major == 1 and match.group(2) is not None:
+            major = int(match.group(2))
+        return major
+
+    def __resolve_classpath(self, dir_worker):
+        """Resolves the classpath of RDFUnit's validate module with Maven, caching it in the worker folder
+
+        :param dir_worker: Folder for the worker files (String)
+        :return: Java classpath (String)
+        """
+        file_classpath = os.path.join(dir_worker, RDFUnitWorker.__filename_classpath)
+        if not os.path.exists(file_classpath):
+            if self.verbose:
+                print('Resolving the RDFUnit classpath with Maven')
+            pom = os.path.join(self.path_rdfunit, RDFUnitWorker.__module_validate, 'pom.xml')
+            try:
+                cp = subprocess.run(['mvn', '-q', '-f', pom, 'dependency:build-classpath',
+                                     '-Dmdep.outputFile=' + file_classpath],
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='UTF-8',
+                                    cwd=self.path_rdfunit)
+            except OSError as e:
+                raise RDFUnitWorkerError('Could not run Maven to resolve the RDFUnit classpath: ' + str(e))
+            if cp.returncode != 0 or not os.path.exists(file_classpath):
+                sys.stderr.write(cp.stdout)
+                raise RDFUnitWorkerError('Could not resolve the RDFUnit classpath with Maven')
+
+        with open(file_classpath) as f:
+            classpath = f.read().strip()
+
+        # Add RDFUnit's own compiled classes
+        dir_classes = os.path.join(self.path_rdfunit, RDFUnitWorker.__module_validate, 'target', 'classes')
+        return dir_classes + os.pathsep + classpath
+
+    @staticmethod
+    def __compile(dir_worker, classpath):
+        """Compiles resources/RDFUnitWorker.java into the worker folder if needed
+
+        :param dir_worker: Folder for the worker files (String)
+        :param classpath: Java classpath (String)
+        :return: None
+        """
+        file_source = os.path.join(config.resource_path, RDFUnitWorker.__filename_source)
+        file_class = os.path.join(dir_worker, 'RDFUnitWorker.class')
+        if os.path.exists(file_class) and os.path.getmtime(file_class) >= os.path.getmtime(file_source):
+            return
+
+        if shutil.which('javac') is None:
+            raise RDFUnitWorkerError('javac is needed to compile the RDFUnit worker')
+        cp = subprocess.run(['javac', '-cp', classpath, '-d', dir_worker, file_source],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='UTF-8')
+        if cp.returncode != 0:
+            sys.stderr.write(cp.stdout)
+            raise RDFUnitWorkerError('Could not compile the RDFUnit worker')
+
+
+# Worker shared by all validations in this process
+__shared_worker = None
+__shared_worker_lock = threading.Lock()
+
+
+def get_shared_worker():
+    """Gets the RDFUnit worker shared by all validations in this process
+
+    :return: RDFUnitWorker, or None if config.rdfunit_worker is False
+    """
+    global __shared_worker
+    if not config.rdfunit_worker:
+        return None
+    with __shared_worker_lock:
+        if __shared_worker is None:
+            __shared_worker = RDFUnitWorker()
+            atexit.register(__shared_worker.stop)
+        return __shared_worker
@@ -1,83 +1,146 @@
 """Wrapper for calling RDFUnit
 """
 import os
+import re
 import sys
-import subprocess
-from ncats_translator_dqa import config
+import glob
+import shutil
+import hashlib
+import tempfile
+from ncats_translator_dqa import config, profiling, rdf_input, supervisor, sysinfo
+from ncats_translator_dqa.computational_metrics.RDFUnitWorker import RDFUnitWorkerError, RDFUnitWorkerTimeoutError
+from ncats_translator_dqa.computational_metrics import schema_mirror, rdfunit_input
+
+
+class RDFUnitTimeoutError(Exception):
+    """Raised when rdfunit is stopped because it exceeded config.rdfunit_timeout or config.rdfunit_cpu_timeout
+    """
+    pass
 
 
 class RDFUnitWrapper:
     __rdfunit_output_extension = '.shaclFullTestCaseResult.ttl'
 
-    def __init__(self, path_rdfunit=config.path_rdfunit, verbose=config.verbose):
+    # Bytes at the end of the rdfunit log shown in error messages
+    __log_tail_bytes = 64 * 1024
+
+    # Share of the available memory that the JVM heap is allowed to use when it is sized automatically
+    __heap_max_share = 0.75
+
+    # Hex digits of the hash of the dataset path in the names of the output files
+    __path_hash_len = 8
+
+    def __init__(self, path_rdfunit=None, verbose=None, worker=None):
         """Constructor
 
-        :param path_rdfunit: Absolute path to the RDFUnit base directory (one folder above bin)
-        :param verbose: True if you want to print status messages
+        :param path_rdfunit: Absolute path to the RDFUnit base directory (one folder above bin). Defaults to
+         config.path_rdfunit [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        :param worker: Long-lived RDFUnitWorker to run validations on instead of starting bin/rdfunit for every
+         dataset. bin/rdfunit is used if the worker can't be started or dies [optional]
         """
+        if path_rdfunit is None:
+            path_rdfunit = config.path_rdfunit
+        if verbose is None:
+            verbose = config.verbose
         self.path_rdfunit = path_rdfunit
         self.__bin_rdfunit = os.path.join(self.path_rdfunit, 'bin/rdfunit')
         self.__bin_dqvreport = os.path.join(self.path_rdfunit, 'bin/dqv-report')
         self.verbose = verbose
+        self.worker = worker
 
-    def rdfunit(self, file_dataset, schema=''):
+    def rdfunit(self, file_dataset, schema='', sources=None):
         """Calls rdfunit on the given dataset
 
+        Each call runs rdfunit with its own private data folder so that multiple validations can run at the same time
+        without overwriting each other's results.
+
+        Schemas are read from the local mirror and the test cases generated from them are reused from the test suite
+        cache, if they are enabled (see schema_mirror.py). In offline mode, a missing schema raises
+        schema_mirror.SchemaOfflineError before rdfunit is started.
+
+        Compressed datasets are decompressed, and converted to N-Triples if needed, while they are streamed to rdfunit
+        (see rdfunit_input.py).
+
         :param file_dataset: Absolute path to the dataset file (i.e., the -d parameter to rdfunit)
         :param schema: URI to schema to perform validation against or defined schema prefix. Leave empty for automatic
          detection of ontologies by rdfunit (String) [optional]
+        :param sources: Schemas already resolved for this or a larger dataset, see schema_mirror.schema_sources().
+         Resolved from the schema argument if not given (SchemaSources) [optional]
         :return: Path of the output file generated by rdfunit
         """
+        # Local copies of the schemas
+        if sources is None:
+            sources = schema_mirror.schema_sources(file_dataset, schema)
+
         if self.verbose:
             print('Running rdfunit on ' + file_dataset)
 
-        # Run rdfunit
-        if len(schema) > 0:
-            cp = subprocess.run([self.__bin_rdfunit, '-d', file_dataset, '-s', schema, '-r', 'shacl',
-                                 '-o', 'html,turtle'],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='UTF-8', cwd=self.path_rdfunit)
-        else:
-            cp = subprocess.run([self.__bin_rdfunit, '-d', file_dataset, '-r', 'shacl', '-o', 'html,turtle'],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='UTF-8', cwd=self.path_rdfunit)
+        # Output files are named after the dataset
+        filename_dataset = rdf_input.strip_compression(os.path.split(file_dataset)[1])
+        filename_dataset = os.path.splitext(filename_dataset)[0]
+        file_rdfunit_new, file_html_new = RDFUnitWrapper.output_files(file_dataset)
+
+        # Private data folder for this run
+        dir_data = self.__make_data_folder(filename_dataset)
+        RDFUnitWrapper.__declare_schemas(dir_data, sources.declarations)
 
-        # Check the return code for errors
-        if cp.returncode != 0:
+        # Test cases generated from the same schemas by a previous run
+        test_suites = schema_mirror.get_test_suite_cache()
+        key_tests = test_suites.key(sources, self.version()) if test_suites is not None else None
+        if key_tests is not None:
+            test_suites.restore(key_tests, os.path.join(dir_data, 'tests'))
+
+        # Run rdfunit on the decompressed data
+        file_log = os.path.join(dir_data, 'rdfunit.log')
+        with rdfunit_input.prepared_input(file_dataset, verbose=self.verbose) as file_input:
+            args = ['-d', file_input, '-f', dir_data + os.sep, '-r', 'shacl', '-o', 'html,turtle']
+            if len(sources.argument) > 0:
+                args += ['-s', sources.argument]
+            n_bytes = os.path.getsize(file_input) if os.path.isfile(file_input) else \
+                rdfunit_input.prepared_size(file_dataset)
+            returncode, timed_out, log_tail = self.__run(args, file_log, file_dataset, n_bytes)
+
+        # Check for timeouts and the return code for errors. Only the end of the log is shown, the whole log is kept
+        if timed_out is not None:
+            sys.stderr.write('rdfunit was stopped after exceeding the ' +
+                             ('wall-clock' if timed_out == supervisor.TIMEOUT_WALL else 'CPU') + ' time limit on ' +
+                             file_dataset + '\n')
+            sys.stderr.write(log_tail)
+            sys.stderr.write('rdfunit log kept for diagnostics: ' + file_log + '\n')
+            raise RDFUnitTimeoutError('rdfunit timeout')
+        if returncode != 0:
             sys.stderr.write('There was an error running rdfunit\n')
-            sys.stderr.write(str(cp.args))
-            sys.stderr.write(cp.stderr)
-            sys.stderr.write(cp.stdout)
+            sys.stderr.write(str(args) + '\n')
+            sys.stderr.write(log_tail)
+            sys.stderr.write('rdfunit data folder kept for diagnostics: ' + dir_data + '\n')
             raise Exception('rdfunit error')
 
-        # Build the expected filename of the output file written by rdfunit
-        filename_dataset_sanitized = file_dataset.replace(os.sep, '_')
-        file_rdf_output = os.path.join(self.path_rdfunit, 'data', 'results',
-                                       filename_dataset_sanitized + RDFUnitWrapper.__rdfunit_output_extension)
-
-        # Check that the output file was created
-        if not os.path.exists(file_rdf_output):
-            # Try to extract the output file name from the output log (rdfunit writes output to stderr)
-            output_line = cp.stderr.split('\n')[-2]
-            file_rdf_output = output_line.split(' ')[-1]
-            file_rdf_output = file_rdf_output.replace('*', 'ttl')
-            file_rdf_output = os.path.join(self.path_rdfunit, file_rdf_output)
-
-            # Check if this output file exists
-            if not os.path.exists(file_rdf_output):
-                sys.stderr.write('Could not find the output RDF file from rdfunit\n')
-                raise FileNotFoundError(file_rdf_output)
-
-        # Move the output files from the <RDFUnit>/data/results to the configured output directory
-        filename_dataset = os.path.split(file_dataset)[1]
-        filename_dataset = os.path.splitext(filename_dataset)[0]
-        file_rdfunit_new = os.path.join(config.path_output, filename_dataset + '_computational_metrics.ttl')
-        os.rename(file_rdf_output, file_rdfunit_new)
+        # The results folder is private to this run, so it contains only this run's output file
+        dir_results = os.path.join(dir_data, 'results')
+        files_rdf_output = glob.glob(os.path.join(dir_results, '*' + RDFUnitWrapper.__rdfunit_output_extension))
+        if len(files_rdf_output) != 1:
+            sys.stderr.write('Could not find the output RDF file from rdfunit in ' + dir_results + '\n')
+            raise FileNotFoundError(os.path.join(dir_results, '*' + RDFUnitWrapper.__rdfunit_output_extension))
+        file_rdf_output = files_rdf_output[0]
+
+        # Move the output files from the private results folder to the configured output directory
+        shutil.move(file_rdf_output, file_rdfunit_new)
 
         # Move the html file also
         filename_rdf_output = os.path.split(file_rdf_output)[1]
         filename_rdf_output = os.path.splitext(filename_rdf_output)[0]
-        file_html_old = os.path.join(config.path_rdfunit, 'data', 'results', filename_rdf_output + '.html')
-        file_html_new = os.path.join(config.path_output, filename_dataset + '_computational_metrics.html')
-        os.rename(file_html_old, file_html_new)
+        file_html_old = os.path.join(dir_results, filename_rdf_output + '.html')
+        if os.path.exists(file_html_old):
+            shutil.move(file_html_old, file_html_new)
+
+        # Keep the test cases rdfunit generated for later runs
+        if key_tests is not None:
+            test_suites.store(key_tests, os.path.join(dir_data, 'tests'),
+                              os.path.join(self.path_rdfunit, 'data', 'tests'))
+
+        # Clean up the private data folder
+        shutil.rmtree(dir_data, ignore_errors=True)
 
         if self.verbose:
             print('rdfunit finished. output file: ' + file_rdfunit_new)
@@ -85,6 +148,199 @@ class RDFUnitWrapper:
         # Return the path to the rdfunit output file
         return file_rdfunit_new
 
+    @staticmethod
+    def output_files(file_dataset):
+        """Gets the paths of the output files that rdfunit() writes for the given dataset
+
+        The file names combine the name of the dataset with a hash of its full path, so datasets with the same name in
+        different folders don't overwrite each other's results.
+
+        :param file_dataset: Absolute path to the dataset file (String)
+        :return: Tuple (path to the turtle results file, path to the html results file)
+        """
+        filename_dataset = rdf_input.strip_compression(os.path.split(file_dataset)[1])
+        filename_dataset = os.path.splitext(filename_dataset)[0] + '_' + \
+            hashlib.sha256(os.path.abspath(file_dataset).encode('UTF-8')).hexdigest()[:RDFUnitWrapper.__path_hash_len]
+        file_ttl = os.path.join(config.path_output, filename_dataset + '_computational_metrics.ttl')
+        file_html = os.path.join(config.path_output, filename_dataset + '_computational_metrics.html')
+        return file_ttl, file_html
+
+    def version(self):
+        """Gets an identifier of the installed RDFUnit version
+
+        Combines the project version from RDFUnit's pom.xml with the git commit of the RDFUnit folder, if any.
+
+        :return: Version identifier (String)
+        """
+        version = ''
+
+        # Project version declared in the top-level pom.xml
+        file_pom = os.path.join(self.path_rdfunit, 'pom.xml')
+        if os.path.exists(file_pom):
+            with open(file_pom, encoding='UTF-8') as f:
+                match = re.search(r'<artifactId>rdfunit-parent</artifactId>\s*(?:<[^>]+>[^<]*</[^>]+>\s*)*?'
+                                  r'<version>([^<]+)</version>', f.read())
+            if match is not None:
+                version = match.group(1).strip()
+
+        # Git commit of a cloned repository
+        file_head = os.path.join(self.path_rdfunit, '.git', 'HEAD')
+        if os.path.exists(file_head):
+            with open(file_head) as f:
+                head = f.read().strip()
+            if head.startswith('ref: '):
+                file_ref = os.path.join(self.path_rdfunit, '.git', head[5:])
+                if os.path.exists(file_ref):
+                    with open(file_ref) as f:
+                        head = f.read().strip()
+            version += '@' + head
+
+        return version
+
+    def __run(self, args, file_log, file_dataset, n_bytes):
+        """Runs rdfunit with the given arguments, on the worker if there is one
+
+        bin/rdfunit runs under supervision: its output is streamed to the log file, which is rotated at
+        config.rdfunit_log_max_bytes, it is stopped after config.rdfunit_timeout or config.rdfunit_cpu_timeout, and its
+        JVM heap is sized for the dataset (see heap_size()). Jobs on the worker are stopped after the same time limits,
+        and the worker JVM is started with at least the heap of the dataset.
+
+        :param args: Command line arguments to rdfunit (List)
+        :param file_log: Path to the log file of this run (String)
+        :param file_dataset: Path to the dataset (String)
+        :param n_bytes: Size of the data rdfunit reads, after decompression (Integer)
+        :return: Tuple (return code, supervisor.TIMEOUT_WALL or TIMEOUT_CPU if rdfunit was stopped or None, end of the
+         log output)
+        """
+        heap = self.heap_size(file_dataset, n_bytes)
+        if self.worker is not None:
+            try:
+                with profiling.span('rdfunit.worker', dataset=file_dataset, bytes=n_bytes, heap_bytes=heap) as s:
+                    returncode = self.worker.run(args, file_log, heap, config.rdfunit_timeout,
+                                                 config.rdfunit_cpu_timeout)
+                    s.tag(returncode=returncode)
+                return returncode, None, RDFUnitWrapper.__read_tail(file_log)
+            except RDFUnitWorkerTimeoutError as e:
+                # Running bin/rdfunit on the same data would only exceed the limit again
+                return None, e.timed_out, RDFUnitWrapper.__read_tail(file_log)
+            except RDFUnitWorkerError as e:
+                sys.stderr.write(str(e) + '. Running bin/rdfunit instead\n')
+
+        # bin/rdfunit runs RDFUnit in Maven's JVM, whose options are taken from MAVEN_OPTS. Heap options that are
+        # already set there take precedence
+        env = dict(os.environ)
+        if '-Xmx' not in env.get('MAVEN_OPTS', ''):
+            env['MAVEN_OPTS'] = (env.get('MAVEN_OPTS', '') + ' -Xmx' + str(heap // 1024 ** 2) + 'm').strip()
+
+        result = supervisor.run([self.__bin_rdfunit] + args, file_log, cwd=self.path_rdfunit, env=env,
+                                timeout=config.rdfunit_timeout, cpu_timeout=config.rdfunit_cpu_timeout,
+                                max_log_bytes=config.rdfunit_log_max_bytes, log_backups=config.rdfunit_log_backups,
+                                tail_bytes=RDFUnitWrapper.__log_tail_bytes, name='rdfunit', dataset=file_dataset,
+                                bytes=n_bytes, heap_bytes=heap)
+        return result.returncode, result.timed_out, result.tail
+
+    @staticmethod
+    def heap_size(file_dataset, n_bytes=None):
+        """Gets the maximum JVM heap size for validating a dataset
+
+        Uses config.rdfunit_heap if it is set. Otherwise the heap is config.rdfunit_heap_per_byte times the size of the
+        dataset, at least config.rdfunit_heap_min, and at most 75% of the available memory divided by the number of
+        validations that run at the same time (see sysinfo.concurrency()).
+
+        :param file_dataset: Path to the dataset file (String)
+        :param n_bytes: Size of the dataset after decompression. Estimated for compressed datasets if not given
+         (Integer) [optional]
+        :return: Heap size in bytes (Integer)
+        """
+        if config.rdfunit_heap > 0:
+            return int(config.rdfunit_heap)
+
+        if n_bytes is None:
+            n_bytes = rdfunit_input.prepared_size(file_dataset)
+        heap = max(int(n_bytes * config.rdfunit_heap_per_byte), config.rdfunit_heap_min)
+        memory = sysinfo.available_memory()
+        if memory is not None:
+            # Validations running at the same time share the memory
+            memory_share = memory * RDFUnitWrapper.__heap_max_share / sysinfo.concurrency()
+            heap = min(heap, max(int(memory_share), config.rdfunit_heap_min))
+        return heap
+
+    @staticmethod
+    def __read_tail(file_log):
+        """Reads the end of a log file
+
+        :param file_log: Path to the log file (String)
+        :return: End of the log (String), or '' if there is no log file
+        """
+        if not os.path.exists(file_log):
+            return ''
+        with open(file_log, 'rb') as f:
+            f.seek(max(os.path.getsize(file_log) - RDFUnitWrapper.__log_tail_bytes, 0))
+            return f.read().decode('UTF-8', errors='replace')
+
+    def __make_data_folder(self, name):
+        """Creates a private rdfunit data folder
+
+        The folder mirrors <RDFUnit>/data: shared files are linked, the test case folder is copied so that rdfunit can
+        update its test cache, and the results folder is empty.
+
+        :param name: Name used as the prefix of the folder name (String)
+        :return: Path to the new data folder (String)
+        """
+        if not os.path.exists(config.path_rdfunit_jobs):
+            os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+        dir_data = tempfile.mkdtemp(prefix=name + '_', dir=config.path_rdfunit_jobs)
+
+        dir_data_shared = os.path.join(self.path_rdfunit, 'data')
+        if os.path.isdir(dir_data_shared):
+            for entry in os.listdir(dir_data_shared):
+                path_shared = os.path.join(dir_data_shared, entry)
+                path_private = os.path.join(dir_data, entry)
+                if entry == 'results':
+                    continue
+                elif entry == 'tests' and os.path.isdir(path_shared):
+                    shutil.copytree(path_shared, path_private, symlinks=True)
+                else:
+                    os.symlink(os.path.abspath(path_shared), path_private)
+
+        os.mkdir(os.path.join(dir_data, 'results'))
+        return dir_data
+
+    @staticmethod
+    def __declare_schemas(dir_data, declarations):
+        """Adds schemas to the schemaDecl.csv file of a private rdfunit data folder
+
+        rdfunit reads a schema prefix, its namespace and the location of the schema from each line of schemaDecl.csv.
+        The declarations of the shared file are kept.
+
+        :param dir_data: Path to the private data folder (String)
+        :param declarations: List of tuples (prefix, namespace IRI, path to the local copy of the schema)
+        :return: None
+        """
+        if len(declarations) == 0:
+            return
+
+        file_decl = os.path.join(dir_data, 'schemaDecl.csv')
+        lines = []
+        if os.path.exists(file_decl):
+            with open(file_decl, encoding='UTF-8') as f:
+                lines = [line.rstrip('\n') for line in f]
+            # Replace the link to the shared file instead of writing through it
+            os.remove(file_decl)
+        lines += [prefix + ',' + iri + ',file://' + os.path.abspath(file_schema)
+                  for prefix, iri, file_schema in declarations]
+        with open(file_decl, 'w', encoding='UTF-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    @staticmethod
+    def dqv_report_file(file_rdf_output):
+        """Gets the path of the report written by dqv_report() for an rdfunit output file
+
+        :param file_rdf_output: The output file from rdfunit (String)
+        :return: Path to the dqv report in config.path_output (String)
+        """
+        return os.path.join(config.path_output, os.path.split(file_rdf_output)[1] + '.dqv_report.ttl')
+
     def dqv_report(self, file_rdf_output):
         """Calls dqv-report on the given file
 
@@ -94,31 +350,38 @@ class RDFUnitWrapper:
         if self.verbose:
             print('Running dqv-report on ' + file_rdf_output)
 
-        # Generate an output filename for the dqv report
+        # Generate an output filename for the dqv report, in a folder private to this run
         filename_dqv_report = os.path.split(file_rdf_output)[1] + '.dqv_report.ttl'
-        file_dqv_report_rel = os.path.join('data/results', filename_dqv_report)
+        if not os.path.exists(config.path_rdfunit_jobs):
+            os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+        dir_run = tempfile.mkdtemp(prefix=filename_dqv_report + '_', dir=config.path_rdfunit_jobs)
+        file_dqv_report = os.path.join(os.path.abspath(dir_run), filename_dqv_report)
 
         # Run dqv-report
-        cp = subprocess.run([self.__bin_dqvreport, '-i', file_rdf_output, '-o', file_dqv_report_rel],
-                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='UTF-8', cwd=self.path_rdfunit)
+        args = [self.__bin_dqvreport, '-i', file_rdf_output, '-o', file_dqv_report]
+        file_log = os.path.join(dir_run, filename_dqv_report + '.log')
+        result = supervisor.run(args, file_log, cwd=self.path_rdfunit, timeout=config.rdfunit_timeout,
+                                cpu_timeout=config.rdfunit_cpu_timeout, max_log_bytes=config.rdfunit_log_max_bytes,
+                                log_backups=config.rdfunit_log_backups, tail_bytes=RDFUnitWrapper.__log_tail_bytes,
+                                name='dqv_report', file=file_rdf_output)
 
         # Check the return code for errors
-        if cp.returncode != 0:
+        if result.returncode != 0:
             sys.stderr.write('There was an error running dqv-report\n')
-            sys.stderr.write(str(cp.args) + '\n')
-            sys.stderr.write(cp.stderr)
-            sys.stderr.write(cp.stdout)
+            sys.stderr.write(str(args) + '\n')
+            sys.stderr.write(result.tail)
+            sys.stderr.write('dqv-report log: ' + file_log + '\n')
             raise Exception('dqv-report error')
 
         # Check that the dqv report file was created
-        file_dqv_report = os.path.join(self.path_rdfunit, file_dqv_report_rel)
         if not os.path.exists(file_dqv_report):
             sys.stderr.write('Could not find the dqv-report generated file: ' + file_dqv_report + '\n')
             raise FileNotFoundError(file_dqv_report)
 
-        # Move the output file from the <RDFUnit>/data/results to the configured output directory
-        file_dqv_new = os.path.join(config.path_output, filename_dqv_report)
-        os.rename(file_dqv_report, file_dqv_new)
+        # Move the output file from the private folder to the configured output directory
+        file_dqv_new = RDFUnitWrapper.dqv_report_file(file_rdf_output)
+        shutil.move(file_dqv_report, file_dqv_new)
+        shutil.rmtree(dir_run, ignore_errors=True)
 
         if self.verbose:
             print('dqv-report finished. output file: ' + file_dqv_new)
@@ -2,40 +2,240 @@
 """
 
 import os
-from ncats_translator_dqa import config
+import requests
+from ncats_translator_dqa import config, profiling
 from ncats_translator_dqa.computational_metrics.GraphDBWrapper import GraphDBWrapper
 from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.computational_metrics.RDFUnitWorker import get_shared_worker
+from ncats_translator_dqa.computational_metrics.result_cache import ResultCache
+from ncats_translator_dqa.computational_metrics.lite_validator import LiteValidator
+from ncats_translator_dqa.computational_metrics import sharding, sampling, schema_mirror, delta
 
+# Validation engines
+ENGINE_RDFUNIT = 'rdfunit'
+ENGINE_LITE = 'lite'
+ENGINES = [ENGINE_RDFUNIT, ENGINE_LITE]
 
-def computational_metrics(file_dataset, schema=''):
+# Base IRI of the named graphs holding each dataset's results in the shared GraphDB repository
+GRAPH_BASE = 'urn:ncats-translator-dqa:computational-metrics:'
+
+
+def computational_metrics(file_dataset, schema='', engine=None, file_previous=None):
     """Computes computational metrics for linked open datasets.
 
     Runs RDFUnit on datasets and generates reports in W3C Data Quality Vocabulary (DQV). Creates a new GraphDB
-    repository and imports results for visualization.
+    repository and imports results for visualization. If config.graphdb_repo is set, results are instead loaded into
+    that repository, in a named graph for each dataset (see dataset_graph()).
+
+    With the 'lite' engine, the dataset is checked by the pure-Python LiteValidator instead of RDFUnit. It streams the
+    data once and reports counts of malformed IRIs, ill-typed literals, blank node usage, duplicate triples and
+    undeclared prefixes in DQV. It does not need Java, and the schema is not used.
+
+    Datasets larger than config.shard_bytes are split into shards of subjects that are validated in parallel, and the
+    results of the shards are merged (see sharding.py). No HTML report is written for sharded datasets.
+
+    Given the previous version of the dataset, whose results are in the result cache, only the triples that changed
+    since then are validated, and the results of the previous version are updated (see delta.py).
+
+    With config.sample_fraction set, only a random sample of the subjects is validated, and the results are
+    extrapolated to the whole dataset with confidence intervals and written in DQV, marked as estimated (see
+    sampling.py).
+
+    Schemas are read from a local mirror, and the test cases rdfunit generates from them are cached and reused (see
+    schema_mirror.py).
+
+    With config.normalize_input set, rdfunit validates a normalized copy of the dataset without duplicate triples (see
+    normalization.py).
+
+    Results are cached by the content of the dataset, the schema and the RDFUnit version (see config.path_result_cache).
+    On a cache hit, rdfunit is not run, and the GraphDB repository is kept if it exists.
 
     Please update config.py prior to using this function.
 
-    Note: the function starts the data import on GraphDB, but does not wait for the import to finish. GraphDB may take some
-    time to finish importing and generating diagrams depending on the size of the data.
+    Results are streamed to GraphDB (see config.graphdb_upload) and the function returns once they are loaded. GraphDB
+    may take some more time to generate diagrams depending on the size of the data.
 
     :param file_dataset: Absolute path to dataset
     :param schema: URI to schema to perform validation against or defined schema prefix. Leave empty for automatic
      detection of ontologies by rdfunit (String) [optional]
+    :param engine: Validation engine, 'rdfunit' or 'lite'. Defaults to config.computational_metrics_engine [optional]
+    :param file_previous: Path to the previous version of the dataset, for validating only what changed [optional]
+    :return: None
+    """
+    file_output, cache_hit = validate(file_dataset, schema, engine, file_previous)
+    upload_results(file_dataset, file_output, cache_hit)
+
+
+def validate(file_dataset, schema='', engine=None, file_previous=None):
+    """Validates a dataset and writes the results, without uploading them to GraphDB
+
+    See computational_metrics() for the engines, sharding, delta validation and the result cache.
+
+    :param file_dataset: Absolute path to dataset
+    :param schema: URI to schema to perform validation against or defined schema prefix. Leave empty for automatic
+     detection of ontologies by rdfunit (String) [optional]
+    :param engine: Validation engine, 'rdfunit' or 'lite'. Defaults to config.computational_metrics_engine [optional]
+    :param file_previous: Path to the previous version of the dataset, for validating only what changed [optional]
+    :return: Tuple (path to the turtle results file, True if the results were restored from the result cache)
+    """
+    if engine is None:
+        engine = config.computational_metrics_engine
+    if engine not in ENGINES:
+        raise ValueError('Unknown computational metrics engine: ' + engine)
+
+    with profiling.span('validate', dataset=file_dataset, engine=engine, bytes=os.path.getsize(file_dataset)) as s:
+        file_output, cache_hit = __validate(file_dataset, schema, engine, file_previous, s)
+    return file_output, cache_hit
+
+
+def __validate(file_dataset, schema, engine, file_previous, s):
+    # Implementation of validate(). Tags the profiling span s with the cache status, shards and triples
+    sources = None
+    if engine == ENGINE_LITE:
+        engine_version = 'lite-' + LiteValidator.version
+    else:
+        # RDFUnitWrapper object for running rdfunit and dqv-report. Validations run on a long-lived worker if enabled
+        rdfunit = RDFUnitWrapper(worker=get_shared_worker())
+        engine_version = rdfunit.version()
+
+        # Results depend on the schemas resolved for this dataset and the content of their mirrored copies. The shards,
+        # sample or changes of the dataset are validated against the same schemas
+        sources = schema_mirror.schema_sources(file_dataset, schema)
+        if len(sources.declarations) > 0:
+            engine_version += '/schemas=' + sources.key[:16]
+
+        # rdfunit validates only the distinct triples of normalized datasets
+        if config.normalize_input:
+            engine_version += '/normalized'
+
+    # In sampling mode only a sample of the subjects is validated (see config.sample_fraction). Otherwise large
+    # datasets are validated in shards (see config.shard_bytes)
+    sample = config.sample_fraction > 0
+    n_shards = sharding.n_shards(file_dataset) if not sample else 1
+    engine_base = engine_version
+    if sample:
+        engine_version += '/sample=' + str(config.sample_fraction) + ',' + str(config.sample_seed) + ',' + \
+                          str(config.sample_confidence)
+    elif n_shards > 1:
+        engine_version += '/shards=' + str(n_shards)
+
+    # Reuse the results of a previous run on the same data, schema and engine version
+    result_cache = None
+    cache_hit = False
+    files_output = list(RDFUnitWrapper.output_files(file_dataset))
+    if len(config.path_result_cache) > 0:
+        result_cache = ResultCache()
+        cache_key = result_cache.key(file_dataset, schema, engine_version)
+        cache_hit = result_cache.restore(cache_key, files_output)
+
+    # Results of the previous version of the dataset, for validating only what changed
+    file_previous_results = None
+    if not cache_hit and not sample and file_previous is not None:
+        file_previous_results = __previous_results(file_previous, schema, engine_base, result_cache, files_output[0])
+
+    s.tag(cache_hit=cache_hit, shards=n_shards, sample=sample, delta=file_previous_results is not None)
+    if cache_hit:
+        file_rdfunit_output = files_output[0]
+    elif file_previous_results is not None:
+        # Validate the changes and update the results of the previous version
+        file_rdfunit_output = files_output[0]
+        if os.path.exists(files_output[1]):
+            os.remove(files_output[1])
+        try:
+            info = delta.delta_validation(file_previous, file_dataset, file_previous_results, file_rdfunit_output,
+                                          schema, engine, sources)
+        finally:
+            os.remove(file_previous_results)
+        s.tag(triples=info.added + info.removed)
+    elif sample:
+        # Validate a sample and extrapolate the results
+        file_rdfunit_output = files_output[0]
+        if os.path.exists(files_output[1]):
+            os.remove(files_output[1])
+        info, _ = sampling.sampled_validation(file_dataset, file_rdfunit_output, schema, engine,
+                                                      sources=sources)
+        s.tag(triples=info.triples)
+    elif n_shards > 1:
+        # Validate shards in parallel and merge their results
+        file_rdfunit_output = sharding.sharded_validation(file_dataset, files_output[0], schema, engine, n_shards,
+                                                           sources=sources)
+    elif engine == ENGINE_LITE:
+        # Run the lite validator on data
+        file_rdfunit_output = files_output[0]
+        result = LiteValidator().lite_validation(file_dataset, file_rdfunit_output)
+        s.tag(triples=result.triples)
+    else:
+        # Run rdfunit on data
+        file_rdfunit_output = rdfunit.rdfunit(file_dataset, schema, sources)
+
+    if not cache_hit and result_cache is not None:
+        result_cache.store(cache_key, files_output)
+
+    return file_rdfunit_output, cache_hit
+
+
+def __previous_results(file_previous, schema, engine_base, result_cache, file_output):
+    """Restores the results of the previous version of a dataset from the result cache
+
+    :param file_previous: Path to the previous version of the dataset (String)
+    :param schema: Schema argument of the validation (String)
+    :param engine_base: Engine version identifier, without the sharding (String)
+    :param result_cache: ResultCache, or None if the cache is disabled
+    :param file_output: Path to the results file of the new version (String)
+    :return: Path to the restored results (String), or None if they are not in the cache
+    """
+    if result_cache is not None and os.path.exists(file_previous):
+        n_shards = sharding.n_shards(file_previous)
+        engine_version = engine_base + ('/shards=' + str(n_shards) if n_shards > 1 else '')
+        file_previous_results = file_output + '.previous'
+        if result_cache.restore(result_cache.key(file_previous, schema, engine_version), [file_previous_results]):
+            return file_previous_results
+
+    if config.verbose:
+        print('No results of the previous version ' + file_previous + ' in the result cache. Validating the whole '
+              'dataset')
+    return None
+
+
+def upload_results(file_dataset, file_rdfunit_output, cache_hit=False, file_dqv_report=None):
+    """Uploads the results of a dataset to GraphDB and waits until they are loaded
+
+    :param file_dataset: Absolute path to dataset
+    :param file_rdfunit_output: Path to the turtle results file (String)
+    :param cache_hit: True if the results were restored from the result cache. Results already in GraphDB are then
+     kept [optional]
+    :param file_dqv_report: Path to the DQV report of the results (see RDFUnitWrapper.dqv_report()), loaded together
+     with the results [optional]
     :return: None
     """
-    # RDFUnitWrapper object for running rdfunit and dqv-report
-    rdfunit = RDFUnitWrapper()
+    n_bytes = os.path.getsize(file_rdfunit_output)
+    if file_dqv_report is not None:
+        n_bytes += os.path.getsize(file_dqv_report)
+    with profiling.span('upload', dataset=file_dataset, bytes=n_bytes, cache_hit=cache_hit):
+        __upload_results(file_dataset, file_rdfunit_output, cache_hit, file_dqv_report)
 
-    # Run rdfunit on data
-    file_rdfunit_output = rdfunit.rdfunit(file_dataset, schema)
+
+def __upload_results(file_dataset, file_rdfunit_output, cache_hit, file_dqv_report):
+    # Implementation of upload_results()
 
     # GraphDB object for interacting with GraphDB REST API
     graphdb = GraphDBWrapper(config.url_graphdb, config.verbose)
 
-    # Use the dataset name as the GraphDB repository ID
+    # Load results into a named graph of the shared repository if one is configured
     filename_dataset = os.path.split(file_dataset)[1]
+    if len(config.graphdb_repo) > 0:
+        __load_shared_repo(graphdb, filename_dataset, file_rdfunit_output, cache_hit, file_dqv_report)
+        return
+
+    # Use the dataset name as the GraphDB repository ID
     repo_id = GraphDBWrapper.sanitize_repo_id(filename_dataset)
 
+    # Results from the cache are already in GraphDB if their repository exists
+    if cache_hit and graphdb.repo_exists(repo_id):
+        if config.verbose:
+            print('GraphDB: keeping existing repository ' + repo_id)
+        return
+
     # Delete any existing repository with the same repository ID
     graphdb.delete_repo(repo_id)
 
@@ -43,6 +243,58 @@ def computational_metrics(file_dataset, schema=''):
     repo_title = filename_dataset + ' - Data Quality Computational Metrics'
     graphdb.create_repo(repo_id, repo_title)
 
-    # Upload results to repository
-    url_output = 'file://' + file_rdfunit_output
-    graphdb.upload_data_url(repo_id, url_output)
+    # Upload results and the DQV report to repository and wait until they are loaded
+    for file_output in [file_rdfunit_output] + ([file_dqv_report] if file_dqv_report is not None else []):
+        if config.graphdb_upload == 'url':
+            url_output = 'file://' + file_output
+            graphdb.upload_data_url(repo_id, url_output, wait=True, timeout=config.graphdb_import_timeout)
+        else:
+            graphdb.upload_data_file(repo_id, file_output, compress=config.graphdb_gzip,
+                                     timeout=config.graphdb_import_timeout)
+
+
+def dataset_graph(filename_dataset):
+    """Gets the IRI of the named graph holding a dataset's results in the shared GraphDB repository
+
+    :param filename_dataset: File name of the dataset (String)
+    :return: Graph IRI (String)
+    """
+    return GRAPH_BASE + GraphDBWrapper.sanitize_repo_id(filename_dataset)
+
+
+def __load_shared_repo(graphdb, filename_dataset, file_output, cache_hit, file_dqv_report):
+    """Loads a dataset's results into its named graph of the shared repository (config.graphdb_repo)
+
+    The repository is created if it doesn't exist yet. The graph is replaced in one transaction, so the results of
+    other datasets are not touched. The DQV report is added to the same graph.
+
+    :param graphdb: GraphDBWrapper
+    :param filename_dataset: File name of the dataset (String)
+    :param file_output: Path to the results file (String)
+    :param cache_hit: True if the results were restored from the result cache
+    :param file_dqv_report: Path to the DQV report, or None
+    :return: None
+    """
+    repo_id = GraphDBWrapper.sanitize_repo_id(config.graphdb_repo)
+    graph = dataset_graph(filename_dataset)
+
+    if not graphdb.repo_exists(repo_id):
+        try:
+            graphdb.create_repo(repo_id, 'NCATS Translator DQA - Data Quality Computational Metrics')
+        except requests.HTTPError:
+            # Another worker may have created the repository in the meantime
+            if not graphdb.repo_exists(repo_id):
+                raise
+
+    # Results from the cache are already in GraphDB if their graph is not empty
+    if cache_hit and graphdb.size(repo_id, graph) > 0:
+        if config.verbose:
+            print('GraphDB: keeping existing graph ' + graph)
+        return
+
+    graphdb.replace_graph(repo_id, graph, file_output, compress=config.graphdb_gzip,
+                          timeout=config.graphdb_import_timeout)
+    if file_dqv_report is not None:
+        graphdb.upload_data_file(repo_id, file_dqv_report, compress=config.graphdb_gzip,
+                                 timeout=config.graphdb_import_timeout, graph=graph)
+
@@ -0,0 +1,381 @@
+"""Incremental validation of a new version of a dataset from the results of its previous version
+
+Both versions are converted to sorted N-Triples with an external merge sort (see external_sort.py), so neither is held
+in memory, and the sorted files are compared in one pass to find the added and removed triples. Only what changed is
+validated:
+
+- With RDFUnit, the subjects with added or removed triples and the subjects linking to them are validated again,
+  together with the triples of the resources they link to, so tests that follow links see the same data as in a full
+  run. Results of the previous version on these subjects are replaced by the new results, and all other results are
+  kept.
+- With the lite engine, the counts of the previous version are updated with the counts of the removed and added
+  triples. The triple count, duplicates and syntax problems are counted exactly while sorting the new version.
+
+Validation time scales with the size of the change instead of the size of the dataset. Sorting and comparing the
+versions still reads both files, but only sequentially. Results of tests on blank nodes are matched by their labels,
+which are only stable between versions in N-Triples files.
+"""
+import os
+import shutil
+import tempfile
+import itertools
+from rdflib import Namespace
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.computational_metrics.external_sort import external_sort
+from ncats_translator_dqa.computational_metrics.RDFUnitWorker import get_shared_worker
+from ncats_translator_dqa.computational_metrics.lite_validator import LiteValidator, LiteValidationResult
+from ncats_translator_dqa.computational_metrics.sharding import merge_rdfunit_results, RUT
+from ncats_translator_dqa.results_store import read_results_file
+
+SH = Namespace('http://www.w3.org/ns/shacl#')
+
+# Terms of the results, as written by rdf_stream
+_focus_node = '<' + str(SH.focusNode) + '>'
+_total_individual_errors = '<' + str(RUT.totalIndividualErrors) + '>'
+_xsd_integer = rdf_stream.XSD + 'integer'
+
+# Number of bytes buffered by each file written
+__write_buffer = 1024 * 1024
+
+# Lite counts that are updated from the removed and added triples, and their metrics. The others are counted on the
+# new version
+__per_triple_counts = {'malformed_iris': 'malformedIRIsMetric', 'ill_typed_literals': 'illTypedLiteralsMetric',
+                       'blank_node_triples': 'blankNodeUsageMetric'}
+
+
+class DeltaInfo:
+    """Changes between two versions of a dataset
+
+    Public members:
+    triples - Number of triples in the new version
+    added - Number of triples added
+    removed - Number of triples removed
+    changed_subjects - Number of subjects with added or removed triples
+    affected_subjects - Number of subjects validated again: the changed subjects and the subjects linking to them
+    duplicate_triples - Number of duplicate triples in the new version
+    undeclared_prefixes - Number of prefixed names with an undeclared prefix in the new version
+    syntax_errors - Number of statements of the new version that could not be parsed
+    """
+
+    def __init__(self):
+        self.triples = 0
+        self.added = 0
+        self.removed = 0
+        self.changed_subjects = 0
+        self.affected_subjects = 0
+        self.duplicate_triples = 0
+        self.undeclared_prefixes = 0
+        self.syntax_errors = 0
+
+
+def diff_sorted(file_old, file_new, file_removed, file_added):
+    """Compares two sorted N-Triples files as multisets of statements
+
+    A statement that occurs more often in the new file than in the old one is added as many times as it occurs more
+    often, and the other way around.
+
+    :param file_old: Path to the sorted statements of the old version (String)
+    :param file_new: Path to the sorted statements of the new version (String)
+    :param file_removed: Path to write the removed statements to (String)
+    :param file_added: Path to write the added statements to (String)
+    :return: Tuple (number of removed statements, number of added statements, set of the subjects of the removed and
+     added statements)
+    """
+    n_removed = 0
+    n_added = 0
+    subjects = set()
+    with open(file_old, encoding='UTF-8', buffering=__write_buffer) as old, \
+            open(file_new, encoding='UTF-8', buffering=__write_buffer) as new, \
+            open(file_removed, 'w', encoding='UTF-8', buffering=__write_buffer) as removed, \
+            open(file_added, 'w', encoding='UTF-8', buffering=__write_buffer) as added:
+        line_old = old.readline()
+        line_new = new.readline()
+        while len(line_old) > 0 or len(line_new) > 0:
+            if len(line_new) == 0 or (len(line_old) > 0 and line_old < line_new):
+                removed.write(line_old)
+                n_removed += 1
+                subjects.add(split_statement(line_old)[0])
+                line_old = old.readline()
+            elif len(line_old) == 0 or line_new < line_old:
+                added.write(line_new)
+                n_added += 1
+                subjects.add(split_statement(line_new)[0])
+                line_new = new.readline()
+            else:
+                line_old = old.readline()
+                line_new = new.readline()
+    return n_removed, n_added, subjects
+
+
+def split_statement(line):
+    """Splits an N-Triples statement written by rdf_stream.ntriple() into its terms
+
+    :param line: Statement, with or without its trailing newline (String)
+    :return: Tuple (subject, predicate, object) of N-Triples terms
+    """
+    # IRIs can't contain '>', and blank node labels and predicates can't contain spaces
+    end_s = line.index('>') + 1 if line[0] == '<' else line.index(' ')
+    end_p = line.index('>', end_s) + 1
+    return line[:end_s], line[end_s + 1:end_p], line.rstrip('\n')[end_p + 1:-2]
+
+
+def __subject_groups(file_sorted):
+    # Iterates over the triples of a sorted N-Triples file grouped by subject: tuples (subject, list of statements)
+    with open(file_sorted, encoding='UTF-8', buffering=__write_buffer) as f:
+        for subject, lines in itertools.groupby(f, key=lambda line: split_statement(line)[0]):
+            yield subject, list(lines)
+
+
+def affected_subjects(file_sorted, changed):
+    """Finds the subjects to validate again: the changed subjects and the subjects linking to them
+
+    :param file_sorted: Path to the sorted statements of the new version (String)
+    :param changed: Set of subjects with added or removed triples (N-Triples terms)
+    :return: Set of subjects (N-Triples terms)
+    """
+    affected = set(changed)
+    if len(changed) == 0:
+        return affected
+    for subject, lines in __subject_groups(file_sorted):
+        if subject not in affected and any(split_statement(line)[2] in changed for line in lines):
+            affected.add(subject)
+    return affected
+
+
+def extract_subjects(file_sorted, subjects, file_output):
+    """Writes the triples of the given subjects and of the resources they link to
+
+    The triples of the linked resources are included so that tests that follow links (e.g., the type of an object)
+    see the same data as in the whole dataset.
+
+    :param file_sorted: Path to the sorted statements of the new version (String)
+    :param subjects: Set of subjects (N-Triples terms)
+    :param file_output: Path to the N-Triples file to write (String)
+    :return: Number of triples written (Integer)
+    """
+    n_triples = 0
+    linked = set()
+    with open(file_output, 'w', encoding='UTF-8', buffering=__write_buffer) as f:
+        for subject, lines in __subject_groups(file_sorted):
+            if subject in subjects:
+                f.writelines(lines)
+                n_triples += len(lines)
+                for line in lines:
+                    o = split_statement(line)[2]
+                    if o[0] in '<_' and o not in subjects:
+                        linked.add(o)
+
+        # Triples of the linked resources, in a second pass since they are only known now
+        if len(linked) > 0:
+            for subject, lines in __subject_groups(file_sorted):
+                if subject in linked:
+                    f.writelines(lines)
+                    n_triples += len(lines)
+    return n_triples
+
+
+def delta_validation(file_previous, file_dataset, file_previous_results, file_output, schema='', engine='rdfunit',
+                     sources=None):
+    """Validates a new version of a dataset from the results of its previous version
+
+    :param file_previous: Path to the previous version of the dataset (String)
+    :param file_dataset: Absolute path to the new version of the dataset (String)
+    :param file_previous_results: Path to the results of the previous version, written by the same engine (String)
+    :param file_output: Path to the results file to write (String)
+    :param schema: Schema argument for rdfunit (String) [optional]
+    :param engine: Validation engine, 'rdfunit' or 'lite' [optional]
+    :param sources: Schemas resolved for the new version, used for the changes (SchemaSources) [optional]
+    :return: DeltaInfo
+    """
+    if not os.path.exists(config.path_rdfunit_jobs):
+        os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+    name = os.path.splitext(os.path.split(file_dataset)[1])[0]
+    dir_delta = tempfile.mkdtemp(prefix=name + '_delta_', dir=config.path_rdfunit_jobs)
+    info = DeltaInfo()
+
+    def on_issue(kind, detail, line_number):
+        if kind == rdf_stream.ISSUE_UNDECLARED_PREFIX:
+            info.undeclared_prefixes += 1
+        elif kind == rdf_stream.ISSUE_SYNTAX_ERROR:
+            info.syntax_errors += 1
+
+    try:
+        # Sort both versions and compare them
+        file_old_sorted = os.path.join(dir_delta, 'previous.sorted.nt')
+        file_new_sorted = os.path.join(dir_delta, 'new.sorted.nt')
+        with profiling.span('delta.sort', dataset=file_dataset,
+                            bytes=os.path.getsize(file_previous) + os.path.getsize(file_dataset)):
+            external_sort(file_previous, file_old_sorted, dir_delta)
+            info.triples = external_sort(file_dataset, file_new_sorted, dir_delta, on_issue=on_issue)
+
+        file_removed = os.path.join(dir_delta, 'removed.nt')
+        file_added = os.path.join(dir_delta, 'added.nt')
+        with profiling.span('delta.diff', dataset=file_dataset) as s:
+            info.removed, info.added, changed = diff_sorted(file_old_sorted, file_new_sorted, file_removed,
+                                                            file_added)
+            info.changed_subjects = len(changed)
+            info.duplicate_triples = __count_duplicates(file_new_sorted)
+            s.tag(triples=info.added + info.removed)
+        os.remove(file_old_sorted)
+
+        if config.verbose:
+            print('Delta of ' + file_dataset + ': ' + str(info.added) + ' triples added, ' + str(info.removed) +
+                  ' removed, ' + str(info.changed_subjects) + ' subjects changed')
+
+        with profiling.span('delta.validate', dataset=file_dataset, engine=engine) as s:
+            if engine == 'lite':
+                __delta_lite(file_dataset, file_previous_results, file_removed, file_added, file_output, info)
+            else:
+                affected = affected_subjects(file_new_sorted, changed)
+                info.affected_subjects = len(affected)
+                file_delta = os.path.join(dir_delta, name + '.delta.nt')
+                s.tag(triples=extract_subjects(file_new_sorted, affected, file_delta))
+                __delta_rdfunit(file_previous, file_dataset, file_previous_results, file_delta, affected, file_output,
+                                schema, sources, dir_delta)
+    finally:
+        shutil.rmtree(dir_delta, ignore_errors=True)
+
+    if config.verbose:
+        print('Delta validation finished. output file: ' + file_output)
+
+    return info
+
+
+def __count_duplicates(file_sorted):
+    # Counts the statements of a sorted file that are equal to the statement before them
+    n_duplicates = 0
+    with open(file_sorted, encoding='UTF-8', buffering=__write_buffer) as f:
+        line_last = None
+        for line in f:
+            if line == line_last:
+                n_duplicates += 1
+            line_last = line
+    return n_duplicates
+
+
+def __delta_lite(file_dataset, file_previous_results, file_removed, file_added, file_output, info):
+    """Updates the lite validation results of the previous version with the removed and added triples
+
+    :param file_dataset: Path to the new version of the dataset (String)
+    :param file_previous_results: Path to the lite results of the previous version (String)
+    :param file_removed: Path to the removed triples (String)
+    :param file_added: Path to the added triples (String)
+    :param file_output: Path to the results file to write (String)
+    :param info: DeltaInfo
+    :return: None
+    """
+    validator = LiteValidator(verbose=False)
+    removed = validator.validate(file_removed)
+    added = validator.validate(file_added)
+
+    # Previous values of the metrics, by metric name
+    previous = {}
+    for metric, value, _ in read_results_file(file_previous_results)[1]:
+        previous[metric.rsplit('#', 1)[-1].rsplit('/', 1)[-1]] = int(value)
+
+    result = LiteValidationResult()
+    for attribute, metric in __per_triple_counts.items():
+        if metric not in previous:
+            raise ValueError('The previous results have no value for ' + metric + ': ' + file_previous_results)
+        setattr(result, attribute, previous[metric] - getattr(removed, attribute) + getattr(added, attribute))
+    result.triples = info.triples
+    result.duplicate_triples = info.duplicate_triples
+    result.undeclared_prefixes = info.undeclared_prefixes
+    result.syntax_errors = info.syntax_errors
+    LiteValidator(verbose=False).write_dqv(file_dataset, result, file_output)
+
+
+def __delta_rdfunit(file_previous, file_dataset, file_previous_results, file_delta, affected, file_output, schema,
+                    sources, dir_delta):
+    """Validates the affected subjects with rdfunit and merges their results with the other results of the previous
+    version
+
+    :param file_previous: Path to the previous version of the dataset (String)
+    :param file_dataset: Path to the new version of the dataset (String)
+    :param file_previous_results: Path to the rdfunit results of the previous version (String)
+    :param file_delta: Path to the triples of the affected subjects and the resources they link to (String)
+    :param affected: Set of affected subjects (N-Triples terms)
+    :param file_output: Path to the results file to write (String)
+    :param schema: Schema argument for rdfunit (String)
+    :param sources: Schemas resolved for the new version, or None (SchemaSources)
+    :param dir_delta: Folder for intermediate files (String)
+    :return: None
+    """
+    # Results of the previous version on subjects that are not affected
+    files_results = [os.path.join(dir_delta, 'previous_results.nt')]
+    __filter_results(file_previous_results, lambda focus: focus not in affected, files_results[0])
+
+    # Results of the affected subjects in the new version. Results on the linked resources are left out, since those
+    # are only included for context
+    if os.path.getsize(file_delta) > 0:
+        file_rdfunit_output = RDFUnitWrapper(worker=get_shared_worker()).rdfunit(file_delta, schema, sources)
+        file_delta_results = os.path.join(dir_delta, 'delta_results.nt')
+        shutil.move(file_rdfunit_output, os.path.join(dir_delta, 'delta_results_all.ttl'))
+        file_html = RDFUnitWrapper.output_files(file_delta)[1]
+        if os.path.exists(file_html):
+            os.remove(file_html)
+        __filter_results(os.path.join(dir_delta, 'delta_results_all.ttl'), lambda focus: focus in affected,
+                         file_delta_results)
+        files_results.append(file_delta_results)
+
+    merge_rdfunit_results(files_results, file_output, {os.path.abspath(file_previous): file_dataset,
+                                                       file_delta: file_dataset})
+
+
+def __filter_results(file_results, keep, file_output):
+    """Writes the results of an rdfunit results file whose focus node passes a test
+
+    The results file is streamed: the results to leave out are found in one pass, and the other statements are written
+    in another, so memory use depends on the number of results left out, not on the size of the file. The individual
+    error count of the test execution is reduced by the number of results left out.
+
+    :param file_results: Path to the rdfunit results file (String)
+    :param keep: Function keep(focus node as an N-Triples term) returning True to keep a result
+    :param file_output: Path to the N-Triples file to write, which is read as Turtle by merge_rdfunit_results()
+     (String)
+    :return: None
+    """
+    dropped = set()
+    for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+        if p == _focus_node and not keep(o):
+            dropped.add(s)
+    removed = len(dropped)
+
+    # Blank nodes only the left out results refer to, e.g., property paths, one level at a time
+    nodes = dropped
+    while len(nodes) > 0:
+        nodes = __referenced_bnodes(file_results, nodes, dropped)
+        dropped |= nodes
+
+    with open(file_output, 'w', encoding='UTF-8', errors='surrogatepass', buffering=__write_buffer) as f:
+        for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+            if s in dropped:
+                continue
+            if p == _total_individual_errors and removed > 0:
+                total = int(rdf_stream.parse_literal(o)[0])
+                o = rdf_stream.literal(str(max(total - removed, 0)), datatype=_xsd_integer)
+            f.write(rdf_stream.ntriple(s, p, o))
+
+
+def __referenced_bnodes(file_results, nodes, dropped):
+    """Finds the blank nodes that some of the given nodes refer to and that no other node refers to
+
+    :param file_results: Path to the rdfunit results file (String)
+    :param nodes: Nodes whose objects are looked at (Set of N-Triples terms)
+    :param dropped: Nodes left out so far, including the given nodes (Set of N-Triples terms)
+    :return: Set of blank nodes (N-Triples terms)
+    """
+    candidates = set()
+    for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+        if s in nodes and o[0] == '_' and o not in dropped:
+            candidates.add(o)
+    if len(candidates) == 0:
+        return candidates
+
+    # Leave out the blank nodes that are shared with a node that is kept
+    shared = set()
+    for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+        if o in candidates and s not in dropped:
+            shared.add(o)
+    return candidates - shared
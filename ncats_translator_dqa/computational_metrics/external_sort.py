@@ -0,0 +1,144 @@
+"""External merge sort of N-Triples statements
+
+Statements are read in runs of a bounded size, each run is sorted in memory and written to a temporary file, and the
+runs are merged, so datasets of any size are sorted with bounded memory. Since each statement starts with its subject,
+the triples of a subject are next to each other in the sorted file. Used to compare versions of a dataset (see
+delta.py), to drop duplicate triples before validation (see normalization.py) and to count them (see
+lite_validator.py).
+"""
+import os
+import heapq
+from ncats_translator_dqa import config, rdf_stream
+
+# Number of bytes buffered by each file written
+__write_buffer = 1024 * 1024
+
+# Maximum number of sorted runs merged at a time
+__merge_fan_in = 64
+
+# Approximate memory used by each line held in memory while sorting, in addition to its characters
+__line_overhead = 64
+
+# Bytes read at a time when counting the lines of a sorted file
+__read_size = 1024 * 1024
+
+
+def external_sort(file_dataset, file_sorted, dir_tmp, max_bytes=None, on_issue=None):
+    """Writes the triples of a dataset as sorted N-Triples statements, with bounded memory
+
+    Duplicate triples are kept.
+
+    :param file_dataset: Path to the dataset file (String)
+    :param file_sorted: Path to the sorted N-Triples file to write (String)
+    :param dir_tmp: Folder for the sorted runs (String)
+    :param max_bytes: Memory used for sorting each run, in bytes. Defaults to config.delta_sort_bytes [optional]
+    :param on_issue: Function on_issue(kind, detail, line_number) called for each problem found while reading the
+     dataset (see rdf_stream.iter_triples) [optional]
+    :return: Number of triples (Integer)
+    """
+    statements = (rdf_stream.ntriple(s, p, o) for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue))
+    return sort_statements(statements, file_sorted, dir_tmp, max_bytes)
+
+
+def sort_statements(statements, file_sorted, dir_tmp, max_bytes=None, unique=False):
+    """Writes N-Triples statements sorted, with bounded memory
+
+    :param statements: Iterable of N-Triples statements, each with a trailing newline (Strings)
+    :param file_sorted: Path to the sorted N-Triples file to write (String)
+    :param dir_tmp: Folder for the sorted runs (String)
+    :param max_bytes: Memory used for sorting each run, in bytes. Defaults to config.delta_sort_bytes [optional]
+    :param unique: True to write each distinct statement once, dropping duplicates [optional]
+    :return: Number of statements read (Integer)
+    """
+    if max_bytes is None:
+        max_bytes = config.delta_sort_bytes
+
+    name = os.path.split(file_sorted)[1]
+    files_run = []
+    lines = []
+    n_bytes = 0
+    n_statements = 0
+    for line in statements:
+        lines.append(line)
+        n_bytes += len(line) + __line_overhead
+        n_statements += 1
+        if n_bytes >= max_bytes:
+            files_run.append(__write_run(lines, os.path.join(dir_tmp, name + '.run' + str(len(files_run))), unique))
+            lines = []
+            n_bytes = 0
+
+    if len(files_run) == 0:
+        # The whole dataset fit in memory
+        __write_run(lines, file_sorted, unique)
+        return n_statements
+    if len(lines) > 0:
+        files_run.append(__write_run(lines, os.path.join(dir_tmp, name + '.run' + str(len(files_run))), unique))
+    del lines
+
+    # Merge the runs, in several rounds if there are too many to keep open at the same time
+    level = 0
+    while len(files_run) > __merge_fan_in:
+        level += 1
+        files_merged = []
+        for i in range(0, len(files_run), __merge_fan_in):
+            file_merged = os.path.join(dir_tmp, name + '.merge' + str(level) + '_' + str(len(files_merged)))
+            __merge_runs(files_run[i:i + __merge_fan_in], file_merged, unique)
+            files_merged.append(file_merged)
+        files_run = files_merged
+    __merge_runs(files_run, file_sorted, unique)
+    return n_statements
+
+
+def count_duplicates(statements, dir_tmp, max_bytes=None):
+    """Counts the statements that are equal to an earlier statement, with bounded memory
+
+    :param statements: Iterable of N-Triples statements, each with a trailing newline (Strings)
+    :param dir_tmp: Folder for the sorted runs and the distinct statements (String)
+    :param max_bytes: Memory used for sorting each run, in bytes. Defaults to config.delta_sort_bytes [optional]
+    :return: Tuple (number of statements, number of duplicate statements)
+    """
+    file_distinct = os.path.join(dir_tmp, 'distinct.nt')
+    n_statements = sort_statements(statements, file_distinct, dir_tmp, max_bytes, unique=True)
+
+    # Count the distinct statements without decoding them
+    n_distinct = 0
+    with open(file_distinct, 'rb') as f:
+        while True:
+            block = f.read(__read_size)
+            if len(block) == 0:
+                break
+            n_distinct += block.count(b'\n')
+    os.remove(file_distinct)
+    return n_statements, n_statements - n_distinct
+
+
+def __write_run(lines, file_run, unique):
+    # Sorts lines in memory and writes them to a file
+    lines.sort()
+    with open(file_run, 'w', encoding='UTF-8', errors='surrogatepass', buffering=__write_buffer) as f:
+        f.writelines(__distinct(lines) if unique else lines)
+    return file_run
+
+
+def __merge_runs(files_run, file_merged, unique):
+    # Merges sorted files into one sorted file and removes them
+    runs = [open(file_run, encoding='UTF-8', errors='surrogatepass', buffering=__write_buffer)
+            for file_run in files_run]
+    try:
+        with open(file_merged, 'w', encoding='UTF-8', errors='surrogatepass', buffering=__write_buffer) as f:
+            merged = heapq.merge(*runs)
+            f.writelines(__distinct(merged) if unique else merged)
+    finally:
+        for run in runs:
+            run.close()
+    for file_run in files_run:
+        os.remove(file_run)
+
+
+def __distinct(lines):
+    # Skips the lines of a sorted iterable that are equal to the line before them
+    line_last = None
+    for line in lines:
+        if line != line_last:
+            yield line
+            line_last = line
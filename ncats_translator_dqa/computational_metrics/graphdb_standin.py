@@ -0,0 +1,371 @@
+"""Local stand-in for the GraphDB REST API
+
+Implements the few GraphDB endpoints used by GraphDBWrapper, keeping repositories in memory, so the wrapper and the
+computational metrics pipeline can be tried and timed without a GraphDB installation. Statements are parsed with
+rdf_stream, so only Turtle, N-Triples and N-Quads data are accepted. SPARQL queries are not supported.
+
+Usage: python -m ncats_translator_dqa.computational_metrics.graphdb_standin [--port 7200]
+"""
+import io
+import sys
+import json
+import zlib
+import time
+import argparse
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs, unquote
+from ncats_translator_dqa import rdf_stream
+
+# rdf_stream formats by content type
+__formats = {
+    'text/turtle': 'ttl',
+    'application/x-turtle': 'ttl',
+    'application/n-triples': 'nt',
+    'text/plain': 'nt',
+    'application/n-quads': 'nq'
+}
+
+
+def stream_format(content_type):
+    """Gets the rdf_stream format for a content type
+
+    :param content_type: Value of a Content-Type header (String)
+    :return: 'ttl', 'nt' or 'nq', or None if the content type is not supported
+    """
+    return __formats.get(content_type.split(';')[0].strip().lower())
+
+
+class _Repository:
+    """In-memory repository
+
+    Statements are kept in sets by named graph. The default graph has the key None.
+    """
+
+    def __init__(self, repo_config):
+        self.config = repo_config
+        self.graphs = {}
+        self.imports = {}
+        self.lock = threading.Lock()
+
+    def add(self, stream, format, graph=None, replace=False):
+        """Parses statements from a text stream and adds them to a graph
+
+        Nothing is changed if the stream has syntax errors.
+
+        :param stream: Text stream
+        :param format: 'ttl', 'nt' or 'nq'
+        :param graph: IRI of the named graph, or None for the default graph
+        :param replace: True to replace the content of the graph
+        :return: Number of syntax errors
+        """
+        errors = []
+        triples = set(rdf_stream.iter_triples(stream, format, on_issue=lambda kind, detail, line: errors.append(kind)))
+        if len(errors) > 0:
+            return len(errors)
+        with self.lock:
+            if replace:
+                self.graphs[graph] = triples
+            else:
+                self.graphs.setdefault(graph, set()).update(triples)
+        return 0
+
+    def clear(self, graph):
+        with self.lock:
+            self.graphs.pop(graph, None)
+
+    def size(self, graph=None, all_graphs=True):
+        with self.lock:
+            if all_graphs:
+                return sum(len(triples) for triples in self.graphs.values())
+            return len(self.graphs.get(graph, ()))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler. The stand-in is available as self.server.standin
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.standin.verbose:
+            sys.stderr.write('GraphDB stand-in: ' + (format % args) + '\n')
+
+    def do_GET(self):
+        self.__delay()
+        path, query = self.__parse_url()
+        standin = self.server.standin
+        if path == ['rest', 'repositories']:
+            self.__send_json(200, [r.config for r in standin.repositories.values()])
+        elif len(path) == 3 and path[:2] == ['rest', 'repositories']:
+            repo = standin.repositories.get(path[2])
+            if repo is None:
+                self.__send_text(404, 'Repository ' + path[2] + ' not found')
+            else:
+                self.__send_json(200, repo.config)
+        elif len(path) == 5 and path[:4] == ['rest', 'data', 'import', 'url']:
+            repo = self.__repository(path[4])
+            if repo is not None:
+                with repo.lock:
+                    self.__send_json(200, [dict(status) for status in repo.imports.values()])
+        elif len(path) == 3 and path[0] == 'repositories' and path[2] == 'size':
+            repo = self.__repository(path[1])
+            if repo is not None:
+                if 'context' in query:
+                    size = repo.size(query['context'][0].strip('<>'), all_graphs=False)
+                else:
+                    size = repo.size()
+                self.__send_text(200, str(size))
+        else:
+            self.__send_text(404, 'Not found')
+
+    def do_PUT(self):
+        self.__delay()
+        path, query = self.__parse_url()
+        standin = self.server.standin
+        if path == ['rest', 'repositories']:
+            repo_config = json.loads(self.__read_body().decode('UTF-8'))
+            with standin.lock:
+                if repo_config['id'] in standin.repositories:
+                    self.__send_text(400, 'Repository ' + repo_config['id'] + ' already exists')
+                    return
+                standin.repositories[repo_config['id']] = _Repository(repo_config)
+            self.__send_text(201, '')
+        elif self.__is_graph_store(path):
+            repo = self.__repository(path[1])
+            if repo is not None:
+                self.__receive_data(repo, query['graph'][0], replace=True)
+        else:
+            self.__send_text(404, 'Not found')
+
+    def do_DELETE(self):
+        self.__delay()
+        path, query = self.__parse_url()
+        standin = self.server.standin
+        if len(path) == 3 and path[:2] == ['rest', 'repositories']:
+            with standin.lock:
+                standin.repositories.pop(path[2], None)
+            self.__send_text(200, '')
+        elif self.__is_graph_store(path):
+            repo = self.__repository(path[1])
+            if repo is not None:
+                repo.clear(query['graph'][0])
+                self.__send_text(204, None)
+        else:
+            self.__send_text(404, 'Not found')
+
+    def do_POST(self):
+        self.__delay()
+        path, query = self.__parse_url()
+        if len(path) == 5 and path[:4] == ['rest', 'data', 'import', 'url']:
+            repo = self.__repository(path[4])
+            if repo is not None:
+                self.__read_body()
+                url = query.get('url', [''])[0]
+                self.server.standin.start_import(repo, url)
+                self.__send_text(202, '')
+        elif len(path) == 3 and path[0] == 'repositories' and path[2] == 'statements':
+            repo = self.__repository(path[1])
+            if repo is not None:
+                graph = query['context'][0].strip('<>') if 'context' in query else None
+                self.__receive_data(repo, graph, replace=False)
+        elif len(path) == 2 and path[0] == 'repositories':
+            self.__read_body()
+            self.__send_text(501, 'SPARQL queries are not supported by the GraphDB stand-in')
+        else:
+            self.__send_text(404, 'Not found')
+
+    def __receive_data(self, repo, graph, replace):
+        """Adds the RDF data in the request body to a graph and sends the response
+        """
+        format = stream_format(self.headers.get('Content-Type', ''))
+        body = self.__read_body()
+        if format is None:
+            self.__send_text(415, 'Unsupported content type')
+            return
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        n_errors = repo.add(io.StringIO(body.decode('UTF-8')), format, graph, replace)
+        if n_errors > 0:
+            self.__send_text(400, str(n_errors) + ' syntax errors')
+        else:
+            self.__send_text(204, None)
+
+    def __delay(self):
+        """Waits for the configured response latency
+        """
+        if self.server.standin.latency > 0:
+            time.sleep(self.server.standin.latency)
+
+    @staticmethod
+    def __is_graph_store(path):
+        return len(path) == 4 and path[0] == 'repositories' and path[2:] == ['rdf-graphs', 'service']
+
+    def __parse_url(self):
+        url = urlsplit(self.path)
+        path = [unquote(p) for p in url.path.split('/') if len(p) > 0]
+        return path, parse_qs(url.query)
+
+    def __repository(self, repo_id):
+        """Gets a repository, or sends a 404 response if it doesn't exist
+        """
+        repo = self.server.standin.repositories.get(repo_id)
+        if repo is None:
+            self.__read_body()
+            self.__send_text(404, 'Repository ' + repo_id + ' not found')
+        return repo
+
+    def __read_body(self):
+        """Reads the request body, with or without chunked transfer encoding
+
+        :return: bytes
+        """
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the final empty line
+                    while self.rfile.readline().strip():
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def __send_json(self, code, content):
+        self.__send(code, json.dumps(content).encode('UTF-8'), 'application/json')
+
+    def __send_text(self, code, content):
+        self.__send(code, content.encode('UTF-8') if content is not None else None, 'text/plain')
+
+    def __send(self, code, body, content_type):
+        self.send_response(code)
+        if body is not None:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+
+class GraphDBStandIn:
+    """Local stand-in for the GraphDB REST API
+
+    Public members:
+    url - URL of the stand-in, to be passed to GraphDBWrapper
+    repositories - Dictionary of repositories by ID
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, import_delay=0, verbose=False, latency=0):
+        """Constructor
+
+        :param host: Host name to listen on [optional]
+        :param port: Port to listen on. 0 picks a free port [optional]
+        :param import_delay: Time in seconds each URL import stays pending before it runs, to exercise status polling
+         [optional]
+        :param verbose: True if you want to print each request [optional]
+        :param latency: Time in seconds added to every response, to simulate a remote or busy server [optional]
+        """
+        self.import_delay = import_delay
+        self.latency = latency
+        self.verbose = verbose
+        self.repositories = {}
+        self.lock = threading.Lock()
+        self.__server = _Server((host, port), _Handler)
+        self.__server.standin = self
+        self.__thread = None
+        self.url = 'http://' + host + ':' + str(self.__server.server_address[1]) + '/'
+
+    def start(self):
+        """Starts serving requests in a background thread
+
+        :return: self
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server
+
+        :return: None
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def serve_forever(self):
+        """Serves requests in the current thread until interrupted
+
+        :return: None
+        """
+        self.__server.serve_forever()
+
+    def start_import(self, repo, url):
+        """Starts a URL import in a background thread, reporting its status like GraphDB
+
+        Only file:// URLs are supported.
+
+        :param repo: _Repository to import into
+        :param url: URL of the data
+        :return: None
+        """
+        status = {'name': url, 'status': 'PENDING', 'message': ''}
+        with repo.lock:
+            repo.imports[url] = status
+
+        def run():
+            time.sleep(self.import_delay)
+            with repo.lock:
+                status['status'] = 'IMPORTING'
+            try:
+                file = urlsplit(url)
+                if file.scheme != 'file':
+                    raise ValueError('Only file:// URLs are supported')
+                path = unquote(file.path)
+                with open(path, encoding='UTF-8', errors='replace') as stream:
+                    n_errors = repo.add(stream, rdf_stream.guess_format(path))
+                if n_errors > 0:
+                    raise ValueError(str(n_errors) + ' syntax errors')
+                state, message = 'DONE', 'Imported successfully'
+            except (OSError, ValueError) as e:
+                state, message = 'ERROR', str(e)
+            with repo.lock:
+                status['status'] = state
+                status['message'] = message
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the GraphDB REST API')
+    parser.add_argument('--host', default='127.0.0.1', help='Host name to listen on')
+    parser.add_argument('--port', type=int, default=7200, help='Port to listen on')
+    parser.add_argument('--import-delay', type=float, default=0, help='Seconds each URL import stays pending')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+    args = parser.parse_args()
+
+    standin = GraphDBStandIn(args.host, args.port, args.import_delay, verbose=True, latency=args.latency)
+    print('GraphDB stand-in listening on ' + standin.url)
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Interlinking and link quality metrics of a dataset
+
+The metrics are computed on the integer-encoded triples of the dataset's triple cache (see triple_cache.py) with
+vectorized NumPy operations instead of loops over the triples:
+- the number of owl:sameAs links and of cross-references (skos mappings, rdfs:seeAlso, oboInOwl:hasDbXref, ...), and
+  the number of links of each link predicate
+- the number of links between IRIs in different namespaces
+- dangling IRIs: IRIs used as object that are never described, i.e., never used as subject
+- for the namespaces with the most IRIs: the number of IRIs, and the mean, median and maximum out-degree and in-degree
+  of their IRIs
+
+Objects of rdf:type are not counted as links. Namespaces end at the last '/' or '#' of an IRI, or include the prefix of
+OBO-style local names, e.g., http://purl.obolibrary.org/obo/GO_.
+
+Usage:
+python -m ncats_translator_dqa.computational_metrics.interlinking <data file> [-o <DQV file>]
+"""
+import os
+import re
+import argparse
+import numpy as np
+from rdflib.namespace import XSD
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.triple_cache import TripleCache
+from ncats_translator_dqa.preliminary_statistics.prelim_stats_rdf import DQVWriter
+
+VOID = 'http://rdfs.org/ns/void#'
+NS_LOCAL = 'http://ncats.nih.gov/'
+
+OWL_SAME_AS = 'http://www.w3.org/2002/07/owl#sameAs'
+
+# Predicates counted as cross-references to other datasets
+CROSS_REFERENCE_PREDICATES = [
+    'http://www.w3.org/2004/02/skos/core#exactMatch',
+    'http://www.w3.org/2004/02/skos/core#closeMatch',
+    'http://www.w3.org/2004/02/skos/core#relatedMatch',
+    'http://www.w3.org/2004/02/skos/core#broadMatch',
+    'http://www.w3.org/2004/02/skos/core#narrowMatch',
+    'http://www.w3.org/2000/01/rdf-schema#seeAlso',
+    'http://www.geneontology.org/formats/oboInOwl#hasDbXref',
+    'http://schema.org/sameAs'
+]
+
+# Namespace of each IRI term in a block of concatenated terms: up to the last '/' or '#', and the prefix of an OBO-style
+# local name such as GO_0008150
+_re_namespace = re.compile(rb'<((?:[^>]*[/#])?(?:[A-Za-z][A-Za-z0-9]*_(?=[0-9]))?)[^>]*>')
+
+
+class InterlinkingResult:
+    """Interlinking metrics of a dataset
+
+    Public members:
+    triples - Number of triples
+    same_as_links - Number of owl:sameAs triples
+    cross_references - Number of triples with a cross-reference predicate (CROSS_REFERENCE_PREDICATES)
+    link_predicates - List of tuples (predicate IRI, number of triples) of the link predicates used
+    external_links - Number of triples linking IRIs in different namespaces
+    dangling_iris - Number of distinct IRIs used as object but never as subject
+    dangling_links - Number of triples whose object is a dangling IRI
+    namespaces - List of tuples (namespace, number of IRIs used as subject or object of a link, out-degree (mean,
+     median, maximum), in-degree (mean, median, maximum)) of the namespaces with the most IRIs. Degrees are None if no
+     IRI of the namespace is a subject, or an object of a link, respectively
+    """
+
+    def __init__(self):
+        self.triples = 0
+        self.same_as_links = 0
+        self.cross_references = 0
+        self.link_predicates = []
+        self.external_links = 0
+        self.dangling_iris = 0
+        self.dangling_links = 0
+        self.namespaces = []
+
+    def measurements(self):
+        """Gets the results as measurements of the metrics defined in resources/dqv_definitions.ttl
+
+        :return: List of tuples (metric name, value, XSD datatype, list of tuples (property IRI, N-Triples term))
+        """
+        result = [('sameAsLinksMetric', self.same_as_links, XSD.integer, []),
+                  ('crossReferencesMetric', self.cross_references, XSD.integer, []),
+                  ('externalLinksMetric', self.external_links, XSD.integer, []),
+                  ('danglingIRIsMetric', self.dangling_iris, XSD.integer, []),
+                  ('danglingLinksMetric', self.dangling_links, XSD.integer, [])]
+        result += [('linkPredicateMetric', n, XSD.integer, [(VOID + 'linkPredicate', '<' + predicate + '>')])
+                   for predicate, n in self.link_predicates]
+
+        for namespace, n_iris, out_degree, in_degree in self.namespaces:
+            uri_space = [(VOID + 'uriSpace', rdf_stream.literal(namespace))]
+            result.append(('namespaceIRIsMetric', n_iris, XSD.integer, uri_space))
+            for metric, degree in [('namespaceOutDegreeMetric', out_degree), ('namespaceInDegreeMetric', in_degree)]:
+                if degree is not None:
+                    mean, median, maximum = degree
+                    result.append((metric, '%.3f' % mean, XSD.decimal, uri_space + [
+                        (NS_LOCAL + 'medianDegree', rdf_stream.literal(str(median), datatype=str(XSD.integer))),
+                        (NS_LOCAL + 'maximumDegree', rdf_stream.literal(str(maximum), datatype=str(XSD.integer)))]))
+        return result
+
+
+class InterlinkingMetrics:
+    """Vectorized interlinking metrics over a triple cache
+    """
+
+    def __init__(self, top_namespaces=None, verbose=None):
+        """Constructor
+
+        :param top_namespaces: Number of namespaces with degree statistics. Defaults to
+         config.interlinking_top_namespaces [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.top_namespaces = top_namespaces if top_namespaces is not None else config.interlinking_top_namespaces
+        self.verbose = verbose if verbose is not None else config.verbose
+
+    def compute(self, file_dataset):
+        """Computes the interlinking metrics of a dataset, building its triple cache first if needed
+
+        :param file_dataset: Path to the dataset file (String)
+        :return: InterlinkingResult
+        """
+        cache = TripleCache.open(file_dataset, verbose=self.verbose)
+        if self.verbose:
+            print('Computing interlinking metrics of ' + file_dataset)
+
+        with profiling.span('interlinking', dataset=file_dataset, triples=cache.n_triples):
+            result = self.compute_cache(cache)
+
+        if self.verbose:
+            print('Interlinking metrics: ' + ', '.join(m[0] + '=' + str(m[1]) for m in result.measurements()
+                                                       if len(m[3]) == 0))
+        return result
+
+    def compute_cache(self, cache):
+        """Computes the interlinking metrics of an open triple cache
+
+        :param cache: TripleCache
+        :return: InterlinkingResult
+        """
+        result = InterlinkingResult()
+        result.triples = cache.n_triples
+        n_terms = cache.n_terms
+        first_iri = cache.first_iri
+        first_bnode = cache.first_bnode
+        if cache.n_triples == 0:
+            return result
+
+        s = np.asarray(cache.spo[:, 0])
+        p = np.asarray(cache.spo[:, 1])
+        o = np.asarray(cache.spo[:, 2])
+
+        # Links by predicate, from the ranges of the predicates in the POS index
+        for predicate in [OWL_SAME_AS] + CROSS_REFERENCE_PREDICATES:
+            predicate_id = cache.term_id('<' + predicate + '>')
+            if predicate_id >= 0:
+                n = len(cache.predicate_rows(predicate_id))
+                result.link_predicates.append((predicate, n))
+                if predicate == OWL_SAME_AS:
+                    result.same_as_links = n
+                else:
+                    result.cross_references += n
+
+        # Triples linking two IRIs. Term ids of IRIs are a contiguous range
+        type_id = cache.term_id('<' + rdf_stream.RDF + 'type>')
+        s_iri = (s >= first_iri) & (s < first_bnode)
+        o_link = (o >= first_iri) & (o < first_bnode) & (p != type_id)
+
+        # Out-degree and in-degree of every term
+        out_degree = np.bincount(s[s_iri], minlength=n_terms)[first_iri:first_bnode]
+        in_degree = np.bincount(o[o_link], minlength=n_terms)[first_iri:first_bnode]
+
+        # Dangling IRIs are objects of links that are never subjects
+        dangling = (in_degree > 0) & (out_degree == 0)
+        result.dangling_iris = int(np.count_nonzero(dangling))
+        result.dangling_links = int(in_degree[dangling].sum())
+
+        # Namespace of every IRI, and links between namespaces
+        namespace_ids, namespaces = self.__namespaces(cache)
+        namespace_of = np.full(n_terms, -1, dtype=np.int32)
+        namespace_of[first_iri:first_bnode] = namespace_ids
+        both = s_iri & o_link
+        result.external_links = int(np.count_nonzero(namespace_of[s[both]] != namespace_of[o[both]]))
+
+        # Degree distributions of the namespaces with the most IRIs that occur as subject or object
+        used = (out_degree > 0) | (in_degree > 0)
+        n_iris = np.bincount(namespace_ids[used], minlength=len(namespaces))
+        top = [i for i in np.argsort(-n_iris, kind='stable')[:self.top_namespaces + 1]
+               if n_iris[i] > 0 and len(namespaces[i]) > 0][:self.top_namespaces]
+        out_stats = InterlinkingMetrics.__degree_stats(namespace_ids, out_degree, len(namespaces), top)
+        in_stats = InterlinkingMetrics.__degree_stats(namespace_ids, in_degree, len(namespaces), top)
+        result.namespaces = [(namespaces[i], int(n_iris[i]), out_stats.get(i), in_stats.get(i)) for i in top]
+
+        return result
+
+    @staticmethod
+    def __namespaces(cache):
+        # Namespace id of every IRI, in term id order, and the namespaces
+        first_iri, first_bnode = cache.first_iri, cache.first_bnode
+        matches = _re_namespace.findall(cache.terms_bytes(first_iri, first_bnode))
+        if len(matches) != first_bnode - first_iri:
+            # IRIs containing '>' are matched term by term
+            matches = [_re_namespace.match(cache.terms_bytes(i, i + 1)).group(1) for i in range(first_iri, first_bnode)]
+        ids = {m: i for i, m in enumerate(dict.fromkeys(matches))}
+        namespace_ids = np.array(list(map(ids.__getitem__, matches)), dtype=np.int32)
+        return namespace_ids, [m.decode('UTF-8', 'surrogatepass') for m in ids]
+
+    @staticmethod
+    def __degree_stats(namespace_ids, degree, n_namespaces, selected_namespaces):
+        # Mean, median and maximum degree of the IRIs of the selected namespaces whose degree is not 0
+        selected = (degree > 0) & np.isin(namespace_ids, selected_namespaces)
+        groups = namespace_ids[selected]
+        degrees = degree[selected]
+        if len(degrees) == 0:
+            return {}
+        order = np.lexsort((degrees, groups))
+        groups = groups[order]
+        degrees = degrees[order]
+        counts = np.bincount(groups, minlength=n_namespaces)
+        sums = np.bincount(groups, weights=degrees, minlength=n_namespaces)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        stats = {}
+        for i in selected_namespaces:
+            if counts[i] == 0:
+                continue
+            stats[i] = (sums[i] / counts[i], int(degrees[starts[i] + (counts[i] - 1) // 2]),
+                        int(degrees[starts[i] + counts[i] - 1]))
+        return stats
+
+    @staticmethod
+    def write_dqv(file_dataset, result, file_output):
+        """Writes interlinking metrics in W3C Data Quality Vocabulary
+
+        :param file_dataset: Path to the dataset file (String)
+        :param result: InterlinkingResult
+        :param file_output: Path to the turtle file to write (String)
+        :return: None
+        """
+        filename_dataset = os.path.split(file_dataset)[1]
+        dataset_id = ''.join([c for c in filename_dataset if c.isalnum()]) + 'Dataset'
+        with DQVWriter(file_output) as writer:
+            writer.add_dataset(dataset_id, byte_size=os.path.getsize(file_dataset))
+            add_measurements(writer, result.measurements())
+
+
+def add_measurements(writer, measurements):
+    """Adds interlinking metrics to a DQVWriter or PrelimStatsRDF
+
+    :param writer: DQVWriter or PrelimStatsRDF
+    :param measurements: Measurements from InterlinkingResult.measurements(), or None
+    :return: None
+    """
+    if measurements is None:
+        return
+    for metric, value, datatype, annotations in measurements:
+        writer.add_annotated_measurement(metric, value, datatype, annotations)
+
+
+def interlinking_metrics(file_dataset):
+    """Computes the interlinking metrics of a dataset with the settings in config.py
+
+    :param file_dataset: Path to the dataset file (String)
+    :return: InterlinkingResult, or None if the metrics are disabled (config.interlinking_metrics) or the file doesn't
+     exist
+    """
+    if not config.interlinking_metrics or len(file_dataset) == 0 or not os.path.exists(file_dataset):
+        return None
+    return InterlinkingMetrics().compute(file_dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Computes interlinking metrics of a data set: owl:sameAs and '
+                                                  'cross-reference links, links between namespaces, dangling IRIs '
+                                                  'and the degree distributions of its namespaces'))
+    parser.add_argument('file_dataset', metavar='FILE', help='Data set (N-Triples, N-Quads or Turtle)')
+    parser.add_argument('-o', dest='file_output', help='Write the metrics in W3C DQV to this file')
+    parser.add_argument('-n', dest='top_namespaces', type=int, help='Number of namespaces with degree statistics')
+    args = parser.parse_args()
+
+    result = InterlinkingMetrics(args.top_namespaces, verbose=False).compute(args.file_dataset)
+    for metric, value, datatype, annotations in result.measurements():
+        print(metric + ''.join(' ' + term for _, term in annotations) + ': ' + str(value))
+
+    if args.file_output is not None:
+        InterlinkingMetrics.write_dqv(args.file_dataset, result, args.file_output)
+
+
+if __name__ == '__main__':
+    main()
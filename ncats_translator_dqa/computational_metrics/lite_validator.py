@@ -0,0 +1,299 @@
+"""Pure-Python streaming validator for a fast triage of linked open datasets
+
+The lite validator reads a dataset once, triple by triple, and counts common syntactic problems. It does not need
+Java or RDFUnit, and its memory use does not depend on the size of the dataset: duplicate triples are counted exactly
+with an external sort (see external_sort.py), which sorts larger datasets on disk.
+"""
+import os
+import re
+import shutil
+import tempfile
+from datetime import date
+from rdflib.namespace import XSD
+from ncats_translator_dqa import config, rdf_stream
+from ncats_translator_dqa.computational_metrics.external_sort import count_duplicates
+from ncats_translator_dqa.preliminary_statistics.prelim_stats_rdf import DQVWriter
+
+# Absolute IRI: a scheme followed by characters allowed in IRIs and valid percent-encodings
+__re_iri = re.compile(r'[A-Za-z][A-Za-z0-9+.\-]*:(?:[^\x00-\x20<>"{}|^`\\%]|%[0-9A-Fa-f]{2})*\Z')
+
+# Lexical forms of XSD datatypes
+__re_decimal = re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)\Z')
+__re_double = re.compile(r'(?:[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|[+-]?INF|NaN)\Z')
+__re_integer = re.compile(r'[+-]?\d+\Z')
+__re_date = re.compile(r'(-?\d{4,})-(\d{2})-(\d{2})(Z|[+-]\d{2}:\d{2})?\Z')
+__re_datetime = re.compile(r'(-?\d{4,})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(\.\d+)?(Z|[+-]\d{2}:\d{2})?\Z')
+__re_time = re.compile(r'(\d{2}):(\d{2}):(\d{2})(\.\d+)?(Z|[+-]\d{2}:\d{2})?\Z')
+__re_gyear = re.compile(r'-?\d{4,}(Z|[+-]\d{2}:\d{2})?\Z')
+__re_gyearmonth = re.compile(r'-?\d{4,}-(0[1-9]|1[0-2])(Z|[+-]\d{2}:\d{2})?\Z')
+
+# Value ranges of the integer datatypes derived from xsd:integer
+__integer_ranges = {
+    'integer': (None, None),
+    'long': (-2 ** 63, 2 ** 63 - 1),
+    'int': (-2 ** 31, 2 ** 31 - 1),
+    'short': (-2 ** 15, 2 ** 15 - 1),
+    'byte': (-2 ** 7, 2 ** 7 - 1),
+    'nonNegativeInteger': (0, None),
+    'positiveInteger': (1, None),
+    'nonPositiveInteger': (None, 0),
+    'negativeInteger': (None, -1),
+    'unsignedLong': (0, 2 ** 64 - 1),
+    'unsignedInt': (0, 2 ** 32 - 1),
+    'unsignedShort': (0, 2 ** 16 - 1),
+    'unsignedByte': (0, 2 ** 8 - 1)
+}
+
+
+def is_valid_iri(iri):
+    """Checks whether a string is a well-formed absolute IRI
+
+    :param iri: IRI without angle brackets (String)
+    :return: True if the IRI is well-formed
+    """
+    return __re_iri.match(iri) is not None
+
+
+def is_well_typed(lexical, datatype):
+    """Checks whether the lexical form of a literal is valid for its XSD datatype
+
+    Datatypes other than the common XSD datatypes are not checked.
+
+    :param lexical: Lexical form (String)
+    :param datatype: Datatype IRI (String)
+    :return: True unless the lexical form is invalid for the datatype
+    """
+    checker = __checkers.get(datatype)
+    return checker is None or checker(lexical.strip())
+
+
+def __check_integer(low, high):
+    def check(value):
+        if __re_integer.match(value) is None:
+            return False
+        number = int(value)
+        return (low is None or number >= low) and (high is None or number <= high)
+    return check
+
+
+def __check_regex(regex):
+    def check(value):
+        return regex.match(value) is not None
+    return check
+
+
+def __check_date(value):
+    match = __re_date.match(value)
+    return match is not None and __is_valid_date(match.group(1), match.group(2), match.group(3))
+
+
+def __check_datetime(value):
+    match = __re_datetime.match(value)
+    return match is not None and __is_valid_date(match.group(1), match.group(2), match.group(3)) and \
+        __is_valid_time(match.group(4), match.group(5), match.group(6))
+
+
+def __check_time(value):
+    match = __re_time.match(value)
+    return match is not None and __is_valid_time(match.group(1), match.group(2), match.group(3))
+
+
+def __check_boolean(value):
+    return value in ('true', 'false', '1', '0')
+
+
+def __check_any_uri(value):
+    return not any(c in value for c in '<>"{}|^`\\ ')
+
+
+def __is_valid_date(year, month, day):
+    year = int(year)
+    if year < 1 or year > 9999:
+        # Outside of Python's date range: check the day of the month against a year with the same leap year status
+        year = 2000 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 2001
+    try:
+        date(year, int(month), int(day))
+        return True
+    except ValueError:
+        return False
+
+
+def __is_valid_time(hour, minute, second):
+    hour, minute, second = int(hour), int(minute), int(second)
+    if hour == 24:
+        return minute == 0 and second == 0
+    return hour < 24 and minute < 60 and second < 60
+
+
+# Lexical form checks by datatype IRI
+__checkers = {rdf_stream.XSD + name: __check_integer(low, high) for name, (low, high) in __integer_ranges.items()}
+__checkers.update({
+    rdf_stream.XSD + 'decimal': __check_regex(__re_decimal),
+    rdf_stream.XSD + 'double': __check_regex(__re_double),
+    rdf_stream.XSD + 'float': __check_regex(__re_double),
+    rdf_stream.XSD + 'boolean': __check_boolean,
+    rdf_stream.XSD + 'date': __check_date,
+    rdf_stream.XSD + 'dateTime': __check_datetime,
+    rdf_stream.XSD + 'time': __check_time,
+    rdf_stream.XSD + 'gYear': __check_regex(__re_gyear),
+    rdf_stream.XSD + 'gYearMonth': __check_regex(__re_gyearmonth),
+    rdf_stream.XSD + 'anyURI': __check_any_uri
+})
+
+
+class LiteValidationResult:
+    """Counts of problems found by the lite validator
+
+    Public members:
+    triples - Number of triples read
+    malformed_iris - Number of IRIs that are not well-formed absolute IRIs
+    ill_typed_literals - Number of literals whose lexical form is invalid for their XSD datatype
+    blank_node_triples - Number of triples with a blank node as subject or object
+    duplicate_triples - Number of triples that are the same as an earlier triple
+    undeclared_prefixes - Number of prefixed names with an undeclared prefix
+    syntax_errors - Number of statements that could not be parsed
+    """
+
+    def __init__(self):
+        self.triples = 0
+        self.malformed_iris = 0
+        self.ill_typed_literals = 0
+        self.blank_node_triples = 0
+        self.duplicate_triples = 0
+        self.undeclared_prefixes = 0
+        self.syntax_errors = 0
+
+    def add(self, other):
+        """Adds the counts of another result, e.g., of another shard of the same dataset
+
+        :param other: LiteValidationResult
+        :return: None
+        """
+        for name in vars(self):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def metrics(self):
+        """Gets the results as values of the metrics defined in resources/dqv_definitions.ttl
+
+        :return: List of tuples (metric name, value)
+        """
+        return [('tripleCountMetric', self.triples),
+                ('malformedIRIsMetric', self.malformed_iris),
+                ('illTypedLiteralsMetric', self.ill_typed_literals),
+                ('blankNodeUsageMetric', self.blank_node_triples),
+                ('duplicateTriplesMetric', self.duplicate_triples),
+                ('undeclaredPrefixesMetric', self.undeclared_prefixes),
+                ('syntaxErrorsMetric', self.syntax_errors)]
+
+
+class LiteValidator:
+    """Pure-Python streaming validator
+    """
+    version = '2'
+
+    def __init__(self, sort_bytes=None, verbose=None):
+        """Constructor
+
+        :param sort_bytes: Memory used to sort the triples for counting duplicate triples, in bytes. Defaults to
+         config.lite_sort_bytes [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.sort_bytes = sort_bytes if sort_bytes is not None else config.lite_sort_bytes
+        self.verbose = verbose if verbose is not None else config.verbose
+
+    def validate(self, file_dataset):
+        """Validates a dataset
+
+        :param file_dataset: Path to the dataset file (String)
+        :return: LiteValidationResult
+        """
+        if self.verbose:
+            print('Running lite validation on ' + file_dataset)
+
+        result = LiteValidationResult()
+        checked_iris = {}
+
+        def on_issue(kind, detail, line_number):
+            if kind == rdf_stream.ISSUE_UNDECLARED_PREFIX:
+                result.undeclared_prefixes += 1
+            elif kind == rdf_stream.ISSUE_SYNTAX_ERROR:
+                result.syntax_errors += 1
+
+        def statements():
+            for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue):
+                self.__check(s, p, o, result, checked_iris)
+                yield rdf_stream.ntriple(s, p, o)
+
+        # Duplicates are counted while the triples are checked
+        if not os.path.exists(config.path_rdfunit_jobs):
+            os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+        name = os.path.splitext(os.path.split(file_dataset)[1])[0]
+        dir_sort = tempfile.mkdtemp(prefix=name + '_lite_', dir=config.path_rdfunit_jobs)
+        try:
+            result.triples, result.duplicate_triples = count_duplicates(statements(), dir_sort, self.sort_bytes)
+        finally:
+            shutil.rmtree(dir_sort, ignore_errors=True)
+
+        if self.verbose:
+            print('Lite validation finished: ' + ', '.join(name + '=' + str(value) for name, value in result.metrics()))
+
+        return result
+
+    @staticmethod
+    def __check(s, p, o, result, checked_iris):
+        """Checks one triple and adds the problems found to the counts
+
+        :param s: Subject (N-Triples term)
+        :param p: Predicate (N-Triples term)
+        :param o: Object (N-Triples term)
+        :param result: LiteValidationResult to add to
+        :param checked_iris: Memo of recently checked IRIs (Dictionary {IRI term: True if well-formed})
+        :return: None
+        """
+        # IRIs. Recently checked IRIs (e.g., predicates) are remembered in a small memo
+        for term in (s, p, o):
+            if term[0] == '<':
+                valid = checked_iris.get(term)
+                if valid is None:
+                    valid = is_valid_iri(term[1:-1])
+                    if len(checked_iris) >= 10000:
+                        checked_iris.clear()
+                    checked_iris[term] = valid
+                if not valid:
+                    result.malformed_iris += 1
+
+        # Typed literals
+        if o[0] == '"' and o[-1] == '>':
+            end = o.rindex('"^^<')
+            if not is_well_typed(rdf_stream.unescape(o[1:end]), o[end + 4:-1]):
+                result.ill_typed_literals += 1
+
+        # Blank nodes
+        if s[0] == '_' or o[0] == '_':
+            result.blank_node_triples += 1
+
+    def write_dqv(self, file_dataset, result, file_output):
+        """Writes lite validation results in W3C Data Quality Vocabulary
+
+        :param file_dataset: Path to the dataset file (String)
+        :param result: LiteValidationResult
+        :param file_output: Path to the turtle file to write (String)
+        :return: None
+        """
+        filename_dataset = os.path.split(file_dataset)[1]
+        dataset_id = ''.join([c for c in filename_dataset if c.isalnum()]) + 'Dataset'
+        with DQVWriter(file_output) as writer:
+            writer.add_dataset(dataset_id, byte_size=os.path.getsize(file_dataset))
+            for metric, value in result.metrics():
+                writer.add_measurement_value(metric, value, XSD.integer)
+
+    def lite_validation(self, file_dataset, file_output):
+        """Validates a dataset and writes the results in W3C Data Quality Vocabulary
+
+        :param file_dataset: Path to the dataset file (String)
+        :param file_output: Path to the turtle file to write (String)
+        :return: LiteValidationResult
+        """
+        result = self.validate(file_dataset)
+        self.write_dqv(file_dataset, result, file_output)
+        return result
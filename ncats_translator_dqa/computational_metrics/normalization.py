@@ -0,0 +1,201 @@
+"""Normalization of datasets before validation
+
+Source dumps often repeat the same triples, declare the same prefixes over and over, and are split across several files,
+and rdfunit loads and checks every copy. Normalization reads one or more data files (in any format and compression
+read by rdf_stream), writes every term in a canonical form, sorts the triples with an external merge sort (see
+external_sort.py) and keeps each distinct triple once, in a single N-Triples file:
+
+- Escape sequences in IRIs and literals are replaced with the characters they stand for, except for the characters
+  N-Triples requires to be escaped
+- Language tags are written in lower case
+- The xsd:string datatype is dropped, since "x"^^xsd:string and "x" are the same literal
+- When several files are merged, blank node labels are prefixed with the position of their file, since labels are local
+  to a file
+
+With config.normalize_input set, datasets are normalized before they are validated with rdfunit (see
+rdfunit_input.py).
+
+Usage from the command line, e.g., to merge the parts of a dump into one data file:
+python3 -m ncats_translator_dqa.computational_metrics.normalization <data file> [<data file> ...] -o <output file>
+"""
+import os
+import re
+import sys
+import shutil
+import tempfile
+import argparse
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.computational_metrics.external_sort import sort_statements
+
+# Datatype suffix of xsd:string literals
+_xsd_string = '^^<' + rdf_stream.XSD + 'string>'
+
+# Characters that can't be written in an N-Triples IRI without an escape sequence
+_re_iri_escaped = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+
+# Bytes read at a time when counting the statements of the normalized file
+__read_size = 1024 * 1024
+
+
+class NormalizationInfo:
+    """Size of a dataset before and after normalization
+
+    Public members:
+    files - Number of data files read
+    triples - Number of triples read
+    distinct_triples - Number of triples written, once each
+    duplicate_triples - Number of triples dropped because they were the same as another triple after normalization
+    input_bytes - Size of the data files (Integer)
+    ntriples_bytes - Size of the triples read, written as N-Triples (Integer)
+    normalized_bytes - Size of the normalized N-Triples file (Integer)
+    undeclared_prefixes - Number of prefixed names with an undeclared prefix
+    syntax_errors - Number of statements that could not be parsed
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.triples = 0
+        self.distinct_triples = 0
+        self.duplicate_triples = 0
+        self.input_bytes = 0
+        self.ntriples_bytes = 0
+        self.normalized_bytes = 0
+        self.undeclared_prefixes = 0
+        self.syntax_errors = 0
+
+    def reduction(self):
+        """Gets the share of the N-Triples bytes removed by normalization
+
+        :return: Share between 0 and 1 (Float)
+        """
+        if self.ntriples_bytes == 0:
+            return 0.0
+        return 1 - self.normalized_bytes / self.ntriples_bytes
+
+    def summary(self):
+        """Describes the reduction in size
+
+        :return: Summary (String)
+        """
+        return (str(self.triples) + ' triples in ' + str(self.files) + ' file(s), ' + str(self.duplicate_triples) +
+                ' duplicates dropped, ' + str(self.distinct_triples) + ' distinct triples. N-Triples: ' +
+                '{:.1f}'.format(self.ntriples_bytes / 1024 ** 2) + ' MB reduced to ' +
+                '{:.1f}'.format(self.normalized_bytes / 1024 ** 2) + ' MB (' +
+                '{:.0%}'.format(self.reduction()) + ' less)')
+
+
+def canonical_term(term, bnode_prefix=''):
+    """Writes an N-Triples term in its canonical form
+
+    :param term: N-Triples term (String)
+    :param bnode_prefix: Prefix added to blank node labels [optional]
+    :return: N-Triples term (String)
+    """
+    c = term[0]
+    if c == '<':
+        if '\\' not in term:
+            return term
+        iri = rdf_stream.unescape(term[1:-1])
+        return term if _re_iri_escaped.search(iri) else '<' + iri + '>'
+    if c == '_':
+        return '_:' + bnode_prefix + term[2:] if bnode_prefix else term
+
+    # Literals
+    if '\\' in term:
+        lexical, lang, datatype = rdf_stream.parse_literal(term)
+        term = rdf_stream.literal(lexical, lang, datatype)
+    if term.endswith(_xsd_string):
+        return term[:-len(_xsd_string)]
+    end = term.rindex('"')
+    if end < len(term) - 1 and term[end + 1] == '@':
+        return term[:end + 1] + term[end + 1:].lower()
+    return term
+
+
+def normalize(files_dataset, file_output, max_bytes=None, verbose=None):
+    """Normalizes and merges data files into one N-Triples file of distinct triples
+
+    :param files_dataset: Paths to the data files (List of Strings)
+    :param file_output: Path to the N-Triples file to write (String)
+    :param max_bytes: Memory used for sorting, in bytes. Defaults to config.normalize_sort_bytes [optional]
+    :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+    :return: NormalizationInfo
+    """
+    if max_bytes is None:
+        max_bytes = config.normalize_sort_bytes
+    if verbose is None:
+        verbose = config.verbose
+
+    info = NormalizationInfo()
+    info.files = len(files_dataset)
+    info.input_bytes = sum(os.path.getsize(file_dataset) for file_dataset in files_dataset)
+
+    def on_issue(kind, detail, line_number):
+        if kind == rdf_stream.ISSUE_UNDECLARED_PREFIX:
+            info.undeclared_prefixes += 1
+        elif kind == rdf_stream.ISSUE_SYNTAX_ERROR:
+            info.syntax_errors += 1
+
+    def statements():
+        for i, file_dataset in enumerate(files_dataset):
+            bnode_prefix = 'f' + str(i) + '_' if len(files_dataset) > 1 else ''
+            for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue):
+                info.ntriples_bytes += len(rdf_stream.ntriple(s, p, o).encode('UTF-8', errors='surrogatepass'))
+                yield rdf_stream.ntriple(canonical_term(s, bnode_prefix), canonical_term(p),
+                                         canonical_term(o, bnode_prefix))
+
+    # Runs of the external sort are written next to the output
+    dir_tmp = tempfile.mkdtemp(prefix='normalize_', dir=os.path.dirname(os.path.abspath(file_output)))
+    name = os.path.split(files_dataset[0])[1] if len(files_dataset) > 0 else file_output
+    try:
+        with profiling.span('normalize', dataset=name, bytes=info.input_bytes, files=info.files) as s:
+            info.triples = sort_statements(statements(), file_output, dir_tmp, max_bytes, unique=True)
+            info.distinct_triples = __count_statements(file_output)
+            info.duplicate_triples = info.triples - info.distinct_triples
+            info.normalized_bytes = os.path.getsize(file_output)
+            s.tag(triples=info.triples, distinct_triples=info.distinct_triples,
+                  ntriples_bytes=info.ntriples_bytes, normalized_bytes=info.normalized_bytes)
+    finally:
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+    if verbose:
+        print('Normalized ' + ', '.join(files_dataset) + ': ' + info.summary())
+
+    return info
+
+
+def __count_statements(file_ntriples):
+    # Counts the lines of an N-Triples file without decoding it
+    n_lines = 0
+    with open(file_ntriples, 'rb') as f:
+        while True:
+            block = f.read(__read_size)
+            if len(block) == 0:
+                return n_lines
+            n_lines += block.count(b'\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Normalizes data files and merges them into one N-Triples file, '
+                                                  'keeping each distinct triple once'))
+    parser.add_argument('files_dataset', nargs='+', metavar='file_dataset',
+                        help='Path to a data file, optionally compressed')
+    parser.add_argument('-o', dest='file_output', required=True, help='N-Triples output file')
+    parser.add_argument('--sort-bytes', dest='sort_bytes', type=int, default=None,
+                        help='Memory used for sorting, in bytes. Defaults to config.normalize_sort_bytes')
+    args = parser.parse_args()
+
+    for file_dataset in args.files_dataset:
+        if not os.path.exists(file_dataset):
+            sys.stderr.write('Data file not found: ' + file_dataset + '\n')
+            sys.exit(1)
+
+    info = normalize(args.files_dataset, args.file_output, args.sort_bytes, verbose=False)
+    print(info.summary())
+    if info.syntax_errors > 0 or info.undeclared_prefixes > 0:
+        print(str(info.syntax_errors) + ' statements could not be parsed, ' + str(info.undeclared_prefixes) +
+              ' prefixed names with an undeclared prefix')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Data files prepared for rdfunit
+
+rdfunit reads the data set from a file path. Compressed data sets (see rdf_input.py) are decompressed in one streaming
+pass, and serializations listed in config.input_convert_to_ntriples (e.g., N-Quads and RDF/XML) are converted to
+N-Triples in the same pass, so a compressed dump is never decompressed to disk in full before it is converted.
+
+The prepared data is written to a scratch file in config.path_input_scratch, a tmpfs folder such as /dev/shm by default.
+The scratch file is bounded by config.input_scratch_max_bytes: when it grows past the bound, it is moved to the
+rdfunit_jobs folder on disk and the rest of the data is written there, as it is when the scratch folder runs out of
+space. With config.input_pipe set, the data is instead
+streamed to rdfunit through a named pipe and never stored, which works with rdfunit setups that read the data set once.
+
+With config.normalize_input set, every data set is instead normalized into an N-Triples file of its distinct triples in
+the rdfunit_jobs folder (see normalization.py), which also decompresses and converts it, and rdfunit validates that
+file.
+
+Usage:
+with rdfunit_input.prepared_input(file_dataset) as file_input:
+    ... run rdfunit on file_input ...
+"""
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from ncats_translator_dqa import config, profiling, rdf_input, rdf_stream, sysinfo
+from ncats_translator_dqa.computational_metrics import normalization
+
+# Bytes copied or converted at a time
+_block_size = 1024 * 1024
+
+# Seconds between attempts to release the thread writing to a named pipe that rdfunit didn't read to the end
+_pipe_poll = 0.1
+
+# Share of the free space of the scratch folder used when config.input_scratch_max_bytes is 0, divided among the
+# validations that run at the same time
+_scratch_max_share = 0.5
+
+
+def needs_preparation(file_dataset):
+    """Checks whether a data set has to be prepared before rdfunit can read it
+
+    :param file_dataset: Path to the data set (String)
+    :return: True if the data set is compressed or normalized
+    """
+    return config.normalize_input or rdf_input.compression(file_dataset) is not None
+
+
+def prepared_name(file_dataset):
+    """Gets the file name of the prepared data set
+
+    :param file_dataset: Path to the data set (String)
+    :return: File name without the compression extension, with the .nt extension if the data set is converted or
+     normalized (String)
+    """
+    name = rdf_input.strip_compression(os.path.basename(file_dataset))
+    if config.normalize_input or rdf_stream.guess_format(file_dataset) in config.input_convert_to_ntriples:
+        name = os.path.splitext(name)[0] + '.nt'
+    return name
+
+
+def prepared_size(file_dataset):
+    """Estimates the size of the prepared data set, e.g., for sizing the JVM heap before it is written
+
+    :param file_dataset: Path to the data set (String)
+    :return: Size in bytes (Integer)
+    """
+    return rdf_input.expanded_size(file_dataset)
+
+
+@contextmanager
+def prepared_input(file_dataset, pipe=None, verbose=None):
+    """Prepares a data set for rdfunit
+
+    Data sets that don't need preparation (see needs_preparation()) are used as they are. With config.normalize_input
+    set, the data set is normalized. Otherwise it is decompressed, and converted to N-Triples if its serialization is
+    listed in config.input_convert_to_ntriples. The prepared file is removed when the block ends.
+
+    :param file_dataset: Path to the data set (String)
+    :param pipe: True to stream the data through a named pipe instead of a scratch file. Defaults to config.input_pipe
+     [optional]
+    :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+    :return: Context manager yielding the path to the file rdfunit should read (String)
+    """
+    if not needs_preparation(file_dataset):
+        yield file_dataset
+        return
+
+    if pipe is None:
+        pipe = config.input_pipe
+    if verbose is None:
+        verbose = config.verbose
+
+    # Pipes are not supported on Windows
+    if pipe and not hasattr(os, 'mkfifo'):
+        pipe = False
+
+    if not os.path.exists(config.path_rdfunit_jobs):
+        os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+    dir_input = tempfile.mkdtemp(prefix='input_', dir=config.path_rdfunit_jobs)
+    try:
+        if config.normalize_input:
+            file_input = os.path.join(dir_input, prepared_name(file_dataset))
+            normalization.normalize([file_dataset], file_input, verbose=verbose)
+            yield file_input
+        elif pipe:
+            with __piped(file_dataset, dir_input, verbose) as file_input:
+                yield file_input
+        else:
+            scratch = __scratch(file_dataset, dir_input, verbose)
+            try:
+                yield scratch.file
+            finally:
+                scratch.remove()
+    finally:
+        shutil.rmtree(dir_input, ignore_errors=True)
+
+
+def __scratch(file_dataset, dir_input, verbose):
+    """Writes the prepared data set to a scratch file
+
+    :param file_dataset: Path to the data set (String)
+    :param dir_input: Folder on disk for the prepared data set, if it doesn't fit into the scratch folder (String)
+    :param verbose: True if you want to print status messages
+    :return: ScratchFile with the prepared data set
+    """
+    # Without a scratch folder, the data set is prepared on disk
+    dir_scratch = config.path_input_scratch
+    max_bytes = None
+    if len(dir_scratch) == 0 or not os.path.isdir(dir_scratch):
+        dir_scratch = dir_input
+    elif config.input_scratch_max_bytes > 0:
+        max_bytes = config.input_scratch_max_bytes
+    else:
+        max_bytes = int(shutil.disk_usage(dir_scratch).free * _scratch_max_share / sysinfo.concurrency())
+
+    scratch = ScratchFile(dir_scratch, prepared_name(file_dataset), max_bytes, dir_input)
+    with profiling.span('input.prepare', dataset=file_dataset, bytes=os.path.getsize(file_dataset)) as s:
+        try:
+            write_prepared(file_dataset, scratch)
+        except BaseException:
+            scratch.close()
+            scratch.remove()
+            raise
+        scratch.close()
+        s.tag(prepared_bytes=scratch.size, spilled=scratch.spilled)
+
+    if verbose:
+        print('Prepared ' + file_dataset + ' for rdfunit: ' + str(scratch.size) + ' bytes in ' + scratch.file +
+              (' (scratch folder bound exceeded)' if scratch.spilled else ''))
+    return scratch
+
+
+@contextmanager
+def __piped(file_dataset, dir_input, verbose):
+    """Streams the prepared data set through a named pipe
+
+    The data is written by a thread, which blocks until rdfunit opens the pipe. If rdfunit never opens it or stops
+    reading, the thread is released when the block ends. An error while preparing the data is raised at the end of the
+    block, since rdfunit then only read part of the data set.
+
+    :param file_dataset: Path to the data set (String)
+    :param dir_input: Folder for the pipe (String)
+    :param verbose: True if you want to print status messages
+    :return: Context manager yielding the path to the pipe (String)
+    """
+    file_pipe = os.path.join(dir_input, prepared_name(file_dataset))
+    os.mkfifo(file_pipe)
+    errors = []
+
+    def write():
+        try:
+            with open(file_pipe, 'wb') as f:
+                write_prepared(file_dataset, f)
+        except BrokenPipeError:
+            # rdfunit stopped reading
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    if verbose:
+        print('Streaming ' + file_dataset + ' to rdfunit through ' + file_pipe)
+
+    thread = threading.Thread(target=write, name='input-pipe', daemon=True)
+    thread.start()
+    try:
+        yield file_pipe
+    finally:
+        while thread.is_alive():
+            # Open and close the reading end, so that a writer waiting for a reader, or for a reader to read, fails
+            try:
+                fd = os.open(file_pipe, os.O_RDONLY | os.O_NONBLOCK)
+            except OSError:
+                fd = None
+            thread.join(_pipe_poll)
+            if fd is not None:
+                os.close(fd)
+
+    if len(errors) > 0:
+        sys.stderr.write('Could not stream ' + file_dataset + ' to rdfunit\n')
+        raise errors[0]
+
+
+def write_prepared(file_dataset, output):
+    """Writes a data set decompressed, and converted to N-Triples if its serialization is listed in
+    config.input_convert_to_ntriples
+
+    :param file_dataset: Path to the data set (String)
+    :param output: Binary stream (e.g., a ScratchFile)
+    :return: None
+    """
+    if rdf_stream.guess_format(file_dataset) not in config.input_convert_to_ntriples:
+        with rdf_input.open_binary(file_dataset) as f:
+            while True:
+                block = f.read(_block_size)
+                if len(block) == 0:
+                    return
+                output.write(block)
+
+    # Convert to N-Triples, writing blocks of statements
+    lines = []
+    n_chars = 0
+
+    def on_issue(kind, detail, line_number):
+        sys.stderr.write(file_dataset + (':' + str(line_number) if line_number is not None else '') + ': ' + kind +
+                         ': ' + detail + '\n')
+
+    for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue):
+        line = rdf_stream.ntriple(s, p, o)
+        lines.append(line)
+        n_chars += len(line)
+        if n_chars >= _block_size:
+            output.write(''.join(lines).encode('UTF-8', errors='surrogatepass'))
+            lines = []
+            n_chars = 0
+    output.write(''.join(lines).encode('UTF-8', errors='surrogatepass'))
+
+
+class ScratchFile:
+    """Binary file in a scratch folder that is moved to another folder when it grows past a size bound or the scratch
+    folder runs out of space
+
+    Public members:
+    file - Current path of the file
+    size - Bytes written
+    spilled - True if the file was moved out of the scratch folder
+    """
+
+    def __init__(self, dir_scratch, name, max_bytes, dir_spill):
+        """Constructor
+
+        :param dir_scratch: Scratch folder. The file is written to a new folder in it (String)
+        :param name: File name (String)
+        :param max_bytes: Size bound of the file in the scratch folder in bytes, or None for no bound, in which case
+         running out of space is an error (Integer)
+        :param dir_spill: Folder the file is moved to when it grows past max_bytes (String)
+        """
+        self.__dir = tempfile.mkdtemp(prefix='input_', dir=dir_scratch)
+        self.file = os.path.join(self.__dir, name)
+        self.size = 0
+        self.spilled = False
+        self.__max_bytes = max_bytes
+        self.__file_spill = os.path.join(dir_spill, name)
+        # Unbuffered, so the file holds everything written so far when the scratch folder runs out of space
+        self.__f = open(self.file, 'wb', buffering=0)
+
+    def write(self, data):
+        if not self.spilled and self.__max_bytes is not None and self.size + len(data) > self.__max_bytes:
+            self.__spill()
+        data = memoryview(data)
+        while len(data) > 0:
+            try:
+                n = self.__f.write(data)
+            except OSError as e:
+                if e.errno != errno.ENOSPC or self.spilled or self.__max_bytes is None:
+                    raise
+                self.__spill()
+                continue
+            data = data[n:]
+            self.size += n
+
+    def close(self):
+        self.__f.close()
+
+    def remove(self):
+        """Removes the file and its folder in the scratch folder
+        """
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        shutil.rmtree(self.__dir, ignore_errors=True)
+
+    def __spill(self):
+        """Moves the file out of the scratch folder and continues writing at its new location
+        """
+        self.__f.close()
+        shutil.move(self.file, self.__file_spill)
+        self.file = self.__file_spill
+        self.spilled = True
+        self.__f = open(self.file, 'ab', buffering=0)
@@ -0,0 +1,138 @@
+"""Stub of the RDFUnit command line tools for benchmarks
+
+Creates an RDFUnit folder whose bin/rdfunit takes the same arguments as RDFUnit, waits for a configurable time and
+writes a SHACL results file with a test execution and about one violation per configurable number of lines of the
+dataset. Whether a line is a violation depends only on its content, so validating a part of a dataset reports the same
+violations for it as validating the whole dataset.
+Its bin/dqv-report writes a W3C DQV report with the number of violations in a results file. Point config.path_rdfunit
+at the folder to run the pipeline without Java or an RDFUnit build.
+"""
+import os
+import sys
+import stat
+
+# Source of bin/rdfunit. Runs with the Python interpreter that created the stub and does not import this package
+__script = '''#!{python}
+"""Stub of bin/rdfunit created by ncats_translator_dqa.computational_metrics.rdfunit_stub
+"""
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+
+LATENCY = {latency!r}
+SECONDS_PER_MB = {seconds_per_mb!r}
+VIOLATION_EVERY = {violation_every!r}
+N_TEST_CASES = 5
+
+args = sys.argv[1:]
+if '-d' not in args:
+    sys.stderr.write('rdfunit stub: missing -d argument\\n')
+    sys.exit(2)
+file_dataset = args[args.index('-d') + 1]
+dir_data = args[args.index('-f') + 1] if '-f' in args else 'data/'
+started = datetime.now().isoformat(timespec='seconds')
+time.sleep(LATENCY + SECONDS_PER_MB * os.path.getsize(file_dataset) / 1024 ** 2)
+
+dir_results = os.path.join(dir_data, 'results')
+os.makedirs(dir_results, exist_ok=True)
+name = os.path.abspath(file_dataset).replace(os.sep, '_')
+execution = '<urn:rdfunit-stub:execution:' + name + '>'
+n_lines = 0
+n_violations = 0
+with open(os.path.join(dir_results, name + '.shaclFullTestCaseResult.ttl'), 'w', encoding='UTF-8') as out, \\
+        open(file_dataset, 'rb') as data:
+    out.write('@prefix rut: <http://rdfunit.aksw.org/ns/core#> .\\n'
+              '@prefix sh: <http://www.w3.org/ns/shacl#> .\\n'
+              '@prefix prov: <http://www.w3.org/ns/prov#> .\\n'
+              '@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\\n\\n')
+    for line in data:
+        n_lines += 1
+        h = zlib.crc32(line.strip())
+        if VIOLATION_EVERY > 0 and h % VIOLATION_EVERY == 0:
+            n_violations += 1
+            # The subject of the line is the focus node
+            focus = line.split(b'>', 1)[0].decode('UTF-8', 'replace') + '>' if line.startswith(b'<') else \\
+                '<urn:rdfunit-stub:line%d>' % n_lines
+            out.write('_:r%d a sh:ValidationResult ; sh:focusNode %s ; '
+                      'sh:resultSeverity sh:Violation ; sh:resultMessage "Stub violation" ; '
+                      'rut:testCase <urn:rdfunit-stub:testCase%d> ; prov:wasGeneratedBy %s .\\n'
+                      % (n_violations, focus, h // VIOLATION_EVERY % N_TEST_CASES, execution))
+    n_failed = min(n_violations, N_TEST_CASES)
+    out.write('%s a rut:TestExecution ; prov:used <file://%s> ; rut:testsRun %d ; rut:testsSuceeded %d ; '
+              'rut:testsFailed %d ; rut:testsTimeout 0 ; rut:testsError 0 ; rut:totalIndividualErrors %d ; '
+              'prov:startedAtTime "%s"^^xsd:dateTime ; prov:endedAtTime "%s"^^xsd:dateTime .\\n'
+              % (execution, os.path.abspath(file_dataset), N_TEST_CASES, N_TEST_CASES - n_failed, n_failed,
+                 n_violations, started, datetime.now().isoformat(timespec='seconds')))
+with open(os.path.join(dir_results, name + '.shaclFullTestCaseResult.html'), 'w', encoding='UTF-8') as out:
+    out.write('<html><body>%d violations</body></html>\\n' % n_violations)
+'''
+
+# Source of bin/dqv-report
+__script_dqv_report = '''#!{python}
+"""Stub of bin/dqv-report created by ncats_translator_dqa.computational_metrics.rdfunit_stub
+"""
+import os
+import sys
+import time
+
+LATENCY = {latency!r}
+
+args = sys.argv[1:]
+if '-i' not in args or '-o' not in args:
+    sys.stderr.write('dqv-report stub: missing -i or -o argument\\n')
+    sys.exit(2)
+file_input = args[args.index('-i') + 1]
+file_output = args[args.index('-o') + 1]
+time.sleep(LATENCY)
+
+with open(file_input, encoding='UTF-8') as f:
+    n_violations = sum(line.count('sh:ValidationResult') for line in f)
+os.makedirs(os.path.dirname(file_output) or '.', exist_ok=True)
+with open(file_output, 'w', encoding='UTF-8') as out:
+    out.write('@prefix dqv: <http://www.w3.org/ns/dqv#> .\\n'
+              '@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\\n\\n'
+              '<urn:rdfunit-stub:measurement:%s> a dqv:QualityMeasurement ; '
+              'dqv:computedOn <file://%s> ; dqv:isMeasurementOf <urn:rdfunit-stub:violations> ; '
+              'dqv:value "%d"^^xsd:integer .\\n'
+              % (os.path.basename(file_input), os.path.abspath(file_input), n_violations))
+'''
+
+# RDFUnit project file, read by RDFUnitWrapper.version()
+__pom = '''<project>
+  <artifactId>rdfunit-parent</artifactId>
+  <version>stub</version>
+</project>
+'''
+
+
+def make_rdfunit_stub(path_rdfunit, latency=0.5, seconds_per_mb=0, violation_every=100, report_latency=0.1):
+    """Creates an RDFUnit folder with a stub bin/rdfunit and bin/dqv-report
+
+    :param path_rdfunit: Folder to create (String)
+    :param latency: Time in seconds each validation takes, e.g., for starting the JVM and loading the test cases
+     (Float) [optional]
+    :param seconds_per_mb: Additional time in seconds for each MB of the dataset (Float) [optional]
+    :param violation_every: Number of dataset lines per reported violation. 0 reports no violations (Integer)
+     [optional]
+    :param report_latency: Time in seconds each run of dqv-report takes (Float) [optional]
+    :return: path_rdfunit (String)
+    """
+    dir_bin = os.path.join(path_rdfunit, 'bin')
+    os.makedirs(dir_bin, exist_ok=True)
+    os.makedirs(os.path.join(path_rdfunit, 'data'), exist_ok=True)
+
+    scripts = {'rdfunit': __script.format(python=sys.executable, latency=float(latency),
+                                          seconds_per_mb=float(seconds_per_mb), violation_every=int(violation_every)),
+               'dqv-report': __script_dqv_report.format(python=sys.executable, latency=float(report_latency))}
+    for name, script in scripts.items():
+        file_script = os.path.join(dir_bin, name)
+        with open(file_script, 'w', encoding='UTF-8') as f:
+            f.write(script)
+        os.chmod(file_script, os.stat(file_script).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    with open(os.path.join(path_rdfunit, 'pom.xml'), 'w', encoding='UTF-8') as f:
+        f.write(__pom)
+
+    return path_rdfunit
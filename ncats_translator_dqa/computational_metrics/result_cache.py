@@ -0,0 +1,149 @@
+"""Content-addressed cache of computational metrics results
+
+Results are keyed by a fingerprint of the dataset's content, the schema argument and the RDFUnit version, so datasets
+that have not changed since the last run can reuse their results instead of being validated again.
+"""
+import os
+import json
+import mmap
+import shutil
+import hashlib
+from ncats_translator_dqa import config
+
+# Number of bytes hashed at a time
+FINGERPRINT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def fingerprint(file, chunk_size=FINGERPRINT_CHUNK_SIZE):
+    """Computes a fingerprint of the content of a file
+
+    The file is memory-mapped and hashed with BLAKE2b in chunks, so memory use does not depend on the file size.
+
+    :param file: Path to the file (String)
+    :param chunk_size: Number of bytes hashed at a time (Integer) [optional]
+    :return: Hex digest (String)
+    """
+    h = hashlib.blake2b(digest_size=32)
+    with open(file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(0, size, chunk_size):
+                h.update(mm[offset:offset + chunk_size])
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of computational metrics results
+
+    The cache folder contains:
+    fingerprints/ - fingerprints of dataset files, with the file stats they were computed for
+    results/<key>/ - the cached results files for one cache key
+    """
+    __dir_fingerprints = 'fingerprints'
+    __dir_results = 'results'
+
+    def __init__(self, path_cache=None, verbose=None):
+        """Constructor
+
+        :param path_cache: Path to the cache folder. Defaults to config.path_result_cache [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.path_cache = path_cache if path_cache is not None else config.path_result_cache
+        self.verbose = verbose if verbose is not None else config.verbose
+
+        for folder in (ResultCache.__dir_fingerprints, ResultCache.__dir_results):
+            os.makedirs(os.path.join(self.path_cache, folder), exist_ok=True)
+
+    def file_fingerprint(self, file):
+        """Gets the fingerprint of a dataset file
+
+        The file's stats are checked first. The content is only hashed if the size, modification time or inode changed
+        since the fingerprint was last computed.
+
+        :param file: Path to the dataset file (String)
+        :return: Hex digest (String)
+        """
+        file = os.path.abspath(file)
+        st = os.stat(file)
+        stats = [st.st_size, st.st_mtime_ns, st.st_ino]
+
+        name = hashlib.sha256(file.encode('UTF-8')).hexdigest() + '.json'
+        file_memo = os.path.join(self.path_cache, ResultCache.__dir_fingerprints, name)
+        try:
+            with open(file_memo) as f:
+                memo = json.load(f)
+            if memo['file'] == file and memo['stats'] == stats:
+                return memo['fingerprint']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if self.verbose:
+            print('Computing fingerprint of ' + file)
+        digest = fingerprint(file)
+
+        memo = {'file': file, 'stats': stats, 'fingerprint': digest}
+        file_tmp = file_memo + '.' + str(os.getpid()) + '.tmp'
+        with open(file_tmp, 'w') as f:
+            json.dump(memo, f)
+        os.replace(file_tmp, file_memo)
+
+        return digest
+
+    def key(self, file_dataset, schema, rdfunit_version):
+        """Gets the cache key for validating a dataset
+
+        :param file_dataset: Path to the dataset file (String)
+        :param schema: Schema argument of the validation (String)
+        :param rdfunit_version: RDFUnit version identifier (String)
+        :return: Cache key (String)
+        """
+        h = hashlib.sha256()
+        for part in (self.file_fingerprint(file_dataset), schema, rdfunit_version):
+            h.update(part.encode('UTF-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def restore(self, key, files_output):
+        """Copies cached results to the given output files
+
+        The first file is the main results file and must be in the cache for a hit. The others are restored if they
+        were stored.
+
+        :param key: Cache key (String)
+        :param files_output: List of paths to write the results files to, in the order they were stored
+        :return: True on a cache hit, False on a miss
+        """
+        dir_entry = os.path.join(self.path_cache, ResultCache.__dir_results, key)
+        files_cached = [os.path.join(dir_entry, str(i)) for i in range(len(files_output))]
+        if not os.path.exists(files_cached[0]):
+            return False
+
+        for file_cached, file_output in zip(files_cached, files_output):
+            if os.path.exists(file_cached):
+                shutil.copyfile(file_cached, file_output)
+
+        if self.verbose:
+            print('Result cache hit: ' + ', '.join(files_output))
+        return True
+
+    def store(self, key, files_output):
+        """Stores results files in the cache
+
+        Files that don't exist are skipped.
+
+        :param key: Cache key (String)
+        :param files_output: List of paths to the results files
+        :return: None
+        """
+        dir_entry = os.path.join(self.path_cache, ResultCache.__dir_results, key)
+        dir_tmp = dir_entry + '.' + str(os.getpid()) + '.tmp'
+        os.makedirs(dir_tmp, exist_ok=True)
+        for i, file_output in enumerate(files_output):
+            if os.path.exists(file_output):
+                shutil.copyfile(file_output, os.path.join(dir_tmp, str(i)))
+
+        # Replace any previous entry
+        shutil.rmtree(dir_entry, ignore_errors=True)
+        os.replace(dir_tmp, dir_entry)
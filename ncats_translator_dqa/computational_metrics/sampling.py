@@ -0,0 +1,287 @@
+"""Sampled validation for fast quality estimates of very large datasets
+
+The dataset is read once as a stream and a random sample of its subjects is drawn, keeping all triples of each sampled
+subject. A subject is sampled if a hash of it, keyed with the seed, falls below the sampling fraction, so the sample is
+reproducible, doesn't depend on the order of the triples and needs no memory beyond the output and a fixed-size sketch
+for counting the sampled subjects. Only the sample is validated.
+
+The number of violations of each test (or the value of each lite metric) is extrapolated to the whole dataset from
+the share of triples in the sample, with a Wilson score confidence interval of the rate per triple. Since whole
+subjects are sampled, problems of the same subject are correlated, and the intervals are somewhat too narrow for tests
+whose violations are concentrated on a few subjects. Tests without violations in the sample are not reported. The
+triple count and the syntax problems found while reading the dataset are exact.
+
+The results are written in W3C DQV, every extrapolated measurement marked as estimated with its confidence interval,
+its value in the sample and the sampled fraction (see DQVWriter.add_estimated_measurement()).
+
+Usage from the command line:
+python3 -m ncats_translator_dqa.computational_metrics.sampling <data set> [--fraction 0.01] [--engine lite]
+"""
+import os
+import sys
+import math
+import shutil
+import hashlib
+import tempfile
+import argparse
+from statistics import NormalDist
+from rdflib.namespace import XSD
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.computational_metrics.RDFUnitWorker import get_shared_worker
+from ncats_translator_dqa.computational_metrics.lite_validator import LiteValidator
+from ncats_translator_dqa.preliminary_statistics.prelim_stats_rdf import DQVWriter
+from ncats_translator_dqa.preliminary_statistics.void_profiler import HyperLogLog
+from ncats_translator_dqa.results_store import read_results_file
+
+# Number of bytes buffered by the sample file
+__write_buffer = 1024 * 1024
+
+# Bytes of the subject hash compared with the sampling fraction
+__hash_bytes = 8
+
+# Lite metrics that are measured exactly while sampling instead of being estimated
+__exact_metrics = ['tripleCountMetric', 'undeclaredPrefixesMetric', 'syntaxErrorsMetric']
+
+
+class SampleInfo:
+    """Size of a dataset and of its sample
+
+    Public members:
+    triples - Number of triples in the dataset
+    sampled_triples - Number of triples in the sample
+    sampled_subjects - Number of subjects in the sample, estimated with a HyperLogLog sketch
+    fraction - Sampling fraction of subjects (Float)
+    seed - Seed of the subject hash (Integer)
+    undeclared_prefixes - Number of prefixed names with an undeclared prefix in the dataset
+    syntax_errors - Number of statements of the dataset that could not be parsed
+    """
+
+    def __init__(self, fraction, seed):
+        self.triples = 0
+        self.sampled_triples = 0
+        self.sampled_subjects = 0
+        self.fraction = fraction
+        self.seed = seed
+        self.undeclared_prefixes = 0
+        self.syntax_errors = 0
+
+
+class Estimate:
+    """Extrapolated value of a test or metric
+
+    Public members:
+    metric - Local name of the lite metric or IRI of the test case (String)
+    sample_value - Value in the sample (Integer)
+    value - Estimated value for the whole dataset (Integer)
+    lower - Lower bound of the confidence interval (Integer)
+    upper - Upper bound of the confidence interval (Integer)
+    """
+
+    def __init__(self, metric, sample_value, value, lower, upper):
+        self.metric = metric
+        self.sample_value = sample_value
+        self.value = value
+        self.lower = lower
+        self.upper = upper
+
+
+def sample_dataset(file_dataset, file_sample, fraction, seed=0):
+    """Writes a sample of the subjects of a dataset, with all their triples, as N-Triples
+
+    :param file_dataset: Path to the dataset file (String)
+    :param file_sample: Path to the N-Triples file to write (String)
+    :param fraction: Fraction of subjects to sample, between 0 and 1 (Float)
+    :param seed: Seed of the subject hash. Different seeds draw independent samples (Integer) [optional]
+    :return: SampleInfo
+    """
+    info = SampleInfo(fraction, seed)
+    threshold = int(fraction * 2 ** (8 * __hash_bytes))
+    key = str(seed).encode('UTF-8')
+    subjects = HyperLogLog()
+
+    def on_issue(kind, detail, line_number):
+        if kind == rdf_stream.ISSUE_UNDECLARED_PREFIX:
+            info.undeclared_prefixes += 1
+        elif kind == rdf_stream.ISSUE_SYNTAX_ERROR:
+            info.syntax_errors += 1
+
+    with open(file_sample, 'w', encoding='UTF-8', buffering=__write_buffer) as sample:
+        # Consecutive triples often share a subject, so the last decision is remembered
+        subject_last = None
+        keep = False
+        for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue):
+            info.triples += 1
+            if s != subject_last:
+                subject_last = s
+                h = hashlib.blake2b(s.encode('UTF-8', errors='surrogatepass'), digest_size=__hash_bytes, key=key)
+                keep = int.from_bytes(h.digest(), 'big') < threshold
+                if keep:
+                    subjects.add(s)
+            if keep:
+                sample.write(rdf_stream.ntriple(s, p, o))
+                info.sampled_triples += 1
+
+    info.sampled_subjects = subjects.count()
+    return info
+
+
+def wilson_interval(k, n, confidence=0.95):
+    """Gets the Wilson score interval of a proportion
+
+    :param k: Number of successes (Integer)
+    :param n: Number of trials (Integer)
+    :param confidence: Confidence level (Float) [optional]
+    :return: Tuple (lower bound, upper bound) of the proportion
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = k / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+def extrapolate(counts, info, confidence=0.95):
+    """Extrapolates counts in the sample to the whole dataset
+
+    :param counts: List of tuples (metric, count in the sample)
+    :param info: SampleInfo
+    :param confidence: Confidence level of the intervals (Float) [optional]
+    :return: List of Estimate
+    """
+    estimates = []
+    n = info.sampled_triples
+    for metric, count in counts:
+        if n == 0:
+            estimates.append(Estimate(metric, count, count, count, count))
+            continue
+        lower, upper = wilson_interval(min(count, n), n, confidence)
+        value = count * info.triples / n
+        estimates.append(Estimate(metric, count, int(round(value)), int(math.floor(min(lower * info.triples, value))),
+                                  int(math.ceil(max(upper * info.triples, value)))))
+    return estimates
+
+
+def sampled_validation(file_dataset, file_output, schema='', engine='rdfunit', fraction=None, seed=None,
+                       confidence=None, sources=None):
+    """Validates a sample of a dataset and writes the extrapolated results in W3C DQV
+
+    :param file_dataset: Absolute path to the dataset file (String)
+    :param file_output: Path to the turtle file to write (String)
+    :param schema: Schema argument for rdfunit (String) [optional]
+    :param engine: Validation engine, 'rdfunit' or 'lite' [optional]
+    :param fraction: Fraction of subjects to sample. Defaults to config.sample_fraction [optional]
+    :param seed: Seed of the sample. Defaults to config.sample_seed [optional]
+    :param confidence: Confidence level of the intervals. Defaults to config.sample_confidence [optional]
+    :param sources: Schemas resolved for the whole dataset, used for the sample (SchemaSources) [optional]
+    :return: Tuple (SampleInfo, List of Estimate)
+    """
+    fraction = fraction if fraction is not None else config.sample_fraction
+    seed = seed if seed is not None else config.sample_seed
+    confidence = confidence if confidence is not None else config.sample_confidence
+    if not 0 < fraction <= 1:
+        raise ValueError('The sampling fraction must be between 0 and 1, not ' + str(fraction))
+
+    if not os.path.exists(config.path_rdfunit_jobs):
+        os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+    name = os.path.splitext(os.path.split(file_dataset)[1])[0]
+    dir_sample = tempfile.mkdtemp(prefix=name + '_sample_', dir=config.path_rdfunit_jobs)
+
+    try:
+        file_sample = os.path.join(dir_sample, name + '.sample.nt')
+        with profiling.span('sample', dataset=file_dataset, bytes=os.path.getsize(file_dataset)) as s:
+            info = sample_dataset(file_dataset, file_sample, fraction, seed)
+            s.tag(triples=info.triples, sampled_triples=info.sampled_triples)
+        if config.verbose:
+            print('Sampled ' + str(info.sampled_triples) + ' of ' + str(info.triples) + ' triples (' +
+                  str(info.sampled_subjects) + ' subjects) from ' + file_dataset)
+
+        if engine == 'lite':
+            result = LiteValidator().validate(file_sample)
+            counts = [(metric, value) for metric, value in result.metrics() if metric not in __exact_metrics]
+        else:
+            # Count the violations of each test case in the sample
+            file_results = RDFUnitWrapper(worker=get_shared_worker()).rdfunit(file_sample, schema, sources)
+            violations, _ = read_results_file(file_results)
+            counts = sorted(violations.items())
+            for file_sample_output in RDFUnitWrapper.output_files(file_sample):
+                if os.path.exists(file_sample_output):
+                    os.remove(file_sample_output)
+    finally:
+        shutil.rmtree(dir_sample, ignore_errors=True)
+
+    estimates = extrapolate(counts, info, confidence)
+    write_dqv(file_dataset, file_output, info, estimates, confidence)
+
+    if config.verbose:
+        print('Sampled validation finished. output file: ' + file_output)
+
+    return info, estimates
+
+
+def write_dqv(file_dataset, file_output, info, estimates, confidence):
+    """Writes the results of a sampled validation in W3C DQV
+
+    :param file_dataset: Path to the dataset file (String)
+    :param file_output: Path to the turtle file to write (String)
+    :param info: SampleInfo
+    :param estimates: List of Estimate
+    :param confidence: Confidence level of the intervals (Float)
+    :return: None
+    """
+    filename_dataset = os.path.split(file_dataset)[1]
+    dataset_id = ''.join([c for c in filename_dataset if c.isalnum()]) + 'Dataset'
+    sample_fraction = info.sampled_triples / info.triples if info.triples > 0 else 0
+    with DQVWriter(file_output) as writer:
+        writer.add_dataset(dataset_id, byte_size=os.path.getsize(file_dataset))
+        writer.add_measurement_value('tripleCountMetric', info.triples, XSD.integer)
+        writer.add_measurement_value('undeclaredPrefixesMetric', info.undeclared_prefixes, XSD.integer)
+        writer.add_measurement_value('syntaxErrorsMetric', info.syntax_errors, XSD.integer)
+        for estimate in estimates:
+            writer.add_estimated_measurement(estimate.metric, estimate.value, estimate.lower, estimate.upper,
+                                             estimate.sample_value, round(sample_fraction, 6), confidence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Estimates the data quality of a large data set by validating a '
+                                                  'random sample of its subjects'))
+    parser.add_argument('file_dataset', help='Path to the data set file')
+    parser.add_argument('--fraction', type=float, default=None,
+                        help='Fraction of subjects to sample. Defaults to config.sample_fraction, or 0.01 if that is 0')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the sample. Defaults to config.sample_seed')
+    parser.add_argument('--confidence', type=float, default=None,
+                        help='Confidence level of the intervals. Defaults to config.sample_confidence')
+    parser.add_argument('-e', dest='engine', choices=['rdfunit', 'lite'], default=None,
+                        help='Validation engine. Defaults to config.computational_metrics_engine')
+    parser.add_argument('-s', dest='schema', default='', help='Schema for rdfunit')
+    parser.add_argument('-o', dest='file_output', default=None,
+                        help='DQV output file. Defaults to <data set>_sample.ttl in the output folder')
+    args = parser.parse_args()
+
+    fraction = args.fraction if args.fraction is not None else (config.sample_fraction or 0.01)
+    engine = args.engine if args.engine is not None else config.computational_metrics_engine
+    file_output = args.file_output
+    if file_output is None:
+        name = os.path.splitext(os.path.split(args.file_dataset)[1])[0]
+        file_output = os.path.join(config.path_output, name + '_sample.ttl')
+    if not os.path.exists(args.file_dataset):
+        sys.stderr.write('Data set not found: ' + args.file_dataset + '\n')
+        sys.exit(1)
+
+    info, estimates = sampled_validation(os.path.abspath(args.file_dataset), file_output, args.schema, engine,
+                                         fraction, args.seed, args.confidence)
+    confidence = args.confidence if args.confidence is not None else config.sample_confidence
+    print('Sample: ' + str(info.sampled_triples) + ' of ' + str(info.triples) + ' triples, ' +
+          str(info.sampled_subjects) + ' subjects')
+    print('{:<60} {:>10} {:>12} {:>27}'.format('test / metric', 'sample', 'estimate',
+                                              '{:.0%} confidence interval'.format(confidence)))
+    for estimate in sorted(estimates, key=lambda e: -e.value):
+        print('{:<60} {:>10} {:>12} {:>27}'.format(estimate.metric[-60:], estimate.sample_value, estimate.value,
+                                                  '[' + str(estimate.lower) + ', ' + str(estimate.upper) + ']'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,614 @@
+"""Local mirror of ontologies and schemas, and cache of the test suites RDFUnit generates from them
+
+Without a schema, rdfunit looks up the vocabularies used by a dataset and downloads them, and it generates its test
+cases from every schema again on each run. With config.schema_mirror set, the mirror keeps a local copy of each
+ontology, keyed by its IRI, and rdfunit is pointed at the local copies through the schemaDecl.csv file of its private
+data folder. The vocabularies a dataset uses are detected from its predicates and classes and are downloaded to the
+mirror the first time they are seen, or ahead of time with the prefetch command:
+
+python -m ncats_translator_dqa.computational_metrics.schema_mirror foaf http://purl.obolibrary.org/obo/go.owl
+python -m ncats_translator_dqa.computational_metrics.schema_mirror -d /home/user/data/data.ttl
+
+The test cases rdfunit generates are kept in the test suite cache, keyed by the content of the schemas and the RDFUnit
+version, and copied into the private data folder of later runs, so datasets that share their schemas reuse them.
+
+When a detected vocabulary can't be downloaded, rdfunit detects the schemas of the dataset itself, as without the
+mirror. Failed downloads are recorded and tried again after config.schema_retry_seconds.
+
+In offline mode (config.schema_offline), which implies the mirror, nothing is downloaded: a schema that is not in the
+mirror raises SchemaOfflineError before rdfunit is started, and detected vocabularies that are not in the mirror are
+left out with a warning.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import filecmp
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit
+import requests
+from ncats_translator_dqa import config, rdf_stream
+
+# Shared mirror and test suite cache of this process
+_mirror = None
+_test_suites = None
+_lock = threading.Lock()
+
+# rdf:type, whose objects are the classes used by a dataset
+_rdf_type = '<' + rdf_stream.RDF + 'type>'
+
+# Prefixes of the mirrored schemas in the schemaDecl.csv files written for rdfunit
+_declared_prefix = 'mirror'
+
+
+class SchemaOfflineError(Exception):
+    """Raised in offline mode when a schema is not in the local mirror
+    """
+    pass
+
+
+class SchemaSources:
+    """Schemas of a validation, resolved to the local mirror
+
+    Public members:
+    argument - Value of the -s argument to rdfunit, or '' to let rdfunit detect the schemas itself (String)
+    declarations - List of tuples (prefix, namespace IRI, path to the local copy) to add to rdfunit's schemaDecl.csv
+    key - Identifier of the schemas and their content for the test suite cache, or None if rdfunit detects the schemas
+     itself (String)
+    """
+
+    def __init__(self, argument, declarations=None, key=None):
+        self.argument = argument
+        self.declarations = declarations or []
+        self.key = key
+
+
+class SchemaMirror:
+    """Local copies of ontologies and schemas, keyed by their IRI
+
+    Each schema is stored as two files named by the SHA-256 hash of its IRI: the ontology in the format it was served
+    in (.ttl, .rdf, .nt, .jsonld) and a JSON file with its IRI, prefix, download URL, content hash and download time.
+    IRIs that could not be downloaded are recorded without a file, so they are not tried again on every run, but only
+    once the record is older than the retry interval.
+    """
+    __ext_meta = '.json'
+
+    # Formats requested when downloading a schema, and the file extension of each
+    __accept = ('text/turtle, application/rdf+xml;q=0.9, application/n-triples;q=0.8, application/ld+json;q=0.5, '
+                '*/*;q=0.1')
+    __content_types = {
+        'text/turtle': '.ttl',
+        'application/x-turtle': '.ttl',
+        'text/n3': '.n3',
+        'application/rdf+xml': '.rdf',
+        'application/xml': '.rdf',
+        'text/xml': '.rdf',
+        'application/owl+xml': '.owl',
+        'application/n-triples': '.nt',
+        'application/ld+json': '.jsonld'
+    }
+    __extensions = ['.ttl', '.n3', '.rdf', '.owl', '.xml', '.nt', '.jsonld']
+
+    # Seconds to wait for a server while downloading a schema
+    __timeout = 60
+
+    def __init__(self, path_mirror=None, offline=None, path_rdfunit=None, retry_seconds=None, verbose=None):
+        """Constructor
+
+        :param path_mirror: Path to the mirror folder. Defaults to config.path_schema_mirror [optional]
+        :param offline: True to never download schemas. Defaults to config.schema_offline [optional]
+        :param path_rdfunit: RDFUnit folder whose data/schemaDecl.csv defines schema prefixes. Defaults to
+         config.path_rdfunit [optional]
+        :param retry_seconds: Seconds before a failed download is tried again. Defaults to config.schema_retry_seconds
+         [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.path_mirror = path_mirror if path_mirror is not None else config.path_schema_mirror
+        self.offline = offline if offline is not None else config.schema_offline
+        self.path_rdfunit = path_rdfunit if path_rdfunit is not None else config.path_rdfunit
+        self.retry_seconds = retry_seconds if retry_seconds is not None else config.schema_retry_seconds
+        self.verbose = verbose if verbose is not None else config.verbose
+        self.__lock = threading.Lock()
+
+        if not os.path.exists(self.path_mirror):
+            os.makedirs(self.path_mirror, exist_ok=True)
+
+    def entry(self, iri):
+        """Gets the record of a schema in the mirror
+
+        An IRI ending in '#' also matches the same IRI without it, and the other way around.
+
+        :param iri: Ontology or namespace IRI (String)
+        :return: Dictionary with keys 'iri', 'prefix', 'url', 'file' (file name, or None if the download failed),
+         'sha256', 'fetched' and 'error', or None if the IRI is not in the mirror
+        """
+        variants = [iri, iri[:-1]] if iri.endswith('#') else [iri, iri + '#']
+        for variant in variants:
+            meta = self.__read_meta(self.__meta_file(variant))
+            if meta is not None:
+                return meta
+        return None
+
+    def lookup(self, iri):
+        """Gets the local copy of a schema
+
+        :param iri: Ontology or namespace IRI (String)
+        :return: Path to the local copy (String), or None if it is not in the mirror
+        """
+        meta = self.entry(iri)
+        if meta is None or meta['file'] is None:
+            return None
+        file_schema = os.path.join(self.path_mirror, meta['file'])
+        return file_schema if os.path.exists(file_schema) else None
+
+    def entries(self):
+        """Gets the records of all schemas in the mirror, see entry()
+
+        :return: List of dictionaries, sorted by IRI
+        """
+        entries = []
+        for filename in os.listdir(self.path_mirror):
+            if filename.endswith(SchemaMirror.__ext_meta):
+                meta = self.__read_meta(os.path.join(self.path_mirror, filename))
+                if meta is not None:
+                    entries.append(meta)
+        return sorted(entries, key=lambda meta: meta['iri'])
+
+    def prefixes(self):
+        """Gets the schema prefixes known to RDFUnit (data/schemaDecl.csv) and to the mirror
+
+        :return: Dictionary {prefix: tuple (namespace IRI, download URL)}
+        """
+        prefixes = {}
+        file_decl = os.path.join(self.path_rdfunit, 'data', 'schemaDecl.csv')
+        if os.path.exists(file_decl):
+            with open(file_decl, encoding='UTF-8') as f:
+                for line in f:
+                    fields = [field.strip() for field in line.split(',')]
+                    if len(fields) >= 2 and len(fields[0]) > 0 and not fields[0].startswith('#'):
+                        prefixes[fields[0]] = (fields[1], fields[2] if len(fields) > 2 and fields[2] else fields[1])
+        for meta in self.entries():
+            if meta.get('prefix'):
+                prefixes[meta['prefix']] = (meta['iri'], meta['url'])
+        return prefixes
+
+    def fetch(self, iri, url=None, prefix=None, refresh=False):
+        """Downloads a schema to the mirror unless it is already there
+
+        A download that failed is tried again once its record is older than retry_seconds.
+
+        :param iri: Ontology or namespace IRI the schema is stored under (String)
+        :param url: URL to download the schema from. Defaults to the IRI [optional]
+        :param prefix: Prefix of the schema, e.g., 'foaf' [optional]
+        :param refresh: True to download the schema again even if it is in the mirror, or failed recently [optional]
+        :return: Path to the local copy (String), or None if the schema could not be downloaded
+        """
+        meta = self.entry(iri)
+        if not refresh and meta is not None and not self.__expired(meta):
+            return self.lookup(iri)
+
+        if self.offline:
+            raise SchemaOfflineError('Schema is not in the local mirror (offline mode): ' + iri)
+
+        if url is None:
+            url = iri
+        meta = {'iri': iri, 'prefix': prefix, 'url': url, 'file': None, 'sha256': None, 'fetched': time.time(),
+                'error': None}
+        if self.verbose:
+            print('Downloading schema ' + iri + (' from ' + url if url != iri else ''))
+        try:
+            response = requests.get(url, headers={'Accept': SchemaMirror.__accept}, timeout=SchemaMirror.__timeout)
+            response.raise_for_status()
+            extension = self.__extension(url, response)
+            if extension is None:
+                raise ValueError('not an RDF document (' + response.headers.get('Content-Type', 'no content type') +
+                                 ')')
+        except (requests.RequestException, ValueError) as e:
+            sys.stderr.write('Could not download schema ' + iri + ': ' + str(e) + '\n')
+            meta['error'] = type(e).__name__ + ': ' + str(e)
+            with self.__lock:
+                self.__write_file(self.__meta_file(iri), json.dumps(meta).encode('UTF-8'))
+            return None
+
+        # The schema file is written before its record, so a record always points to a complete file
+        meta['file'] = self.__name(iri) + extension
+        meta['sha256'] = hashlib.sha256(response.content).hexdigest()
+        with self.__lock:
+            self.__write_file(os.path.join(self.path_mirror, meta['file']), response.content)
+            self.__write_file(self.__meta_file(iri), json.dumps(meta).encode('UTF-8'))
+        if self.verbose:
+            print('Mirrored schema ' + iri + ': ' + os.path.join(self.path_mirror, meta['file']))
+        return os.path.join(self.path_mirror, meta['file'])
+
+    def detect(self, file_dataset):
+        """Finds the namespaces of the vocabularies a dataset uses
+
+        The namespaces are taken from the predicates and the classes (objects of rdf:type) of the dataset, by cutting
+        their IRIs after the last '#' or '/'.
+
+        :param file_dataset: Path to the dataset file (String)
+        :return: Sorted list of namespace IRIs
+        """
+        namespaces = set()
+        for _, p, o in rdf_stream.iter_triples(file_dataset):
+            namespaces.add(_namespace(p))
+            if p == _rdf_type and o.startswith('<'):
+                namespaces.add(_namespace(o))
+        namespaces.discard(None)
+        return sorted(namespaces)
+
+    def resolve(self, file_dataset, schema=''):
+        """Resolves the schemas of a validation to local copies
+
+        The schema argument is a comma-separated list of IRIs or prefixes, as rdfunit's -s argument. Without a schema,
+        the vocabularies used by the dataset are detected. Schemas that are not in the mirror are downloaded, except in
+        offline mode, where a missing schema given in the argument raises SchemaOfflineError. If a detected vocabulary
+        can't be downloaded, rdfunit detects the schemas itself. In offline mode, detected vocabularies that are not in
+        the mirror are left out.
+
+        :param file_dataset: Path to the dataset file. Only needed without a schema (String)
+        :param schema: Schema argument of the validation (String) [optional]
+        :return: SchemaSources
+        """
+        if len(schema) == 0:
+            return self.__resolve_detected(file_dataset)
+
+        prefixes = self.prefixes()
+        declarations = []
+        arguments = []
+        missing = []
+        for token in [token.strip() for token in schema.split(',') if len(token.strip()) > 0]:
+            # Prefixes are resolved to their namespace through schemaDecl.csv or the mirror
+            iri, url = (token, token) if ':' in token else prefixes.get(token, (None, None))
+            file_schema = None
+            if iri is not None:
+                file_schema = self.lookup(iri)
+                if file_schema is None and not self.offline:
+                    file_schema = self.fetch(iri, url, None if iri == token else token)
+
+            if file_schema is not None:
+                prefix = _declared_prefix + self.__name(iri)[:12]
+                declarations.append((prefix, iri, file_schema))
+                arguments.append(prefix)
+            elif self.offline:
+                missing.append(token)
+            else:
+                # Leave it to rdfunit
+                arguments.append(token)
+
+        if len(missing) > 0:
+            sys.stderr.write('Schemas missing from the local mirror ' + self.path_mirror + ': ' + ', '.join(missing) +
+                             '\n')
+            sys.stderr.write('Download them with python -m ncats_translator_dqa.computational_metrics.schema_mirror ' +
+                             ' '.join(missing) + ' while online\n')
+            raise SchemaOfflineError('Schemas are not in the local mirror (offline mode): ' + ', '.join(missing))
+
+        return SchemaSources(','.join(arguments), declarations, self.__sources_key(arguments, declarations))
+
+    def __resolve_detected(self, file_dataset):
+        # Resolves the vocabularies used by a dataset, see resolve()
+        namespaces = self.detect(file_dataset)
+        declarations = []
+        missing = []
+        for iri in namespaces:
+            file_schema = self.lookup(iri)
+            if file_schema is None and not self.offline:
+                file_schema = self.fetch(iri)
+            if file_schema is not None:
+                declarations.append((_declared_prefix + self.__name(iri)[:12], iri, file_schema))
+            else:
+                missing.append(iri)
+
+        if len(missing) > 0 and not self.offline:
+            # Validating against part of the vocabularies would drop test cases, so let rdfunit detect the schemas
+            if self.verbose:
+                print('Letting rdfunit detect the schemas of ' + file_dataset + ', ' + str(len(missing)) +
+                      ' vocabularies could not be mirrored: ' + ', '.join(missing))
+            return SchemaSources('')
+
+        if len(missing) > 0:
+            sys.stderr.write('Vocabularies used by ' + file_dataset + ' that are not in the local mirror ' +
+                             self.path_mirror + ' are left out: ' + ', '.join(missing) + '\n')
+        if len(declarations) == 0:
+            if self.offline:
+                raise SchemaOfflineError('No schemas for ' + file_dataset + ' in the local mirror (offline mode)')
+            # The dataset uses no vocabularies, let rdfunit handle it as before
+            return SchemaSources('')
+
+        if self.verbose:
+            print('Validating ' + file_dataset + ' against ' + str(len(declarations)) + ' mirrored schemas')
+        arguments = [prefix for prefix, _, _ in declarations]
+        return SchemaSources(','.join(arguments), declarations, self.__sources_key(arguments, declarations))
+
+    @staticmethod
+    def __sources_key(arguments, declarations):
+        """Identifies a list of schemas and the content of their local copies
+
+        :param arguments: Prefixes and IRIs passed to rdfunit (List of String)
+        :param declarations: List of tuples (prefix, namespace IRI, path to the local copy)
+        :return: Hex digest (String)
+        """
+        files = {prefix: file_schema for prefix, _, file_schema in declarations}
+        h = hashlib.sha256()
+        for argument in arguments:
+            h.update(argument.encode('UTF-8') + b'\0')
+            if argument in files:
+                with open(files[argument], 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+        return h.hexdigest()
+
+    def __expired(self, meta):
+        """Checks whether a failed download should be tried again
+
+        :param meta: Record of the schema, see entry()
+        :return: True if the download failed and its record is older than retry_seconds
+        """
+        return meta['file'] is None and time.time() - meta['fetched'] >= self.retry_seconds
+
+    def __extension(self, url, response):
+        """Gets the file extension for a downloaded schema from its content type, URL or content
+
+        :param url: URL the schema was downloaded from (String)
+        :param response: requests.response
+        :return: File extension (String), or None if the response is not an RDF document
+        """
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type in SchemaMirror.__content_types:
+            return SchemaMirror.__content_types[content_type]
+        if content_type == 'text/html':
+            return None
+
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if extension in SchemaMirror.__extensions:
+            return '.rdf' if extension == '.xml' else extension
+
+        start = response.content[:1024].lstrip().decode('UTF-8', errors='replace')
+        if start.startswith('<?xml') or start.startswith('<rdf:RDF'):
+            return '.rdf'
+        if re.match(r'(@prefix|@base|PREFIX|BASE)\s', start, re.IGNORECASE):
+            return '.ttl'
+        return None
+
+    def __meta_file(self, iri):
+        return os.path.join(self.path_mirror, self.__name(iri) + SchemaMirror.__ext_meta)
+
+    @staticmethod
+    def __name(iri):
+        return hashlib.sha256(iri.encode('UTF-8')).hexdigest()
+
+    @staticmethod
+    def __read_meta(file_meta):
+        """Reads a record file
+
+        :param file_meta: Path to the record file (String)
+        :return: Dictionary with the record, or None if the file does not exist or can't be read
+        """
+        try:
+            with open(file_meta, 'rb') as f:
+                return json.loads(f.read().decode('UTF-8'))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __write_file(file, content):
+        """Atomically writes content to a file
+
+        :param file: Path to the file (String)
+        :param content: Content to write (bytes)
+        :return: None
+        """
+        file_tmp = file + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(file_tmp, 'wb') as f:
+            f.write(content)
+        os.replace(file_tmp, file)
+
+
+class TestSuiteCache:
+    """Cache of the test cases rdfunit generates from a set of schemas
+
+    rdfunit writes the test cases it generates to the tests folder of its data folder and loads them from there on
+    later runs. Each run has a private copy of that folder (see RDFUnitWrapper), so the generated test cases are kept
+    here instead: results/<key>/ holds the files a run added to its tests folder, for one set of schemas and RDFUnit
+    version.
+    """
+
+    def __init__(self, path_cache=None, verbose=None):
+        """Constructor
+
+        :param path_cache: Path to the cache folder. Defaults to config.path_test_suite_cache [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.path_cache = path_cache if path_cache is not None else config.path_test_suite_cache
+        self.verbose = verbose if verbose is not None else config.verbose
+
+        if not os.path.exists(self.path_cache):
+            os.makedirs(self.path_cache, exist_ok=True)
+
+    @staticmethod
+    def key(sources, rdfunit_version):
+        """Gets the cache key of the test suite of a set of schemas
+
+        :param sources: SchemaSources
+        :param rdfunit_version: RDFUnit version identifier (String)
+        :return: Cache key (String), or None if the test suite can't be cached because rdfunit detects the schemas
+        """
+        if sources.key is None:
+            return None
+        return hashlib.sha256((sources.key + '\0' + rdfunit_version).encode('UTF-8')).hexdigest()
+
+    def restore(self, key, dir_tests):
+        """Copies a cached test suite into the tests folder of a run
+
+        :param key: Cache key (String)
+        :param dir_tests: Tests folder of the run's private data folder (String)
+        :return: True on a cache hit, False on a miss
+        """
+        dir_entry = os.path.join(self.path_cache, key)
+        if not os.path.isdir(dir_entry):
+            return False
+
+        for dir_from, _, filenames in os.walk(dir_entry):
+            dir_to = os.path.join(dir_tests, os.path.relpath(dir_from, dir_entry))
+            os.makedirs(dir_to, exist_ok=True)
+            for filename in filenames:
+                file_to = os.path.join(dir_to, filename)
+                # Replace links to the shared tests folder instead of writing through them
+                if os.path.islink(file_to):
+                    os.remove(file_to)
+                shutil.copy2(os.path.join(dir_from, filename), file_to)
+
+        if self.verbose:
+            print('Test suite cache hit: ' + key)
+        return True
+
+    def store(self, key, dir_tests, dir_tests_shared):
+        """Stores the test cases a run generated
+
+        Files in the run's tests folder that are not in the shared tests folder of RDFUnit, or differ from it, are
+        stored. An existing entry is kept.
+
+        :param key: Cache key (String)
+        :param dir_tests: Tests folder of the run's private data folder (String)
+        :param dir_tests_shared: Tests folder of the RDFUnit data folder (String)
+        :return: None
+        """
+        dir_entry = os.path.join(self.path_cache, key)
+        if os.path.isdir(dir_entry) or not os.path.isdir(dir_tests):
+            return
+
+        dir_tmp = dir_entry + '.' + str(os.getpid()) + '.tmp'
+        n_files = 0
+        for dir_from, _, filenames in os.walk(dir_tests):
+            relpath = os.path.relpath(dir_from, dir_tests)
+            for filename in filenames:
+                file_from = os.path.join(dir_from, filename)
+                file_shared = os.path.join(dir_tests_shared, relpath, filename)
+                if os.path.exists(file_shared) and filecmp.cmp(file_from, file_shared, shallow=False):
+                    continue
+                os.makedirs(os.path.join(dir_tmp, relpath), exist_ok=True)
+                shutil.copy2(file_from, os.path.join(dir_tmp, relpath, filename))
+                n_files += 1
+
+        if n_files == 0:
+            return
+        try:
+            os.replace(dir_tmp, dir_entry)
+        except OSError:
+            # Another run stored the same test suite in the meantime
+            shutil.rmtree(dir_tmp, ignore_errors=True)
+            return
+        if self.verbose:
+            print('Stored ' + str(n_files) + ' generated test files in the test suite cache: ' + key)
+
+
+def get_mirror():
+    """Gets the schema mirror shared by all validations of this process
+
+    :return: SchemaMirror, or None if the mirror is disabled (config.schema_mirror and config.schema_offline are not
+     set, or config.path_schema_mirror is empty)
+    """
+    global _mirror
+    if not (config.schema_mirror or config.schema_offline) or len(config.path_schema_mirror) == 0:
+        return None
+    with _lock:
+        if _mirror is None or _mirror.path_mirror != config.path_schema_mirror or \
+                _mirror.offline != config.schema_offline:
+            _mirror = SchemaMirror()
+        return _mirror
+
+
+def get_test_suite_cache():
+    """Gets the test suite cache shared by all validations of this process
+
+    :return: TestSuiteCache, or None if the cache is disabled (config.path_test_suite_cache is empty)
+    """
+    global _test_suites
+    if len(config.path_test_suite_cache) == 0:
+        return None
+    with _lock:
+        if _test_suites is None or _test_suites.path_cache != config.path_test_suite_cache:
+            _test_suites = TestSuiteCache()
+        return _test_suites
+
+
+def schema_sources(file_dataset, schema=''):
+    """Resolves the schemas of a validation, through the local mirror if it is enabled
+
+    :param file_dataset: Path to the dataset file. Only needed without a schema (String)
+    :param schema: Schema argument of the validation (String) [optional]
+    :return: SchemaSources
+    """
+    mirror = get_mirror()
+    if mirror is not None:
+        return mirror.resolve(file_dataset, schema)
+    if config.schema_offline:
+        raise SchemaOfflineError('Offline mode needs the local schema mirror (config.path_schema_mirror is empty)')
+    return SchemaSources(schema, key=schema if len(schema) > 0 else None)
+
+
+def _namespace(iri):
+    # Namespace of an IRI term '<...>', up to and including the last '#' or '/'
+    if not iri.startswith('<'):
+        return None
+    iri = iri[1:-1]
+    cut = max(iri.rfind('#'), iri.rfind('/'))
+    if cut < 0 or iri[:cut].endswith(':/') or iri[:cut].endswith(':'):
+        return None
+    return iri[:cut + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Downloads ontologies and schemas to the local mirror used by '
+                                                  'rdfunit, e.g., before validating in offline mode'))
+    parser.add_argument('schemas', nargs='*', metavar='SCHEMA',
+                        help=('Ontology IRI, prefix known to RDFUnit (e.g., foaf) or prefix=IRI. Add @URL to download '
+                              'from a different location, e.g., go=http://purl.obolibrary.org/obo/go.owl@file.owl'))
+    parser.add_argument('-d', dest='files_dataset', action='append', default=[], metavar='FILE',
+                        help='Data set whose vocabularies are downloaded. Can be given more than once')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Download schemas again, including those that failed recently')
+    parser.add_argument('--list', action='store_true', help='List the schemas in the mirror')
+    args = parser.parse_args()
+
+    if len(config.path_schema_mirror) == 0:
+        sys.stderr.write('The schema mirror is disabled (config.path_schema_mirror)\n')
+        sys.exit(1)
+    mirror = SchemaMirror(offline=False)
+
+    # Schemas as (IRI, download URL, prefix)
+    prefixes = mirror.prefixes()
+    schemas = []
+    for argument in args.schemas:
+        prefix, iri = argument.split('=', 1) if '=' in argument.split(':', 1)[0] else (None, argument)
+        iri, url = iri.rsplit('@', 1) if '@' in iri else (iri, None)
+        if ':' not in iri:
+            if iri not in prefixes:
+                sys.stderr.write('Unknown schema prefix: ' + iri + '\n')
+                sys.exit(1)
+            prefix = iri
+            iri, url_known = prefixes[iri]
+            url = url or url_known
+        schemas.append((iri, url, prefix))
+    for file_dataset in args.files_dataset:
+        schemas += [(iri, None, None) for iri in mirror.detect(file_dataset)]
+
+    failed = 0
+    for iri, url, prefix in schemas:
+        if mirror.fetch(iri, url, prefix, refresh=args.refresh) is None:
+            failed += 1
+
+    if args.list or len(schemas) == 0:
+        for meta in mirror.entries():
+            print('{:<10} {:<60} {}'.format(meta.get('prefix') or '', meta['iri'],
+                                            meta['file'] if meta['file'] is not None else 'failed: ' + meta['error']))
+    if len(schemas) > 0:
+        print('Mirrored ' + str(len(schemas) - failed) + ' of ' + str(len(schemas)) + ' schemas in ' +
+              mirror.path_mirror)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Sharded validation of very large datasets
+
+A dataset is split into shards in one streaming pass, with all triples of a subject in the same shard. The shards are
+validated in parallel and their results are merged into one result file. Tests that only look at the triples of one
+subject (e.g., datatypes, cardinalities, value ranges) report the same results as an unsharded run. Tests that follow
+links between subjects, such as the type of an object, only see the subjects in the same shard.
+
+Memory use of each validation scales with the shard size instead of the dataset size.
+"""
+import os
+import zlib
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from rdflib import Literal, URIRef, Namespace
+from ncats_translator_dqa import config, profiling, rdf_stream, sysinfo
+from ncats_translator_dqa.computational_metrics.external_sort import sort_statements
+from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.computational_metrics.RDFUnitWorker import get_shared_worker
+from ncats_translator_dqa.computational_metrics.lite_validator import LiteValidator, LiteValidationResult
+
+# RDFUnit core vocabulary
+RUT = Namespace('http://rdfunit.aksw.org/ns/core#')
+PROV = Namespace('http://www.w3.org/ns/prov#')
+
+# Terms of the test executions in rdfunit results, as written by rdf_stream
+_rdf_type = '<' + rdf_stream.RDF + 'type>'
+_xsd_integer = rdf_stream.XSD + 'integer'
+_test_execution = '<' + str(RUT.TestExecution) + '>'
+_test_case = '<' + str(RUT.testCase) + '>'
+_tests_run = '<' + str(RUT.testsRun) + '>'
+_tests_timeout = '<' + str(RUT.testsTimeout) + '>'
+_tests_error = '<' + str(RUT.testsError) + '>'
+_tests_failed = '<' + str(RUT.testsFailed) + '>'
+_tests_succeeded = '<' + str(RUT.testsSuceeded) + '>'
+_total_individual_errors = '<' + str(RUT.totalIndividualErrors) + '>'
+_started_at = '<' + str(PROV.startedAtTime) + '>'
+_ended_at = '<' + str(PROV.endedAtTime) + '>'
+
+# Counters of a test execution that are merged, and all properties of a test execution that are merged
+_counters = [_tests_run, _tests_timeout, _tests_error, _tests_failed, _total_individual_errors]
+_execution_properties = set(_counters + [_tests_succeeded, _started_at, _ended_at])
+
+# Number of bytes buffered by each shard file
+__write_buffer = 1024 * 1024
+
+
+def n_shards(file_dataset, shard_bytes=None):
+    """Gets the number of shards for a dataset
+
+    :param file_dataset: Path to the dataset file (String)
+    :param shard_bytes: Approximate size of a shard in bytes. 0 disables sharding. Defaults to config.shard_bytes
+     [optional]
+    :return: Number of shards (Integer). 1 if the dataset should not be sharded
+    """
+    if shard_bytes is None:
+        shard_bytes = config.shard_bytes
+    if shard_bytes <= 0:
+        return 1
+    return max(1, -(-os.path.getsize(file_dataset) // shard_bytes))
+
+
+def shard_dataset(file_dataset, n, dir_shards, on_issue=None):
+    """Splits a dataset into N-Triples shards, grouping triples by subject
+
+    The dataset is read once as a stream. Each triple goes to the shard given by a hash of its subject, so all triples
+    of a subject end up in the same shard.
+
+    :param file_dataset: Path to the dataset file (String)
+    :param n: Number of shards (Integer)
+    :param dir_shards: Folder to write the shards to (String)
+    :param on_issue: Function on_issue(kind, detail, line_number) called for each problem found while reading the
+     dataset (see rdf_stream.iter_triples) [optional]
+    :return: List of paths to the shard files
+    """
+    name = os.path.splitext(os.path.split(file_dataset)[1])[0]
+    files_shard = [os.path.join(dir_shards, name + '.shard' + str(i) + '.nt') for i in range(n)]
+    shards = [open(file_shard, 'w', encoding='UTF-8', buffering=__write_buffer) for file_shard in files_shard]
+    try:
+        # Consecutive triples often share a subject, so the last shard is remembered
+        subject_last = None
+        shard = None
+        for s, p, o in rdf_stream.iter_triples(file_dataset, on_issue=on_issue):
+            if s != subject_last:
+                subject_last = s
+                shard = shards[zlib.crc32(s.encode('UTF-8')) % n]
+            shard.write(rdf_stream.ntriple(s, p, o))
+    finally:
+        for shard in shards:
+            shard.close()
+
+    return files_shard
+
+
+def sharded_validation(file_dataset, file_output, schema='', engine='rdfunit', n=None, n_workers=None, sources=None):
+    """Validates a dataset in shards and merges the results
+
+    :param file_dataset: Absolute path to the dataset file (String)
+    :param file_output: Path to the merged results file (String)
+    :param schema: Schema argument for rdfunit. Pass a schema explicitly to make sure all shards are validated against
+     the same ontologies (String) [optional]
+    :param engine: Validation engine, 'rdfunit' or 'lite' [optional]
+    :param n: Number of shards. Defaults to n_shards() [optional]
+    :param n_workers: Number of shards validated at the same time. Defaults to a number based on the CPU count and
+     available memory, divided by the number of validations already running at the same time (see
+     sysinfo.concurrency()) [optional]
+    :param sources: Schemas resolved for the whole dataset, used for every shard (SchemaSources) [optional]
+    :return: Path to the merged results file (String)
+    """
+    if n is None:
+        n = n_shards(file_dataset)
+    if n_workers is None:
+        # Share the machine with the validations that already run at the same time, e.g., the other -m workers
+        n_workers = sysinfo.default_workers(config.rdfunit_worker_memory) // sysinfo.concurrency()
+    n_workers = max(1, min(n_workers, n))
+
+    if not os.path.exists(config.path_rdfunit_jobs):
+        os.makedirs(config.path_rdfunit_jobs, exist_ok=True)
+    name = os.path.splitext(os.path.split(file_dataset)[1])[0]
+    dir_shards = tempfile.mkdtemp(prefix=name + '_shards_', dir=config.path_rdfunit_jobs)
+
+    try:
+        # Problems found while reading the dataset, which the N-Triples shards don't have anymore
+        issues = LiteValidationResult()
+
+        def on_issue(kind, detail, line_number):
+            if kind == rdf_stream.ISSUE_UNDECLARED_PREFIX:
+                issues.undeclared_prefixes += 1
+            elif kind == rdf_stream.ISSUE_SYNTAX_ERROR:
+                issues.syntax_errors += 1
+
+        if config.verbose:
+            print('Splitting ' + file_dataset + ' into ' + str(n) + ' shards')
+        with profiling.span('shard.split', dataset=file_dataset, bytes=os.path.getsize(file_dataset), shards=n):
+            files_shard = shard_dataset(file_dataset, n, dir_shards, on_issue)
+
+        if config.verbose:
+            print('Validating ' + str(n) + ' shards with ' + str(n_workers) + ' workers')
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=sysinfo.set_concurrency,
+                                 initargs=(sysinfo.concurrency() * n_workers,)) as executor:
+            results = list(executor.map(_validate_shard, files_shard, [schema] * n, [engine] * n, [sources] * n))
+
+        with profiling.span('shard.merge', dataset=file_dataset, shards=n):
+            if engine == 'lite':
+                result = issues
+                for shard_result in results:
+                    result.add(shard_result)
+                LiteValidator().write_dqv(file_dataset, result, file_output)
+            else:
+                merge_rdfunit_results(results, file_output, {
+                    file_shard: file_dataset for file_shard in files_shard})
+    finally:
+        shutil.rmtree(dir_shards, ignore_errors=True)
+
+    if config.verbose:
+        print('Sharded validation finished. output file: ' + file_output)
+
+    return file_output
+
+
+def _validate_shard(file_shard, schema, engine, sources=None):
+    """Validates one shard. Runs in a worker process
+
+    :param file_shard: Path to the shard file (String)
+    :param schema: Schema argument for rdfunit (String)
+    :param engine: Validation engine, 'rdfunit' or 'lite'
+    :param sources: Schemas resolved for the whole dataset (SchemaSources) [optional]
+    :return: LiteValidationResult for the lite engine, otherwise the path to the rdfunit results file
+    """
+    if engine == 'lite':
+        with profiling.span('shard.validate', dataset=file_shard, engine=engine,
+                            bytes=os.path.getsize(file_shard)) as s:
+            result = LiteValidator().validate(file_shard)
+            s.tag(triples=result.triples)
+        return result
+
+    # Keep the results next to the shard instead of in the output folder
+    file_results = os.path.splitext(file_shard)[0] + '_results.ttl'
+    file_rdfunit_output = RDFUnitWrapper(worker=get_shared_worker()).rdfunit(file_shard, schema, sources)
+    shutil.move(file_rdfunit_output, file_results)
+    file_html = RDFUnitWrapper.output_files(file_shard)[1]
+    if os.path.exists(file_html):
+        os.remove(file_html)
+    return file_results
+
+
+def merge_rdfunit_results(files_results, file_output, replacements=None):
+    """Merges the shaclFullTestCaseResult files of shards into one results file
+
+    The test executions of the shards are merged into the execution of the first shard: individual errors are summed,
+    a test counts as failed if it failed in any shard, and the execution spans from the earliest start to the latest
+    end. All other statements are combined.
+
+    The results files are streamed, each twice: once for the counters of their test executions and once for the other
+    statements, which are written once each with an external sort (see external_sort.py). Memory use therefore does not
+    depend on the number of results. The merged file is written as N-Triples, which can be read as Turtle.
+
+    :param files_results: Paths to the results files of the shards (List)
+    :param file_output: Path to the merged file to write (String)
+    :param replacements: Substrings to replace in IRIs, e.g., shard file paths by the dataset path (Dictionary)
+     [optional]
+    :return: None
+    """
+    # Test executions of each shard, and their counters and times
+    executions = []
+    counts = {counter: 0 for counter in _counters}
+    started = []
+    ended = []
+    for file_results in files_results:
+        executions_shard, counts_shard, started_shard, ended_shard = __read_executions(file_results)
+        executions.append(executions_shard)
+        for counter, values in counts_shard.items():
+            for value in values:
+                if counter == _total_individual_errors:
+                    counts[counter] += value
+                else:
+                    counts[counter] = max(counts[counter], value)
+        started += started_shard
+        ended += ended_shard
+
+    execution = None
+    for i, executions_shard in enumerate(executions):
+        if len(executions_shard) > 0:
+            execution = __replace_iri(__prefix_bnode(executions_shard[0], __bnode_prefix(i)), replacements)
+            break
+    tests_failed = set()
+
+    def statements():
+        for i, file_results in enumerate(files_results):
+            bnode_prefix = __bnode_prefix(i)
+            executions_shard = set(executions[i])
+            for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+                if s in executions_shard and p in _execution_properties:
+                    continue
+                if p == _test_case:
+                    tests_failed.add(o)
+                s = execution if s in executions_shard else __replace_iri(__prefix_bnode(s, bnode_prefix), replacements)
+                o = execution if o in executions_shard else __replace_iri(__prefix_bnode(o, bnode_prefix), replacements)
+                yield rdf_stream.ntriple(s, p, o)
+
+    def statements_execution():
+        # Runs after statements(), when the failed tests are known
+        if execution is None:
+            return
+        if len(tests_failed) > 0:
+            # Tests failed in any shard, if the results identify their test cases
+            counts[_tests_failed] = len(tests_failed)
+        counts_succeeded = counts[_tests_run] - counts[_tests_failed] - counts[_tests_timeout] - counts[_tests_error]
+        for counter, value in list(counts.items()) + [(_tests_succeeded, max(counts_succeeded, 0))]:
+            yield rdf_stream.ntriple(execution, counter, rdf_stream.literal(str(value), datatype=_xsd_integer))
+        if len(started) > 0:
+            yield rdf_stream.ntriple(execution, _started_at, min(started, key=__time))
+        if len(ended) > 0:
+            yield rdf_stream.ntriple(execution, _ended_at, max(ended, key=__time))
+
+    dir_tmp = tempfile.mkdtemp(prefix='merge_', dir=os.path.dirname(os.path.abspath(file_output)))
+    try:
+        sort_statements(itertools.chain(statements(), statements_execution()), file_output, dir_tmp, unique=True)
+    finally:
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+
+def __read_executions(file_results):
+    """Reads the test executions of a results file and their counters and times
+
+    :param file_results: Path to the results file (String)
+    :return: Tuple (list of test executions, dictionary {counter: list of Integers}, list of start times, list of end
+     times), as N-Triples terms
+    """
+    executions = []
+    values = {}
+    for s, p, o in rdf_stream.iter_triples(file_results, format='ttl'):
+        if p == _rdf_type and o == _test_execution:
+            executions.append(s)
+        elif p in _execution_properties:
+            values.setdefault(s, []).append((p, o))
+
+    counts = {}
+    started = []
+    ended = []
+    for execution in executions:
+        for p, o in values.get(execution, []):
+            if p in _counters:
+                counts.setdefault(p, []).append(int(rdf_stream.parse_literal(o)[0]))
+            elif p == _started_at:
+                started.append(o)
+            elif p == _ended_at:
+                ended.append(o)
+    return executions, counts, started, ended
+
+
+def __time(term):
+    # Value of an xsd:dateTime literal, for comparing times with different time zones
+    lexical, _, datatype = rdf_stream.parse_literal(term)
+    return Literal(lexical, datatype=URIRef(datatype) if datatype else None).toPython()
+
+
+def __bnode_prefix(i):
+    # Prefix of the blank node labels of the i-th results file, since labels are local to each file
+    return 'r' + str(i) + '_'
+
+
+def __prefix_bnode(term, prefix):
+    # Prefixes the label of a blank node term
+    return '_:' + prefix + term[2:] if term.startswith('_:') else term
+
+
+def __replace_iri(term, replacements):
+    """Replaces substrings in an IRI
+
+    :param term: N-Triples term (String)
+    :param replacements: Dictionary of substrings to replace, or None
+    :return: N-Triples term (String)
+    """
+    if replacements is None or not term.startswith('<'):
+        return term
+    for old, new in replacements.items():
+        term = term.replace(old, new)
+    return term
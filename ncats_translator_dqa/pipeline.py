@@ -0,0 +1,132 @@
+"""Staged pipeline with bounded queues
+
+Items flow through a sequence of stages. Each stage has its own pool of worker threads, and stages are connected by
+bounded queues: a stage that falls behind blocks the stage before it once the queue between them is full
+(backpressure), so at most a few items wait between any two stages. Different items are in different stages at the
+same time, e.g., dataset N+1 is validated while dataset N is uploaded and dataset N+2 is scraped.
+
+Each stage takes the waiting items in the order they were fed to the pipeline, so an order chosen by the caller (e.g.,
+the largest data sets first) is kept even when an earlier stage finishes items out of order.
+
+Every item passes through every stage in order. A stage function decides itself whether there is anything to do for
+an item, e.g., because a previous stage failed for it. An exception raised by a stage function is written to stderr
+and doesn't stop the pipeline.
+"""
+import sys
+import math
+import queue
+import itertools
+import threading
+from ncats_translator_dqa import config
+
+# Marks the end of the items in a queue
+_end = object()
+
+
+class PipelineStage:
+    """A stage of a Pipeline
+
+    Public members:
+    name - Stage name (String)
+    function - Function function(item) processing one item
+    workers - Number of items processed at the same time (Integer)
+    """
+
+    def __init__(self, name, function, workers=1):
+        """Constructor
+
+        :param name: Stage name (String)
+        :param function: Function function(item) processing one item. Its return value is ignored
+        :param workers: Number of items processed at the same time (Integer) [optional]
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(int(workers), 1)
+
+
+class Pipeline:
+    """Runs items through stages connected by bounded queues
+    """
+
+    def __init__(self, stages, queue_size=None, verbose=None):
+        """Constructor
+
+        :param stages: List of PipelineStage, in order
+        :param queue_size: Maximum number of items waiting in front of each stage. Defaults to
+         config.pipeline_queue_size [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.stages = stages
+        self.queue_size = queue_size if queue_size is not None else config.pipeline_queue_size
+        self.verbose = verbose if verbose is not None else config.verbose
+
+    def run(self, items):
+        """Runs all items through the pipeline and waits until the last stage is done with them
+
+        :param items: Iterable of items
+        :return: None
+        """
+        if len(self.stages) == 0:
+            return
+
+        if self.verbose:
+            print('Pipeline: ' + ' -> '.join(stage.name + ' (' + str(stage.workers) + ')' for stage in self.stages))
+
+        # Queue entries are (position in the input, item). End markers sort after all items
+        queues = [queue.PriorityQueue(maxsize=max(self.queue_size, 1)) for _ in self.stages]
+        lock = threading.Lock()
+        workers_left = [stage.workers for stage in self.stages]
+        ends = itertools.count()
+
+        def work(k):
+            stage = self.stages[k]
+            while True:
+                position, item = queues[k].get()
+                if item is _end:
+                    break
+
+                try:
+                    stage.function(item)
+                except Exception as e:
+                    sys.stderr.write('Pipeline stage ' + stage.name + ' failed on ' + str(item) + ': ' +
+                                     type(e).__name__ + ': ' + str(e) + '\n')
+
+                # Blocks while the next stage is busy and its queue is full
+                if k + 1 < len(self.stages):
+                    queues[k + 1].put((position, item))
+
+            # The last worker of a stage to finish ends the next stage
+            with lock:
+                workers_left[k] -= 1
+                last = workers_left[k] == 0
+            if last and k + 1 < len(self.stages):
+                for _ in range(self.stages[k + 1].workers):
+                    queues[k + 1].put(((math.inf, next(ends)), _end))
+
+        threads = [threading.Thread(target=work, args=(k,), name='pipeline-' + stage.name + '-' + str(i), daemon=True)
+                   for k, stage in enumerate(self.stages) for i in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+
+        # Feed the first stage. Blocks while it is busy
+        for position, item in enumerate(items):
+            queues[0].put(((position, 0), item))
+        for _ in range(self.stages[0].workers):
+            queues[0].put(((math.inf, next(ends)), _end))
+
+        for thread in threads:
+            thread.join()
+
+
+def run_all(runs):
+    """Runs several pipelines at the same time and waits until all of them are done
+
+    :param runs: List of tuples (Pipeline, iterable of items)
+    :return: None
+    """
+    threads = [threading.Thread(target=p.run, args=(items,), name='pipeline-' + str(k), daemon=True)
+               for k, (p, items) in enumerate(runs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
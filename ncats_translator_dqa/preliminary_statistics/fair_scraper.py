@@ -2,10 +2,86 @@
 Scrapes information from FAIRsharing.org
 """
 import os
+import threading
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from lxml import html
 import pandas as pd
-from ncats_translator_dqa import config
+from ncats_translator_dqa import config, profiling
+from ncats_translator_dqa.preliminary_statistics.http_cache import HTTPCache
+
+# Shared HTTP session so that all page requests reuse the same pool of keep-alive connections
+__session = None
+__session_lock = threading.Lock()
+
+# Persistent on-disk cache of downloaded pages
+__cache = None
+
+# Semaphores limiting the number of concurrent requests to each host
+__host_semaphores = {}
+
+
+def get_session():
+    """Gets the HTTP session shared by all FAIRsharing.org requests
+
+    The session is created on first use with a connection pool large enough for the configured number of scraping
+    workers.
+
+    :return: requests.Session
+    """
+    global __session
+    with __session_lock:
+        if __session is None:
+            pool_size = max(config.scrape_workers, 1)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            __session = session
+        return __session
+
+
+def get_cache():
+    """Gets the HTTP cache shared by all FAIRsharing.org requests
+
+    The cache is created on first use from the settings in config.py.
+
+    :return: HTTPCache, or None if caching is disabled (config.path_http_cache is empty)
+    """
+    global __cache
+    if len(config.path_http_cache) == 0:
+        return None
+    with __session_lock:
+        if __cache is None:
+            __cache = HTTPCache(config.path_http_cache, ttl=config.http_cache_ttl,
+                                max_bytes=config.http_cache_max_bytes, offline=config.http_cache_offline,
+                                verbose=config.verbose)
+        return __cache
+
+
+def __download(url, headers=None):
+    """Downloads a page over the shared session, respecting the per-host concurrency limit
+
+    :param url: URL of the page (String)
+    :param headers: Additional request headers (Dictionary) [optional]
+    :return: requests.response
+    """
+    with __host_semaphore(url):
+        return get_session().get(url, headers=headers)
+
+
+def __host_semaphore(url):
+    """Gets the semaphore limiting concurrent requests to the host of the given url
+
+    :param url: URL to be requested (String)
+    :return: threading.BoundedSemaphore
+    """
+    host = urlsplit(url).netloc
+    with __session_lock:
+        if host not in __host_semaphores:
+            __host_semaphores[host] = threading.BoundedSemaphore(max(config.scrape_max_per_host, 1))
+        return __host_semaphores[host]
 
 
 def fair_scraper(url):
@@ -21,11 +97,28 @@ def fair_scraper(url):
     if config.verbose:
         print('Scraping: ' + url)
 
-    # load the page
-    page = requests.get(url)
+    # load the page, from the cache if possible
+    with profiling.span('scrape.download', url=url) as s:
+        cache = get_cache()
+        if cache is not None:
+            page_content = cache.get(url, __download)
+        else:
+            page_content = __download(url).content
+        s.tag(bytes=len(page_content))
 
     # parse the HTML
-    html_content = html.fromstring(page.content)
+    with profiling.span('scrape.parse', url=url, bytes=len(page_content)):
+        return __parse_page(url, page_content)
+
+
+def __parse_page(url, page_content):
+    """Extracts the preliminary statistics from a FAIRsharing.org page
+
+    :param url: String url of the page
+    :param page_content: HTML of the page (bytes)
+    :return: FAIRPrelimStats object
+    """
+    html_content = html.fromstring(page_content)
 
     # Get the database name
     # <div class="title-text">
@@ -114,20 +207,15 @@ def fair_table(fpss, file_output):
     :param file_output: Path to output file to write to (String)
     :return:
     """
-    # Store results in data frame
-    num_fpss = len(fpss)
-    df = pd.DataFrame(index=range(0, num_fpss),
+    # Store results in data frame, built from all rows at once
+    rows = [[fps.url,
+             fps.title,
+             fps.get_scope_and_data_types_string(),
+             fps.get_terminology_artifacts_string(),
+             fps.get_license_string()] for fps in fpss]
+    df = pd.DataFrame(rows, index=range(0, len(fpss)),
                       columns=['URL', 'title', 'scope and data types', 'terminology artifacts', 'license'])
 
-    # Add each FPS result to the data frame
-    for i in range(num_fpss):
-        fps = fpss[i]
-        df.loc[i] = [fps.url,
-                     fps.title,
-                     fps.get_scope_and_data_types_string(),
-                     fps.get_terminology_artifacts_string(),
-                     fps.get_license_string()]
-
     # Make sure the output directory exists
     directory = os.path.split(file_output)[0]
     if not os.path.exists(directory):
@@ -0,0 +1,255 @@
+"""Local stand-in for FAIRsharing.org
+
+Serves recorded FAIRsharing.org record pages, so the scraper can be tried and timed without network access. Pages are
+read from a folder of <record>.html files, e.g., recorded with record_pages(). Records without a recorded page get a
+generated page with the same structure as a FAIRsharing.org record page.
+
+Usage: python -m ncats_translator_dqa.preliminary_statistics.fairsharing_standin [--port 8000] [--pages folder]
+       python -m ncats_translator_dqa.preliminary_statistics.fairsharing_standin --record folder url [url ...]
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+import threading
+from html import escape
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, unquote
+from ncats_translator_dqa.preliminary_statistics import fair_scraper
+
+# Values the generated pages are built from
+__domains = ['Approved drug', 'Chemical entity', 'Gene', 'Protein', 'Pathway', 'Disease', 'Phenotype', 'Anatomy',
+             'Adverse reaction', 'Molecular interaction']
+__artifacts = ['Chemical Entities of Biological Interest', 'Gene Ontology', 'Human Phenotype Ontology',
+               'PSI Molecular Interaction Controlled Vocabulary', 'Disease Ontology', 'Uberon']
+__licenses = [('https://creativecommons.org/licenses/by/4.0/', 'Creative Commons Attribution (CC-BY) 4.0'),
+              ('https://creativecommons.org/licenses/by-sa/3.0/', 'Creative Commons Attribution-ShareAlike 3.0'),
+              ('http://www.apache.org/licenses/LICENSE-2.0', 'Apache License 2.0'),
+              ('https://opensource.org/licenses/MIT', 'MIT License')]
+
+
+def synthetic_page(record):
+    """Generates a FAIRsharing.org record page
+
+    The content depends only on the record name, so every request for a record returns the same page.
+
+    :param record: Record name, e.g., biodbcore-000340 (String)
+    :return: HTML page (bytes)
+    """
+    h = zlib.crc32(record.encode('UTF-8'))
+    domains = [__domains[(h + i) % len(__domains)] for i in range(2 + h % 4)]
+    artifacts = [__artifacts[(h + i) % len(__artifacts)] for i in range(1 + h % 3)]
+    licenses = [('Data use', __licenses[h % len(__licenses)]),
+                ('Database software', __licenses[(h >> 8) % len(__licenses)])]
+
+    lines = ['<html><head><title>FAIRsharing</title></head><body>',
+             '<div class="title-text">',
+             '  <h2>',
+             '    <img src="/static/img/status_circles/ready.png" class="view_status_icon" alt="ready"/>',
+             '    Synthetic database ' + escape(record),
+             '  </h2>',
+             '</div>',
+             '<ul>']
+    for domain in domains:
+        lines += ['  <li class="bio-tag domain">',
+                  '    <span class="bio-icon-tag" style="padding-right: 5px"></span>',
+                  '    ' + escape(domain),
+                  '  </li>']
+    lines += ['</ul>',
+              '<div class="standard-unit">',
+              '<p><span class="heavier">Terminology Artifacts</span></p>',
+              '<ul class="record-list-link">']
+    for i, artifact in enumerate(artifacts):
+        lines.append('  <li class="small"><a href="/bsg-s%06d" target="_blank">%s</a></li>' % (i, escape(artifact)))
+    lines += ['</ul>',
+              '</div>',
+              '<div class="standard-unit">',
+              '<p class="section-title"><span class="heavier">Conditions of Use</span></p>']
+    for applies_to, (url, name) in licenses:
+        lines += ['<span class="section-header">',
+                  '  Applies to:',
+                  '',
+                  '  ' + applies_to,
+                  '',
+                  '  </span>',
+                  '<ul>',
+                  '  <li>',
+                  '    <span class="small"><a href="%s" target="_blank">%s</a></span>' % (url, escape(name)),
+                  '  </li>',
+                  '</ul>']
+    lines += ['<div class="clearfix"></div>',
+              '</div>',
+              '</body></html>']
+    return '\n'.join(lines).encode('UTF-8')
+
+
+def record_pages(urls, dir_pages):
+    """Downloads FAIRsharing.org record pages for serving them with the stand-in
+
+    :param urls: List of String urls to record pages
+    :param dir_pages: Folder to write the <record>.html files to (String)
+    :return: List of paths to the recorded pages
+    """
+    if not os.path.exists(dir_pages):
+        os.makedirs(dir_pages, exist_ok=True)
+
+    files_page = []
+    session = fair_scraper.get_session()
+    for url in urls:
+        response = session.get(url)
+        response.raise_for_status()
+        file_page = os.path.join(dir_pages, url.rstrip('/').split('/')[-1] + '.html')
+        with open(file_page, 'wb') as f:
+            f.write(response.content)
+        files_page.append(file_page)
+    return files_page
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler. The stand-in is available as self.server.standin
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.standin.verbose:
+            sys.stderr.write('FAIRsharing stand-in: ' + (format % args) + '\n')
+
+    def do_GET(self):
+        standin = self.server.standin
+        if standin.latency > 0:
+            time.sleep(standin.latency)
+
+        path = [unquote(p) for p in urlsplit(self.path).path.split('/') if len(p) > 0]
+        if len(path) != 1:
+            body = b'Not found'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+        else:
+            body = standin.page(path[0])
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with standin.lock:
+            standin.requests += 1
+
+
+class FAIRsharingStandIn:
+    """Local stand-in for FAIRsharing.org
+
+    Public members:
+    url - URL of the stand-in. The page of a record is at url + record name
+    requests - Number of requests served
+    """
+
+    def __init__(self, dir_pages=None, host='127.0.0.1', port=0, latency=0, verbose=False):
+        """Constructor
+
+        :param dir_pages: Folder of recorded <record>.html pages. Records without a recorded page get a generated
+         page [optional]
+        :param host: Host name to listen on [optional]
+        :param port: Port to listen on. 0 picks a free port [optional]
+        :param latency: Time in seconds added to every response, to simulate the network [optional]
+        :param verbose: True if you want to print each request [optional]
+        """
+        self.dir_pages = dir_pages
+        self.latency = latency
+        self.verbose = verbose
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.__server = _Server((host, port), _Handler)
+        self.__server.standin = self
+        self.__thread = None
+        self.url = 'http://' + host + ':' + str(self.__server.server_address[1]) + '/'
+
+    def records(self):
+        """Gets the names of the recorded records
+
+        :return: List of record names, sorted
+        """
+        if self.dir_pages is None or not os.path.isdir(self.dir_pages):
+            return []
+        return sorted(os.path.splitext(filename)[0] for filename in os.listdir(self.dir_pages)
+                      if filename.endswith('.html'))
+
+    def page(self, record):
+        """Gets the page of a record, recorded or generated
+
+        :param record: Record name (String)
+        :return: HTML page (bytes)
+        """
+        if self.dir_pages is not None:
+            file_page = os.path.join(self.dir_pages, os.path.basename(record) + '.html')
+            if os.path.exists(file_page):
+                with open(file_page, 'rb') as f:
+                    return f.read()
+        return synthetic_page(record)
+
+    def start(self):
+        """Starts serving requests in a background thread
+
+        :return: self
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server
+
+        :return: None
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def serve_forever(self):
+        """Serves requests in the current thread until interrupted
+
+        :return: None
+        """
+        self.__server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for FAIRsharing.org')
+    parser.add_argument('--host', default='127.0.0.1', help='Host name to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--pages', help='Folder of recorded <record>.html pages')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+    parser.add_argument('--record', metavar='FOLDER',
+                        help='Download the pages of the given FAIRsharing.org urls into FOLDER and exit')
+    parser.add_argument('urls', nargs='*', help='FAIRsharing.org urls to record')
+    args = parser.parse_args()
+
+    if args.record is not None:
+        for file_page in record_pages(args.urls, args.record):
+            print('Recorded ' + file_page)
+        return
+
+    standin = FAIRsharingStandIn(args.pages, args.host, args.port, args.latency, verbose=True)
+    print('FAIRsharing stand-in listening on ' + standin.url)
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Persistent on-disk cache for HTTP pages downloaded from FAIRsharing.org
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+
+
+class CacheMissError(Exception):
+    """Raised in offline mode when a requested page is not in the cache
+    """
+    pass
+
+
+class HTTPCache:
+    """Persistent on-disk HTTP cache keyed by URL
+
+    Each cached page is stored as two files named by the SHA-256 hash of the URL: the response body (.body) and a JSON
+    file with the URL, ETag and Last-Modified headers and the time the page was last validated (.json). Pages older
+    than the TTL are revalidated with a conditional GET, and served stale with a warning if the revalidation fails. The
+    modification time of the body file records when the page was last used, and the least recently used pages are
+    evicted when the cache grows beyond its size limit.
+    """
+    __ext_body = '.body'
+    __ext_meta = '.json'
+
+    def __init__(self, path_cache, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024, offline=False, verbose=False):
+        """Constructor
+
+        :param path_cache: Path to the cache folder (String)
+        :param ttl: Time in seconds before a cached page is revalidated (Number)
+        :param max_bytes: Maximum total size of the cached page bodies in bytes (Integer)
+        :param offline: True to serve pages from the cache only and never access the network
+        :param verbose: True if you want to print status messages
+        """
+        self.path_cache = path_cache
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.verbose = verbose
+        self.__lock = threading.Lock()
+
+        if not os.path.exists(self.path_cache):
+            os.makedirs(self.path_cache, exist_ok=True)
+
+    def get(self, url, fetch):
+        """Gets the content of the page at the given url, from the cache if possible
+
+        :param url: URL of the page (String)
+        :param fetch: Function fetch(url, headers) performing the HTTP GET request and returning a requests.response
+        :return: Page content (bytes)
+        """
+        file_body, file_meta = self.__cache_files(url)
+        meta = self.__read_meta(file_meta)
+        cached = meta is not None and os.path.exists(file_body)
+
+        # Serve fresh pages, or any cached page in offline mode, without going to the network
+        if cached and (self.offline or time.time() - meta['validated'] < self.ttl):
+            if self.verbose:
+                print('HTTP cache hit: ' + url)
+            return self.__read_body(file_body)
+
+        if self.offline:
+            raise CacheMissError('Page is not in the HTTP cache (offline mode): ' + url)
+
+        # Revalidate stale pages with a conditional GET
+        headers = {}
+        if cached:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            response = fetch(url, headers)
+        except OSError as e:
+            # requests exceptions are OSErrors. Keep serving the stale page while the server can't be reached
+            if not cached:
+                raise
+            return self.__serve_stale(url, file_body, str(e))
+
+        if cached and response.status_code == 304:
+            if self.verbose:
+                print('HTTP cache revalidated: ' + url)
+            meta['validated'] = time.time()
+            self.__write_file(file_meta, json.dumps(meta).encode('UTF-8'))
+            return self.__read_body(file_body)
+
+        # Only store successful responses
+        if response.status_code == 200:
+            meta = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'validated': time.time()
+            }
+            with self.__lock:
+                self.__write_file(file_body, response.content)
+                self.__write_file(file_meta, json.dumps(meta).encode('UTF-8'))
+                self.__evict()
+        elif cached:
+            return self.__serve_stale(url, file_body, 'HTTP status ' + str(response.status_code))
+
+        return response.content
+
+    def clear(self):
+        """Removes all pages from the cache
+
+        :return: None
+        """
+        with self.__lock:
+            for filename in os.listdir(self.path_cache):
+                if filename.endswith(HTTPCache.__ext_body) or filename.endswith(HTTPCache.__ext_meta):
+                    os.remove(os.path.join(self.path_cache, filename))
+
+    def __serve_stale(self, url, file_body, reason):
+        """Serves a stale cached page after its revalidation failed
+
+        The page is not marked as validated, so it is revalidated again on the next request.
+
+        :param url: URL of the page (String)
+        :param file_body: Path to the body file (String)
+        :param reason: Why the revalidation failed (String)
+        :return: Page content (bytes)
+        """
+        sys.stderr.write('Warning: could not revalidate ' + url + ' (' + reason + '). Serving the stale cached page\n')
+        return self.__read_body(file_body)
+
+    def __cache_files(self, url):
+        """Gets the paths of the body and metadata files for the given url
+
+        :param url: URL of the page (String)
+        :return: Tuple (body file path, metadata file path)
+        """
+        key = hashlib.sha256(url.encode('UTF-8')).hexdigest()
+        file_base = os.path.join(self.path_cache, key)
+        return file_base + HTTPCache.__ext_body, file_base + HTTPCache.__ext_meta
+
+    @staticmethod
+    def __read_meta(file_meta):
+        """Reads a metadata file
+
+        :param file_meta: Path to the metadata file (String)
+        :return: Dictionary with the metadata, or None if the file does not exist or can't be read
+        """
+        try:
+            with open(file_meta, 'rb') as f:
+                return json.loads(f.read().decode('UTF-8'))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __read_body(file_body):
+        """Reads a cached page body and marks it as recently used
+
+        :param file_body: Path to the body file (String)
+        :return: Page content (bytes)
+        """
+        with open(file_body, 'rb') as f:
+            content = f.read()
+        try:
+            os.utime(file_body, None)
+        except OSError:
+            pass
+        return content
+
+    @staticmethod
+    def __write_file(file, content):
+        """Atomically writes content to a file
+
+        :param file: Path to the file (String)
+        :param content: Content to write (bytes)
+        :return: None
+        """
+        file_tmp = file + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(file_tmp, 'wb') as f:
+            f.write(content)
+        os.replace(file_tmp, file)
+
+    def __evict(self):
+        """Removes the least recently used pages until the cache is within its size limit
+
+        :return: None
+        """
+        entries = []
+        total_bytes = 0
+        for filename in os.listdir(self.path_cache):
+            if filename.endswith(HTTPCache.__ext_body):
+                file_body = os.path.join(self.path_cache, filename)
+                try:
+                    st = os.stat(file_body)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, file_body))
+                total_bytes += st.st_size
+
+        # Oldest first
+        entries.sort()
+        for _, size, file_body in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            file_meta = file_body[:-len(HTTPCache.__ext_body)] + HTTPCache.__ext_meta
+            for file in (file_body, file_meta):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+            total_bytes -= size
+
+            if self.verbose:
+                print('HTTP cache evicted: ' + file_body)
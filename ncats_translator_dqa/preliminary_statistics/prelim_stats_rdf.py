@@ -1,8 +1,58 @@
 import sys
 import os
+import threading
 from rdflib import Graph, Literal, URIRef, Namespace, RDF
 from rdflib.namespace import DCTERMS, XSD
-from ncats_translator_dqa import config
+from ncats_translator_dqa import config, profiling, rdf_stream
+
+# Pre-defined DQV metrics, dimensions and categories, parsed once per process
+__definitions = None
+__definitions_text = {}
+__definitions_lock = threading.Lock()
+
+
+def get_definitions():
+    """Gets the graph of pre-defined DQV metrics, dimensions and categories (resources/dqv_definitions.ttl)
+
+    The file is parsed once per process. The graph is shared and must not be modified.
+
+    :return: rdflib.Graph
+    """
+    global __definitions
+    with __definitions_lock:
+        if __definitions is None:
+            g = Graph()
+            g.parse(os.path.join(config.resource_path, 'dqv_definitions.ttl'), format='ttl')
+            __definitions = g
+        return __definitions
+
+
+def get_definitions_text(format='ttl'):
+    """Gets the pre-defined DQV metrics, dimensions and categories serialized in the given format
+
+    The serialization is computed once per process and format.
+
+    :param format: 'ttl' or 'nt' (String) [optional]
+    :return: Serialized definitions (String)
+    """
+    g = get_definitions()
+    with __definitions_lock:
+        if format not in __definitions_text:
+            __definitions_text[format] = _to_text(g.serialize(format=format))
+        return __definitions_text[format]
+
+
+def _to_text(data):
+    # Older rdflib versions serialize to bytes
+    return data.decode('UTF-8') if isinstance(data, bytes) else data
+
+
+def _to_node(term):
+    # Converts an N-Triples IRI or literal term to an rdflib node
+    if term[0] == '<':
+        return URIRef(term[1:-1])
+    lexical, lang, datatype = rdf_stream.parse_literal(term)
+    return Literal(lexical, lang=lang, datatype=URIRef(datatype) if datatype is not None else None)
 
 
 class PrelimStatsRDF:
@@ -26,12 +76,12 @@ class PrelimStatsRDF:
         self.__ns_dcat = Namespace("http://www.w3.org/ns/dcat#")
         self.__ns_dqv = Namespace("http://www.w3.org/ns/dqv#")
 
-        # Create a new graph
+        # Create a new graph. The pre-defined metrics (resources/dqv_definitions.ttl) are shared by all instances and
+        # added when the graph is serialized
         self.g = Graph()
-
-        # Read in the pre-defined turtle file from resources
-        file_predefined = os.path.join(config.resource_path, "dqv_definitions.ttl")
-        self.g.parse(file_predefined, format="ttl")
+        self.g.bind('', self.__ns_local)
+        self.g.bind('dcat', self.__ns_dcat)
+        self.g.bind('dqv', self.__ns_dqv)
 
         # Create new resources for the data set and distribution
         self.__dataset = self.__ns_local[self.dataset_id]
@@ -101,6 +151,56 @@ class PrelimStatsRDF:
 
         return measurement
 
+    def add_measurement_value(self, metric, value, datatype=XSD.string):
+        """Adds a measurement of a metric defined in resources/dqv_definitions.ttl
+
+        :param metric: Local name of the metric, e.g., 'tripleCountMetric' (String)
+        :param value: Value of the measurement
+        :param datatype: XSD datatype of the value (URIRef) [default=XSD.string]
+        :return: The new measurement node
+        """
+        measurement = self.__add_measurement()
+        self.g.add((measurement, self.__ns_dqv.isMeasurementOf, self.__ns_local[metric]))
+        self.g.add((measurement, self.__ns_dqv.value, Literal(value, datatype=datatype)))
+        return measurement
+
+    def add_annotated_measurement(self, metric, value, datatype, annotations):
+        """Adds a measurement with further statements about it, e.g., the namespace it was computed for
+
+        :param metric: Local name of the metric (String)
+        :param value: Value of the measurement
+        :param datatype: XSD datatype of the value (URIRef)
+        :param annotations: List of tuples (property IRI, N-Triples term) (List)
+        :return: The new measurement node
+        """
+        measurement = self.add_measurement_value(metric, value, datatype)
+        for predicate, term in annotations:
+            self.g.add((measurement, URIRef(predicate), _to_node(term)))
+        return measurement
+
+    def add_void_profile(self, profile):
+        """Adds the VoID statistics of the dataset file (see void_profiler.py)
+
+        Values estimated with sketches are marked as estimated and have the bounds of their confidence interval.
+        Measurements of a partition are linked to its class, property, datatype or language.
+
+        :param profile: VoidProfile, or None
+        :return: None
+        """
+        if profile is None:
+            return
+
+        for metric, value, lower, upper, confidence, partition in profile.measurements:
+            measurement = self.add_measurement_value(metric, value, XSD.integer)
+            if lower is not None:
+                self.g.add((measurement, self.__ns_local.estimated, Literal('true', datatype=XSD.boolean)))
+                self.g.add((measurement, self.__ns_local.confidenceLowerBound, Literal(lower, datatype=XSD.integer)))
+                self.g.add((measurement, self.__ns_local.confidenceUpperBound, Literal(upper, datatype=XSD.integer)))
+                self.g.add((measurement, self.__ns_local.confidenceLevel,
+                            Literal(str(confidence), datatype=XSD.decimal)))
+            if partition is not None:
+                self.g.add((measurement, URIRef(partition[0]), _to_node(partition[1])))
+
     def add_licensing_metric(self, license_string):
         """Adds a licensingMetric measurement
 
@@ -164,15 +264,26 @@ class PrelimStatsRDF:
         self.add_terminology_artifacts(fps.terminology_artifacts)
 
     def serialize(self, file, format='ttl'):
-        """Writes the RDF graph to file in the specified format
+        """Writes the RDF graph and the pre-defined metrics to file in the specified format
 
         :param file: Path to the file to write to (String)
         :param format: RDF format (default: 'ttl')
         :return:
         """
         try:
-            # Write out turtle file
-            self.g.serialize(destination=file, format=format)
+            with profiling.span('prelim_stats_rdf.serialize', file=file, triples=len(self.g)):
+                if format in ('ttl', 'turtle', 'nt'):
+                    # Turtle and N-Triples documents can be concatenated, so the cached definitions are written as
+                    # they are
+                    format = 'ttl' if format == 'turtle' else format
+                    with open(file, 'w', encoding='UTF-8') as f:
+                        f.write(get_definitions_text(format))
+                        f.write(_to_text(self.g.serialize(format=format)))
+                else:
+                    g = Graph()
+                    g += get_definitions()
+                    g += self.g
+                    g.serialize(destination=file, format=format)
 
             # Output message
             if config.verbose:
@@ -180,3 +291,259 @@ class PrelimStatsRDF:
         except IOError:
             sys.stderr.write('Error while trying to serialize preliminary stats RDF graph to file: ' + file + '\n')
 
+
+class DQVWriter:
+    """Streaming writer for dataset data quality metrics in W3C Data Quality Vocabulary
+
+    Writes the same statements as PrelimStatsRDF, but appends them to the output file as they are added instead of
+    building a graph first. One writer can write any number of datasets into a single combined file. Measurements are
+    named after their dataset (e.g., ChEMBLDatasetMeasurement0001) so that they are unique in a combined file.
+
+    Usage:
+    with DQVWriter(file_output) as writer:
+        writer.add_dataset(dataset_id, fps)
+        writer.add_measurement_value('tripleCountMetric', 1000, XSD.integer)
+    """
+    __ns_local = 'http://ncats.nih.gov/'
+    __ns_dcat = 'http://www.w3.org/ns/dcat#'
+    __ns_dqv = 'http://www.w3.org/ns/dqv#'
+    __rdf_type = '<' + str(RDF.type) + '>'
+
+    def __init__(self, file, format='ttl', definitions=True):
+        """Constructor. Opens the output file
+
+        :param file: Path to the file to write to (String)
+        :param format: 'ttl' or 'nt'. Statements are written one per line, which is valid in both formats [optional]
+        :param definitions: True to start the file with the pre-defined metrics (resources/dqv_definitions.ttl)
+         [optional]
+        """
+        if format not in ('ttl', 'nt'):
+            raise ValueError('DQVWriter only writes ttl or nt, not ' + format)
+        self.file = file
+        self.__f = open(file, 'w', encoding='UTF-8')
+        if definitions:
+            self.__f.write(get_definitions_text(format))
+        self.__dataset = None
+        self.__distribution = None
+        self.__dataset_id = None
+        self.__n_measurements = 0
+        self.__n_datasets = 0
+
+    def add_dataset(self, dataset_id, fps=None, down_url='', byte_size=-1):
+        """Starts a new dataset. Subsequent measurements are added to this dataset
+
+        :param dataset_id: ID to be used in URI for this data set (String)
+        :param fps: FAIRsharing preliminary stats (FAIRPrelimStats) [optional]
+        :param down_url: Download URL of dataset (String) [optional]
+        :param byte_size: Size of dataset in bytes [optional]
+        :return: None
+        """
+        self.__dataset_id = dataset_id
+        self.__dataset = DQVWriter.__iri(DQVWriter.__ns_local + dataset_id)
+        self.__distribution = DQVWriter.__iri(DQVWriter.__ns_local + dataset_id + 'Distribution')
+        self.__n_measurements = 0
+        self.__n_datasets += 1
+
+        # Add information about the data set and the distribution
+        self.__write(self.__dataset, DQVWriter.__rdf_type, DQVWriter.__iri(DQVWriter.__ns_dcat + 'Dataset'))
+        self.__write(self.__dataset, DQVWriter.__iri(DQVWriter.__ns_dcat + 'distribution'), self.__distribution)
+        self.__write(self.__distribution, DQVWriter.__rdf_type, DQVWriter.__iri(DQVWriter.__ns_dcat + 'Distribution'))
+        self.__write(self.__distribution, DQVWriter.__iri(DQVWriter.__ns_dcat + 'mediaType'),
+                     DQVWriter.__literal('application/rdf'))
+
+        self.add_download_url(down_url)
+        self.add_byte_size(byte_size)
+        if fps is not None:
+            self.add_fair_prelim_stats(fps)
+
+    def add_title(self, title):
+        """Adds dcterms:title to dataset and distribution nodes
+
+        :param title: Title (String)
+        """
+        self.__write(self.__dataset, DQVWriter.__iri(str(DCTERMS.title)), DQVWriter.__literal(title, lang='en'))
+        self.__write(self.__distribution, DQVWriter.__iri(str(DCTERMS.title)), DQVWriter.__literal(title))
+
+    def add_download_url(self, url):
+        """Adds dcat:downloadURL to distribution
+
+        :param url: URL to the data set download (String)
+        """
+        if len(url) > 0:
+            self.__write(self.__distribution, DQVWriter.__iri(DQVWriter.__ns_dcat + 'downloadURL'), DQVWriter.__iri(url))
+
+    def add_byte_size(self, byte_size):
+        """Adds dcat:byteSize to distribution
+
+        :param byte_size: Size of the data set in bytes (Float)
+        """
+        if byte_size >= 0:
+            self.__write(self.__distribution, DQVWriter.__iri(DQVWriter.__ns_dcat + 'byteSize'),
+                         DQVWriter.__literal(str(byte_size), datatype=str(XSD.decimal)))
+
+    def add_measurement_value(self, metric, value, datatype=XSD.string):
+        """Adds a measurement of a metric defined in resources/dqv_definitions.ttl
+
+        :param metric: Local name of the metric, e.g., 'tripleCountMetric', or the IRI of another metric, e.g., an
+         RDFUnit test case (String)
+        :param value: Value of the measurement
+        :param datatype: XSD datatype of the value (URIRef) [default=XSD.string]
+        :return: None
+        """
+        self.__add_measurement(metric, value, datatype)
+
+    def add_estimated_measurement(self, metric, value, lower, upper, sample_value, sample_fraction, confidence,
+                                  datatype=XSD.integer):
+        """Adds a measurement whose value was extrapolated from a sample of the dataset (see sampling.py)
+
+        The measurement is marked as estimated and has the bounds of its confidence interval, its value in the sample,
+        the sampled fraction of the dataset and the confidence level (properties defined in
+        resources/dqv_definitions.ttl).
+
+        :param metric: Local name or IRI of the metric, see add_measurement_value() (String)
+        :param value: Estimated value for the whole dataset
+        :param lower: Lower bound of the confidence interval
+        :param upper: Upper bound of the confidence interval
+        :param sample_value: Value measured on the sample
+        :param sample_fraction: Fraction of the dataset's triples in the sample (Float)
+        :param confidence: Confidence level of the interval, e.g., 0.95 (Float)
+        :param datatype: XSD datatype of the values (URIRef) [default=XSD.integer]
+        :return: None
+        """
+        measurement = self.__add_measurement(metric, value, datatype)
+        self.__annotate(measurement, [('estimated', 'true', XSD.boolean),
+                                      ('confidenceLowerBound', lower, datatype),
+                                      ('confidenceUpperBound', upper, datatype),
+                                      ('sampleValue', sample_value, datatype),
+                                      ('sampleFraction', sample_fraction, XSD.decimal),
+                                      ('confidenceLevel', confidence, XSD.decimal)])
+
+    def add_annotated_measurement(self, metric, value, datatype, annotations):
+        """Adds a measurement with further statements about it, e.g., the namespace it was computed for
+
+        :param metric: Local name or IRI of the metric, see add_measurement_value() (String)
+        :param value: Value of the measurement
+        :param datatype: XSD datatype of the value (URIRef)
+        :param annotations: List of tuples (property IRI, N-Triples term) (List)
+        :return: None
+        """
+        measurement = self.__add_measurement(metric, value, datatype)
+        for predicate, term in annotations:
+            self.__write(measurement, DQVWriter.__iri(predicate), term)
+
+    def add_void_profile(self, profile):
+        """Adds the VoID statistics of the dataset file (see void_profiler.py)
+
+        Values estimated with sketches are marked as estimated and have the bounds of their confidence interval.
+        Measurements of a partition are linked to its class, property, datatype or language.
+
+        :param profile: VoidProfile, or None
+        :return: None
+        """
+        if profile is None:
+            return
+
+        for metric, value, lower, upper, confidence, partition in profile.measurements:
+            measurement = self.__add_measurement(metric, value, XSD.integer)
+            if lower is not None:
+                self.__annotate(measurement, [('estimated', 'true', XSD.boolean),
+                                              ('confidenceLowerBound', lower, XSD.integer),
+                                              ('confidenceUpperBound', upper, XSD.integer),
+                                              ('confidenceLevel', confidence, XSD.decimal)])
+            if partition is not None:
+                self.__write(measurement, DQVWriter.__iri(partition[0]), partition[1])
+
+    def __annotate(self, measurement, annotations):
+        # Writes (local property name, value, datatype) annotations of a measurement
+        for name, annotation, annotation_datatype in annotations:
+            self.__write(measurement, DQVWriter.__iri(DQVWriter.__ns_local + name),
+                         DQVWriter.__literal(str(annotation), datatype=str(annotation_datatype)))
+
+    def __add_measurement(self, metric, value, datatype):
+        # Writes a measurement and returns its IRI in N-Triples form
+        if self.__dataset is None:
+            raise ValueError('DQVWriter: add_dataset must be called before adding measurements')
+
+        self.__n_measurements += 1
+        measurement = DQVWriter.__iri(DQVWriter.__ns_local + self.__dataset_id + 'Measurement' +
+                                      '%04d' % self.__n_measurements)
+        metric = metric if ':' in metric else DQVWriter.__ns_local + metric
+        self.__write(measurement, DQVWriter.__rdf_type, DQVWriter.__iri(DQVWriter.__ns_dqv + 'QualityMeasurement'))
+        self.__write(measurement, DQVWriter.__iri(DQVWriter.__ns_dqv + 'computedOn'), self.__distribution)
+        self.__write(self.__distribution, DQVWriter.__iri(DQVWriter.__ns_dqv + 'hasQualityMeasurement'), measurement)
+        self.__write(measurement, DQVWriter.__iri(DQVWriter.__ns_dqv + 'isMeasurementOf'), DQVWriter.__iri(metric))
+        self.__write(measurement, DQVWriter.__iri(DQVWriter.__ns_dqv + 'value'),
+                     DQVWriter.__literal(str(value), datatype=str(datatype)))
+        return measurement
+
+    def add_licensing_metric(self, license_string):
+        """Adds a licensingMetric measurement
+
+        :param license_string: String representing the license
+        """
+        if len(license_string) > 0:
+            self.add_measurement_value('licensingMetric', license_string)
+
+    def add_scopes_and_data_types(self, sads):
+        """Adds a list of scopes and data types as scopeAndDatatypesMetric
+
+        :param sads: List of strings representing the scopes and data types
+        """
+        if sads is None:
+            return
+        for sad in sads:
+            self.add_measurement_value('scopeAndDatatypesMetric', sad)
+
+    def add_terminology_artifacts(self, tas):
+        """Adds a list of terminology artifacts as terminologyArtifactsMetric
+
+        :param tas: List of strings representing the terminology artifacts
+        """
+        if tas is None:
+            return
+        for ta in tas:
+            self.add_measurement_value('terminologyArtifactsMetric', ta)
+
+    def add_fair_prelim_stats(self, fps):
+        """Adds preliminary statistics scraped from FAIRsharing.org
+
+        :param fps: FAIRPrelimStats object
+        :return:
+        """
+        if fps is None:
+            return
+
+        if len(fps.title) > 0:
+            self.add_title(fps.title)
+        if len(fps.license) > 0:
+            self.add_licensing_metric(fps.get_license_string())
+        self.add_scopes_and_data_types(fps.scope_and_data_types)
+        self.add_terminology_artifacts(fps.terminology_artifacts)
+
+    def close(self):
+        """Closes the output file
+
+        :return: None
+        """
+        if self.__f is not None:
+            self.__f.close()
+            self.__f = None
+            if config.verbose:
+                print('W3C DQV for ' + str(self.__n_datasets) + ' data set(s) written to: ' + self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __write(self, s, p, o):
+        self.__f.write(s + ' ' + p + ' ' + o + ' .\n')
+
+    @staticmethod
+    def __iri(iri):
+        return '<' + iri + '>'
+
+    @staticmethod
+    def __literal(lexical, lang=None, datatype=None):
+        return rdf_stream.literal(lexical, lang, datatype)
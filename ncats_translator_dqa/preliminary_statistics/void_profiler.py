@@ -0,0 +1,393 @@
+"""Bounded-memory VoID profile of a dataset
+
+The profiler reads a dataset once, triple by triple, and computes VoID-style statistics: the number of triples, the
+number of distinct subjects, properties, objects and classes, the largest class and property partitions, and the
+datatypes and languages of its literals. Distinct counts are estimated with HyperLogLog sketches and the partitions
+and literal distributions with count-min sketches, so memory use does not depend on the size of the dataset. The
+profile is added to the preliminary statistics in W3C DQV (PrelimStatsRDF.add_void_profile).
+
+Usage:
+python -m ncats_translator_dqa.preliminary_statistics.void_profiler <data file> [-o <DQV file>]
+"""
+import os
+import math
+import argparse
+from array import array
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.preliminary_statistics.prelim_stats_rdf import DQVWriter
+
+VOID = 'http://rdfs.org/ns/void#'
+NS_LOCAL = 'http://ncats.nih.gov/'
+
+# Properties linking a partition measurement to its class, property, datatype or language
+PARTITION_CLASS = VOID + 'class'
+PARTITION_PROPERTY = VOID + 'property'
+PARTITION_DATATYPE = NS_LOCAL + 'literalDatatype'
+PARTITION_LANGUAGE = NS_LOCAL + 'literalLanguage'
+
+_rdf_type = '<' + rdf_stream.RDF + 'type>'
+_xsd_string = rdf_stream.XSD + 'string'
+_rdf_lang_string = rdf_stream.RDF + 'langString'
+
+# Width of the count-min sketches, and confidence level of the intervals of the distinct counts
+_cms_width = 2 ** 14
+_cms_depth = 4
+_hll_confidence = 0.95
+_hll_z = 1.96
+
+_mask64 = 0xFFFFFFFFFFFFFFFF
+
+
+class HyperLogLog:
+    """HyperLogLog sketch for estimating the number of distinct items in a stream with fixed memory
+
+    The relative standard error of the estimate is about 1.04 / sqrt(2 ** precision), e.g., 0.8% with precision 14,
+    which uses 16 KB.
+    """
+
+    def __init__(self, precision=14):
+        """Constructor
+
+        :param precision: Number of bits of the hash used to choose a register, 4 to 18 (Integer)
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision must be between 4 and 18, not ' + str(precision))
+        self.precision = precision
+        self.__registers = bytearray(1 << precision)
+        self.__shift = 64 - precision
+        self.__mask = (1 << self.__shift) - 1
+
+    def add(self, item):
+        """Adds an item to the sketch
+
+        Items are hashed with Python's built-in hash, so a sketch must only be used within one process.
+
+        :param item: Hashable item
+        :return: None
+        """
+        h = hash(item) & _mask64
+        register = h >> self.__shift
+        rank = self.__shift - (h & self.__mask).bit_length() + 1
+        if rank > self.__registers[register]:
+            self.__registers[register] = rank
+
+    def merge(self, other):
+        """Adds the items of another sketch with the same precision, e.g., of another part of the same stream
+
+        :param other: HyperLogLog
+        :return: None
+        """
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.__registers = bytearray(map(max, self.__registers, other.__registers))
+
+    def relative_error(self):
+        """Gets the relative standard error of the estimate
+
+        :return: Float
+        """
+        return 1.04 / math.sqrt(len(self.__registers))
+
+    def count(self):
+        """Estimates the number of distinct items added
+
+        :return: Integer
+        """
+        m = len(self.__registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.__registers)
+
+        # Linear counting is more accurate while many registers are still empty
+        zeros = self.__registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """Count-min sketch for estimating how often items occur in a stream with fixed memory
+
+    Estimates are never too low. With probability 1 - exp(-depth), an estimate is too high by at most
+    e / width times the total count of the stream. Counters are updated conservatively, i.e., only the counters
+    holding the current estimate are incremented, which makes estimates more accurate.
+    """
+
+    def __init__(self, width=_cms_width, depth=_cms_depth):
+        """Constructor
+
+        :param width: Number of counters per row (Integer)
+        :param depth: Number of rows, i.e., hash functions (Integer)
+        """
+        self.width = max(width, 1)
+        self.depth = max(depth, 1)
+        self.total = 0
+        self.__rows = [array('Q', [0]) * self.width for _ in range(self.depth)]
+
+    def __indexes(self, item):
+        h = hash(item) & _mask64
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        """Adds occurrences of an item
+
+        Items are hashed with Python's built-in hash, so a sketch must only be used within one process.
+
+        :param item: Hashable item
+        :param count: Number of occurrences (Integer) [optional]
+        :return: New estimate of the number of occurrences of the item (Integer)
+        """
+        self.total += count
+        indexes = self.__indexes(item)
+        estimate = min(row[index] for row, index in zip(self.__rows, indexes)) + count
+        for row, index in zip(self.__rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+        return estimate
+
+    def estimate(self, item):
+        """Estimates the number of occurrences of an item
+
+        :param item: Hashable item
+        :return: Integer
+        """
+        return min(row[index] for row, index in zip(self.__rows, self.__indexes(item)))
+
+    def error(self):
+        """Gets the bound of the overestimate that holds with probability confidence()
+
+        :return: Integer
+        """
+        return int(math.ceil(math.e / self.width * self.total))
+
+    def confidence(self):
+        """Gets the probability that an estimate is within error() of the true count
+
+        :return: Float
+        """
+        return 1 - math.exp(-self.depth)
+
+
+class HeavyHitters:
+    """The most frequent items of a stream, counted with a count-min sketch
+
+    A fixed number of candidates is kept. An item that is not a candidate replaces the least frequent candidate once
+    its estimated count is higher.
+    """
+
+    def __init__(self, top_k, width=_cms_width, depth=_cms_depth):
+        """Constructor
+
+        :param top_k: Number of most frequent items to report (Integer)
+        :param width: Width of the count-min sketch (Integer) [optional]
+        :param depth: Depth of the count-min sketch (Integer) [optional]
+        """
+        self.top_k = top_k
+        self.sketch = CountMinSketch(width, depth)
+        self.__capacity = max(4 * top_k, 1)
+        self.__candidates = {}
+        self.__threshold = 0
+
+    def add(self, item):
+        """Adds an occurrence of an item
+
+        :param item: Hashable item
+        :return: None
+        """
+        estimate = self.sketch.add(item)
+        candidates = self.__candidates
+        if item in candidates or len(candidates) < self.__capacity:
+            candidates[item] = estimate
+        elif estimate > self.__threshold:
+            # Counts of candidates only grow, so the threshold is a lower bound of the smallest count
+            smallest = min(candidates, key=candidates.get)
+            if candidates[smallest] < estimate:
+                del candidates[smallest]
+                candidates[item] = estimate
+            self.__threshold = min(candidates.values())
+
+    def top(self):
+        """Gets the most frequent items
+
+        :return: List of tuples (item, estimated count), most frequent first
+        """
+        return sorted(self.__candidates.items(), key=lambda c: (-c[1], c[0]))[:self.top_k]
+
+
+class VoidProfile:
+    """VoID statistics of a dataset
+
+    Public members:
+    measurements - List of tuples (metric, value, lower bound, upper bound, confidence level, partition). The metrics
+     are defined in resources/dqv_definitions.ttl. Bounds and confidence level are None for exact values. Partition is
+     None or a tuple (property IRI, N-Triples term) of the class, property, datatype or language measured
+    """
+
+    def __init__(self, measurements=None):
+        self.measurements = measurements if measurements is not None else []
+
+    def add(self, metric, value, lower=None, upper=None, confidence=None, partition=None):
+        """Adds a measurement
+
+        :param metric: Local name of the metric (String)
+        :param value: Value (Integer)
+        :param lower: Lower bound of the confidence interval of an estimated value (Integer) [optional]
+        :param upper: Upper bound of the confidence interval of an estimated value (Integer) [optional]
+        :param confidence: Confidence level of the interval (Float) [optional]
+        :param partition: Tuple (property IRI, N-Triples term) [optional]
+        :return: None
+        """
+        self.measurements.append((metric, value, lower, upper, confidence, partition))
+
+    def value(self, metric):
+        """Gets the value of the first measurement of a metric
+
+        :param metric: Local name of the metric (String)
+        :return: Value, or None if the metric was not measured
+        """
+        for m in self.measurements:
+            if m[0] == metric:
+                return m[1]
+        return None
+
+    def to_dict(self):
+        """Converts the profile to a JSON-serializable dictionary
+
+        :return: Dictionary
+        """
+        return {'measurements': [list(m) for m in self.measurements]}
+
+    @staticmethod
+    def from_dict(d):
+        """Creates a profile from a dictionary written by to_dict()
+
+        :param d: Dictionary
+        :return: VoidProfile
+        """
+        return VoidProfile([tuple(m[:5]) + (tuple(m[5]) if m[5] is not None else None,) for m in d['measurements']])
+
+
+class VoidProfiler:
+    """Streaming VoID profiler
+    """
+
+    def __init__(self, precision=None, top_k=None, verbose=None):
+        """Constructor
+
+        :param precision: Precision of the HyperLogLog sketches. Defaults to config.void_hll_precision [optional]
+        :param top_k: Number of largest partitions reported. Defaults to config.void_top_k [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.precision = precision if precision is not None else config.void_hll_precision
+        self.top_k = top_k if top_k is not None else config.void_top_k
+        self.verbose = verbose if verbose is not None else config.verbose
+
+    def profile(self, file_dataset):
+        """Profiles a dataset
+
+        :param file_dataset: Path to the dataset file (String)
+        :return: VoidProfile
+        """
+        if self.verbose:
+            print('Profiling ' + file_dataset)
+
+        subjects = HyperLogLog(self.precision)
+        properties = HyperLogLog(self.precision)
+        objects = HyperLogLog(self.precision)
+        classes = HyperLogLog(self.precision)
+        class_partitions = HeavyHitters(self.top_k)
+        property_partitions = HeavyHitters(self.top_k)
+        datatypes = HeavyHitters(self.top_k)
+        languages = HeavyHitters(self.top_k)
+        triples = 0
+        literals = 0
+
+        with profiling.span('void_profile', dataset=file_dataset, bytes=os.path.getsize(file_dataset)) as span:
+            for s, p, o in rdf_stream.iter_triples(file_dataset):
+                triples += 1
+                subjects.add(s)
+                properties.add(p)
+                objects.add(o)
+                property_partitions.add(p)
+
+                if o[0] == '"':
+                    # Literals without a datatype are xsd:string, or rdf:langString with a language tag
+                    literals += 1
+                    if o[-1] == '>':
+                        datatypes.add(o[o.rindex('"^^<') + 4:-1])
+                    else:
+                        end = o.rindex('"')
+                        if end < len(o) - 1:
+                            datatypes.add(_rdf_lang_string)
+                            languages.add(o[end + 2:].lower())
+                        else:
+                            datatypes.add(_xsd_string)
+                elif p == _rdf_type:
+                    classes.add(o)
+                    class_partitions.add(o)
+            span.tag(triples=triples)
+
+        result = VoidProfile()
+        result.add('tripleCountMetric', triples)
+        for metric, sketch in [('distinctSubjectsMetric', subjects), ('distinctPropertiesMetric', properties),
+                               ('distinctObjectsMetric', objects), ('distinctClassesMetric', classes)]:
+            estimate = sketch.count()
+            margin = int(math.ceil(_hll_z * sketch.relative_error() * estimate))
+            result.add(metric, estimate, max(estimate - margin, 0), estimate + margin, _hll_confidence)
+        result.add('literalCountMetric', literals)
+
+        for metric, partition, sketch, term in [
+                ('classPartitionMetric', PARTITION_CLASS, class_partitions, lambda c: c),
+                ('propertyPartitionMetric', PARTITION_PROPERTY, property_partitions, lambda p: p),
+                ('literalDatatypeMetric', PARTITION_DATATYPE, datatypes, lambda d: '<' + d + '>'),
+                ('literalLanguageMetric', PARTITION_LANGUAGE, languages, lambda tag: rdf_stream.literal(tag))]:
+            error = sketch.sketch.error()
+            for item, estimate in sketch.top():
+                result.add(metric, estimate, max(estimate - error, 0), estimate, round(sketch.sketch.confidence(), 4),
+                           (partition, term(item)))
+
+        if self.verbose:
+            print('Profile of ' + file_dataset + ': ' + ', '.join(m[0] + '=' + str(m[1]) for m in result.measurements
+                                                                  if m[5] is None))
+
+        return result
+
+
+def void_profile(file_dataset):
+    """Profiles a dataset with the settings in config.py
+
+    :param file_dataset: Path to the dataset file (String)
+    :return: VoidProfile, or None if profiling is disabled (config.void_profile) or the file doesn't exist
+    """
+    if not config.void_profile or len(file_dataset) == 0 or not os.path.exists(file_dataset):
+        return None
+    return VoidProfiler().profile(file_dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Computes a VoID profile of a data set: distinct subjects, '
+                                                  'properties, objects and classes, the largest class and property '
+                                                  'partitions, and the datatypes and languages of its literals'))
+    parser.add_argument('file_dataset', metavar='FILE', help='Data set (N-Triples, N-Quads or Turtle)')
+    parser.add_argument('-o', dest='file_output', help='Write the profile in W3C DQV to this file')
+    parser.add_argument('-k', dest='top_k', type=int, help='Number of largest partitions reported')
+    args = parser.parse_args()
+
+    profile = VoidProfiler(top_k=args.top_k, verbose=False).profile(args.file_dataset)
+    for metric, value, lower, upper, confidence, partition in profile.measurements:
+        line = metric + ('' if partition is None else ' ' + partition[1]) + ': ' + str(value)
+        if lower is not None:
+            line += ' [' + str(lower) + ', ' + str(upper) + ']'
+        print(line)
+
+    if args.file_output is not None:
+        filename_dataset = os.path.split(args.file_dataset)[1]
+        with DQVWriter(args.file_output) as writer:
+            writer.add_dataset(''.join([c for c in filename_dataset if c.isalnum()]) + 'Dataset',
+                               byte_size=os.path.getsize(args.file_dataset))
+            writer.add_void_profile(profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Instrumentation of the pipeline stages
+
+Stages are wrapped in spans that record their duration, outcome and tags such as the dataset, bytes and triples
+processed. Subprocesses run by supervisor.run() additionally record their CPU time and peak RSS. While profiling is
+enabled (translator_dqa.py --profile), every finished span is appended as one JSON line to a trace file. Worker
+processes started after start() append to the same file, so the trace covers the whole run. At the end of the run,
+finish() writes a summary of each stage as a Prometheus textfile and prints it as a table.
+
+Spans cost next to nothing while profiling is disabled.
+"""
+import os
+import json
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from ncats_translator_dqa import sysinfo
+
+# Path to the trace file while profiling is enabled, otherwise None
+__file_trace = None
+__lock = threading.Lock()
+
+# Span IDs are unique within a process, and spans are identified by process and span ID in the trace
+__ids = itertools.count(1)
+__local = threading.local()
+
+# Prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = 'translator_dqa_'
+
+# Span tags summed for each stage in the summary
+__summed_tags = ['bytes', 'triples', 'child_cpu_seconds']
+
+
+class Span:
+    """A running span. Use tag() to add tags that are only known while the stage runs
+
+    Public members:
+    tags - Dictionary of tags
+    """
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+
+    def tag(self, **tags):
+        """Adds tags to the span
+
+        :param tags: Tag values (numbers or Strings)
+        :return: None
+        """
+        self.tags.update(tags)
+
+
+class _NullSpan:
+    """Span used while profiling is disabled
+    """
+    tags = {}
+
+    def tag(self, **tags):
+        pass
+
+
+__null_span = _NullSpan()
+
+
+def start(file_trace):
+    """Enables profiling, writing the trace to the given file
+
+    The file is truncated. Worker processes forked after this call inherit the setting.
+
+    :param file_trace: Path to the JSON-lines trace file (String)
+    :return: None
+    """
+    global __file_trace
+    directory = os.path.split(file_trace)[0]
+    if len(directory) > 0 and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    open(file_trace, 'w').close()
+    __file_trace = file_trace
+
+
+def stop():
+    """Disables profiling
+
+    :return: None
+    """
+    global __file_trace
+    __file_trace = None
+
+
+def enabled():
+    """Checks whether profiling is enabled
+
+    :return: True if spans are recorded
+    """
+    return __file_trace is not None
+
+
+@contextmanager
+def span(name, **tags):
+    """Records a span around a block of code
+
+    Usage:
+    with profiling.span('validate', dataset=file_dataset) as s:
+        ...
+        s.tag(triples=n_triples)
+
+    :param name: Stage name, e.g., 'scrape' (String)
+    :param tags: Tags of the span, e.g., dataset, bytes and triples
+    :return: Context manager yielding the Span
+    """
+    if __file_trace is None:
+        yield __null_span
+        return
+
+    # Spans started inside this one are its children
+    stack = getattr(__local, 'stack', None)
+    if stack is None:
+        stack = __local.stack = []
+    span_id = next(__ids)
+    parent = stack[-1] if len(stack) > 0 else None
+    stack.append(span_id)
+
+    s = Span(name, tags)
+    status = 'ok'
+    error = None
+    started = time.time()
+    started_perf = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        yield s
+    except BaseException as e:
+        status = 'error'
+        error = type(e).__name__ + ': ' + str(e)
+        raise
+    finally:
+        stack.pop()
+        record = {'name': name, 'pid': os.getpid(), 'id': span_id, 'parent': parent,
+                  'thread': threading.current_thread().name, 'start': round(started, 6),
+                  'seconds': round(time.perf_counter() - started_perf, 6),
+                  'process_cpu_seconds': round(time.process_time() - cpu_started, 6),
+                  'rss_bytes': sysinfo.rss(), 'peak_rss_bytes': sysinfo.peak_rss(), 'status': status}
+        if error is not None:
+            record['error'] = error
+        record['tags'] = s.tags
+        __write(record)
+
+
+def read_trace(file_trace):
+    """Reads the spans of a trace file
+
+    :param file_trace: Path to the JSON-lines trace file (String)
+    :return: List of span records (Dictionaries)
+    """
+    spans = []
+    with open(file_trace, encoding='UTF-8') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) > 0:
+                spans.append(json.loads(line))
+    return spans
+
+
+def summarize(spans):
+    """Summarizes spans by stage name
+
+    :param spans: List of span records, see read_trace()
+    :return: Dictionary of summaries by stage name, in the order the stages first finished. Each summary has count,
+     errors, seconds, mean_seconds, p95_seconds, max_seconds, the sums of bytes, triples and child_cpu_seconds, and
+     child_peak_rss_bytes and peak_rss_bytes
+    """
+    by_name = {}
+    for record in spans:
+        by_name.setdefault(record['name'], []).append(record)
+
+    summary = {}
+    for name, records in by_name.items():
+        seconds = sorted(record['seconds'] for record in records)
+        stage = {'count': len(records),
+                 'errors': sum(1 for record in records if record['status'] != 'ok'),
+                 'seconds': round(sum(seconds), 6),
+                 'mean_seconds': round(sum(seconds) / len(seconds), 6),
+                 'p95_seconds': seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))],
+                 'max_seconds': seconds[-1]}
+        for tag in __summed_tags:
+            values = [record['tags'][tag] for record in records if isinstance(record['tags'].get(tag), (int, float))]
+            stage[tag] = round(sum(values), 6) if len(values) > 0 else None
+        stage['child_peak_rss_bytes'] = __max(record['tags'].get('child_peak_rss_bytes') for record in records)
+        stage['peak_rss_bytes'] = __max(record.get('peak_rss_bytes') for record in records)
+        summary[name] = stage
+    return summary
+
+
+def write_prometheus(summary, file_prom):
+    """Writes a stage summary in the Prometheus text format, e.g., for the node exporter's textfile collector
+
+    The file is replaced atomically.
+
+    :param summary: Stage summary, see summarize()
+    :param file_prom: Path to the .prom file (String)
+    :return: None
+    """
+    metrics = [('stage_runs_total', 'counter', 'Number of times the stage ran', 'count'),
+               ('stage_errors_total', 'counter', 'Number of times the stage failed', 'errors'),
+               ('stage_seconds_total', 'counter', 'Time spent in the stage', 'seconds'),
+               ('stage_max_seconds', 'gauge', 'Longest run of the stage', 'max_seconds'),
+               ('stage_p95_seconds', 'gauge', '95th percentile of the run time of the stage', 'p95_seconds'),
+               ('stage_bytes_total', 'counter', 'Bytes processed by the stage', 'bytes'),
+               ('stage_triples_total', 'counter', 'Triples processed by the stage', 'triples'),
+               ('stage_child_cpu_seconds_total', 'counter', 'CPU time of the subprocesses of the stage',
+                'child_cpu_seconds'),
+               ('stage_child_peak_rss_bytes', 'gauge', 'Peak RSS of the subprocesses of the stage',
+                'child_peak_rss_bytes'),
+               ('stage_peak_rss_bytes', 'gauge', 'Peak RSS of the processes running the stage', 'peak_rss_bytes')]
+
+    lines = []
+    for metric, kind, description, key in metrics:
+        values = [(name, stage[key]) for name, stage in summary.items() if stage.get(key) is not None]
+        if len(values) == 0:
+            continue
+        lines.append('# HELP ' + PROMETHEUS_PREFIX + metric + ' ' + description)
+        lines.append('# TYPE ' + PROMETHEUS_PREFIX + metric + ' ' + kind)
+        for name, value in values:
+            lines.append(PROMETHEUS_PREFIX + metric + '{stage="' + __escape_label(name) + '"} ' + repr(value))
+    lines.append('# HELP ' + PROMETHEUS_PREFIX + 'last_run_timestamp_seconds Time the profiled run finished')
+    lines.append('# TYPE ' + PROMETHEUS_PREFIX + 'last_run_timestamp_seconds gauge')
+    lines.append(PROMETHEUS_PREFIX + 'last_run_timestamp_seconds ' + repr(round(time.time(), 3)))
+
+    file_tmp = file_prom + '.tmp'
+    with open(file_tmp, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(file_tmp, file_prom)
+
+
+def format_summary(summary):
+    """Formats a stage summary as a table
+
+    :param summary: Stage summary, see summarize()
+    :return: Table (String)
+    """
+    columns = [('stage', None), ('runs', 'count'), ('errors', 'errors'), ('total s', 'seconds'),
+               ('mean s', 'mean_seconds'), ('p95 s', 'p95_seconds'), ('max s', 'max_seconds'), ('MB', 'bytes'),
+               ('triples', 'triples'), ('child cpu s', 'child_cpu_seconds'), ('child rss MB', 'child_peak_rss_bytes'),
+               ('peak rss MB', 'peak_rss_bytes')]
+
+    rows = []
+    for name, stage in summary.items():
+        row = [name]
+        for title, key in columns[1:]:
+            value = stage.get(key)
+            if value is None:
+                row.append('-')
+            elif key.endswith('bytes'):
+                row.append('{:.1f}'.format(value / 1024 ** 2))
+            elif isinstance(value, float):
+                row.append('{:.3f}'.format(value))
+            else:
+                row.append(str(value))
+        rows.append(row)
+
+    widths = [max([len(title)] + [len(row[i]) for row in rows]) for i, (title, key) in enumerate(columns)]
+    lines = ['  '.join(title.ljust(widths[i]) if i == 0 else title.rjust(widths[i])
+                       for i, (title, key) in enumerate(columns))]
+    for row in rows:
+        lines.append('  '.join(value.ljust(widths[i]) if i == 0 else value.rjust(widths[i])
+                               for i, value in enumerate(row)))
+    return '\n'.join(lines)
+
+
+def finish(file_prom=None):
+    """Disables profiling, writes the Prometheus textfile and prints the summary table
+
+    :param file_prom: Path to the .prom file. Defaults to the trace file with the extension .prom [optional]
+    :return: Stage summary, see summarize(), or None if profiling was not enabled
+    """
+    file_trace = __file_trace
+    if file_trace is None:
+        return None
+    stop()
+
+    summary = summarize(read_trace(file_trace))
+    if file_prom is None:
+        file_prom = os.path.splitext(file_trace)[0] + '.prom'
+    write_prometheus(summary, file_prom)
+
+    print('\nProfile of ' + str(sum(stage['count'] for stage in summary.values())) + ' spans:')
+    print(format_summary(summary))
+    print('Trace: ' + file_trace)
+    print('Prometheus textfile: ' + file_prom)
+    return summary
+
+
+def __write(record):
+    """Appends a span record to the trace file
+
+    Each record is written with a single write to a file opened in append mode, so records of concurrent threads and
+    processes are not interleaved.
+
+    :param record: Span record (Dictionary)
+    :return: None
+    """
+    file_trace = __file_trace
+    if file_trace is None:
+        return
+    line = (json.dumps(record, default=str) + '\n').encode('UTF-8')
+    with __lock:
+        fd = os.open(file_trace, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def __max(values):
+    values = [value for value in values if value is not None]
+    return max(values) if len(values) > 0 else None
+
+
+def __escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
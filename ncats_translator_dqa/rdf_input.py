@@ -0,0 +1,207 @@
+"""Compressed data files
+
+Data files may be compressed with gzip (.gz), bzip2 (.bz2) or xz (.xz). The compression is detected from the file
+extension or, failing that, from the first bytes of the file, and files are decompressed while they are read, so they
+never have to be decompressed on disk. A parallel decompressor (pigz, lbzip2 or pbzip2, and xz with threads) is run in
+a pipe when one is installed and config.input_parallel_decompression is set. Otherwise Python's gzip, bz2 and lzma
+modules are used.
+"""
+import io
+import os
+import bz2
+import sys
+import gzip
+import lzma
+import shutil
+import subprocess
+from ncats_translator_dqa import config, sysinfo
+
+# Compression formats
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_BZIP2 = 'bzip2'
+COMPRESSION_XZ = 'xz'
+
+# File extensions of the compression formats
+_compression_extensions = {
+    '.gz': COMPRESSION_GZIP,
+    '.gzip': COMPRESSION_GZIP,
+    '.bz2': COMPRESSION_BZIP2,
+    '.xz': COMPRESSION_XZ
+}
+
+# First bytes of the compressed files
+_compression_magic = [
+    (b'\x1f\x8b', COMPRESSION_GZIP),
+    (b'BZh', COMPRESSION_BZIP2),
+    (b'\xfd7zXZ\x00', COMPRESSION_XZ)
+]
+
+# Python modules for decompressing, used when there is no parallel decompressor
+_compression_modules = {
+    COMPRESSION_GZIP: gzip,
+    COMPRESSION_BZIP2: bz2,
+    COMPRESSION_XZ: lzma
+}
+
+# Typical ratio of the decompressed size to the compressed size of RDF data, for estimating the decompressed size
+_compression_ratios = {
+    COMPRESSION_GZIP: 8,
+    COMPRESSION_BZIP2: 12,
+    COMPRESSION_XZ: 12
+}
+
+# Bytes read from a decompressor pipe at a time
+_pipe_buffer = 1024 * 1024
+
+
+def compression(file):
+    """Detects the compression of a file
+
+    :param file: Path to the file (String)
+    :return: COMPRESSION_GZIP, COMPRESSION_BZIP2, COMPRESSION_XZ, or None if the file is not compressed
+    """
+    extension = os.path.splitext(file)[1].lower()
+    if extension in _compression_extensions:
+        return _compression_extensions[extension]
+
+    # Look at the content of files without a known extension
+    try:
+        with open(file, 'rb') as f:
+            head = f.read(6)
+    except OSError:
+        return None
+    for magic, name in _compression_magic:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def strip_compression(file):
+    """Removes the compression extension from a file name, e.g., data.ttl.gz becomes data.ttl
+
+    :param file: Path or name of the file (String)
+    :return: Path or name without the compression extension (String)
+    """
+    base, extension = os.path.splitext(file)
+    if extension.lower() in _compression_extensions:
+        return base
+    return file
+
+
+def expanded_size(file):
+    """Estimates the size of the content of a file after decompression
+
+    :param file: Path to the file (String)
+    :return: Size in bytes (Integer). The size of the file if it is not compressed
+    """
+    size = os.path.getsize(file)
+    name = compression(file)
+    if name is None:
+        return size
+    return size * _compression_ratios[name]
+
+
+def decompressor(name):
+    """Gets the command line of a parallel decompressor that writes to standard output
+
+    :param name: Compression format, e.g., COMPRESSION_GZIP (String)
+    :return: Command line (List), or None if no parallel decompressor is installed or they are disabled
+    """
+    if not config.input_parallel_decompression:
+        return None
+
+    # The CPUs are shared among the validations that run at the same time
+    threads = str(max(sysinfo.cpu_count() // sysinfo.concurrency(), 1))
+    if name == COMPRESSION_GZIP:
+        candidates = [['pigz', '-d', '-c', '-p', threads]]
+    elif name == COMPRESSION_BZIP2:
+        candidates = [['lbzip2', '-d', '-c', '-n', threads], ['pbzip2', '-d', '-c', '-p' + threads]]
+    elif name == COMPRESSION_XZ:
+        # xz decompresses in parallel since version 5.4, and only files written with more than one block
+        candidates = [['xz', '-d', '-c', '-T', threads]]
+    else:
+        return None
+
+    for candidate in candidates:
+        path = shutil.which(candidate[0])
+        if path is not None:
+            return [path] + candidate[1:]
+    return None
+
+
+def open_binary(file):
+    """Opens a file for reading bytes, decompressing it if it is compressed
+
+    :param file: Path to the file (String)
+    :return: Binary stream. Close it when done, e.g., in a with statement
+    """
+    name = compression(file)
+    if name is None:
+        return open(file, 'rb')
+
+    command = decompressor(name)
+    if command is not None:
+        return io.BufferedReader(DecompressorPipe(command, file), buffer_size=_pipe_buffer)
+    return _compression_modules[name].open(file, 'rb')
+
+
+def open_text(file):
+    """Opens a UTF-8 file for reading text, decompressing it if it is compressed
+
+    Invalid UTF-8 sequences are replaced.
+
+    :param file: Path to the file (String)
+    :return: Text stream. Close it when done, e.g., in a with statement
+    """
+    if compression(file) is None:
+        return open(file, encoding='UTF-8', errors='replace')
+    return io.TextIOWrapper(open_binary(file), encoding='UTF-8', errors='replace')
+
+
+class DecompressorPipe(io.RawIOBase):
+    """Output of a decompressor process that reads a compressed file
+
+    The process is stopped if the stream is closed before the end of its output. An exception is raised at the end of
+    the output if the decompressor failed, e.g., because the file is truncated.
+    """
+
+    def __init__(self, command, file):
+        """Constructor
+
+        :param command: Command line of the decompressor, which reads standard input and writes to standard output
+         (List)
+        :param file: Path to the compressed file (String)
+        """
+        super().__init__()
+        self.command = command
+        self.file = file
+        with open(file, 'rb') as stdin:
+            self.__process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.__process.stdout.readinto(b)
+        if n == 0:
+            self.__check()
+        return n
+
+    def close(self):
+        if not self.closed:
+            if self.__process.poll() is None:
+                # Stopped before the end of the output
+                self.__process.kill()
+            self.__process.wait()
+            self.__process.stdout.close()
+            self.__process.stderr.close()
+        super().close()
+
+    def __check(self):
+        """Raises an exception if the decompressor failed
+        """
+        returncode = self.__process.wait()
+        if returncode != 0:
+            message = self.__process.stderr.read().decode('UTF-8', errors='replace').strip()
+            sys.stderr.write(os.path.basename(self.command[0]) + ' failed on ' + self.file + ': ' + message + '\n')
+            raise IOError('Could not decompress ' + self.file)
@@ -0,0 +1,668 @@
+"""Streaming parser for N-Triples, N-Quads, Turtle and RDF/XML files
+
+Files compressed with gzip, bzip2 or xz are decompressed while they are read (see rdf_input.py). Triples are produced
+one at a time as N-Triples terms (Strings), e.g., '<http://example.org/s>', '_:b0', '"chembl"@en' or
+'"1"^^<http://www.w3.org/2001/XMLSchema#integer>', so files of any size can be processed with bounded memory.
+Problems found while parsing are reported through an optional callback on_issue(kind, detail, line_number) instead of
+stopping the parse. Issue kinds are ISSUE_SYNTAX_ERROR and ISSUE_UNDECLARED_PREFIX.
+"""
+import os
+import re
+from urllib.parse import urljoin
+from xml.sax.xmlreader import InputSource
+from rdflib import BNode, Literal
+from rdflib.plugins.parsers.rdfxml import create_parser
+from ncats_translator_dqa import rdf_input
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+
+ISSUE_SYNTAX_ERROR = 'syntax_error'
+ISSUE_UNDECLARED_PREFIX = 'undeclared_prefix'
+
+# File extensions of the supported formats
+_format_extensions = {
+    '.nt': 'nt',
+    '.ntriples': 'nt',
+    '.nq': 'nq',
+    '.nquads': 'nq',
+    '.ttl': 'ttl',
+    '.turtle': 'ttl',
+    '.n3': 'ttl',
+    '.rdf': 'xml',
+    '.owl': 'xml',
+    '.xml': 'xml'
+}
+
+# A complete N-Triples/N-Quads statement on one line
+_re_ntriple = re.compile(r'\s*(<[^<>\s]*>|_:\S+)\s*(<[^<>\s]*>)\s*'
+                          r'(<[^<>\s]*>|_:\S+|"(?:[^"\\\n]|\\.)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*|\^\^<[^<>\s]*>)?)'
+                          r'\s*(<[^<>\s]*>|_:\S+)?\s*\.\s*(?:#.*)?$')
+
+# Turtle tokens
+_re_token = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*(?:\n|$))
+  | (?P<iri><[^>\n]*>)
+  | (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+               |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<langtag>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<bnode>_:[^\s<>"'()\[\];,]+)
+  | (?P<double>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.\d+[eE][+-]?\d+|\d+[eE][+-]?\d+))
+  | (?P<decimal>[+-]?\d*\.\d+)
+  | (?P<integer>[+-]?\d+)
+  | (?P<pname>[^\s<>"'()\[\];,:\#]*:(?:[^\s<>"'()\[\];,\\\#]|\\.)*)
+  | (?P<keyword>[A-Za-z]+)
+  | (?P<punct>[.;,\[\]()])
+  | (?P<error>\S)
+''', re.VERBOSE)
+
+# Escape sequences in strings and IRIs
+_re_escape = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.DOTALL)
+_string_escapes = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+# Characters escaped when writing N-Triples literals
+_re_literal_escape = re.compile(r'[\\"\n\r]')
+_literal_escapes = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'}
+
+# Size of the blocks read from the input
+_read_size = 1024 * 1024
+
+
+def guess_format(file):
+    """Guesses the serialization of an RDF file from its extension
+
+    The extension of compressed files is ignored, e.g., data.nt.gz is N-Triples.
+
+    :param file: Path to the file (String)
+    :return: 'nt', 'nq', 'ttl' or 'xml' (String). Unknown extensions are treated as Turtle
+    """
+    name = rdf_input.strip_compression(file.lower())
+    for ext, fmt in _format_extensions.items():
+        if name.endswith(ext):
+            return fmt
+    return 'ttl'
+
+
+def iter_triples(file, format=None, on_issue=None, base=None):
+    """Iterates over the triples in an RDF file
+
+    Compressed files are decompressed while they are read.
+
+    :param file: Path to the file (String) or a stream. RDF/XML is read from binary streams, the other formats from
+     text streams
+    :param format: 'nt', 'nq', 'ttl' or 'xml'. Guessed from the file extension if not given [optional]
+    :param on_issue: Function on_issue(kind, detail, line_number) called for each problem found [optional]
+    :param base: Base IRI for relative IRIs in Turtle and RDF/XML. Defaults to the file's URL when a path is given
+     [optional]
+    :return: Generator of (subject, predicate, object) tuples of N-Triples terms
+    """
+    if isinstance(file, str):
+        if format is None:
+            format = guess_format(file)
+        open_stream = rdf_input.open_binary if format == 'xml' else rdf_input.open_text
+        with open_stream(file) as stream:
+            yield from iter_triples(stream, format, on_issue, 'file://' + os.path.abspath(file))
+        return
+
+    if format == 'xml':
+        yield from __iter_rdfxml(file, on_issue, base)
+    elif format in ('nt', 'nq'):
+        yield from __iter_ntriples(file, on_issue)
+    else:
+        yield from TurtleParser(file, on_issue, base).triples()
+
+
+def __iter_ntriples(stream, on_issue):
+    """Iterates over the triples of an N-Triples or N-Quads stream, one statement per line
+
+    Graph names of N-Quads statements are dropped. Lines that don't match the simple line format (e.g., unusual
+    whitespace) are parsed with the Turtle parser instead.
+    """
+    for line_number, line in enumerate(stream, 1):
+        match = _re_ntriple.match(line)
+        if match is not None:
+            yield match.group(1), match.group(2), match.group(3)
+            continue
+
+        stripped = line.strip()
+        if len(stripped) == 0 or stripped[0] == '#':
+            continue
+
+        # Drop the graph name of a quad so the statement can be parsed as Turtle
+        def issue(kind, detail, _):
+            if on_issue is not None:
+                on_issue(kind, detail, line_number)
+        yield from TurtleParser([__drop_graph_name(line)], issue).triples()
+
+
+def __iter_rdfxml(stream, on_issue, base):
+    """Iterates over the triples of an RDF/XML stream
+
+    The document is fed to rdflib's RDF/XML parser block by block, and the triples it finds are produced as they are
+    parsed. A syntax error ends the parse, since XML can't be recovered after one.
+    """
+    source = InputSource(base)
+    sink = _TripleSink()
+    parser = create_parser(source, sink)
+    try:
+        while True:
+            block = stream.read(_read_size)
+            if len(block) == 0:
+                parser.close()
+            else:
+                parser.feed(block)
+            yield from sink.triples
+            sink.triples = []
+            if len(block) == 0:
+                return
+    except Exception as e:
+        # SAXParseException, or an error of rdflib's RDF/XML handler
+        yield from sink.triples
+        if on_issue is not None:
+            line_number = e.getLineNumber() if hasattr(e, 'getLineNumber') else None
+            on_issue(ISSUE_SYNTAX_ERROR, str(e), line_number)
+
+
+class _TripleSink:
+    """Collects the triples found by rdflib's RDF/XML parser as N-Triples terms
+    """
+
+    def __init__(self):
+        self.triples = []
+
+    def add(self, triple):
+        self.triples.append(tuple(_term(node) for node in triple))
+
+    def bind(self, prefix, namespace, override=True):
+        pass
+
+
+def _term(node):
+    """Formats an rdflib node as an N-Triples term
+
+    :param node: URIRef, BNode or Literal
+    :return: N-Triples term (String)
+    """
+    if isinstance(node, Literal):
+        return literal(str(node), node.language, str(node.datatype) if node.datatype is not None else None)
+    if isinstance(node, BNode):
+        return '_:' + str(node)
+    return '<' + str(node) + '>'
+
+
+def __drop_graph_name(line):
+    """Removes the graph name from an N-Quads statement, if there is one
+
+    :param line: N-Quads statement (String)
+    :return: N-Triples statement (String)
+    """
+    # Group the tokens into terms. Language tags and datatypes belong to the preceding literal
+    terms = []
+    suffix = False
+    for m in _re_token.finditer(line):
+        kind = m.lastgroup
+        if kind == 'ws' or (kind == 'punct' and m.group() == '.'):
+            continue
+        if kind in ('langtag', 'datatype') or suffix:
+            suffix = kind == 'datatype'
+            continue
+        terms.append(m)
+
+    if len(terms) == 4 and terms[3].lastgroup in ('iri', 'bnode'):
+        return line[:terms[3].start()] + ' .\n'
+    return line
+
+
+def ntriple(s, p, o):
+    """Formats a triple as an N-Triples statement
+
+    :param s: Subject term (String)
+    :param p: Predicate term (String)
+    :param o: Object term (String)
+    :return: N-Triples statement with a trailing newline (String)
+    """
+    return s + ' ' + p + ' ' + o + ' .\n'
+
+
+def literal(lexical, lang=None, datatype=None):
+    """Formats a literal as an N-Triples term
+
+    :param lexical: Lexical form, unescaped (String)
+    :param lang: Language tag [optional]
+    :param datatype: Datatype IRI, without angle brackets [optional]
+    :return: N-Triples term (String)
+    """
+    term = '"' + _re_literal_escape.sub(lambda m: _literal_escapes[m.group()], lexical) + '"'
+    if lang:
+        return term + '@' + lang
+    if datatype:
+        return term + '^^<' + datatype + '>'
+    return term
+
+
+def term_kind(term):
+    """Gets the kind of an N-Triples term
+
+    :param term: N-Triples term (String)
+    :return: 'iri', 'bnode' or 'literal' (String)
+    """
+    c = term[0]
+    if c == '<':
+        return 'iri'
+    if c == '_':
+        return 'bnode'
+    return 'literal'
+
+
+def parse_literal(term):
+    """Splits an N-Triples literal into its parts
+
+    :param term: N-Triples literal term (String)
+    :return: Tuple (unescaped lexical form, language tag or None, datatype IRI or None)
+    """
+    end = term.rindex('"')
+    lexical = unescape(term[1:end])
+    suffix = term[end + 1:]
+    if suffix.startswith('@'):
+        return lexical, suffix[1:], None
+    if suffix.startswith('^^<'):
+        return lexical, None, suffix[3:-1]
+    return lexical, None, None
+
+
+def unescape(text):
+    """Replaces string escape sequences (\\n, \\uXXXX, ...) with the characters they represent
+
+    :param text: Escaped text (String)
+    :return: Unescaped text (String)
+    """
+    if '\\' not in text:
+        return text
+
+    def replace(m):
+        if m.group(1) is not None:
+            return chr(int(m.group(1), 16))
+        if m.group(2) is not None:
+            return chr(int(m.group(2), 16))
+        return _string_escapes.get(m.group(3), m.group(3))
+    return _re_escape.sub(replace, text)
+
+
+class TurtleParser:
+    """Streaming Turtle parser
+
+    Supports prefix and base declarations (@prefix, @base, PREFIX, BASE), prefixed names, 'a', predicate and object
+    lists, blank node property lists, collections, and string, numeric and boolean literals. Statements with syntax
+    errors are skipped up to the next '.' and reported to on_issue.
+    """
+
+    def __init__(self, stream, on_issue=None, base=None):
+        """Constructor
+
+        :param stream: Text stream or iterable of text blocks
+        :param on_issue: Function on_issue(kind, detail, line_number) called for each problem found [optional]
+        :param base: Base IRI for resolving relative IRIs (String) [optional]
+        """
+        if hasattr(stream, 'read'):
+            self.__blocks = iter(lambda: stream.read(_read_size), '')
+        else:
+            self.__blocks = iter(stream)
+        self.__on_issue = on_issue
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+        self.__tokens = []
+        self.__positions = []
+        self.__i = 0
+        self.__last = None
+        self.__lines_before = 0
+        self.__line_pos = 0
+        self.__line_count = 0
+        self.__last_was_property_list = False
+        self.prefixes = {}
+        self.base = base
+        self.__pnames = {}
+        self.__n_bnodes = 0
+        self.__triples = []
+
+    def triples(self):
+        """Iterates over the triples in the stream
+
+        :return: Generator of (subject, predicate, object) tuples of N-Triples terms
+        """
+        while True:
+            token = self.__peek()
+            if token is None:
+                return
+            self.__last = None
+            try:
+                self.__statement()
+            except _TurtleSyntaxError as e:
+                self.__issue(ISSUE_SYNTAX_ERROR, str(e))
+                self.__triples = []
+                self.__recover()
+            yield from self.__triples
+            self.__triples = []
+
+    # Statements
+
+    def __statement(self):
+        kind, value = self.__peek()
+        if kind == 'langtag' and value in ('@prefix', '@base'):
+            self.__next()
+            self.__directive(value[1:])
+            self.__expect('.')
+        elif kind == 'keyword' and value.upper() in ('PREFIX', 'BASE'):
+            self.__next()
+            self.__directive(value.lower())
+        else:
+            subject = self.__subject()
+            if self.__last_was_property_list and self.__peek_punct('.'):
+                # A blank node property list can be a statement on its own
+                self.__next()
+                return
+            self.__predicate_object_list(subject)
+            self.__expect('.')
+
+    def __directive(self, name):
+        if name == 'prefix':
+            kind, value = self.__next()
+            if kind != 'pname' or not value.endswith(':'):
+                raise _TurtleSyntaxError('Expected a prefix name, found ' + value)
+            kind, iri = self.__next()
+            if kind != 'iri':
+                raise _TurtleSyntaxError('Expected an IRI, found ' + iri)
+            self.prefixes[value[:-1]] = self.__resolve(unescape(iri[1:-1]))
+            self.__pnames.clear()
+        else:
+            kind, iri = self.__next()
+            if kind != 'iri':
+                raise _TurtleSyntaxError('Expected an IRI, found ' + iri)
+            self.base = self.__resolve(unescape(iri[1:-1]))
+
+    def __subject(self):
+        self.__last_was_property_list = False
+        kind, value = self.__peek()
+        if kind == 'punct' and value == '[':
+            self.__last_was_property_list = True
+            return self.__blank_node_property_list()
+        if kind == 'punct' and value == '(':
+            return self.__collection()
+        self.__next()
+        if kind == 'iri':
+            return self.__iri(value)
+        if kind == 'pname':
+            return self.__pname(value)
+        if kind == 'bnode':
+            return value
+        raise _TurtleSyntaxError('Unexpected subject ' + value)
+
+    def __predicate_object_list(self, subject):
+        while True:
+            predicate = self.__predicate()
+            self.__object_list(subject, predicate)
+
+            # Continue after ';' unless the list ends
+            if not self.__peek_punct(';'):
+                return
+            while self.__peek_punct(';'):
+                self.__next()
+            if self.__peek_punct('.') or self.__peek_punct(']'):
+                return
+
+    def __object_list(self, subject, predicate):
+        while True:
+            obj = self.__object()
+            self.__triples.append((subject, predicate, obj))
+            if not self.__peek_punct(','):
+                return
+            self.__next()
+
+    def __predicate(self):
+        kind, value = self.__next()
+        if kind == 'iri':
+            return self.__iri(value)
+        if kind == 'pname':
+            return self.__pname(value)
+        if kind == 'keyword' and value == 'a':
+            return '<' + RDF + 'type>'
+        raise _TurtleSyntaxError('Unexpected predicate ' + value)
+
+    def __object(self):
+        kind, value = self.__peek()
+        if kind == 'punct' and value == '[':
+            return self.__blank_node_property_list()
+        if kind == 'punct' and value == '(':
+            return self.__collection()
+        self.__next()
+        if kind == 'iri':
+            return self.__iri(value)
+        if kind == 'pname':
+            return self.__pname(value)
+        if kind == 'bnode':
+            return value
+        if kind == 'string':
+            return self.__literal(value)
+        if kind == 'integer':
+            return literal(value, datatype=XSD + 'integer')
+        if kind == 'decimal':
+            return literal(value, datatype=XSD + 'decimal')
+        if kind == 'double':
+            return literal(value, datatype=XSD + 'double')
+        if kind == 'keyword' and value in ('true', 'false'):
+            return literal(value, datatype=XSD + 'boolean')
+        raise _TurtleSyntaxError('Unexpected object ' + value)
+
+    def __literal(self, value):
+        if value[:3] in ('"""', "'''"):
+            lexical = unescape(value[3:-3])
+        else:
+            lexical = unescape(value[1:-1])
+
+        token = self.__peek()
+        if token is not None and token[0] == 'langtag':
+            self.__next()
+            return literal(lexical, lang=token[1][1:])
+        if token is not None and token[0] == 'datatype':
+            self.__next()
+            kind, dt = self.__next()
+            if kind == 'iri':
+                dt = self.__iri(dt)
+            elif kind == 'pname':
+                dt = self.__pname(dt)
+            else:
+                raise _TurtleSyntaxError('Expected a datatype IRI, found ' + dt)
+            return literal(lexical, datatype=dt[1:-1])
+        return literal(lexical)
+
+    def __blank_node_property_list(self):
+        self.__expect('[')
+        node = self.__new_bnode()
+        if not self.__peek_punct(']'):
+            self.__predicate_object_list(node)
+        self.__expect(']')
+        return node
+
+    def __collection(self):
+        self.__expect('(')
+        items = []
+        while not self.__peek_punct(')'):
+            items.append(self.__object())
+        self.__next()
+
+        if len(items) == 0:
+            return '<' + RDF + 'nil>'
+        head = self.__new_bnode()
+        node = head
+        for i, item in enumerate(items):
+            self.__triples.append((node, '<' + RDF + 'first>', item))
+            rest = self.__new_bnode() if i < len(items) - 1 else '<' + RDF + 'nil>'
+            self.__triples.append((node, '<' + RDF + 'rest>', rest))
+            node = rest
+        return head
+
+    # Terms
+
+    def __new_bnode(self):
+        self.__n_bnodes += 1
+        return '_:genid' + str(self.__n_bnodes)
+
+    def __iri(self, token):
+        return '<' + self.__resolve(unescape(token[1:-1])) + '>'
+
+    def __resolve(self, iri):
+        if self.base is not None and not re.match(r'[A-Za-z][A-Za-z0-9+.\-]*:', iri):
+            return urljoin(self.base, iri)
+        return iri
+
+    def __pname(self, token):
+        iri = self.__pnames.get(token)
+        if iri is not None:
+            return iri
+
+        prefix, local = token.split(':', 1)
+        if '\\' in local:
+            local = re.sub(r'\\(.)', r'\1', local)
+        if prefix not in self.prefixes:
+            self.__issue(ISSUE_UNDECLARED_PREFIX, prefix)
+            return '<' + prefix + ':' + local + '>'
+        iri = '<' + self.prefixes[prefix] + local + '>'
+
+        # Remember expanded names, which repeat often (e.g., predicates and classes)
+        if len(self.__pnames) >= 100000:
+            self.__pnames.clear()
+        self.__pnames[token] = iri
+        return iri
+
+    # Tokens
+
+    def __peek_punct(self, punct):
+        token = self.__peek()
+        return token is not None and token[0] == 'punct' and token[1] == punct
+
+    def __expect(self, punct):
+        token = self.__next()
+        if token[0] != 'punct' or token[1] != punct:
+            raise _TurtleSyntaxError("Expected '" + punct + "', found " + token[1])
+
+    def __peek(self):
+        if self.__i >= len(self.__tokens):
+            self.__tokenize()
+            if len(self.__tokens) == 0:
+                return None
+        return self.__tokens[self.__i]
+
+    def __next(self):
+        token = self.__peek()
+        if token is None:
+            raise _TurtleSyntaxError('Unexpected end of input')
+        self.__i += 1
+        self.__last = token
+        return token
+
+    def __tokenize(self):
+        """Reads the next block of input and splits the buffered input into tokens
+
+        Tokens close to the end of the buffer may continue in the next block (e.g., '1' in '1.5' or '1e3'), so they
+        are left in the buffer for the next call.
+        """
+        self.__tokens = []
+        self.__positions = []
+        self.__i = 0
+        tokens = self.__tokens
+        positions = self.__positions
+
+        while len(tokens) == 0:
+            # Discard the tokenized part of the buffer
+            if self.__pos > 0:
+                self.__lines_before += self.__buffer.count('\n', 0, self.__pos)
+                self.__buffer = self.__buffer[self.__pos:]
+                self.__pos = 0
+                self.__line_pos = 0
+                self.__line_count = 0
+
+            if not self.__eof:
+                block = next(self.__blocks, '')
+                if len(block) == 0:
+                    self.__eof = True
+                self.__buffer += block
+            elif len(self.__buffer) == 0:
+                return
+
+            buffer = self.__buffer
+            end = len(buffer)
+            eof = self.__eof
+            pos = self.__pos
+            for match in _re_token.finditer(buffer, pos):
+                kind = match.lastgroup
+                if not eof and (end - match.end() < 3 or
+                                (kind == 'string' and self.__is_unterminated_long_string(match)) or
+                                (kind == 'error' and buffer.find('\n', match.start()) < 0)):
+                    # The token may continue in the next block
+                    break
+                pos = match.end()
+                if kind == 'ws':
+                    continue
+
+                value = match.group()
+                if (kind == 'pname' or kind == 'bnode') and value[-1] == '.':
+                    # Names can't end with '.', which ends the statement instead
+                    stripped = value.rstrip('.')
+                    tokens.append((kind, stripped))
+                    positions.append(match.start())
+                    for _ in range(len(value) - len(stripped)):
+                        tokens.append(('punct', '.'))
+                        positions.append(match.start())
+                else:
+                    tokens.append((kind, value))
+                    positions.append(match.start())
+            self.__pos = pos
+
+            if eof and len(tokens) == 0:
+                self.__buffer = ''
+                return
+
+    def __is_unterminated_long_string(self, match):
+        """Checks whether a short string token is actually the start of a long string that continues past the buffer
+
+        :param match: Token match
+        :return: True if more input must be read
+        """
+        quotes = self.__buffer[match.start():match.start() + 3]
+        return (quotes == '"""' or quotes == "'''") and match.group()[:3] != quotes
+
+    def __recover(self):
+        """Skips input up to and including the next '.' at the end of a statement
+        """
+        if self.__last == ('punct', '.'):
+            return
+        while True:
+            token = self.__peek()
+            if token is None:
+                return
+            self.__i += 1
+            if token == ('punct', '.'):
+                return
+
+    def __current_line(self):
+        """Gets the line number of the current token
+        """
+        if len(self.__positions) == 0:
+            return self.__lines_before + 1
+        position = self.__positions[min(max(self.__i - 1, 0), len(self.__positions) - 1)]
+        if position < self.__line_pos:
+            self.__line_pos = 0
+            self.__line_count = 0
+        self.__line_count += self.__buffer.count('\n', self.__line_pos, position)
+        self.__line_pos = position
+        return self.__lines_before + self.__line_count + 1
+
+    def __issue(self, kind, detail):
+        if self.__on_issue is not None:
+            self.__on_issue(kind, detail, self.__current_line())
+
+
+class _TurtleSyntaxError(Exception):
+    pass
+
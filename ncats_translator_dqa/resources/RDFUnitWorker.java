@@ -0,0 +1,141 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.security.Permission;
+import java.util.Arrays;
+
+/**
+ * Long-lived RDFUnit worker used by ncats_translator_dqa.computational_metrics.RDFUnitWorker
+ *
+ * Usage: java -cp <RDFUnit classpath>:<folder of this class> RDFUnitWorker <main class>
+ *
+ * The worker keeps one JVM running and calls the main method of the given class (e.g.,
+ * org.aksw.rdfunit.validate.cli.ValidateCLI) once for each job read from stdin. Each job is one line of
+ * tab-separated fields:
+ *
+ *   job id, log file, argument 1, argument 2, ...
+ *
+ * Everything the job writes to System.out and System.err goes to the log file. When the job is done, the worker
+ * writes "job id, exit code" (tab-separated) to its own stdout. System.exit() calls made by the job are trapped and
+ * reported as the exit code instead of stopping the JVM. The worker writes READY once it is able to accept jobs and
+ * exits when stdin is closed.
+ *
+ * Exits are trapped with a Security Manager, which JDK 18 to 23 only allow with -Djava.security.manager=allow. JDK 24
+ * and later no longer support it: the worker still runs, but a job that calls System.exit() stops the JVM.
+ */
+public class RDFUnitWorker {
+
+    /** Thrown instead of exiting the JVM when a job calls System.exit() */
+    private static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            this.status = status;
+        }
+    }
+
+    /** Output stream that forwards to the log file of the current job */
+    private static class SwitchableOutputStream extends OutputStream {
+        private volatile OutputStream target;
+
+        SwitchableOutputStream(OutputStream target) {
+            this.target = target;
+        }
+
+        void setTarget(OutputStream target) {
+            this.target = target;
+        }
+
+        @Override
+        public void write(int b) throws IOException {
+            target.write(b);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) throws IOException {
+            target.write(b, off, len);
+        }
+
+        @Override
+        public void flush() throws IOException {
+            target.flush();
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        Method jobMain = Class.forName(args[0]).getMethod("main", String[].class);
+
+        // The protocol channel is the original stdout. Everything else written to System.out and System.err,
+        // including by loggers initialized later, goes to the current job's log file.
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        OutputStream idle = new FileOutputStream(FileDescriptor.err);
+        SwitchableOutputStream output = new SwitchableOutputStream(idle);
+        PrintStream jobStream = new PrintStream(output, true, "UTF-8");
+        System.setOut(jobStream);
+        System.setErr(jobStream);
+
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrappedException(status);
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            new PrintStream(idle, true, "UTF-8").println(
+                    "RDFUnitWorker: this JVM can't trap System.exit(). A job that calls it stops the worker");
+        }
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        protocol.println("READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] fields = line.split("\t", -1);
+            if (fields.length < 2) {
+                continue;
+            }
+            String[] jobArgs = Arrays.copyOfRange(fields, 2, fields.length);
+
+            int status = 0;
+            try (FileOutputStream log = new FileOutputStream(fields[1])) {
+                output.setTarget(log);
+                try {
+                    jobMain.invoke(null, (Object) jobArgs);
+                } catch (InvocationTargetException e) {
+                    Throwable cause = e.getCause();
+                    if (cause instanceof ExitTrappedException) {
+                        status = ((ExitTrappedException) cause).status;
+                    } else {
+                        cause.printStackTrace(jobStream);
+                        status = 1;
+                    }
+                } catch (ExitTrappedException e) {
+                    status = e.status;
+                }
+                jobStream.flush();
+            } catch (IOException e) {
+                e.printStackTrace(new PrintStream(idle, true));
+                status = 1;
+            } finally {
+                output.setTarget(idle);
+            }
+
+            protocol.println(fields[0] + "\t" + status);
+        }
+    }
+}
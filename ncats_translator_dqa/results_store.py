@@ -0,0 +1,423 @@
+"""Persistent store of data quality results
+
+Every run of translator_dqa records its preliminary statistics, per-test violation counts and DQV measurements in one
+SQLite database (config.path_results_db), so results can be compared across runs without re-parsing output files.
+
+Usage from the command line:
+python3 -m ncats_translator_dqa.results_store runs
+python3 -m ncats_translator_dqa.results_store trend <data set> [--test <test case> | --metric <metric>] [-n 20]
+python3 -m ncats_translator_dqa.results_store top [--run <run id>] [-n 10]
+python3 -m ncats_translator_dqa.results_store export <run id> <output.csv|output.ttl>
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+import pandas as pd
+from rdflib.namespace import XSD
+from ncats_translator_dqa import config, rdf_stream
+from ncats_translator_dqa.preliminary_statistics.fair_scraper import FAIRPrelimStats, fair_table
+from ncats_translator_dqa.preliminary_statistics.prelim_stats_rdf import DQVWriter
+
+# Predicates read from results files
+_rut_test_case = '<http://rdfunit.aksw.org/ns/core#testCase>'
+_sh_source_shape = '<http://www.w3.org/ns/shacl#sourceShape>'
+_dqv_is_measurement_of = '<http://www.w3.org/ns/dqv#isMeasurementOf>'
+_dqv_value = '<http://www.w3.org/ns/dqv#value>'
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    finished TEXT,
+    command TEXT
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS prelim_stats (
+    run_id INTEGER NOT NULL REFERENCES runs,
+    dataset_id INTEGER NOT NULL REFERENCES datasets,
+    title TEXT,
+    scope_and_data_types TEXT,
+    terminology_artifacts TEXT,
+    license TEXT,
+    license_json TEXT,
+    PRIMARY KEY (run_id, dataset_id)
+);
+CREATE TABLE IF NOT EXISTS run_datasets (
+    run_id INTEGER NOT NULL REFERENCES runs,
+    dataset_id INTEGER NOT NULL REFERENCES datasets,
+    PRIMARY KEY (run_id, dataset_id)
+);
+CREATE TABLE IF NOT EXISTS violations (
+    run_id INTEGER NOT NULL REFERENCES runs,
+    dataset_id INTEGER NOT NULL REFERENCES datasets,
+    test_case TEXT NOT NULL,
+    n_violations INTEGER NOT NULL,
+    PRIMARY KEY (run_id, dataset_id, test_case)
+);
+CREATE INDEX IF NOT EXISTS violations_dataset ON violations (dataset_id, run_id);
+CREATE TABLE IF NOT EXISTS measurements (
+    run_id INTEGER NOT NULL REFERENCES runs,
+    dataset_id INTEGER NOT NULL REFERENCES datasets,
+    metric TEXT NOT NULL,
+    value TEXT,
+    datatype TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_dataset ON measurements (dataset_id, metric, run_id);
+CREATE TABLE IF NOT EXISTS job_times (
+    run_id INTEGER NOT NULL REFERENCES runs,
+    dataset_id INTEGER NOT NULL REFERENCES datasets,
+    engine TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, dataset_id, engine)
+);
+'''
+
+# Databases created before run_datasets existed record the data sets checked in a run only by their results
+_backfill_run_datasets = '''
+INSERT OR IGNORE INTO run_datasets
+SELECT run_id, dataset_id FROM violations UNION SELECT run_id, dataset_id FROM measurements
+'''
+
+
+def read_results_file(file_results):
+    """Reads violation counts and DQV measurements from a computational metrics results file
+
+    The file is streamed with rdf_stream. Violations of RDFUnit results are counted by rut:testCase, or by
+    sh:sourceShape if the results don't name their test cases.
+
+    :param file_results: Path to the results file, e.g., data_file_computational_metrics.ttl (String)
+    :return: Tuple (Dictionary of violation counts by test case IRI, List of tuples (metric IRI, value, datatype IRI))
+    """
+    by_test_case = {}
+    by_shape = {}
+    metrics = {}
+    values = {}
+    for s, p, o in rdf_stream.iter_triples(file_results):
+        if p == _rut_test_case:
+            by_test_case[o] = by_test_case.get(o, 0) + 1
+        elif p == _sh_source_shape:
+            by_shape[o] = by_shape.get(o, 0) + 1
+        elif p == _dqv_is_measurement_of:
+            metrics[s] = o
+        elif p == _dqv_value:
+            values[s] = o
+
+    violations = by_test_case if len(by_test_case) > 0 else by_shape
+    violations = {test_case[1:-1]: n for test_case, n in violations.items() if test_case[0] == '<'}
+
+    measurements = []
+    for measurement, metric in metrics.items():
+        if measurement in values and metric[0] == '<':
+            value, lang, datatype = rdf_stream.parse_literal(values[measurement])
+            measurements.append((metric[1:-1], value, datatype))
+
+    return violations, measurements
+
+
+class ResultsStore:
+    """SQLite database of data quality results, in WAL mode so that readers don't block the writer
+    """
+
+    def __init__(self, path_db=None, verbose=None):
+        """Constructor. Opens the database, creating it if needed
+
+        :param path_db: Path to the SQLite database file. Defaults to config.path_results_db [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        """
+        self.path_db = path_db if path_db is not None else config.path_results_db
+        self.verbose = verbose if verbose is not None else config.verbose
+
+        directory = os.path.split(self.path_db)[0]
+        if len(directory) > 0 and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(self.path_db, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        tables = [row[0] for row in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self.db.executescript(_schema)
+        if 'violations' in tables and 'run_datasets' not in tables:
+            with self.db:
+                self.db.execute(_backfill_run_datasets)
+
+    def close(self):
+        """Closes the database
+
+        :return: None
+        """
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start_run(self, command=''):
+        """Records the start of a run
+
+        :param command: Command line of the run (String) [optional]
+        :return: Run ID (Integer)
+        """
+        with self.db:
+            cursor = self.db.execute('INSERT INTO runs (started, command) VALUES (?, ?)',
+                                     (datetime.now().isoformat(timespec='seconds'), command))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """Records the end of a run
+
+        :param run_id: Run ID (Integer)
+        :return: None
+        """
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ? WHERE run_id = ?',
+                            (datetime.now().isoformat(timespec='seconds'), run_id))
+
+    def add_prelim_stats(self, run_id, fpss):
+        """Records preliminary statistics scraped from FAIRsharing.org. Data sets are identified by their URL
+
+        :param run_id: Run ID (Integer)
+        :param fpss: List of FAIRPrelimStats
+        :return: None
+        """
+        with self.db:
+            ids = self.__dataset_ids([fps.url for fps in fpss])
+            self.db.executemany('INSERT OR REPLACE INTO prelim_stats VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                [(run_id, ids[fps.url], fps.title, fps.get_scope_and_data_types_string(),
+                                  fps.get_terminology_artifacts_string(), fps.get_license_string(),
+                                  json.dumps(fps.license)) for fps in fpss])
+
+    def add_results_file(self, run_id, dataset, file_results):
+        """Records the violation counts and DQV measurements of a computational metrics results file
+
+        The data set is recorded as checked in the run even if it has no violations, so that trend() reports 0 for it.
+
+        :param run_id: Run ID (Integer)
+        :param dataset: Data set name, e.g., the path to the data file (String)
+        :param file_results: Path to the results file (String)
+        :return: None
+        """
+        violations, measurements = read_results_file(file_results)
+        with self.db:
+            dataset_id = self.__dataset_ids([dataset])[dataset]
+            self.db.execute('INSERT OR IGNORE INTO run_datasets VALUES (?, ?)', (run_id, dataset_id))
+            self.db.execute('DELETE FROM violations WHERE run_id = ? AND dataset_id = ?', (run_id, dataset_id))
+            self.db.execute('DELETE FROM measurements WHERE run_id = ? AND dataset_id = ?', (run_id, dataset_id))
+            self.db.executemany('INSERT INTO violations VALUES (?, ?, ?, ?)',
+                                [(run_id, dataset_id, test_case, n) for test_case, n in violations.items()])
+            self.db.executemany('INSERT INTO measurements VALUES (?, ?, ?, ?, ?)',
+                                [(run_id, dataset_id, metric, value, datatype)
+                                 for metric, value, datatype in measurements])
+
+        if self.verbose:
+            print('Results store: recorded ' + str(sum(violations.values())) + ' violations and ' +
+                  str(len(measurements)) + ' measurements of ' + dataset)
+
+    def add_job_times(self, run_id, engine, times):
+        """Records how long the validation of data sets took, for estimating the cost of later runs (see scheduler.py)
+
+        :param run_id: Run ID (Integer)
+        :param engine: Validation engine, 'rdfunit' or 'lite' (String)
+        :param times: List of tuples (data set name, size of the data file in bytes, seconds)
+        :return: None
+        """
+        if len(times) == 0:
+            return
+        with self.db:
+            ids = self.__dataset_ids([dataset for dataset, n_bytes, seconds in times])
+            self.db.executemany('INSERT OR REPLACE INTO job_times VALUES (?, ?, ?, ?, ?)',
+                                [(run_id, ids[dataset], engine, n_bytes, seconds)
+                                 for dataset, n_bytes, seconds in times])
+
+    def job_times(self, engine, last_n=1000):
+        """Gets the most recent validation times recorded with add_job_times()
+
+        :param engine: Validation engine, 'rdfunit' or 'lite' (String)
+        :param last_n: Maximum number of validation times [optional]
+        :return: List of tuples (data set name, size of the data file in bytes, seconds), oldest first
+        """
+        query = '''
+            SELECT d.name, j.bytes, j.seconds
+            FROM job_times j JOIN datasets d ON d.dataset_id = j.dataset_id
+            WHERE j.engine = ?
+            ORDER BY j.run_id DESC LIMIT ?'''
+        return [tuple(row) for row in self.db.execute(query, (engine, last_n))][::-1]
+
+    def runs(self, limit=20):
+        """Gets the most recent runs
+
+        :param limit: Maximum number of runs [optional]
+        :return: pandas.DataFrame with columns run_id, started, finished, command
+        """
+        return pd.read_sql_query('SELECT * FROM runs ORDER BY run_id DESC LIMIT ?', self.db, params=(limit,))
+
+    def trend(self, dataset, test_case=None, last_n=20):
+        """Gets the number of violations of a data set in its most recent runs
+
+        :param dataset: Data set name (String)
+        :param test_case: IRI of a test case to count violations of. Defaults to all test cases [optional]
+        :param last_n: Number of runs [optional]
+        :return: pandas.DataFrame with columns run_id, started, n_violations, oldest run first. Runs that checked the
+         data set without finding violations have n_violations 0
+        """
+        query = '''
+            SELECT r.run_id, r.started, COALESCE(SUM(v.n_violations), 0) AS n_violations
+            FROM run_datasets rd JOIN runs r ON r.run_id = rd.run_id JOIN datasets d ON d.dataset_id = rd.dataset_id
+            LEFT JOIN violations v ON v.run_id = rd.run_id AND v.dataset_id = rd.dataset_id
+                AND (? IS NULL OR v.test_case = ?)
+            WHERE d.name = ?
+            GROUP BY r.run_id ORDER BY r.run_id DESC LIMIT ?'''
+        df = pd.read_sql_query(query, self.db, params=(test_case, test_case, dataset, last_n))
+        return df.iloc[::-1].reset_index(drop=True)
+
+    def measurement_trend(self, dataset, metric, last_n=20):
+        """Gets the values of a DQV metric for a data set in its most recent runs
+
+        :param dataset: Data set name (String)
+        :param metric: Local name or IRI of the metric, e.g., 'illTypedLiteralsMetric' (String)
+        :param last_n: Number of runs [optional]
+        :return: pandas.DataFrame with columns run_id, started, value, oldest run first
+        """
+        if ':' not in metric:
+            metric = 'http://ncats.nih.gov/' + metric
+        query = '''
+            SELECT r.run_id, r.started, m.value
+            FROM measurements m JOIN runs r ON r.run_id = m.run_id JOIN datasets d ON d.dataset_id = m.dataset_id
+            WHERE d.name = ? AND m.metric = ?
+            ORDER BY r.run_id DESC LIMIT ?'''
+        df = pd.read_sql_query(query, self.db, params=(dataset, metric, last_n))
+        return df.iloc[::-1].reset_index(drop=True)
+
+    def top_offenders(self, run_id=None, limit=10):
+        """Gets the data sets with the most violations in a run
+
+        :param run_id: Run ID. Defaults to the most recent run with violations [optional]
+        :param limit: Maximum number of data sets [optional]
+        :return: pandas.DataFrame with columns dataset, n_violations, n_test_cases
+        """
+        if run_id is None:
+            row = self.db.execute('SELECT MAX(run_id) FROM violations').fetchone()
+            run_id = row[0]
+        query = '''
+            SELECT d.name AS dataset, SUM(v.n_violations) AS n_violations, COUNT(*) AS n_test_cases
+            FROM violations v JOIN datasets d ON d.dataset_id = v.dataset_id
+            WHERE v.run_id = ?
+            GROUP BY d.dataset_id ORDER BY n_violations DESC LIMIT ?'''
+        return pd.read_sql_query(query, self.db, params=(run_id, limit))
+
+    def prelim_stats(self, run_id):
+        """Gets the preliminary statistics recorded in a run
+
+        :param run_id: Run ID (Integer)
+        :return: List of FAIRPrelimStats. Scopes and data types and terminology artifacts are restored from their
+         '; '-separated strings
+        """
+        query = '''
+            SELECT d.name, p.title, p.scope_and_data_types, p.terminology_artifacts, p.license_json
+            FROM prelim_stats p JOIN datasets d ON d.dataset_id = p.dataset_id
+            WHERE p.run_id = ? ORDER BY d.dataset_id'''
+        fpss = []
+        for url, title, sad, ta, lic in self.db.execute(query, (run_id,)):
+            lic = [(usage, licenses) for usage, licenses in json.loads(lic)]
+            fpss.append(FAIRPrelimStats(url, title, _split(sad), _split(ta), lic))
+        return fpss
+
+    def export_csv(self, run_id, file_output):
+        """Writes the preliminary statistics of a run to a CSV file in the format of fair_scraper.fair_table
+
+        :param run_id: Run ID (Integer)
+        :param file_output: Path to the CSV file (String)
+        :return: None
+        """
+        fair_table(self.prelim_stats(run_id), file_output)
+
+    def export_ttl(self, run_id, file_output):
+        """Writes the preliminary statistics and measurements of a run in W3C DQV
+
+        :param run_id: Run ID (Integer)
+        :param file_output: Path to the turtle file (String)
+        :return: None
+        """
+        with DQVWriter(file_output) as writer:
+            for fps in self.prelim_stats(run_id):
+                writer.add_dataset(''.join([c for c in fps.title if c.isalnum()]) + 'Dataset', fps)
+
+            query = '''
+                SELECT d.name, m.metric, m.value, m.datatype
+                FROM measurements m JOIN datasets d ON d.dataset_id = m.dataset_id
+                WHERE m.run_id = ? ORDER BY d.dataset_id'''
+            dataset_last = None
+            for dataset, metric, value, datatype in self.db.execute(query, (run_id,)):
+                if dataset != dataset_last:
+                    dataset_last = dataset
+                    filename_dataset = os.path.split(dataset)[1]
+                    writer.add_dataset(''.join([c for c in filename_dataset if c.isalnum()]) + 'Dataset')
+                writer.add_measurement_value(metric.split('/')[-1], value, datatype or XSD.string)
+
+    def __dataset_ids(self, names):
+        """Gets the IDs of data sets by name, adding new data sets. Must be called in a transaction
+
+        :param names: List of data set names
+        :return: Dictionary of data set IDs by name
+        """
+        self.db.executemany('INSERT OR IGNORE INTO datasets (name) VALUES (?)', [(name,) for name in names])
+        ids = {}
+        for name in set(names):
+            ids[name] = self.db.execute('SELECT dataset_id FROM datasets WHERE name = ?', (name,)).fetchone()[0]
+        return ids
+
+
+def _split(text):
+    return text.split('; ') if text else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queries the NCATS translator DQA results store')
+    parser.add_argument('--db', dest='path_db', help='Path to the results database. Defaults to config.path_results_db')
+    subparsers = parser.add_subparsers(dest='command')
+    parser_runs = subparsers.add_parser('runs', help='List the most recent runs')
+    parser_runs.add_argument('-n', type=int, default=20, help='Number of runs')
+    parser_trend = subparsers.add_parser('trend', help='Violations of a data set in its most recent runs')
+    parser_trend.add_argument('dataset', help='Data set name, i.e., the path to the data file')
+    parser_trend.add_argument('--test', dest='test_case', help='Only count violations of this test case IRI')
+    parser_trend.add_argument('--metric', help='Show the values of this DQV metric instead of violations, e.g., '
+                                               'illTypedLiteralsMetric')
+    parser_trend.add_argument('-n', type=int, default=20, help='Number of runs')
+    parser_top = subparsers.add_parser('top', help='Data sets with the most violations in a run')
+    parser_top.add_argument('--run', dest='run_id', type=int, help='Run ID. Defaults to the most recent run')
+    parser_top.add_argument('-n', type=int, default=10, help='Number of data sets')
+    parser_export = subparsers.add_parser('export', help='Export the results of a run to CSV or turtle')
+    parser_export.add_argument('run_id', type=int, help='Run ID')
+    parser_export.add_argument('file_output', help='Output file. The format is chosen by the extension (.csv or .ttl)')
+    args = parser.parse_args()
+
+    with ResultsStore(args.path_db, verbose=False) as store:
+        if args.command == 'runs':
+            print(store.runs(args.n).to_string(index=False))
+        elif args.command == 'trend':
+            if args.metric is not None:
+                print(store.measurement_trend(args.dataset, args.metric, args.n).to_string(index=False))
+            else:
+                print(store.trend(args.dataset, args.test_case, args.n).to_string(index=False))
+        elif args.command == 'top':
+            print(store.top_offenders(args.run_id, args.n).to_string(index=False))
+        elif args.command == 'export':
+            if args.file_output.endswith('.csv'):
+                store.export_csv(args.run_id, args.file_output)
+            else:
+                store.export_ttl(args.run_id, args.file_output)
+        else:
+            parser.print_help()
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
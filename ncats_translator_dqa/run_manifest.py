@@ -0,0 +1,239 @@
+"""Run manifest with per-row, per-stage checkpoints for processing multiple data sets (-m)
+
+The manifest lists the rows of the CSV file and records, for each row, which stages of the pipeline are done or
+failed. It is saved to a JSON file after every change, so an interrupted or partly failed run can be resumed at the
+first incomplete stage of each row (translator_dqa.py --resume).
+"""
+import os
+import json
+import threading
+from datetime import datetime
+from ncats_translator_dqa.preliminary_statistics.fair_scraper import FAIRPrelimStats
+from ncats_translator_dqa.preliminary_statistics.void_profiler import VoidProfile
+
+# Stages of the pipeline, in order
+STAGE_SCRAPE = 'scrape'
+STAGE_RDF = 'rdf'
+STAGE_VALIDATE = 'validate'
+STAGE_REPORT = 'report'
+STAGE_UPLOAD = 'upload'
+STAGES = [STAGE_SCRAPE, STAGE_RDF, STAGE_VALIDATE, STAGE_REPORT, STAGE_UPLOAD]
+
+# Stage that must be done before a stage can run. A failed report does not hold up the upload of the results
+__requires = {STAGE_RDF: STAGE_SCRAPE, STAGE_REPORT: STAGE_VALIDATE, STAGE_UPLOAD: STAGE_VALIDATE}
+
+# Row field a stage works on. Rows without it skip the stage
+__inputs = {STAGE_SCRAPE: 'url', STAGE_RDF: 'url', STAGE_VALIDATE: 'file_data', STAGE_REPORT: 'file_data',
+            STAGE_UPLOAD: 'file_data'}
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def required_stage(stage):
+    """Gets the stage that must be done before the given stage
+
+    :param stage: Stage name (String)
+    :return: Stage name, or None
+    """
+    return __requires.get(stage)
+
+
+def stage_input(stage):
+    """Gets the row field the given stage works on
+
+    :param stage: Stage name (String)
+    :return: 'url' or 'file_data'
+    """
+    return __inputs[stage]
+
+
+class RunManifest:
+    """Checkpoints of a run over multiple data sets
+
+    Public members:
+    rows - List of dictionaries with keys 'url', 'file_data', 'stages' (status of each stage), 'prelim_stats',
+     'void_profile' and 'interlinking'
+    """
+
+    def __init__(self, file_manifest, rows):
+        """Constructor. Creates a new manifest without any completed stages
+
+        :param file_manifest: Path to the JSON file the manifest is saved to (String)
+        :param rows: List of tuples (FAIRsharing.org url, path to the data file). Use '' for a missing value
+        """
+        self.file_manifest = file_manifest
+        self.created = datetime.now().isoformat(timespec='seconds')
+        self.rows = [{'url': url, 'file_data': file_data, 'stages': {}, 'prelim_stats': None, 'void_profile': None,
+                      'interlinking': None} for url, file_data in rows]
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def open(file_manifest, rows, resume=False, verbose=False):
+        """Opens the manifest of a run
+
+        :param file_manifest: Path to the JSON file of the manifest (String)
+        :param rows: List of tuples (FAIRsharing.org url, path to the data file) of the run
+        :param resume: True to continue from the checkpoints in an existing manifest. It is only used if it lists the
+         same rows [optional]
+        :param verbose: True if you want to print status messages [optional]
+        :return: RunManifest
+        """
+        if resume and os.path.exists(file_manifest):
+            with open(file_manifest, encoding='UTF-8') as f:
+                saved = json.load(f)
+            if [(row['url'], row['file_data']) for row in saved['rows']] == [tuple(row) for row in rows]:
+                manifest = RunManifest(file_manifest, rows)
+                manifest.created = saved['created']
+                manifest.rows = saved['rows']
+                if verbose:
+                    print('Resuming run started ' + manifest.created + ' from ' + file_manifest)
+                return manifest
+            elif verbose:
+                print('The data sets changed since ' + file_manifest + ' was written. Starting a new run')
+
+        manifest = RunManifest(file_manifest, rows)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        """Writes the manifest to its JSON file, replacing the previous version atomically
+
+        :return: None
+        """
+        with self.__lock:
+            directory = os.path.split(self.file_manifest)[0]
+            if len(directory) > 0 and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            file_tmp = self.file_manifest + '.tmp'
+            with open(file_tmp, 'w', encoding='UTF-8') as f:
+                json.dump({'created': self.created, 'rows': self.rows}, f, indent=1)
+            os.replace(file_tmp, self.file_manifest)
+
+    def pending(self, stage):
+        """Gets the rows where a stage still has to run
+
+        A stage has to run if the row has the stage's input, the stage is not done and the stage it requires is done.
+        Failed stages run again.
+
+        :param stage: Stage name (String)
+        :return: List of row indexes
+        """
+        with self.__lock:
+            return [i for i in range(len(self.rows)) if self.is_pending(i, stage)]
+
+    def is_pending(self, i, stage):
+        """Checks whether a stage still has to run for a row, see pending()
+
+        :param i: Row index (Integer)
+        :param stage: Stage name (String)
+        :return: True if the stage has to run
+        """
+        required = required_stage(stage)
+        with self.__lock:
+            return len(self.rows[i][stage_input(stage)]) > 0 and not self.is_done(i, stage) and \
+                (required is None or self.is_done(i, required))
+
+    def is_done(self, i, stage):
+        """Checks whether a stage is done for a row
+
+        :param i: Row index (Integer)
+        :param stage: Stage name (String)
+        :return: True if the stage is done
+        """
+        with self.__lock:
+            status = self.rows[i]['stages'].get(stage)
+            return status is not None and status['status'] == STATUS_DONE
+
+    def mark(self, i, stage, exception=None):
+        """Records the outcome of a stage for a row and saves the manifest
+
+        :param i: Row index (Integer)
+        :param stage: Stage name (String)
+        :param exception: Exception raised by the stage, or None if the stage succeeded [optional]
+        :return: None
+        """
+        status = {'status': STATUS_DONE if exception is None else STATUS_FAILED,
+                  'time': datetime.now().isoformat(timespec='seconds')}
+        if exception is not None:
+            status['error'] = type(exception).__name__ + ': ' + str(exception)
+        with self.__lock:
+            self.rows[i]['stages'][stage] = status
+            self.save()
+
+    def set_prelim_stats(self, i, fps):
+        """Stores the preliminary statistics scraped for a row, so they don't need to be scraped again on resume
+
+        :param i: Row index (Integer)
+        :param fps: FAIRPrelimStats
+        :return: None
+        """
+        with self.__lock:
+            self.rows[i]['prelim_stats'] = {'url': fps.url, 'title': fps.title, 'sad': fps.scope_and_data_types,
+                                            'ta': fps.terminology_artifacts, 'lic': fps.license}
+
+    def prelim_stats(self, i):
+        """Gets the preliminary statistics scraped for a row
+
+        :param i: Row index (Integer)
+        :return: FAIRPrelimStats, or None if the row has not been scraped
+        """
+        with self.__lock:
+            fps = self.rows[i]['prelim_stats']
+        if fps is None:
+            return None
+        lic = [(usage, licenses) for usage, licenses in fps['lic']]
+        return FAIRPrelimStats(fps['url'], fps['title'], fps['sad'], fps['ta'], lic)
+
+    def set_void_profile(self, i, profile):
+        """Stores the VoID profile of the data file of a row, for the combined preliminary statistics of the run
+
+        :param i: Row index (Integer)
+        :param profile: VoidProfile
+        :return: None
+        """
+        with self.__lock:
+            self.rows[i]['void_profile'] = profile.to_dict()
+
+    def void_profile(self, i):
+        """Gets the VoID profile of the data file of a row
+
+        :param i: Row index (Integer)
+        :return: VoidProfile, or None if the data file has not been profiled
+        """
+        with self.__lock:
+            profile = self.rows[i].get('void_profile')
+        return VoidProfile.from_dict(profile) if profile is not None else None
+
+    def set_interlinking(self, i, measurements):
+        """Stores the interlinking metrics of the data file of a row, for the combined preliminary statistics of the run
+
+        :param i: Row index (Integer)
+        :param measurements: Measurements from InterlinkingResult.measurements()
+        :return: None
+        """
+        with self.__lock:
+            self.rows[i]['interlinking'] = [[metric, value, str(datatype), [list(a) for a in annotations]]
+                                            for metric, value, datatype, annotations in measurements]
+
+    def interlinking(self, i):
+        """Gets the interlinking metrics of the data file of a row
+
+        :param i: Row index (Integer)
+        :return: List of measurements as from InterlinkingResult.measurements(), or None
+        """
+        with self.__lock:
+            measurements = self.rows[i].get('interlinking')
+        if measurements is None:
+            return None
+        return [(metric, value, datatype, [tuple(a) for a in annotations])
+                for metric, value, datatype, annotations in measurements]
+
+    def failures(self):
+        """Gets the failed stages
+
+        :return: List of tuples (row index, stage, error message)
+        """
+        with self.__lock:
+            return [(i, stage, status.get('error', '')) for i, row in enumerate(self.rows)
+                    for stage, status in row['stages'].items() if status['status'] == STATUS_FAILED]
@@ -0,0 +1,270 @@
+"""Size-aware scheduling and progress of the validations of a batch run (-m)
+
+Validation time grows with the size of a data set, so a large data set that starts last sets the end of the whole run.
+The data files are sized up front and the cost of each is estimated from its size and from the validation times of
+previous runs recorded in the results store. The most expensive data sets are started first (longest processing time
+first), which spreads the work evenly over the workers and leaves the small data sets to fill the gaps at the end.
+
+Progress reports the number of data sets and bytes validated, the throughput and an estimate of the remaining time.
+The estimate simulates the remaining data sets on the workers, with their costs calibrated by the validations that
+have finished in this run.
+"""
+import os
+import time
+import heapq
+import threading
+from datetime import datetime, timedelta
+from ncats_translator_dqa import config
+
+# Cost model used when there are no previous runs: fixed seconds per validation, e.g., for starting the JVM, and bytes
+# validated per second
+_default_overhead = 10.0
+_default_bytes_per_second = 1024 ** 2
+
+
+class Job:
+    """A data set to validate
+
+    Public members:
+    index - Row index of the data set in the batch (Integer)
+    file_data - Path to the data file (String)
+    n_bytes - Size of the data file in bytes (Integer)
+    estimate - Estimated validation time in seconds (Float)
+    """
+
+    def __init__(self, index, file_data, n_bytes, estimate):
+        self.index = index
+        self.file_data = file_data
+        self.n_bytes = n_bytes
+        self.estimate = estimate
+
+
+class CostModel:
+    """Estimates validation times from the size of the data files and the validation times of previous runs
+
+    Data sets validated before are estimated from their own last validation time, scaled to their current size. Other
+    data sets are estimated with a linear fit, seconds = overhead + bytes / throughput, over all previous validations.
+    """
+
+    def __init__(self, history=None):
+        """Constructor
+
+        :param history: List of tuples (data set name, bytes, seconds) of previous validations, oldest first, e.g.,
+         from ResultsStore.job_times() [optional]
+        """
+        history = [(dataset, n_bytes, seconds) for dataset, n_bytes, seconds in (history or []) if seconds > 0]
+        self.overhead = _default_overhead
+        self.bytes_per_second = _default_bytes_per_second
+        self.__last = {dataset: (n_bytes, seconds) for dataset, n_bytes, seconds in history}
+
+        # Least squares fit of seconds over bytes
+        if len(history) > 0:
+            sizes = [n_bytes for _, n_bytes, _ in history]
+            times = [seconds for _, _, seconds in history]
+            mean_size = sum(sizes) / len(sizes)
+            mean_time = sum(times) / len(times)
+            variance = sum((size - mean_size) ** 2 for size in sizes)
+            slope = sum((size - mean_size) * (t - mean_time) for size, t in zip(sizes, times)) / variance \
+                if variance > 0 else 0
+            if slope > 0 and mean_time - slope * mean_size >= 0:
+                self.overhead = mean_time - slope * mean_size
+                self.bytes_per_second = 1 / slope
+            elif sum(sizes) > 0:
+                # All data sets have about the same size, or larger ones were faster: use the average throughput
+                self.overhead = 0.0
+                self.bytes_per_second = sum(sizes) / sum(times)
+            else:
+                self.overhead = mean_time
+
+    def estimate(self, dataset, n_bytes):
+        """Estimates the validation time of a data set
+
+        :param dataset: Data set name, i.e., the path to the data file (String)
+        :param n_bytes: Size of the data file in bytes (Integer)
+        :return: Seconds (Float)
+        """
+        if dataset in self.__last:
+            last_bytes, last_seconds = self.__last[dataset]
+            if last_bytes > 0:
+                overhead = min(self.overhead, last_seconds)
+                return overhead + (last_seconds - overhead) * n_bytes / last_bytes
+            return last_seconds
+        return self.overhead + n_bytes / self.bytes_per_second
+
+
+def make_jobs(files_data, model, indexes=None):
+    """Sizes the data files and estimates their validation times
+
+    :param files_data: List of paths to the data files
+    :param model: CostModel
+    :param indexes: Row index of each data file. Defaults to their position in files_data [optional]
+    :return: List of Job, in the order of files_data
+    """
+    if indexes is None:
+        indexes = range(len(files_data))
+    jobs = []
+    for i, file_data in zip(indexes, files_data):
+        n_bytes = os.path.getsize(file_data) if os.path.exists(file_data) else 0
+        jobs.append(Job(i, file_data, n_bytes, model.estimate(file_data, n_bytes)))
+    return jobs
+
+
+def largest_first(jobs):
+    """Orders jobs by decreasing estimated cost. Jobs with the same cost keep their order
+
+    :param jobs: List of Job
+    :return: List of Job
+    """
+    return sorted(jobs, key=lambda job: -job.estimate)
+
+
+def makespan(estimates, n_workers, busy=None):
+    """Simulates running jobs in the given order on workers that each take the next job when they become free
+
+    :param estimates: Estimated seconds of each job, in the order they are started
+    :param n_workers: Number of workers (Integer)
+    :param busy: Remaining seconds of the jobs already running, one per busy worker [optional]
+    :return: Seconds until the last job finishes (Float)
+    """
+    loads = sorted(list(busy or [])[:n_workers])
+    loads += [0.0] * (max(n_workers, 1) - len(loads))
+    heapq.heapify(loads)
+    for estimate in estimates:
+        heapq.heapreplace(loads, loads[0] + estimate)
+    return max(loads)
+
+
+class Progress:
+    """Progress of the validations of a batch run, with throughput and an estimate of the remaining time
+
+    Call started() and finished() from the workers as each job starts and ends. With an interval, the progress is
+    also printed periodically while the context manager is active.
+    """
+
+    def __init__(self, jobs, n_workers, interval=None, verbose=None):
+        """Constructor
+
+        :param jobs: List of Job to validate, in the order they are started
+        :param n_workers: Number of jobs run at the same time (Integer)
+        :param interval: Seconds between progress messages while jobs run. Defaults to config.progress_interval.
+         0 only reports when a job finishes [optional]
+        :param verbose: True if you want to print progress messages. Defaults to config.verbose [optional]
+        """
+        self.jobs = {job.index: job for job in jobs}
+        self.order = [job.index for job in jobs]
+        self.n_workers = max(n_workers, 1)
+        self.interval = interval if interval is not None else config.progress_interval
+        self.verbose = verbose if verbose is not None else config.verbose
+        self.total_bytes = sum(job.n_bytes for job in jobs)
+        self.__lock = threading.Lock()
+        self.__started = time.monotonic()
+        self.__running = {}
+        self.__done = {}
+        self.__failed = 0
+        self.__stop = threading.Event()
+        self.__ticker = None
+
+    def __enter__(self):
+        self.__started = time.monotonic()
+        if self.verbose:
+            print('Scheduling ' + str(len(self.jobs)) + ' data sets (' + _format_bytes(self.total_bytes) +
+                  ') largest first on ' + str(self.n_workers) + ' workers, estimated ' +
+                  _format_seconds(makespan([self.jobs[i].estimate for i in self.order], self.n_workers)))
+            if self.interval > 0 and len(self.jobs) > 0:
+                self.__ticker = threading.Thread(target=self.__tick, name='progress', daemon=True)
+                self.__ticker.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__stop.set()
+        if self.__ticker is not None:
+            self.__ticker.join()
+
+    def started(self, index):
+        """Records that a job started
+
+        :param index: Row index of the job (Integer)
+        :return: None
+        """
+        with self.__lock:
+            self.__running[index] = time.monotonic()
+
+    def finished(self, index, exception=None):
+        """Records that a job finished and prints the progress
+
+        :param index: Row index of the job (Integer)
+        :param exception: Exception raised by the job, or None if it succeeded [optional]
+        :return: None
+        """
+        with self.__lock:
+            started = self.__running.pop(index, time.monotonic())
+            self.__done[index] = time.monotonic() - started
+            if exception is not None:
+                self.__failed += 1
+        if self.verbose:
+            print(self.status())
+
+    def seconds(self, index):
+        """Gets how long a finished job took
+
+        :param index: Row index of the job (Integer)
+        :return: Seconds (Float), or None if the job has not finished
+        """
+        with self.__lock:
+            return self.__done.get(index)
+
+    def eta(self):
+        """Estimates the time until the last job finishes
+
+        The estimated costs are scaled by the ratio of actual to estimated time of the jobs finished so far.
+
+        :return: Seconds (Float)
+        """
+        now = time.monotonic()
+        with self.__lock:
+            estimated = sum(self.jobs[i].estimate for i in self.__done)
+            calibration = sum(self.__done.values()) / estimated if estimated > 0 else 1.0
+            busy = [max(self.jobs[i].estimate * calibration - (now - started), 0)
+                    for i, started in self.__running.items()]
+            waiting = [self.jobs[i].estimate * calibration for i in self.order
+                       if i not in self.__done and i not in self.__running]
+        return makespan(waiting, self.n_workers, busy)
+
+    def status(self):
+        """Formats the progress, e.g., 'Validated 3/10 data sets, 1.2 GB/4.5 GB, 2.1 MB/s, ETA 0:26:12 (02:41)'
+
+        :return: String
+        """
+        with self.__lock:
+            n_done = len(self.__done)
+            bytes_done = sum(self.jobs[i].n_bytes for i in self.__done)
+            failed = self.__failed
+        elapsed = time.monotonic() - self.__started
+        eta = self.eta()
+        status = 'Validated ' + str(n_done) + '/' + str(len(self.jobs)) + ' data sets, ' + \
+                 _format_bytes(bytes_done) + '/' + _format_bytes(self.total_bytes)
+        if elapsed > 0:
+            status += ', ' + _format_bytes(bytes_done / elapsed) + '/s'
+        if failed > 0:
+            status += ', ' + str(failed) + ' failed'
+        if n_done < len(self.jobs):
+            status += ', ETA ' + _format_seconds(eta) + ' (' + \
+                      (datetime.now() + timedelta(seconds=eta)).strftime('%H:%M') + ')'
+        return status
+
+    def __tick(self):
+        # Prints the progress periodically until the context manager exits
+        while not self.__stop.wait(self.interval):
+            print(self.status())
+
+
+def _format_bytes(n_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024:
+            return '{:.1f} {}'.format(n_bytes, unit)
+        n_bytes /= 1024
+    return '{:.1f} TB'.format(n_bytes)
+
+
+def _format_seconds(seconds):
+    return str(timedelta(seconds=int(round(seconds))))
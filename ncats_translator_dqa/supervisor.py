@@ -0,0 +1,259 @@
+"""Supervised subprocesses with bounded memory use
+
+Runs a command with its output streamed to a rotating log file instead of being buffered in memory. Only the tail of
+the output is kept for error messages. The command is stopped when it runs longer than a wall-clock timeout, and each
+of its processes when it uses more than a CPU time limit (POSIX only). Every run is recorded as a profiling span with
+the CPU time and peak RSS of the command.
+"""
+import os
+import sys
+import math
+import time
+import signal
+import threading
+import subprocess
+from ncats_translator_dqa import profiling
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Reasons for stopping a command
+TIMEOUT_WALL = 'wall'
+TIMEOUT_CPU = 'cpu'
+
+# Time in seconds between asking a timed out command to terminate and killing it
+__kill_grace = 10
+
+# Bytes read from the output of the command at a time
+__read_size = 64 * 1024
+
+
+class SupervisedResult:
+    """Outcome of a supervised command
+
+    Public members:
+    returncode - Exit code of the command, or the negative signal number if it was killed by a signal
+    timed_out - TIMEOUT_WALL or TIMEOUT_CPU if the command was stopped for running too long, otherwise None
+    seconds - Wall-clock time of the command
+    cpu_seconds - CPU time of the command and the descendants it waited for, or None if not available
+    peak_rss_bytes - Peak RSS of the command and the descendants it waited for, or None if not available
+    file_log - Path to the log file with the output of the command
+    tail - End of the output of the command (String)
+    """
+
+    def __init__(self, returncode, timed_out, seconds, cpu_seconds, peak_rss_bytes, file_log, tail):
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.seconds = seconds
+        self.cpu_seconds = cpu_seconds
+        self.peak_rss_bytes = peak_rss_bytes
+        self.file_log = file_log
+        self.tail = tail
+
+
+class RotatingLog:
+    """Log file that is rotated when it grows too large, keeping the end of the output in memory
+
+    The log is written to file_log. When it exceeds max_bytes, it is renamed to file_log.1, an existing file_log.1 to
+    file_log.2 and so on, and the oldest file is removed, so at most (backups + 1) * max_bytes are kept on disk.
+    """
+
+    def __init__(self, file_log, max_bytes=64 * 1024 * 1024, backups=2, tail_bytes=64 * 1024):
+        """Constructor. Truncates the log file and removes rotated files of a previous run
+
+        :param file_log: Path to the log file (String)
+        :param max_bytes: Size of a log file before it is rotated (Integer) [optional]
+        :param backups: Number of rotated files to keep (Integer) [optional]
+        :param tail_bytes: Number of bytes at the end of the output kept in memory (Integer) [optional]
+        """
+        self.file_log = file_log
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.tail_bytes = tail_bytes
+        self.__tail = bytearray()
+
+        directory = os.path.split(file_log)[0]
+        if len(directory) > 0 and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        for i in range(1, backups + 1):
+            if os.path.exists(self.__backup(i)):
+                os.remove(self.__backup(i))
+        self.__file = open(file_log, 'wb')
+        self.__size = 0
+
+    def write(self, data):
+        """Writes output to the log
+
+        :param data: Output (bytes)
+        :return: None
+        """
+        if self.__size + len(data) > self.max_bytes and self.__size > 0:
+            self.__rotate()
+        self.__file.write(data)
+        self.__size += len(data)
+
+        self.__tail += data
+        if len(self.__tail) > 2 * self.tail_bytes:
+            del self.__tail[:-self.tail_bytes]
+
+    def tail(self):
+        """Gets the end of the output, starting at a line break
+
+        :return: String
+        """
+        tail = bytes(self.__tail[-self.tail_bytes:])
+        if len(self.__tail) > self.tail_bytes and b'\n' in tail:
+            tail = tail[tail.index(b'\n') + 1:]
+        return tail.decode('UTF-8', errors='replace')
+
+    def close(self):
+        """Closes the log file
+
+        :return: None
+        """
+        self.__file.close()
+
+    def __rotate(self):
+        self.__file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(self.__backup(i)):
+                    os.replace(self.__backup(i), self.__backup(i + 1))
+            os.replace(self.file_log, self.__backup(1))
+        self.__file = open(self.file_log, 'wb')
+        self.__size = 0
+
+    def __backup(self, i):
+        return self.file_log + '.' + str(i)
+
+
+def run(args, file_log, cwd=None, env=None, timeout=None, cpu_timeout=None, max_log_bytes=64 * 1024 * 1024,
+        log_backups=2, tail_bytes=64 * 1024, name='subprocess', **tags):
+    """Runs a command under supervision and waits until it finishes
+
+    Standard output and standard error are streamed to a rotating log file (see RotatingLog). On POSIX systems the
+    command runs in its own process group, so a timed out command is stopped together with the processes it started
+    (e.g., the JVM started by a shell script).
+
+    :param args: Command and arguments (List)
+    :param file_log: Path to the log file (String)
+    :param cwd: Working directory of the command [optional]
+    :param env: Environment variables of the command (Dictionary). Defaults to the environment of this process
+     [optional]
+    :param timeout: Maximum wall-clock time in seconds. None waits indefinitely [optional]
+    :param cpu_timeout: Maximum CPU time in seconds of each process of the command. None for no limit. Only supported
+     on POSIX systems [optional]
+    :param max_log_bytes: Size of the log file before it is rotated [optional]
+    :param log_backups: Number of rotated log files to keep [optional]
+    :param tail_bytes: Number of bytes at the end of the output kept for SupervisedResult.tail [optional]
+    :param name: Stage name of the profiling span [optional]
+    :param tags: Tags of the profiling span
+    :return: SupervisedResult
+    """
+    with profiling.span(name, **tags) as s:
+        log = RotatingLog(file_log, max_log_bytes, log_backups, tail_bytes)
+        posix = os.name == 'posix'
+        kwargs = {}
+        if posix:
+            kwargs['start_new_session'] = True
+            if cpu_timeout is not None and resource is not None:
+                limit = int(math.ceil(cpu_timeout))
+                kwargs['preexec_fn'] = lambda: resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + __kill_grace))
+
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, env=env,
+                                       **kwargs)
+        except OSError:
+            log.close()
+            raise
+
+        reader = threading.Thread(target=__pump, args=(process.stdout, log), daemon=True)
+        reader.start()
+
+        # Stop the command when it runs too long: first ask it to terminate, then kill it
+        stopped = []
+        timers = []
+        if timeout is not None:
+            def stop():
+                stopped.append(TIMEOUT_WALL)
+                __signal(process, kill=False)
+                timer_kill = threading.Timer(__kill_grace, __signal, args=(process, True))
+                timer_kill.daemon = True
+                timers.append(timer_kill)
+                timer_kill.start()
+
+            timer = threading.Timer(timeout, stop)
+            timer.daemon = True
+            timers.append(timer)
+            timer.start()
+
+        cpu_seconds = None
+        peak_rss_bytes = None
+        try:
+            if hasattr(os, 'wait4'):
+                # Waiting with os.wait4 gives the resource usage of the command
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+                cpu_seconds = usage.ru_utime + usage.ru_stime
+                peak_rss_bytes = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+            else:
+                process.wait()
+        finally:
+            for timer in timers:
+                timer.cancel()
+            reader.join()
+            process.stdout.close()
+            log.close()
+
+        # A process that exceeds the CPU time limit receives SIGXCPU, which a shell script reports as exit code 128 +
+        # SIGXCPU. Processes that ignore it are killed at the hard limit
+        timed_out = stopped[0] if len(stopped) > 0 else None
+        if timed_out is None and cpu_timeout is not None and process.returncode != 0:
+            sigxcpu = getattr(signal, 'SIGXCPU', None)
+            if (sigxcpu is not None and process.returncode in (-sigxcpu, 128 + sigxcpu)) or \
+                    (cpu_seconds is not None and cpu_seconds >= 0.95 * cpu_timeout):
+                timed_out = TIMEOUT_CPU
+
+        s.tag(returncode=process.returncode, timed_out=timed_out, log=file_log)
+        if cpu_seconds is not None:
+            s.tag(child_cpu_seconds=round(cpu_seconds, 6), child_peak_rss_bytes=peak_rss_bytes)
+
+        return SupervisedResult(process.returncode, timed_out, time.monotonic() - started, cpu_seconds,
+                                peak_rss_bytes, file_log, log.tail())
+
+
+def __pump(stream, log):
+    """Copies the output of a command to its log until the command closes its output
+
+    :param stream: Binary stream of the output
+    :param log: RotatingLog
+    :return: None
+    """
+    while True:
+        data = stream.read1(__read_size) if hasattr(stream, 'read1') else stream.read(__read_size)
+        if not data:
+            break
+        log.write(data)
+
+
+def __signal(process, kill):
+    """Asks a command and the processes it started to terminate, or kills them
+
+    :param process: subprocess.Popen of the command
+    :param kill: True to kill the processes, False to ask them to terminate
+    :return: None
+    """
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        elif kill:
+            process.kill()
+        else:
+            process.terminate()
+    except OSError:
+        # The command has already finished
+        pass
@@ -0,0 +1,112 @@
+"""Synthetic RDF datasets for benchmarks
+
+Datasets describe generated entities with a type, a label, typed literals and links between entities. A configurable
+share of the triples is replaced by errors of the kinds detected by the lite validator, so that the effect of the error
+rate on the validation speed can be measured and the detected errors can be checked against the injected ones.
+"""
+import os
+import random
+from ncats_translator_dqa import rdf_stream
+
+# Namespace of the generated entities and properties
+BASE = 'http://example.org/synthetic/'
+
+# Kinds of injected errors
+ERROR_ILL_TYPED_LITERAL = 'ill_typed_literal'
+ERROR_MALFORMED_IRI = 'malformed_iri'
+ERROR_DUPLICATE_TRIPLE = 'duplicate_triple'
+ERROR_UNDECLARED_PREFIX = 'undeclared_prefix'
+ERRORS = [ERROR_ILL_TYPED_LITERAL, ERROR_MALFORMED_IRI, ERROR_DUPLICATE_TRIPLE, ERROR_UNDECLARED_PREFIX]
+
+# Number of triples describing each entity
+__triples_per_entity = 6
+
+# Number of bytes buffered while writing
+__write_buffer = 1024 * 1024
+
+
+def generate_dataset(file_dataset, n_triples, error_rate=0.01, seed=0, format=None):
+    """Writes a synthetic dataset
+
+    Every triple is written as its own statement. Turtle files use prefixed names, N-Triples files full IRIs. Undeclared
+    prefixes can only be written in Turtle, so N-Triples datasets get the other kinds of errors only.
+
+    :param file_dataset: Path to the file to write (String)
+    :param n_triples: Number of triples to write, including the errors (Integer)
+    :param error_rate: Share of the triples replaced by errors, between 0 and 1 (Float) [optional]
+    :param seed: Seed of the random number generator. The same seed writes the same dataset [optional]
+    :param format: 'ttl' or 'nt'. Guessed from the file extension if not given [optional]
+    :return: Dictionary with the number of triples written ('triples') and of errors injected of each kind
+    """
+    if format is None:
+        format = rdf_stream.guess_format(file_dataset)
+    turtle = format == 'ttl'
+    kinds = ERRORS if turtle else [kind for kind in ERRORS if kind != ERROR_UNDECLARED_PREFIX]
+    rng = random.Random(seed)
+    n_entities = max(1, -(-n_triples // __triples_per_entity))
+
+    # Terms by the name used in the templates below, as prefixed names or as full IRIs
+    if turtle:
+        terms = {'type': 'a', 'label': 'rdfs:label', 'count': 'ex:count', 'created': 'ex:created',
+                 'score': 'ex:score', 'related': 'ex:related', 'class': 'ex:Entity', 'integer': 'xsd:integer',
+                 'date': 'xsd:date', 'decimal': 'xsd:decimal'}
+    else:
+        terms = {'type': '<' + rdf_stream.RDF + 'type>', 'label': '<http://www.w3.org/2000/01/rdf-schema#label>',
+                 'count': '<' + BASE + 'count>', 'created': '<' + BASE + 'created>', 'score': '<' + BASE + 'score>',
+                 'related': '<' + BASE + 'related>', 'class': '<' + BASE + 'Entity>',
+                 'integer': '<' + rdf_stream.XSD + 'integer>', 'date': '<' + rdf_stream.XSD + 'date>',
+                 'decimal': '<' + rdf_stream.XSD + 'decimal>'}
+
+    def entity(i):
+        return 'ex:entity' + str(i) if turtle else '<' + BASE + 'entity' + str(i) + '>'
+
+    stats = {'triples': 0}
+    stats.update({kind: 0 for kind in kinds})
+
+    directory = os.path.split(file_dataset)[0]
+    if len(directory) > 0 and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    with open(file_dataset, 'w', encoding='UTF-8', buffering=__write_buffer) as f:
+        if turtle:
+            f.write('@prefix ex: <' + BASE + '> .\n')
+            f.write('@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .\n')
+            f.write('@prefix xsd: <' + rdf_stream.XSD + '> .\n\n')
+
+        statement_last = None
+        for i in range(n_entities):
+            s = entity(i)
+            statements = [
+                (terms['type'], terms['class']),
+                (terms['label'], '"Entity ' + str(i) + '"@en'),
+                (terms['count'], '"' + str(rng.randint(0, 10000)) + '"^^' + terms['integer']),
+                (terms['created'], '"20%02d-%02d-%02d"^^%s' % (rng.randint(0, 24), rng.randint(1, 12),
+                                                               rng.randint(1, 28), terms['date'])),
+                (terms['score'], '"%.3f"^^%s' % (rng.random(), terms['decimal'])),
+                (terms['related'], entity(rng.randrange(n_entities)))
+            ]
+            for p, o in statements:
+                if stats['triples'] >= n_triples:
+                    break
+
+                if rng.random() < error_rate:
+                    kind = rng.choice(kinds)
+                    if kind == ERROR_DUPLICATE_TRIPLE and statement_last is None:
+                        kind = ERROR_ILL_TYPED_LITERAL
+                    stats[kind] += 1
+                    if kind == ERROR_ILL_TYPED_LITERAL:
+                        p, o = terms['count'], '"not a number"^^' + terms['integer']
+                    elif kind == ERROR_MALFORMED_IRI:
+                        p, o = terms['related'], '<' + BASE + 'entity|' + str(i) + '>'
+                    elif kind == ERROR_DUPLICATE_TRIPLE:
+                        f.write(statement_last)
+                        stats['triples'] += 1
+                        continue
+                    elif kind == ERROR_UNDECLARED_PREFIX:
+                        p = 'undeclared:property'
+
+                statement_last = s + ' ' + p + ' ' + o + ' .\n'
+                f.write(statement_last)
+                stats['triples'] += 1
+
+    return stats
@@ -0,0 +1,110 @@
+"""Information about the resources available on this machine
+"""
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Unit of ru_maxrss in bytes: bytes on macOS, kilobytes elsewhere
+__maxrss_unit = 1 if sys.platform == 'darwin' else 1024
+
+# Number of validations that run at the same time as those of this process, including them. Set in the worker
+# processes of the pools that run validations
+__concurrency = 1
+
+
+def cpu_count():
+    """Gets the number of CPUs available to this process
+
+    :return: Number of CPUs (Integer)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """Gets the amount of memory available for starting new processes without swapping
+
+    :return: Available memory in bytes (Integer), or None if it can't be determined
+    """
+    # Linux: MemAvailable accounts for reclaimable caches
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # Other POSIX systems: free physical pages
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_workers(memory_per_worker):
+    """Gets a default number of parallel workers from the CPU count and available memory
+
+    :param memory_per_worker: Memory needed by each worker in bytes (Integer)
+    :return: Number of workers, at least 1 (Integer)
+    """
+    n_workers = cpu_count()
+
+    memory = available_memory()
+    if memory is not None and memory_per_worker > 0:
+        n_workers = min(n_workers, memory // memory_per_worker)
+
+    return max(int(n_workers), 1)
+
+
+def concurrency():
+    """Gets the number of validations that run at the same time on this machine, e.g., to share the memory among them
+
+    :return: Number of validations, at least 1 (Integer)
+    """
+    return __concurrency
+
+
+def set_concurrency(n):
+    """Sets the number of validations that run at the same time on this machine
+
+    Pass it as the initializer of a process pool that runs validations, with the number of workers times concurrency()
+    as its argument, so pools started inside workers are counted too.
+
+    :param n: Number of validations (Integer)
+    :return: None
+    """
+    global __concurrency
+    __concurrency = max(int(n), 1)
+
+
+def peak_rss(children=False):
+    """Gets the peak resident set size of this process, or of its terminated child processes
+
+    :param children: True to get the largest peak of the child processes that have been waited for [optional]
+    :return: Peak resident set size in bytes (Integer), or None if it can't be determined
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss * __maxrss_unit
+
+
+def rss():
+    """Gets the current resident set size of this process
+
+    :return: Resident set size in bytes (Integer), or None if it can't be determined
+    """
+    # Linux: the second field of statm is the number of resident pages
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
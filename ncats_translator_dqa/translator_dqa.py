@@ -1,18 +1,29 @@
 import os
+import sys
 import argparse
 import csv
 from datetime import datetime
-from ncats_translator_dqa import config
-from ncats_translator_dqa.preliminary_statistics import fair_scraper, prelim_stats_rdf
-from ncats_translator_dqa.computational_metrics.computational_metrics import computational_metrics
+from concurrent.futures import ProcessPoolExecutor
+from ncats_translator_dqa import config, profiling, run_manifest, pipeline, scheduler, sysinfo
+from ncats_translator_dqa.preliminary_statistics import fair_scraper, prelim_stats_rdf, void_profiler
+from ncats_translator_dqa.computational_metrics import computational_metrics, schema_mirror, interlinking
+from ncats_translator_dqa.computational_metrics.RDFUnitWrapper import RDFUnitWrapper
+from ncats_translator_dqa.results_store import ResultsStore
 
 
-def translator_dqa(fair_url=None, file_data=None, file_multi=None, schema=None):
+def translator_dqa(fair_url=None, file_data=None, file_multi=None, schema=None, engine=None, resume=False,
+                   profile=False, file_previous=None):
     """Implementation of the command line interface for NCATS Translator Data Quality Analysis Pipeline
 
     :param fair_url: FAIRsharing.org url
     :param file_data: Absolute path to data file for computational metrics
     :param file_multi: Path to CSV file listing FAIRsharing.org url and data set path for each data set to test
+    :param schema: Schema for computational metrics
+    :param engine: Computational metrics engine, 'rdfunit' or 'lite'
+    :param resume: True to resume a previous run of file_multi from its checkpoints
+    :param profile: True to write a trace of the time, memory and subprocess resources of each stage and print a
+     summary at the end
+    :param file_previous: Path to the previous version of file_data, for validating only what changed since then
     :return:
     """
     dir_output = config.path_output
@@ -22,62 +33,292 @@ def translator_dqa(fair_url=None, file_data=None, file_multi=None, schema=None):
     if schema is None:
         schema = ''
 
+    # Trace of all stages, including those run by worker processes
+    if profile:
+        profiling.start(os.path.join(dir_output, 'profile_' + datetime.now().isoformat(timespec='seconds') + '.jsonl'))
+
+    # Record the results of this run in the results store
+    store = None
+    run_id = None
+    if len(config.path_results_db) > 0:
+        store = ResultsStore()
+        run_id = store.start_run(' '.join(sys.argv))
+
+    try:
+        with profiling.span('run'):
+            __translator_dqa(fair_url, file_data, file_multi, schema, engine, dir_output, store, run_id, resume,
+                             file_previous)
+        if store is not None:
+            store.finish_run(run_id)
+    finally:
+        if store is not None:
+            store.close()
+        profiling.finish()
+
+
+def __translator_dqa(fair_url, file_data, file_multi, schema, engine, dir_output, store, run_id, resume, file_previous):
     # CSV file option
     if file_multi is not None:
-        # Maintain a list of preliminary stats
-        prelim_stats_list = []
-
-        # Process the CSV file line by line
-        with open(file_multi) as csvfile:
-            csv_reader = csv.reader(csvfile, delimiter=',')
-            for row in csv_reader:
-                if len(row) == 2:
-                    # Preliminary statistics
-                    url = row[0]
-                    if url is not None:
-                        url = url.strip()
-                        if len(url) > 0:
-                            stats = __prelim_stats(url, dir_output, False)
-                            prelim_stats_list.append(stats)
-
-                    # Computational metrics
-                    file_data = row[1]
-                    if file_data is not None:
-                        file_data = file_data.strip()
-                        if os.path.exists(file_data):
-                            computational_metrics(file_data, schema)
-
-        # Write all preliminary statistics to a single csv
-        filename = 'prelim_stats_' + datetime.now().isoformat(timespec='seconds') + '.csv'
-        output_csv_file = os.path.join(dir_output, filename)
-        fair_scraper.fair_table(prelim_stats_list, output_csv_file)
+        __multiple_data_sets(file_multi, schema, engine, dir_output, store, run_id, resume)
 
         # Don't process any other command line arguments
         return
 
     # FAIRsharing.org option
     if fair_url is not None:
-        __prelim_stats(fair_url, dir_output, True)
+        profile = void_profiler.void_profile(file_data) if file_data is not None else None
+        links = interlinking.interlinking_metrics(file_data) if file_data is not None else None
+        stats = __prelim_stats(fair_url, dir_output, True, profile=profile,
+                               links=links.measurements() if links is not None else None)
+        if store is not None:
+            store.add_prelim_stats(run_id, [stats])
 
     # Data file option
     if file_data is not None:
-        computational_metrics(file_data, schema)
+        computational_metrics.computational_metrics(file_data, schema, engine, file_previous)
+        if store is not None:
+            __record_results(store, run_id, [file_data])
+
+
+def __multiple_data_sets(file_multi, schema, engine, dir_output, store, run_id, resume):
+    # FAIRsharing.org urls and data files listed in the CSV file. Missing values are ''
+    rows = []
+
+    # Process the CSV file line by line
+    with open(file_multi) as csvfile:
+        csv_reader = csv.reader(csvfile, delimiter=',')
+        for row in csv_reader:
+            if len(row) == 2:
+                # Preliminary statistics
+                url = row[0].strip() if row[0] is not None else ''
+
+                # Computational metrics
+                file_data = row[1].strip() if row[1] is not None else ''
+                if not os.path.exists(file_data):
+                    file_data = ''
+
+                rows.append((url, file_data))
+
+    # Checkpoints of each row and stage. Every stage below only runs on the rows where it is not done yet, and a
+    # failure only affects its own row
+    file_manifest = os.path.join(dir_output, os.path.splitext(os.path.split(file_multi)[1])[0] + '.manifest.json')
+    manifest = run_manifest.RunManifest.open(file_manifest, rows, resume, config.verbose)
+
+    # Validate the most expensive data sets first, so a large data set listed last doesn't set the end of the run.
+    # Costs are estimated from the size of the data files and the validation times of previous runs
+    if engine is None:
+        engine = config.computational_metrics_engine
+
+    # In offline mode, a schema missing from the local mirror stops the run before any data set is validated
+    if config.schema_offline and engine == computational_metrics.ENGINE_RDFUNIT and len(schema) > 0:
+        schema_mirror.schema_sources(None, schema)
+
+    pending = manifest.pending(run_manifest.STAGE_VALIDATE)
+    model = scheduler.CostModel(store.job_times(engine) if store is not None else None)
+    jobs = scheduler.largest_first(scheduler.make_jobs([rows[i][1] for i in pending], model, pending))
+    order = [job.index for job in jobs] + sorted(set(range(len(rows))) - set(pending))
+
+    n_validate = validation_workers(len(jobs))
 
+    # Run the rows through the stages of the pipeline, so different rows are scraped, validated and uploaded at the
+    # same time. Validations run in worker processes, which are started before the threads of the pipeline
+    executor = validation_executor(n_validate) if len(jobs) > 0 else None
+    try:
+        with scheduler.Progress(jobs, n_validate) as progress:
+            results = __run_pipeline(rows, order, manifest, schema, engine, dir_output, n_validate, executor,
+                                     progress)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Validation times for estimating the costs of later runs. Results restored from the cache don't count
+    if store is not None:
+        times = [(job.file_data, job.n_bytes, progress.seconds(job.index)) for job in jobs
+                 if job.index in results and not results[job.index][1]]
+        store.add_job_times(run_id, engine, times)
+
+    # Preliminary statistics of all rows scraped in this or a previous attempt
+    scraped = [i for i in range(len(rows)) if manifest.is_done(i, run_manifest.STAGE_SCRAPE)]
+    prelim_stats_list = [manifest.prelim_stats(i) for i in scraped]
+    data_files = [rows[i][1] for i in range(len(rows)) if manifest.is_done(i, run_manifest.STAGE_VALIDATE)]
+    if store is not None:
+        store.add_prelim_stats(run_id, prelim_stats_list)
+        __record_results(store, run_id, data_files)
+
+    # Write all preliminary statistics to a single csv and a single W3C DQV file
+    filename = 'prelim_stats_' + datetime.now().isoformat(timespec='seconds')
+    output_csv_file = os.path.join(dir_output, filename + '.csv')
+    fair_scraper.fair_table(prelim_stats_list, output_csv_file)
+    with prelim_stats_rdf.DQVWriter(os.path.join(dir_output, filename + '.ttl')) as writer:
+        for i, stats in zip(scraped, prelim_stats_list):
+            writer.add_dataset(__dataset_id(stats), stats)
+            writer.add_void_profile(manifest.void_profile(i))
+            interlinking.add_measurements(writer, manifest.interlinking(i))
+
+    # Report failed rows. They run again with --resume
+    failures = manifest.failures()
+    for i, stage, error in failures:
+        sys.stderr.write('Row ' + str(i + 1) + ' (' + (rows[i][0] or rows[i][1]) + ') failed at ' + stage + ': ' +
+                         error + '\n')
+    if len(failures) > 0:
+        sys.stderr.write(str(len(failures)) + ' stage(s) failed. Run again with --resume to retry them\n')
+
+
+def validation_workers(n_jobs):
+    """Gets the number of data sets validated at the same time
+
+    :param n_jobs: Number of data sets to validate (Integer)
+    :return: config.rdfunit_workers, or if that is 0, a number based on the CPU count and available memory, at most
+     n_jobs and at least 1 (Integer)
+    """
+    n_workers = config.rdfunit_workers
+    if n_workers <= 0:
+        n_workers = sysinfo.default_workers(config.rdfunit_worker_memory)
+    return max(min(n_workers, n_jobs), 1)
+
+
+def validation_executor(n_workers):
+    """Starts a pool of worker processes for running validations
+
+    All workers are started before this function returns. A pool that forks its workers on the first submit() would
+    otherwise fork them from a thread of the pipeline, while other threads may hold a lock, e.g., of stdout, of the HTTP
+    connection pool or of the profiling trace, which would then stay locked forever in the workers.
+
+    :param n_workers: Number of worker processes (Integer)
+    :return: concurrent.futures.ProcessPoolExecutor. Shut it down when done
+    """
+    executor = ProcessPoolExecutor(max_workers=n_workers, initializer=sysinfo.set_concurrency,
+                                   initargs=(sysinfo.concurrency() * n_workers,))
+    try:
+        for future in [executor.submit(os.getpid) for _ in range(n_workers)]:
+            future.result()
+    except BaseException:
+        executor.shutdown()
+        raise
+    return executor
 
-def __prelim_stats(url, dir_output, write_csv=False):
-    # Scrape the page
-    stats = fair_scraper.fair_scraper(url)
+
+def validator(files_data, schema, engine, executor, progress, results):
+    """Makes the function of the validate stage of the pipeline
+
+    :param files_data: Paths to the data files, by row index (List)
+    :param schema: Schema for computational metrics (String)
+    :param engine: Computational metrics engine, 'rdfunit' or 'lite'
+    :param executor: Pool started by validation_executor() to run the validations in, or None to run them in the
+     calling thread
+    :param progress: scheduler.Progress of the validations
+    :param results: Dictionary receiving (results file, cache hit) by row index for each row validated
+    :return: Function validate(row index), which raises the exception of a failed validation
+    """
+    def validate(i):
+        progress.started(i)
+        try:
+            if executor is None:
+                results[i] = computational_metrics.validate(files_data[i], schema, engine)
+            else:
+                results[i] = executor.submit(computational_metrics.validate, files_data[i], schema, engine).result()
+        except Exception as e:
+            progress.finished(i, e)
+            raise
+        progress.finished(i)
+
+    return validate
+
+
+def __run_pipeline(rows, order, manifest, schema, engine, dir_output, n_validate, executor, progress):
+    # Results files of the rows validated in this attempt: row index -> (results file, cache hit)
+    results = {}
+
+    def scrape(i):
+        stats = fair_scraper.fair_scraper(rows[i][0])
+        manifest.set_prelim_stats(i, stats)
+
+    def rdf(i):
+        profile = void_profiler.void_profile(rows[i][1])
+        if profile is not None:
+            manifest.set_void_profile(i, profile)
+        links = interlinking.interlinking_metrics(rows[i][1])
+        if links is not None:
+            links = links.measurements()
+            manifest.set_interlinking(i, links)
+        __prelim_stats(rows[i][0], dir_output, False, manifest.prelim_stats(i), profile, links)
+
+    validate = validator([row[1] for row in rows], schema, engine, executor, progress, results)
+
+    def report(i):
+        RDFUnitWrapper().dqv_report(results_file(i))
+
+    def upload(i):
+        file_dqv_report = RDFUnitWrapper.dqv_report_file(results_file(i))
+        if not with_report or not os.path.exists(file_dqv_report):
+            file_dqv_report = None
+        computational_metrics.upload_results(rows[i][1], results_file(i), results.get(i, (None, False))[1],
+                                             file_dqv_report)
+
+    def results_file(i):
+        # Rows validated in a previous attempt have their results in the default location
+        return results[i][0] if i in results else RDFUnitWrapper.output_files(rows[i][1])[0]
+
+    def checkpointed(stage, function):
+        # Runs a stage on the rows where it is pending and records its outcome in the manifest
+        def run(i):
+            if not manifest.is_pending(i, stage):
+                return
+            try:
+                function(i)
+            except Exception as e:
+                manifest.mark(i, stage, e)
+            else:
+                manifest.mark(i, stage)
+        return run
+
+    # The lite engine writes its results in DQV already
+    with_report = config.dqv_report and engine == computational_metrics.ENGINE_RDFUNIT
+
+    # Preliminary statistics and computational metrics of a row don't depend on each other, so they run in two
+    # pipelines side by side, and validation takes the rows in the scheduled order
+    stages_prelim = [pipeline.PipelineStage(run_manifest.STAGE_SCRAPE,
+                                            checkpointed(run_manifest.STAGE_SCRAPE, scrape), config.scrape_workers),
+                     pipeline.PipelineStage(run_manifest.STAGE_RDF, checkpointed(run_manifest.STAGE_RDF, rdf),
+                                            config.pipeline_rdf_workers)]
+    stages_metrics = [pipeline.PipelineStage(run_manifest.STAGE_VALIDATE,
+                                             checkpointed(run_manifest.STAGE_VALIDATE, validate), n_validate)]
+    if with_report:
+        stages_metrics.append(pipeline.PipelineStage(run_manifest.STAGE_REPORT,
+                                                     checkpointed(run_manifest.STAGE_REPORT, report),
+                                                     config.pipeline_report_workers))
+    stages_metrics.append(pipeline.PipelineStage(run_manifest.STAGE_UPLOAD,
+                                                 checkpointed(run_manifest.STAGE_UPLOAD, upload),
+                                                 config.pipeline_upload_workers))
+    pipeline.run_all([(pipeline.Pipeline(stages_prelim), range(len(rows))),
+                      (pipeline.Pipeline(stages_metrics), order)])
+    return results
+
+
+def __record_results(store, run_id, data_files):
+    # Record the computational metrics results files of the data sets
+    for file_data in data_files:
+        file_results = RDFUnitWrapper.output_files(file_data)[0]
+        if os.path.exists(file_results):
+            with profiling.span('record', dataset=file_data, bytes=os.path.getsize(file_results)):
+                store.add_results_file(run_id, file_data, file_results)
+
+
+def __prelim_stats(url, dir_output, write_csv=False, stats=None, profile=None, links=None):
+    # Scrape the page unless it has already been scraped
+    if stats is None:
+        stats = fair_scraper.fair_scraper(url)
 
     # Output filename based on url
     filename = url.split('/')[-1]
     output_file = os.path.join(dir_output, filename + '_rdf.ttl')
 
-    # Use the dataset title as the local identifier
-    dataset_id = "".join([c for c in stats.title if c.isalnum()]) + 'Dataset'
-
     # Write out preliminary statistics using W3C DQV
-    stats_rdf = prelim_stats_rdf.PrelimStatsRDF(dataset_id, stats)
-    stats_rdf.serialize(output_file, format='ttl')
+    with profiling.span('prelim_stats_rdf', dataset=url):
+        with prelim_stats_rdf.DQVWriter(output_file) as writer:
+            writer.add_dataset(__dataset_id(stats), stats)
+            writer.add_void_profile(profile)
+            interlinking.add_measurements(writer, links)
 
     if write_csv:
         # Write out preliminary statistics as CSV also
@@ -86,6 +327,11 @@ def __prelim_stats(url, dir_output, write_csv=False):
 
     return stats
 
+
+def __dataset_id(stats):
+    # Use the dataset title as the local identifier
+    return "".join([c for c in stats.title if c.isalnum()]) + 'Dataset'
+
 def main():
     """Defines the command line arguments and help documentation
 
@@ -107,12 +353,39 @@ def main():
     parser.add_argument('-f', dest='fair_url', help='FAIRsharing.org URL for preliminary statistics')
     parser.add_argument('-d', dest='file_data', help='Absolute path to data file for computational metrics')
     parser.add_argument('-s', dest='schema', help='Specify schema for computational metrics')
+    parser.add_argument('-e', dest='engine', choices=computational_metrics.ENGINES,
+                        help=('Computational metrics engine: rdfunit (default) or lite, a fast pure-Python check of '
+                              'syntactic problems that does not need Java'))
     parser.add_argument('-m', dest='file_multi', help=('CSV file defining multiple data sets to test. Define one data '
                                                        'set on each line with format [FAIRsharing.org URL], [data set '
                                                        'file] (without brackets). Each argument is optional. If this '
                                                        'argument is used, -f and -d arguments are ignored.'))
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help=('With -m, resume the previous run of the same CSV file: stages that completed are '
+                              'skipped, failed and missing stages run again'))
+    parser.add_argument('--previous', dest='file_previous', metavar='FILE',
+                        help=('With -d, the previous version of the data file. Only the triples that changed are '
+                              'validated, and the results of the previous version are updated. Its results must be '
+                              'in the result cache'))
+    parser.add_argument('--offline', dest='offline', action='store_true',
+                        help=('Serve FAIRsharing.org pages from the local HTTP cache and schemas from the local '
+                              'schema mirror only, without accessing the network'))
+    parser.add_argument('--sample', dest='sample', type=float, default=None, metavar='FRACTION',
+                        help=('Validate only this fraction of the subjects of each data set, e.g., 0.01, and '
+                              'extrapolate the results with confidence intervals. Overrides config.sample_fraction'))
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help=('Write a trace of the time, memory and subprocess resources of each stage to the output '
+                              'folder (profile_<time>.jsonl and .prom) and print a summary at the end'))
     args = parser.parse_args()
-    translator_dqa(args.fair_url, args.file_data, args.file_multi, args.schema)
+
+    if args.offline:
+        config.http_cache_offline = True
+        config.schema_offline = True
+    if args.sample is not None:
+        config.sample_fraction = args.sample
+
+    translator_dqa(args.fair_url, args.file_data, args.file_multi, args.schema, args.engine, args.resume, args.profile,
+                   args.file_previous)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,410 @@
+"""Dictionary-encoded, memory-mapped cache of the triples of a data file
+
+A data file is parsed once and converted to a folder of NumPy arrays: a dictionary of its terms and its triples as
+term ids, sorted in SPO and POS order. Later analyses of the same file open the arrays memory-mapped, in milliseconds
+and without reading them into memory, instead of parsing the file again. The cache is rebuilt automatically when the
+size, modification time or inode of the data file changes.
+
+Term ids follow the order of the UTF-8 encoded N-Triples terms, so literals ('"...') come first, then IRIs ('<...>'),
+then blank nodes ('_:...'), and the IRIs in a namespace have consecutive ids (see TripleCache.prefix_range()).
+
+The cache folder contains:
+meta.json - stats of the data file the cache was built from, and the number of triples and terms
+terms.npy - UTF-8 encoded terms, concatenated (uint8)
+term_offsets.npy - offset of each term in terms.npy, and the total length (int64, number of terms + 1)
+spo.npy - triples as (subject, predicate, object) term ids, sorted (uint32, number of triples x 3)
+pos.npy - triples as (predicate, object, subject) term ids, sorted (uint32, number of triples x 3)
+
+Usage:
+python -m ncats_translator_dqa.triple_cache <data file> [...]
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from array import array
+import numpy as np
+from ncats_translator_dqa import config, profiling, rdf_stream
+from ncats_translator_dqa.computational_metrics.external_sort import sort_statements
+
+# Version of the cache layout. Caches written by another version are rebuilt
+VERSION = '1'
+
+# Number of triples encoded in memory before they are written to disk while building a cache
+_chunk_triples = 1024 * 1024
+
+# Number of triples converted to text at a time for sorting them
+_sort_chunk = 64 * 1024
+
+# Characters of terms that are escaped in the lines sorted while building a cache: the separator of a term and its
+# position, line breaks and the escape character. Each is written as the escape character and a character that keeps
+# the order of the terms, since escaped characters sort before every unescaped one
+_sort_escape_shift = 0x20
+_sort_escapes = {c: '\x01' + chr(c + _sort_escape_shift) for c in range(0x0e)}
+_re_sort_unescape = re.compile('\x01(.)', re.DOTALL)
+
+# Triples are sorted as lines of three term ids in 8 hexadecimal digits each, which sort like the ids
+_hex_digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+_hex_shifts = np.arange(28, -1, -4, dtype=np.uint32)
+_hex_line = 3 * 8 + 1
+
+_meta = 'meta.json'
+_arrays = ['terms', 'term_offsets', 'spo', 'pos']
+
+
+def cache_folder(file_dataset):
+    """Gets the folder of the triple cache of a data file
+
+    :param file_dataset: Path to the data file (String)
+    :return: Path to <data file>.triples next to the data file, or a folder under config.path_triple_cache (String)
+    """
+    file_dataset = os.path.abspath(file_dataset)
+    if len(config.path_triple_cache) == 0:
+        return file_dataset + '.triples'
+    name = os.path.split(file_dataset)[1] + '.' + hashlib.sha256(file_dataset.encode('UTF-8')).hexdigest()[:16]
+    return os.path.join(config.path_triple_cache, name)
+
+
+def _source_stats(file_dataset):
+    st = os.stat(file_dataset)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _sort_key(term):
+    return term.translate(_sort_escapes)
+
+
+def _sort_term(key):
+    return _re_sort_unescape.sub(lambda m: chr(ord(m.group(1)) - _sort_escape_shift), key)
+
+
+def _new_array(file, shape, dtype=np.uint32, raw=False):
+    # Creates an array in a .npy file, or in a raw file without header, and maps it for writing. Empty arrays can't be
+    # memory-mapped
+    if int(np.prod(shape)) == 0:
+        if raw:
+            open(file, 'wb').close()
+        else:
+            np.save(file, np.empty(shape, dtype=dtype))
+        return np.empty(shape, dtype=dtype)
+    if raw:
+        return np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+    return np.lib.format.open_memmap(file, mode='w+', dtype=dtype, shape=shape)
+
+
+def _raw_to_npy(file_raw, file_npy, dtype):
+    # Copies a raw file of values to a .npy file and removes it
+    raw = np.memmap(file_raw, dtype=dtype, mode='r') if os.path.getsize(file_raw) > 0 else np.empty(0, dtype=dtype)
+    array_npy = _new_array(file_npy, raw.shape, dtype)
+    step = _chunk_triples * 8
+    for start in range(0, len(raw), step):
+        array_npy[start:start + step] = raw[start:start + step]
+    del raw, array_npy
+    os.remove(file_raw)
+
+
+def _write_index(ids, columns, file_npy, dir_tmp, max_bytes):
+    # Sorts the triples with their columns in the given order and writes them to a .npy file
+    def lines():
+        for start in range(0, len(ids), _sort_chunk):
+            rows = np.ascontiguousarray(ids[start:start + _sort_chunk][:, columns])
+            chars = np.empty((len(rows), _hex_line), dtype=np.uint8)
+            chars[:, :-1] = _hex_digits[(rows[:, :, None] >> _hex_shifts) & 0xF].reshape(len(rows), -1)
+            chars[:, -1] = ord('\n')
+            yield from chars.tobytes().decode('ascii').splitlines(keepends=True)
+
+    file_sorted = os.path.join(dir_tmp, 'index.sorted')
+    sort_statements(lines(), file_sorted, dir_tmp, max_bytes)
+    index = _new_array(file_npy, ids.shape)
+    with open(file_sorted, 'rb') as f:
+        for start in range(0, len(ids), _sort_chunk):
+            digits = np.frombuffer(f.read(_sort_chunk * _hex_line), dtype=np.uint8).reshape(-1, _hex_line)
+            digits = digits[:, :-1].reshape(-1, 3, 8)
+            values = np.where(digits >= ord('a'), digits - (ord('a') - 10), digits - ord('0')).astype(np.uint32)
+            index[start:start + len(values)] = (values << _hex_shifts).sum(axis=2, dtype=np.uint32)
+    del index
+    os.remove(file_sorted)
+
+
+class TripleCache:
+    """Memory-mapped triples of a data file
+
+    Public members:
+    file_dataset - Path to the data file
+    folder - Path to the cache folder
+    spo - Triples as term ids sorted by subject, predicate and object (NumPy array, number of triples x 3)
+    pos - Triples as (predicate, object, subject) term ids sorted in that order (NumPy array, number of triples x 3)
+    n_triples - Number of triples, including duplicates
+    n_terms - Number of distinct terms
+    first_iri - Id of the first IRI. Ids below are literals
+    first_bnode - Id of the first blank node. Ids from first_iri to first_bnode - 1 are IRIs
+    """
+
+    def __init__(self, file_dataset, folder):
+        """Constructor. Opens an existing cache, use TripleCache.open() to build it if needed
+
+        :param file_dataset: Path to the data file (String)
+        :param folder: Path to the cache folder (String)
+        """
+        self.file_dataset = file_dataset
+        self.folder = folder
+        with open(os.path.join(folder, _meta), encoding='UTF-8') as f:
+            meta = json.load(f)
+        self.n_triples = meta['triples']
+        self.n_terms = meta['terms']
+        self.first_iri = meta['first_iri']
+        self.first_bnode = meta['first_bnode']
+        self.__terms = np.load(os.path.join(folder, 'terms.npy'), mmap_mode='r')
+        self.__offsets = np.load(os.path.join(folder, 'term_offsets.npy'), mmap_mode='r')
+        self.spo = np.load(os.path.join(folder, 'spo.npy'), mmap_mode='r')
+        self.pos = np.load(os.path.join(folder, 'pos.npy'), mmap_mode='r')
+
+    @staticmethod
+    def open(file_dataset, build=True, verbose=None):
+        """Opens the triple cache of a data file, building it first if it is missing or out of date
+
+        :param file_dataset: Path to the data file (String)
+        :param build: False to return None instead of building a missing or out of date cache [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        :return: TripleCache, or None
+        """
+        verbose = verbose if verbose is not None else config.verbose
+        folder = cache_folder(file_dataset)
+        if TripleCache.is_current(file_dataset, folder):
+            with profiling.span('triple_cache.open', dataset=file_dataset):
+                return TripleCache(file_dataset, folder)
+        if not build:
+            return None
+        TripleCache.build(file_dataset, folder, verbose)
+        return TripleCache(file_dataset, folder)
+
+    @staticmethod
+    def is_current(file_dataset, folder=None):
+        """Checks whether the triple cache of a data file exists and was built from the current version of the file
+
+        :param file_dataset: Path to the data file (String)
+        :param folder: Path to the cache folder. Defaults to cache_folder(file_dataset) [optional]
+        :return: True if the cache can be used
+        """
+        folder = folder if folder is not None else cache_folder(file_dataset)
+        try:
+            with open(os.path.join(folder, _meta), encoding='UTF-8') as f:
+                meta = json.load(f)
+            return meta['version'] == VERSION and meta['source'] == os.path.abspath(file_dataset) and \
+                meta['stats'] == _source_stats(file_dataset) and \
+                all(os.path.exists(os.path.join(folder, name + '.npy')) for name in _arrays)
+        except (OSError, ValueError, KeyError):
+            return False
+
+    @staticmethod
+    def build(file_dataset, folder=None, verbose=None, max_bytes=None):
+        """Parses a data file and writes its triple cache
+
+        The terms are numbered and the triples are sorted with an external merge sort (see external_sort.py), so a
+        cache is built with bounded memory, whatever the size of the data file. It needs about 3 times the size of the
+        N-Triples of the data file on disk while it is built. The cache is written to a temporary folder first and
+        then moved in place, so a cache is never seen half written.
+
+        :param file_dataset: Path to the data file (String)
+        :param folder: Path to the cache folder. Defaults to cache_folder(file_dataset) [optional]
+        :param verbose: True if you want to print status messages. Defaults to config.verbose [optional]
+        :param max_bytes: Memory used for sorting, in bytes. Defaults to config.triple_cache_sort_bytes [optional]
+        :return: None
+        """
+        verbose = verbose if verbose is not None else config.verbose
+        max_bytes = max_bytes if max_bytes is not None else config.triple_cache_sort_bytes
+        folder = folder if folder is not None else cache_folder(file_dataset)
+        stats = _source_stats(file_dataset)
+        if verbose:
+            print('Building triple cache of ' + file_dataset + ' in ' + folder)
+
+        parent = os.path.split(os.path.abspath(folder))[0]
+        os.makedirs(parent, exist_ok=True)
+        dir_tmp = tempfile.mkdtemp(prefix='.triples_', dir=parent)
+        try:
+            with profiling.span('triple_cache.build', dataset=file_dataset, bytes=stats[0]) as span:
+                meta = TripleCache.__write_arrays(file_dataset, dir_tmp, max_bytes)
+                span.tag(triples=meta['triples'])
+            meta.update({'version': VERSION, 'source': os.path.abspath(file_dataset), 'stats': stats})
+            with open(os.path.join(dir_tmp, _meta), 'w', encoding='UTF-8') as f:
+                json.dump(meta, f, indent=1)
+
+            # Replace an out of date cache. Another process may have built the same cache in the meantime
+            if os.path.exists(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            try:
+                os.rename(dir_tmp, folder)
+            except OSError:
+                if not TripleCache.is_current(file_dataset, folder):
+                    raise
+        finally:
+            shutil.rmtree(dir_tmp, ignore_errors=True)
+
+        if verbose:
+            print('Triple cache: ' + str(meta['triples']) + ' triples, ' + str(meta['terms']) + ' terms')
+
+    @staticmethod
+    def __write_arrays(file_dataset, dir_output, max_bytes):
+        # Sort the occurrences of the terms, one line per term of each triple with the position of the term
+        n_triples = [0]
+
+        def occurrences():
+            position = 0
+            for triple in rdf_stream.iter_triples(file_dataset):
+                for term in triple:
+                    yield _sort_key(term) + '\x00' + str(position) + '\n'
+                    position += 1
+                n_triples[0] += 1
+
+        file_occurrences = os.path.join(dir_output, 'occurrences.sorted')
+        sort_statements(occurrences(), file_occurrences, dir_output, max_bytes)
+        n_triples = n_triples[0]
+
+        # Number the distinct terms in sorted order, writing the dictionary and the triples as term ids
+        file_ids = os.path.join(dir_output, 'triples.raw')
+        ids = _new_array(file_ids, (n_triples, 3), raw=True)
+        ids_flat = ids.reshape(-1)
+        file_terms = os.path.join(dir_output, 'terms.raw')
+        file_offsets = os.path.join(dir_output, 'term_offsets.raw')
+        positions = array('q')
+        ranks = array('I')
+        offsets = array('q', [0])
+        n_terms = 0
+        offset = 0
+        first_iri = first_bnode = None
+        key_last = None
+        with open(file_occurrences, encoding='UTF-8', errors='surrogatepass') as f_occurrences, \
+                open(file_terms, 'wb') as f_terms, open(file_offsets, 'wb') as f_offsets:
+            for line in f_occurrences:
+                key, _, position = line[:-1].rpartition('\x00')
+                if key != key_last:
+                    key_last = key
+                    encoded = _sort_term(key).encode('UTF-8', 'surrogatepass')
+                    if first_iri is None and encoded[:1] != b'"':
+                        first_iri = n_terms
+                    if first_bnode is None and encoded[:1] == b'_':
+                        first_bnode = n_terms
+                    f_terms.write(encoded)
+                    offset += len(encoded)
+                    offsets.append(offset)
+                    n_terms += 1
+                positions.append(int(position))
+                ranks.append(n_terms - 1)
+                if len(positions) >= 3 * _chunk_triples:
+                    ids_flat[np.frombuffer(positions, dtype=np.int64)] = np.frombuffer(ranks, dtype=np.uint32)
+                    positions, ranks = array('q'), array('I')
+                if len(offsets) >= _chunk_triples:
+                    offsets.tofile(f_offsets)
+                    offsets = array('q')
+            if len(positions) > 0:
+                ids_flat[np.frombuffer(positions, dtype=np.int64)] = np.frombuffer(ranks, dtype=np.uint32)
+            offsets.tofile(f_offsets)
+        os.remove(file_occurrences)
+        first_iri = first_iri if first_iri is not None else n_terms
+        first_bnode = first_bnode if first_bnode is not None else n_terms
+        _raw_to_npy(file_terms, os.path.join(dir_output, 'terms.npy'), np.uint8)
+        _raw_to_npy(file_offsets, os.path.join(dir_output, 'term_offsets.npy'), np.int64)
+
+        # Sorted indexes
+        _write_index(ids, [0, 1, 2], os.path.join(dir_output, 'spo.npy'), dir_output, max_bytes)
+        _write_index(ids, [1, 2, 0], os.path.join(dir_output, 'pos.npy'), dir_output, max_bytes)
+        del ids, ids_flat
+        os.remove(file_ids)
+
+        return {'triples': n_triples, 'terms': n_terms, 'first_iri': first_iri, 'first_bnode': first_bnode}
+
+    def term(self, term_id):
+        """Gets a term by its id
+
+        :param term_id: Term id (Integer)
+        :return: N-Triples term (String)
+        """
+        return self.__encoded(term_id).decode('UTF-8', 'surrogatepass')
+
+    def terms_bytes(self, first, last):
+        """Gets a range of terms as one block of UTF-8 encoded bytes, e.g., to scan many terms with a regex
+
+        :param first: Id of the first term (Integer)
+        :param last: Id of the last term + 1 (Integer)
+        :return: The concatenated UTF-8 encoded N-Triples terms (Bytes)
+        """
+        return bytes(self.__terms[self.__offsets[first]:self.__offsets[last]])
+
+    def term_id(self, term):
+        """Gets the id of a term
+
+        :param term: N-Triples term, e.g., '<http://www.w3.org/2002/07/owl#sameAs>' (String)
+        :return: Term id, or -1 if the term does not occur in the data file (Integer)
+        """
+        encoded = term.encode('UTF-8', 'surrogatepass')
+        i = self.__search(encoded)
+        return i if i < self.n_terms and self.__encoded(i) == encoded else -1
+
+    def prefix_range(self, prefix):
+        """Gets the ids of the terms that start with a prefix, e.g., the IRIs of a namespace
+
+        :param prefix: Start of the N-Triples terms, e.g., '<http://purl.obolibrary.org/obo/GO_' (String)
+        :return: Tuple (first id, last id + 1)
+        """
+        encoded = prefix.encode('UTF-8', 'surrogatepass')
+        # 0xFF does not occur in UTF-8, so it sorts after every term that starts with the prefix
+        return self.__search(encoded), self.__search(encoded + b'\xff')
+
+    def subject_rows(self, subject_id):
+        """Gets the triples of a subject
+
+        :param subject_id: Term id of the subject (Integer)
+        :return: Rows of spo (NumPy array)
+        """
+        lo, hi = np.searchsorted(self.spo[:, 0], [subject_id, subject_id + 1])
+        return self.spo[lo:hi]
+
+    def predicate_rows(self, predicate_id):
+        """Gets the triples with a predicate
+
+        :param predicate_id: Term id of the predicate (Integer)
+        :return: Rows of pos, as (predicate, object, subject) (NumPy array)
+        """
+        lo, hi = np.searchsorted(self.pos[:, 0], [predicate_id, predicate_id + 1])
+        return self.pos[lo:hi]
+
+    def __encoded(self, i):
+        return bytes(self.__terms[self.__offsets[i]:self.__offsets[i + 1]])
+
+    def __search(self, encoded):
+        # Binary search for the first term that is not less than the given UTF-8 encoded term
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__encoded(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=('Converts data files to dictionary-encoded triple caches that are '
+                                                  'memory-mapped by later analyses instead of parsing the files again'))
+    parser.add_argument('files_dataset', nargs='+', metavar='FILE', help='Data file (N-Triples, N-Quads or Turtle)')
+    parser.add_argument('--rebuild', action='store_true', help='Build the caches even if they are up to date')
+    args = parser.parse_args()
+
+    for file_dataset in args.files_dataset:
+        if not os.path.exists(file_dataset):
+            sys.stderr.write('Data file not found: ' + file_dataset + '\n')
+            continue
+        if args.rebuild or not TripleCache.is_current(file_dataset):
+            TripleCache.build(file_dataset)
+        cache = TripleCache.open(file_dataset, build=False)
+        print(file_dataset + ': ' + str(cache.n_triples) + ' triples, ' + str(cache.n_terms) + ' terms (' +
+              str(cache.first_iri) + ' literals, ' + str(cache.first_bnode - cache.first_iri) + ' IRIs, ' +
+              str(cache.n_terms - cache.first_bnode) + ' blank nodes) in ' + cache.folder)
+
+
+if __name__ == '__main__':
+    main()